@@ -1,4 +1,6 @@
+import { timingSafeEqual } from "crypto";
 import { NextRequest, NextResponse } from "next/server";
+import type { SupabaseClient } from "@supabase/supabase-js";
 import { normalizeUserEmail } from "@/lib/auth/user-payload";
 import { createClient } from "@/lib/supabase/server";
 import { createServiceRoleClient } from "@/lib/supabase/service-role";
@@ -11,11 +13,109 @@ type Body = {
   generated_at?: string;
 };
 
+type BatchResult = { appeal_id: string | null; ok: boolean; status: number; error?: string };
+
+function hasInternalSecret(request: NextRequest): boolean {
+  const expected = process.env.INTERNAL_API_SECRET?.trim();
+  const given = request.headers.get("X-Internal-Secret")?.trim();
+  if (!expected || !given || expected.length !== given.length) return false;
+  return timingSafeEqual(Buffer.from(expected), Buffer.from(given));
+}
+
 /**
- * After successful appeal generation, the internal engine POSTs here with the
- * same Supabase JWT. We verify the user and increment usage in public.users.
+ * Count one generated appeal in appeals_generated_monthly for a paid user; returns an HTTP-style
+ * status. The engine retries deliveries, so an appeal_id already counted is answered 200 without
+ * counting it again (record_appeal_usage claims the id and increments in one transaction).
+ */
+async function incrementUsage(
+  svc: SupabaseClient,
+  email: string,
+  userId: string,
+  appealId: string
+): Promise<{ status: number; error?: string }> {
+  const { data: row, error: selErr } = await svc
+    .from("users")
+    .select("is_paid")
+    .eq("email", email)
+    .maybeSingle();
+
+  if (selErr) {
+    console.error("record-usage select", selErr);
+    return { status: 500, error: "Failed to read user" };
+  }
+  if (!row) {
+    return { status: 404, error: "User not found" };
+  }
+  if ((row as { is_paid?: boolean | null }).is_paid !== true) {
+    return { status: 403, error: "Active purchase required" };
+  }
+
+  const { error: upErr } = await svc.rpc("record_appeal_usage", {
+    p_appeal_id: appealId,
+    p_user_id: userId,
+    p_email: email,
+  });
+
+  if (upErr) {
+    console.error("record-usage update", upErr);
+    return { status: 500, error: "Failed to update usage" };
+  }
+  return { status: 200 };
+}
+
+/**
+ * Batched delivery from the engine's record-usage outbox: {"events": [Body, ...]} authorized by
+ * X-Internal-Secret. Answers 200 with one result per event, in order.
+ */
+async function postBatch(events: Body[]) {
+  const svc = createServiceRoleClient();
+  const emails = new Map<string, string | null>();
+  const results: BatchResult[] = [];
+  for (const ev of events) {
+    const userId = (ev.user_id || "").trim();
+    const appealId = (ev.appeal_id || "").trim() || null;
+    if (!userId) {
+      results.push({ appeal_id: appealId, ok: false, status: 400, error: "user_id required" });
+      continue;
+    }
+    if (!appealId) {
+      results.push({ appeal_id: appealId, ok: false, status: 400, error: "appeal_id required" });
+      continue;
+    }
+    if (!emails.has(userId)) {
+      const { data } = await svc.auth.admin.getUserById(userId);
+      emails.set(userId, normalizeUserEmail(data?.user?.email));
+    }
+    const email = emails.get(userId);
+    if (!email) {
+      results.push({ appeal_id: appealId, ok: false, status: 404, error: "User not found" });
+      continue;
+    }
+    const { status, error } = await incrementUsage(svc, email, userId, appealId);
+    results.push({ appeal_id: appealId, ok: status < 400, status, ...(error ? { error } : {}) });
+  }
+  return NextResponse.json({ results });
+}
+
+/**
+ * After successful appeal generation, the internal engine POSTs batches here with
+ * X-Internal-Secret (see postBatch). A single event with the user's own Supabase JWT is
+ * still accepted. Either way each appeal_id counts once in public.users.
  */
 export async function POST(request: NextRequest) {
+  if (hasInternalSecret(request)) {
+    let batch: { events?: Body[] };
+    try {
+      batch = (await request.json()) as { events?: Body[] };
+    } catch {
+      return NextResponse.json({ error: "Invalid JSON" }, { status: 400 });
+    }
+    if (!Array.isArray(batch.events)) {
+      return NextResponse.json({ error: "events array required" }, { status: 400 });
+    }
+    return postBatch(batch.events);
+  }
+
   const authHeader = request.headers.get("Authorization");
   if (!authHeader || !authHeader.toLowerCase().startsWith("bearer ")) {
     return NextResponse.json({ error: "Unauthorized" }, { status: 401 });
@@ -50,35 +150,15 @@ export async function POST(request: NextRequest) {
   if (userId !== authId) {
     return NextResponse.json({ error: "Forbidden" }, { status: 403 });
   }
-
-  const svc = createServiceRoleClient();
-  const { data: row, error: selErr } = await svc
-    .from("users")
-    .select("appeals_generated_monthly, is_paid")
-    .eq("email", email)
-    .maybeSingle();
-
-  if (selErr) {
-    console.error("record-usage select", selErr);
-    return NextResponse.json({ error: "Failed to read user" }, { status: 500 });
-  }
-  if (!row) {
-    return NextResponse.json({ error: "User not found" }, { status: 404 });
-  }
-  if ((row as { is_paid?: boolean | null }).is_paid !== true) {
-    return NextResponse.json({ error: "Active purchase required" }, { status: 403 });
+  const appealId = (body.appeal_id || "").trim();
+  if (!appealId) {
+    return NextResponse.json({ error: "appeal_id required" }, { status: 400 });
   }
 
-  const current = parseInt(String((row as { appeals_generated_monthly: number | null }).appeals_generated_monthly ?? 0), 10) || 0;
-  const { error: upErr } = await svc
-    .from("users")
-    .update({ appeals_generated_monthly: current + 1 })
-    .eq("email", email);
-
-  if (upErr) {
-    console.error("record-usage update", upErr);
-    return NextResponse.json({ error: "Failed to update usage" }, { status: 500 });
+  const { status, error } = await incrementUsage(createServiceRoleClient(), email, userId, appealId);
+  if (error) {
+    return NextResponse.json({ error }, { status });
   }
 
-  return NextResponse.json({ success: true, appeal_id: body.appeal_id ?? null });
+  return NextResponse.json({ success: true, appeal_id: appealId });
 }
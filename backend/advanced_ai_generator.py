@@ -2,6 +2,7 @@
 Advanced AI-powered appeal generation with multi-step reasoning and expert knowledge integration
 This system generates appeals that are significantly superior to generic ChatGPT responses
 """
+import json
 import os
 import re
 import logging
@@ -11,7 +12,7 @@ from dotenv import load_dotenv
 # Load environment variables FIRST before any other imports
 load_dotenv()
 
-from openai import OpenAI
+from openai_clients import call_timeout, get_openai_client
 from denial_templates import get_denial_template
 from appeal_output_structure import (
     SUBMISSION_STRUCTURE_SYSTEM_APPENDIX,
@@ -59,7 +60,7 @@ class AdvancedAIAppealGenerator:
         
         if self.enabled:
             try:
-                self.client = OpenAI(api_key=self.api_key)
+                self.client = get_openai_client(self.api_key)
                 logger.info("Advanced AI appeal generation enabled (OpenAI GPT-4)")
                 logger.info("Appeals will use expert-level AI reasoning and medical knowledge")
             except Exception as e:
@@ -71,11 +72,14 @@ class AdvancedAIAppealGenerator:
             logger.info("To enable AI-powered appeals, add OPENAI_API_KEY to .env")
             logger.info("Get your API key from: https://platform.openai.com/api-keys")
     
-    def generate_appeal_content(self, appeal):
+    def generate_appeal_content(self, appeal, regenerate=False):
         """
         Generate a submission-ready appeal: mandatory payer letter structure,
         CARC/RARC interpretation, multi-denial handling. OpenAI when configured;
         deterministic engine on failure or when API disabled.
+        With APPEAL_CACHE_ENABLED, identical intake for the same user reuses the cached
+        letter unless regenerate=True. Model tier, max_tokens and whether to call the LLM at
+        all come from appeal_routing.route_appeal; the decision is recorded on the appeal.
         """
         from appeal_submission_engine import (
             build_structured_intake_from_appeal,
@@ -84,11 +88,20 @@ class AdvancedAIAppealGenerator:
         )
 
         structured = build_structured_intake_from_appeal(appeal)
-        client = self.client if self.enabled else None
-        model_tag = os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+        route = self._route(appeal, structured, regenerate)
+        client = self.client if self.enabled and route["use_llm"] else None
+        model_tag = route["model"] or os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
 
         try:
-            text, source = generate_submission_appeal(structured, client)
+            user_id = getattr(appeal, "user_id", None)
+            text, source = generate_submission_appeal(
+                structured,
+                client,
+                cache_scope=str(user_id) if user_id else None,
+                bypass_cache=regenerate,
+                model=model_tag,
+                max_tokens=route["max_tokens"] or 4000,
+            )
             if hasattr(appeal, "ai_model_used"):
                 appeal.ai_model_used = model_tag if source == "llm" else "deterministic_submission"
             if hasattr(appeal, "ai_generation_method"):
@@ -107,7 +120,75 @@ class AdvancedAIAppealGenerator:
                 exc_info=True,
             )
             return render_deterministic_submission_appeal(structured)
-    
+
+    def stream_appeal_content(self, appeal):
+        """
+        Streaming form of generate_appeal_content: yields the submission engine's
+        ("delta" | "replace" | "done", text) events and sets the same ai_* fields on the
+        appeal once the source is known.
+        """
+        from appeal_submission_engine import (
+            build_structured_intake_from_appeal,
+            stream_submission_appeal,
+        )
+
+        structured = build_structured_intake_from_appeal(appeal)
+        route = self._route(appeal, structured)
+        client = self.client if self.enabled and route["use_llm"] else None
+        model_tag = route["model"] or os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+        for kind, value in stream_submission_appeal(
+            structured, client, model=model_tag, max_tokens=route["max_tokens"] or 4000
+        ):
+            if kind == "done":
+                if hasattr(appeal, "ai_model_used"):
+                    appeal.ai_model_used = model_tag if value == "llm" else "deterministic_submission"
+                if hasattr(appeal, "ai_generation_method"):
+                    appeal.ai_generation_method = (
+                        "submission_engine_llm_stream"
+                        if value == "llm"
+                        else "submission_engine_deterministic"
+                    )
+            yield kind, value
+
+    def draft_appeal_content(self, appeal, regenerate=False):
+        """
+        Deterministic submission letter to show immediately (speculative_generation.py).
+        Returns (letter_text, refine) where refine says whether routing and configuration
+        allow an LLM letter to replace the draft.
+        """
+        from appeal_submission_engine import (
+            build_structured_intake_from_appeal,
+            render_deterministic_submission_appeal,
+        )
+
+        structured = build_structured_intake_from_appeal(appeal)
+        route = self._route(appeal, structured, regenerate)
+        text = render_deterministic_submission_appeal(structured)
+        if hasattr(appeal, "ai_model_used"):
+            appeal.ai_model_used = "deterministic_submission"
+        if hasattr(appeal, "ai_generation_method"):
+            appeal.ai_generation_method = "submission_engine_draft"
+        if hasattr(appeal, "ai_word_count"):
+            appeal.ai_word_count = len(text.split())
+        return text, bool(self.enabled and route["use_llm"])
+
+    def _route(self, appeal, structured, regenerate=False):
+        """Routing decision for this appeal, stored on appeal.routing_decision_json when present."""
+        from appeal_routing import TIER_STANDARD, route_appeal
+
+        try:
+            route = route_appeal(structured, regenerate=regenerate)
+        except Exception as e:
+            logger.warning(f"Appeal routing failed for {appeal.appeal_id}, using standard tier: {e}")
+            route = {"tier": TIER_STANDARD, "use_llm": True, "model": None, "max_tokens": 4000, "reasons": ["routing error"]}
+        if hasattr(appeal, "routing_decision_json"):
+            appeal.routing_decision_json = json.dumps(route, default=str)
+        logger.info(
+            f"Appeal {appeal.appeal_id} routed to {route['tier']} tier",
+            extra={"appeal_id": appeal.appeal_id, "routing": route},
+        )
+        return route
+
     def _analyze_denial_strategy(self, appeal):
         """Analyze the denial and identify optimal strategic arguments"""
         return get_denial_strategy(appeal.denial_code)
@@ -176,7 +257,8 @@ Provide your strategic analysis in 150 words."""
                 {"role": "user", "content": analysis_prompt}
             ],
             temperature=0.3,
-            max_tokens=300
+            max_tokens=300,
+            timeout=call_timeout("appeal"),
         )
         
         strategic_analysis = analysis_response.choices[0].message.content
@@ -264,7 +346,8 @@ Provide your strategic analysis in 150 words."""
             'max_tokens': 4000,      # Structured 7-section submission-ready appeals
             'top_p': 0.85,           # Slightly lower for more precise language
             'frequency_penalty': 0.4, # Higher to reduce repetition of arguments
-            'presence_penalty': 0.3   # Encourage diverse strategic angles
+            'presence_penalty': 0.3,  # Encourage diverse strategic angles
+            'timeout': call_timeout("appeal"),
         }
         
         # Apply A/B test parameter adjustments if optimization enabled
@@ -2,7 +2,7 @@
 AI-powered appeal content generation using OpenAI GPT-4
 """
 import os
-from openai import OpenAI
+from openai_clients import call_timeout, get_openai_client
 from denial_templates import get_denial_template
 
 class AIAppealGenerator:
@@ -11,7 +11,7 @@ class AIAppealGenerator:
         self.enabled = bool(self.api_key)
         
         if self.enabled:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key)
             print("AI appeal generation enabled (OpenAI)")
         else:
             print("AI appeal generation disabled (using templates only)")
@@ -66,7 +66,8 @@ Format your response as a formal appeal argument only (no greeting, no signature
                     }
                 ],
                 temperature=0.7,
-                max_tokens=1500
+                max_tokens=1500,
+                timeout=call_timeout("appeal"),
             )
             
             content = response.choices[0].message.content
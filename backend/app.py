@@ -7,28 +7,48 @@ Auth: Supabase JWT (Authorization: Bearer). No Stripe, sessions, credits, or adm
 
 from __future__ import annotations
 
+import json
 import logging
 import os
 import re
+import time
 import uuid
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
 
-import httpx
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
 from config import Config
-from models import db, Appeal, User
+from appeal_routing import appeal_routing_stats
+from circuit_breaker import circuit_breaker_stats
+from extract_batch import MAX_BATCH_BODY_BYTES, extract_batch_stats, iter_extractions, parse_batch_body
+from idempotency import idempotency_stats, idempotent
+from llm_cache import llm_cache_stats
+from llm_governor import llm_governor_stats
+from generation_jobs import (
+    create_generation_job,
+    generation_job_stats,
+    job_view,
+    start_generation_executor,
+    submit_generation_job,
+)
+from models import db, Appeal, GenerationJob, User
+from openai_clients import openai_pool_stats
+from prompt_budget import budget_stats
+from single_flight import single_flight_stats
+from speculative_generation import EVENT_DRAFT, add_claim_event, refine_appeal
+from record_usage_outbox import enqueue_record_usage, notify_record_usage, start_record_usage_sender
 from supabase_jwt import (
     bearer_from_request,
     jwt_subject_uuid,
     validate_supabase_jwt,
 )
-from pdf_parser import parse_denial_pdf, parse_denial_text
+from pdf_parser import parse_denial_pdf, parse_denial_text, parse_remittance_pdf
+from pdf_text_cache import pdf_text_cache_stats
 from advanced_ai_generator import advanced_ai_generator
 from appeal_pdf_builder import build_professional_pdf_bytes, build_appeal_pdf_filename
 
@@ -45,16 +65,22 @@ CORS_ORIGINS = [
 ]
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     db.init_app(app)
+    start_record_usage_sender(app)
+    start_generation_executor(app)
 
     CORS(
         app,
         origins=CORS_ORIGINS,
         supports_credentials=False,
-        allow_headers=["Authorization", "Content-Type", "Accept"],
+        allow_headers=["Authorization", "Content-Type", "Accept", "Idempotency-Key"],
         methods=["GET", "POST", "OPTIONS"],
     )
 
@@ -76,7 +102,25 @@ def create_app():
 
     @app.route("/health", methods=["GET"])
     def health():
-        return jsonify({"status": "ok"}), 200
+        return (
+            jsonify(
+                {
+                    "status": "ok",
+                    "openai_pool": openai_pool_stats(),
+                    "llm_cache": llm_cache_stats(),
+                    "llm_governor": llm_governor_stats(),
+                    "llm_circuit": circuit_breaker_stats(),
+                    "generation_jobs": generation_job_stats(),
+                    "idempotency": idempotency_stats(),
+                    "prompt_budget": budget_stats(),
+                    "appeal_routing": appeal_routing_stats(),
+                    "pdf_text_cache": pdf_text_cache_stats(),
+                    "single_flight": single_flight_stats(),
+                    "extract_batch": extract_batch_stats(),
+                }
+            ),
+            200,
+        )
 
     @app.route("/api/extract/text", methods=["POST"])
     def extract_text():
@@ -90,6 +134,45 @@ def create_app():
         result = parse_denial_text(text)
         return jsonify(result), 200
 
+    @app.route("/api/extract/batch", methods=["POST"])
+    def extract_batch():
+        # JWT required: one request can run hundreds of paid LLM extractions.
+        _, uid, err = _require_jwt()
+        if err:
+            return err
+        if not uid:
+            return jsonify({"error": "Unauthorized"}), 401
+        if (request.content_length or 0) > MAX_BATCH_BODY_BYTES:
+            return jsonify({"success": False, "error": "Request body too large"}), 413
+        body = request.stream.read(MAX_BATCH_BODY_BYTES + 1)  # also bounds chunked bodies
+        if len(body) > MAX_BATCH_BODY_BYTES:
+            return jsonify({"success": False, "error": "Request body too large"}), 413
+        items, err = parse_batch_body(body, request.content_type)
+        if err:
+            return jsonify({"success": False, "error": err}), 400
+
+        def lines():
+            started = time.monotonic()
+            succeeded = 0
+            for row in iter_extractions(items):
+                succeeded += 1 if row.get("success") else 0
+                yield json.dumps(row, default=str) + "\n"
+            yield json.dumps(
+                {
+                    "done": True,
+                    "total": len(items),
+                    "succeeded": succeeded,
+                    "failed": len(items) - succeeded,
+                    "elapsed_ms": int((time.monotonic() - started) * 1000),
+                }
+            ) + "\n"
+
+        return Response(
+            stream_with_context(lines()),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.route("/api/extract/file", methods=["POST"])
     def extract_file():
         # No JWT — read-only extraction; no DB writes.
@@ -111,7 +194,11 @@ def create_app():
         temp_path = os.path.join(app.config["UPLOAD_FOLDER"], f"temp_{uuid.uuid4()}_{fn}")
         f.save(temp_path)
         try:
-            result = parse_denial_pdf(temp_path)
+            # ?claims=1: multi-claim remittance → one result per claim
+            if request.args.get("claims") in ("1", "true"):
+                result = parse_remittance_pdf(temp_path)
+            else:
+                result = parse_denial_pdf(temp_path)
             if isinstance(result, dict) and result.get("success") is False:
                 return jsonify(result), 400
             return jsonify(result), 200
@@ -170,21 +257,13 @@ def create_app():
             return None
         return s[:max_len]
 
-    @app.route("/api/generate/appeal", methods=["POST"])
-    def generate_appeal():
-        _, uid, err = _require_jwt()
-        if err:
-            return err
-        if not uid:
-            return jsonify({"error": "Unauthorized"}), 401
-
-        body = request.get_json(silent=True)
-        if not isinstance(body, dict):
-            return jsonify({"error": "JSON body required"}), 400
-
+    def _new_appeal_from_body(
+        body: Dict[str, Any], uid: UUID
+    ) -> Tuple[Optional[Appeal], Optional[Tuple[Any, int]]]:
+        """Validate a generate request body and build the pending Appeal (not yet added)."""
         user = db.session.get(User, uid)
         if not user:
-            return jsonify({"error": "User profile not found in database"}), 404
+            return None, (jsonify({"error": "User profile not found in database"}), 404)
 
         _merge_user_provider(body, user)
 
@@ -196,9 +275,12 @@ def create_app():
         claim_number = (body.get("claim_number") or "").strip()[:100]
 
         if not patient or not prov or not npi:
-            return jsonify(
-                {"error": "patient_name (or patient_id), provider_name, and provider_npi are required"}
-            ), 400
+            return None, (
+                jsonify(
+                    {"error": "patient_name (or patient_id), provider_name, and provider_npi are required"}
+                ),
+                400,
+            )
 
         if not payer:
             payer = "Unknown payer"
@@ -256,17 +338,12 @@ def create_app():
             credit_used=False,
             queue_status="pending",
         )
-        db.session.add(appeal)
-        db.session.flush()
-
-        try:
-            letter = advanced_ai_generator.generate_appeal_content(appeal)
-        except Exception as e:
-            logger.exception("generate_appeal_content failed: %s", e)
-            db.session.rollback()
-            return jsonify({"error": f"Generation failed: {e}"}), 500
+        return appeal, None
 
+    def _complete_generation(appeal: Appeal, letter: str, uid: UUID) -> None:
+        """Store the letter, mark the appeal generated, queue record-usage and commit."""
         appeal.generated_letter_text = letter
+        appeal.letter_version = (appeal.letter_version or 0) + 1
         appeal.status = "completed"
         appeal.queue_status = "generated"
         appeal.completed_at = datetime.utcnow()
@@ -274,10 +351,48 @@ def create_app():
         appeal.generation_count = (appeal.generation_count or 0) + 1
         appeal.appeal_tracking_status = "generated"
         appeal.tracking_updated_at = datetime.utcnow()
+        # Delivered to Next.js in the background (record_usage_outbox); not on the response path
+        enqueue_record_usage(uid, appeal.appeal_id)
 
         db.session.commit()
+        notify_record_usage()
 
-        _fire_record_usage(str(uid), aid, raw_jwt=bearer_from_request())
+    def _jwt_user() -> Optional[UUID]:
+        return _require_jwt()[1]
+
+    @app.route("/api/generate/appeal", methods=["POST"])
+    @idempotent("generate_appeal", user=_jwt_user)
+    def generate_appeal():
+        _, uid, err = _require_jwt()
+        if err:
+            return err
+        if not uid:
+            return jsonify({"error": "Unauthorized"}), 401
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"error": "JSON body required"}), 400
+
+        appeal, err = _new_appeal_from_body(body, uid)
+        if err:
+            return err
+        aid = appeal.appeal_id
+        db.session.add(appeal)
+        db.session.flush()
+
+        if body.get("draft"):
+            return _draft_generation(appeal, uid, bool(body.get("regenerate")))
+
+        try:
+            letter = advanced_ai_generator.generate_appeal_content(
+                appeal, regenerate=bool(body.get("regenerate"))
+            )
+        except Exception as e:
+            logger.exception("generate_appeal_content failed: %s", e)
+            db.session.rollback()
+            return jsonify({"error": f"Generation failed: {e}"}), 500
+
+        _complete_generation(appeal, letter, uid)
 
         pdf_path = f"/api/generate/appeal/{aid}/pdf"
         return (
@@ -291,27 +406,191 @@ def create_app():
             200,
         )
 
-    def _fire_record_usage(user_id: str, appeal_id: str, raw_jwt: Optional[str]):
-        base = (os.getenv("NEXT_INTERNAL_API_URL") or "").strip().rstrip("/")
-        if not base:
-            logger.warning("NEXT_INTERNAL_API_URL not set; skipping record-usage")
-            return
-        url = f"{base}/api/internal/record-usage"
-        payload = {
-            "user_id": user_id,
-            "appeal_id": appeal_id,
-            "generated_at": datetime.utcnow().isoformat() + "Z",
-        }
-        headers = {"Content-Type": "application/json"}
-        if raw_jwt:
-            headers["Authorization"] = f"Bearer {raw_jwt}"
+    def _draft_generation(appeal: Appeal, uid: UUID, regenerate: bool):
+        """
+        "draft": true on /api/generate/appeal: store and return the deterministic letter now,
+        then refine it with the LLM on the generation executor (speculative_generation.py).
+        """
+        aid = appeal.appeal_id
         try:
-            with httpx.Client(timeout=10.0) as client:
-                r = client.post(url, json=payload, headers=headers)
-            if r.status_code >= 400:
-                logger.error("record-usage failed: %s %s", r.status_code, r.text[:500])
+            letter, refine = advanced_ai_generator.draft_appeal_content(appeal, regenerate=regenerate)
         except Exception as e:
-            logger.error("record-usage request error: %s", e)
+            logger.exception("draft_appeal_content failed: %s", e)
+            db.session.rollback()
+            return jsonify({"error": f"Generation failed: {e}"}), 500
+        add_claim_event(
+            appeal.id,
+            uid,
+            EVENT_DRAFT,
+            "Draft letter ready; AI refinement queued" if refine else "Letter generated from the submission template",
+        )
+        _complete_generation(appeal, letter, uid)
+        version = appeal.letter_version
+
+        refine_job = None
+        if refine:
+            job, _ = create_generation_job(uid, aid)
+            submit_generation_job(
+                app,
+                job.job_id,
+                lambda: refine_appeal(advanced_ai_generator, aid, version, uid, regenerate=regenerate),
+            )
+            refine_job = job_view(job)
+        return (
+            jsonify(
+                {
+                    "appeal_id": aid,
+                    "letter_text": letter,
+                    "pdf_url": f"/api/generate/appeal/{aid}/pdf",
+                    "draft": True,
+                    "letter_version": version,
+                    "refining": refine,
+                    "refine_job": refine_job,
+                }
+            ),
+            200,
+        )
+
+    @app.route("/api/generate/appeal/jobs", methods=["POST"])
+    def create_generation_job_route():
+        """
+        Accept-then-poll variant of /api/generate/appeal (same body): returns 202 with a job
+        handle after storing the pending appeal; generation runs on the background executor.
+        Send Idempotency-Key to make retries return the same job.
+        """
+        _, uid, err = _require_jwt()
+        if err:
+            return err
+        if not uid:
+            return jsonify({"error": "Unauthorized"}), 401
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"error": "JSON body required"}), 400
+
+        appeal, err = _new_appeal_from_body(body, uid)
+        if err:
+            return err
+        appeal.queue_status = "generating"
+        db.session.add(appeal)
+        job, created = create_generation_job(uid, appeal.appeal_id, request.headers.get("Idempotency-Key"))
+        view = job_view(job)
+        if created:
+            regenerate = bool(body.get("regenerate"))
+            job_id, aid = job.job_id, appeal.appeal_id
+
+            def run() -> None:
+                a = Appeal.query.filter_by(appeal_id=aid).first()
+                if a is None:
+                    raise LookupError(f"Appeal {aid} not found")
+                letter = advanced_ai_generator.generate_appeal_content(a, regenerate=regenerate)
+                _complete_generation(a, letter, uid)
+
+            submit_generation_job(app, job_id, run)
+        return (
+            jsonify(view),
+            202,
+            {"Location": view["status_url"], "Idempotent-Replay": "false" if created else "true"},
+        )
+
+    @app.route("/api/generate/appeal/jobs/<job_id>", methods=["GET"])
+    def get_generation_job(job_id: str):
+        _, uid, err = _require_jwt()
+        if err:
+            return err
+        job = GenerationJob.query.filter_by(job_id=job_id, user_id=uid).first() if uid else None
+        if not job:
+            return jsonify({"error": "Not found"}), 404
+        view = job_view(job)
+        if job.status == "done":
+            a = Appeal.query.filter_by(appeal_id=job.appeal_id, user_id=uid).first()
+            view["letter_text"] = a.generated_letter_text if a else None
+            view["letter_version"] = a.letter_version if a else None
+            view["pdf_url"] = f"/api/generate/appeal/{job.appeal_id}/pdf"
+            return jsonify(view), 200
+        # Still working: tell pollers when to come back
+        headers = {"Retry-After": "2"} if job.status in ("queued", "running") else {}
+        return jsonify(view), 200, headers
+
+    @app.route("/api/generate/appeal/stream", methods=["POST"])
+    def generate_appeal_stream():
+        """
+        Same request as /api/generate/appeal, answered as Server-Sent Events:
+          event: start    {"appeal_id"}
+          event: delta    {"text"}          letter text as the model writes it
+          event: replace  {"text"}          full fallback letter; discard earlier deltas
+          event: done     {"appeal_id", "pdf_url", "source", "metrics": {ttft_ms, total_ms, chars}}
+          event: error    {"error"}
+        The final text is stored on the appeal before "done" is sent.
+        """
+        started = time.perf_counter()
+        _, uid, err = _require_jwt()
+        if err:
+            return err
+        if not uid:
+            return jsonify({"error": "Unauthorized"}), 401
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"error": "JSON body required"}), 400
+
+        appeal, err = _new_appeal_from_body(body, uid)
+        if err:
+            return err
+        aid = appeal.appeal_id
+        db.session.add(appeal)
+        db.session.flush()
+
+        def events():
+            parts: List[str] = []
+            ttft_ms: Optional[float] = None
+            source = "deterministic"
+            completed = False
+            try:
+                yield _sse("start", {"appeal_id": aid})
+                for kind, value in advanced_ai_generator.stream_appeal_content(appeal):
+                    if kind == "done":
+                        source = value
+                        continue
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                    if kind == "replace":
+                        parts = [value]
+                    else:
+                        parts.append(value)
+                    yield _sse(kind, {"text": value})
+                letter = "".join(parts).strip()
+                if hasattr(appeal, "ai_word_count"):
+                    appeal.ai_word_count = len(letter.split())
+                _complete_generation(appeal, letter, uid)
+                completed = True
+                metrics = {
+                    "ttft_ms": ttft_ms,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "chars": len(letter),
+                }
+                logger.info("Streamed appeal %s (%s): %s", aid, source, metrics)
+                yield _sse(
+                    "done",
+                    {
+                        "appeal_id": aid,
+                        "pdf_url": f"/api/generate/appeal/{aid}/pdf",
+                        "source": source,
+                        "metrics": metrics,
+                    },
+                )
+            except Exception as e:
+                logger.exception("Streaming generation failed for %s: %s", aid, e)
+                yield _sse("error", {"error": f"Generation failed: {e}"})
+            finally:
+                if not completed:
+                    db.session.rollback()
+
+        return Response(
+            stream_with_context(events()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     @app.route("/api/generate/appeal/<appeal_id>/pdf", methods=["GET"])
     def get_appeal_pdf(appeal_id: str):
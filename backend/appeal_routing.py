@@ -0,0 +1,215 @@
+"""
+Complexity-based routing for appeal letter generation.
+
+Before a letter is generated, route_appeal() scores the claim and picks a tier:
+  - deterministic: no LLM call. Used for low-value, single-CARC denials with a templated
+    strategy (timely filing, duplicate, COB, demographic fixes), where the deterministic
+    submission letter is as good as the model's.
+  - light:         OPENAI_APPEAL_MODEL_LIGHT with a smaller max_tokens.
+  - standard:      OPENAI_APPEAL_MODEL with the full max_tokens.
+
+The score adds up:
+  - billed amount: high-value claims weigh the most.
+  - number of distinct CARCs.
+  - the denial_rules strategy: clinical arguments weigh more than administrative ones.
+  - the coding_intelligence.detectDenialRisk score.
+The decision dict (tier, model, max_tokens, score, reasons, inputs) is stored on the appeal
+(routing_decision_json), so routing can be compared with outcomes later. A regenerate never
+routes to the deterministic tier, because that would return the same letter again.
+
+Env:
+  APPEAL_ROUTING_ENABLED                 0 to send every appeal to the standard tier
+  OPENAI_APPEAL_MODEL_LIGHT              model for the light tier
+  APPEAL_ROUTE_LIGHT_MAX_TOKENS          max_tokens for the light tier
+  APPEAL_ROUTE_STANDARD_MAX_TOKENS       max_tokens for the standard tier
+  APPEAL_ROUTE_DETERMINISTIC_MAX_AMOUNT  billed amount at or below which simple denials skip the LLM
+  APPEAL_ROUTE_HIGH_VALUE_AMOUNT         billed amount from which a claim counts as high value
+  APPEAL_ROUTE_STANDARD_SCORE            score from which the standard tier is used
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from coding_intelligence import detectDenialRisk
+from denial_rules import get_strategy
+
+logger = logging.getLogger(__name__)
+
+TIER_DETERMINISTIC = "deterministic"
+TIER_LIGHT = "light"
+TIER_STANDARD = "standard"
+POLICY_VERSION = 1
+
+# Denials whose letter is mostly a fixed argument plus proof
+SIMPLE_STRATEGIES = frozenset(
+    {
+        "timely_filing",
+        "duplicate_claim",
+        "coordination_benefits",
+        "date_error",
+        "patient_info_error",
+        "coverage_inactive",
+    }
+)
+# Denials that need a clinical or policy argument built from the claim facts
+COMPLEX_STRATEGIES = frozenset(
+    {
+        "medical_necessity",
+        "experimental",
+        "prior_authorization",
+        "precertification",
+        "additional_documentation",
+        "non_covered",
+    }
+)
+
+_stats = {TIER_DETERMINISTIC: 0, TIER_LIGHT: 0, TIER_STANDARD: 0}
+_stats_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def routing_enabled() -> bool:
+    return os.getenv("APPEAL_ROUTING_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+
+
+def _amount(v: Any) -> Optional[float]:
+    if v is None or v == "":
+        return None
+    try:
+        return float(str(v).replace(",", "").replace("$", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _strategy_for(carcs: List[str]) -> str:
+    """The most demanding denial_rules strategy among the CARCs ("general" when none is known)."""
+    strategies = [get_strategy(c) for c in carcs]
+    for s in strategies:
+        if s in COMPLEX_STRATEGIES:
+            return s
+    known = [s for s in strategies if s != "general"]
+    return known[0] if known else "general"
+
+
+def _risk_score(structured: Dict[str, Any], carcs: List[str]) -> int:
+    try:
+        risk = detectDenialRisk(
+            {
+                "cpt_codes": structured.get("cpt_codes"),
+                "icd10_codes": structured.get("icd10_codes"),
+                "modifiers": " ".join(structured.get("modifiers") or []),
+                "carc_codes": " ".join(carcs),
+                "rarc_codes": " ".join(structured.get("rarc_codes") or []),
+                "denial_reason": structured.get("denial_reason_text"),
+                "payer": structured.get("payer_name"),
+            }
+        )
+        return int(risk.get("riskScore") or 0)
+    except Exception as e:
+        logger.warning("Denial risk scoring failed during appeal routing: %s", e)
+        return 0
+
+
+def route_appeal(structured: Dict[str, Any], regenerate: bool = False) -> Dict[str, Any]:
+    """
+    Pick the generation tier for a structured intake (build_structured_intake_from_appeal).
+    Returns a JSON-serializable decision: tier, use_llm, model, max_tokens, score, reasons, inputs.
+    """
+    standard_model = os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+    standard_tokens = _env_int("APPEAL_ROUTE_STANDARD_MAX_TOKENS", 4000)
+    carcs = list(dict.fromkeys(str(c) for c in (structured.get("carc_codes") or [])))
+    billed = _amount(structured.get("billed_amount"))
+    strategy = _strategy_for(carcs)
+    risk = _risk_score(structured, carcs)
+    inputs = {"billed_amount": billed, "carc_count": len(carcs), "strategy": strategy, "risk_score": risk}
+
+    if not routing_enabled():
+        return _decide(TIER_STANDARD, standard_model, standard_tokens, 0, ["routing disabled"], inputs)
+
+    high_value = _env_float("APPEAL_ROUTE_HIGH_VALUE_AMOUNT", 5000)
+    deterministic_max = _env_float("APPEAL_ROUTE_DETERMINISTIC_MAX_AMOUNT", 100)
+    reasons: List[str] = []
+    score = 0
+    if billed is None:
+        score += 15
+        reasons.append("billed amount unknown")
+    elif billed >= high_value:
+        score += 40
+        reasons.append(f"high value (${billed:,.2f})")
+    elif billed > deterministic_max:
+        score += 15
+    if len(carcs) >= 3:
+        score += 25
+        reasons.append(f"{len(carcs)} CARCs")
+    elif len(carcs) == 2:
+        score += 15
+        reasons.append("2 CARCs")
+    if strategy in COMPLEX_STRATEGIES:
+        score += 25
+        reasons.append(f"{strategy} strategy")
+    elif strategy not in SIMPLE_STRATEGIES:
+        score += 10
+    score += min(30, risk * 3 // 10)
+    if risk >= 38:
+        reasons.append(f"high denial risk ({risk})")
+
+    simple = (
+        billed is not None
+        and billed <= deterministic_max
+        and len(carcs) <= 1
+        and strategy in SIMPLE_STRATEGIES
+        and risk < 20
+    )
+    if simple and not regenerate:
+        reasons.append(f"low value {strategy} denial")
+        return _decide(TIER_DETERMINISTIC, None, 0, score, reasons, inputs)
+    if score >= _env_int("APPEAL_ROUTE_STANDARD_SCORE", 40):
+        return _decide(TIER_STANDARD, standard_model, standard_tokens, score, reasons, inputs)
+    return _decide(
+        TIER_LIGHT,
+        os.getenv("OPENAI_APPEAL_MODEL_LIGHT", "gpt-4o-mini"),
+        _env_int("APPEAL_ROUTE_LIGHT_MAX_TOKENS", 2000),
+        score,
+        reasons or ["routine denial"],
+        inputs,
+    )
+
+
+def _decide(
+    tier: str, model: Optional[str], max_tokens: int, score: int, reasons: List[str], inputs: Dict[str, Any]
+) -> Dict[str, Any]:
+    with _stats_lock:
+        _stats[tier] += 1
+    return {
+        "policy": POLICY_VERSION,
+        "tier": tier,
+        "use_llm": tier != TIER_DETERMINISTIC,
+        "model": model,
+        "max_tokens": max_tokens,
+        "score": score,
+        "reasons": reasons,
+        "inputs": inputs,
+    }
+
+
+def appeal_routing_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        s: Dict[str, Any] = dict(_stats)
+    s["enabled"] = routing_enabled()
+    return s
@@ -11,11 +11,17 @@ import logging
 import math
 import os
 import re
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import openai
 
 from appeal_output_structure import extract_carc_rarc_from_intake, patient_initials
+from circuit_breaker import get_breaker
+from llm_cache import content_key, get_cache, prompt_version
+from llm_governor import governed_create, governed_stream
+from openai_clients import call_timeout
+from prompt_budget import dump_compact, estimate_prompt_tokens, fit_intake, record_prompt_usage
+from single_flight import get_flight
 
 logger = logging.getLogger(__name__)
 
@@ -447,35 +453,116 @@ Billing Department
 """
 
 
-def generate_submission_appeal_openai(client, structured: Dict[str, Any]) -> str:
-    if client is None:
-        raise ValueError("OpenAI client required")
+APPEAL_CACHE_TTL_SECONDS = int(os.getenv("APPEAL_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+def appeal_cache_enabled() -> bool:
+    """Opt-in (APPEAL_CACHE_ENABLED=1): identical intake for the same user reuses the letter."""
+    return os.getenv("APPEAL_CACHE_ENABLED", "0").strip().lower() in ("1", "true", "yes")
+
 
+def appeal_cache_key(safe_intake: Dict[str, Any], model: str) -> str:
+    """Canonical intake (sorted-key JSON, includes today's date) + model + system prompt version."""
+    canonical = json.dumps(safe_intake, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return content_key(canonical, model, prompt_version(SUBMISSION_APPEAL_SYSTEM_PROMPT))
+
+
+def _submission_user_content(structured: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """
+    (serializable intake incl. today's date, user message) for the appeal prompt. The intake is
+    compacted and clipped to the prompt token budget (prompt_budget.fit_intake).
+    """
     try:
         safe = _truncate_string_values(_make_serializable(structured))
         safe['today_date'] = datetime.date.today().strftime('%B %d, %Y')
-        structured_json = json.dumps(safe, indent=2, ensure_ascii=False)
+        safe, report = fit_intake(safe)
+        structured_json = dump_compact(safe)
     except Exception as serial_exc:
         raise ValueError(f"Could not serialize structured intake: {serial_exc}") from serial_exc
-
-    model = os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+    if report["clipped"]:
+        logger.info(
+            "Appeal intake clipped to budget: %s -> %s tokens (%s)",
+            report["tokens_before"],
+            report["tokens_after"],
+            ", ".join(report["clipped"]),
+        )
     user_content = (
         "STRUCTURED CLAIM DATA (JSON — use only as facts; output must be plain text appeal, no JSON):\n"
         + structured_json
         + "\n\nGenerate the full appeal letter now, following the system instructions exactly."
     )
+    return safe, user_content
+
 
+def _submission_request_body(model: str, user_content: str, max_tokens: int = 4000) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "temperature": 0.2,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "system", "content": SUBMISSION_APPEAL_SYSTEM_PROMPT},
+            {"role": "user", "content": user_content},
+        ],
+    }
+
+
+def submission_appeal_request_body(
+    structured: Dict[str, Any], model: Optional[str] = None, max_tokens: int = 4000
+) -> Dict[str, Any]:
+    """
+    Chat-completions body for one appeal letter, identical to the synchronous call; used to
+    build OpenAI Batch API lines (openai_batch.py). model / max_tokens come from appeal routing.
+    """
+    _safe, user_content = _submission_user_content(structured)
+    return _submission_request_body(model or os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o"), user_content, max_tokens)
+
+
+def generate_submission_appeal_openai(
+    client,
+    structured: Dict[str, Any],
+    cache_scope: Optional[str] = None,
+    bypass_cache: bool = False,
+    model: Optional[str] = None,
+    max_tokens: int = 4000,
+) -> str:
+    """
+    LLM appeal letter. With APPEAL_CACHE_ENABLED and a cache_scope (the user id), a letter for
+    byte-identical intake is served from llm_cache; bypass_cache ("regenerate") skips the lookup
+    and stores the fresh letter in its place. model / max_tokens come from appeal routing
+    (appeal_routing.py); model defaults to OPENAI_APPEAL_MODEL.
+    """
+    if client is None:
+        raise ValueError("OpenAI client required")
+
+    safe, user_content = _submission_user_content(structured)
+    model = model or os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+
+    cache = get_cache("appeal", APPEAL_CACHE_TTL_SECONDS) if cache_scope and appeal_cache_enabled() else None
+    cache_key = appeal_cache_key(safe, model)
+    if cache is not None and not bypass_cache:
+        hit = cache.get(cache_key, scope=cache_scope)
+        if hit and hit.get("text"):
+            return hit["text"]
+
+    # Identical concurrent requests (same user, intake, model, prompt) share one OpenAI call
+    flight_key = f"{cache_scope or ''}:{int(bypass_cache)}:{max_tokens}:{cache_key}"
+    text, _shared = get_flight("appeal").do(
+        flight_key, lambda: _call_submission_model(client, model, user_content, max_tokens)
+    )
+    if cache is not None and text:
+        cache.set(cache_key, {"text": text}, scope=cache_scope)
+    return text
+
+
+def _call_submission_model(client, model: str, user_content: str, max_tokens: int = 4000) -> str:
+    body = _submission_request_body(model, user_content, max_tokens)
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            max_tokens=4000,
-            messages=[
-                {"role": "system", "content": SUBMISSION_APPEAL_SYSTEM_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
+        resp = governed_create(client, breaker=get_breaker("appeal"), timeout=call_timeout("appeal"), **body)
+        record_prompt_usage(
+            estimate_prompt_tokens(body["messages"]),
+            getattr(getattr(resp, "usage", None), "prompt_tokens", None),
         )
-        return (resp.choices[0].message.content or "").strip()
+        text = (resp.choices[0].message.content or "").strip()
     except openai.AuthenticationError:
         raise
     except openai.RateLimitError as e:
@@ -484,18 +571,71 @@ def generate_submission_appeal_openai(client, structured: Dict[str, Any]) -> str
         raise ValueError(f"OpenAI rejected the request (prompt too large or invalid): {e}") from e
     except openai.OpenAIError as e:
         raise RuntimeError(f"OpenAI API error: {e}") from e
+    return text
 
 
 def generate_submission_appeal(
-    structured: Dict[str, Any], client: Any = None
+    structured: Dict[str, Any],
+    client: Any = None,
+    cache_scope: Optional[str] = None,
+    bypass_cache: bool = False,
+    model: Optional[str] = None,
+    max_tokens: int = 4000,
 ) -> Tuple[str, str]:
     """
     Primary path: OpenAI when client provided; always falls back to deterministic on failure.
     Returns (letter_text, source) where source is 'llm' or 'deterministic'.
+    cache_scope / bypass_cache / model / max_tokens: see generate_submission_appeal_openai.
     """
     if client is not None:
         try:
-            return generate_submission_appeal_openai(client, structured), "llm"
+            return (
+                generate_submission_appeal_openai(
+                    client,
+                    structured,
+                    cache_scope=cache_scope,
+                    bypass_cache=bypass_cache,
+                    model=model,
+                    max_tokens=max_tokens,
+                ),
+                "llm",
+            )
         except Exception as e:
             logger.warning("Submission appeal LLM failed, using deterministic: %s", e)
     return render_deterministic_submission_appeal(structured), "deterministic"
+
+
+def stream_submission_appeal(
+    structured: Dict[str, Any],
+    client: Any = None,
+    model: Optional[str] = None,
+    max_tokens: int = 4000,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Streaming counterpart of generate_submission_appeal. Yields ("delta", text) chunks as the
+    model writes them. When the LLM is unavailable or fails (before or mid-stream) it yields one
+    ("replace", deterministic_letter) that supersedes anything sent so far. Always ends with
+    ("done", source).
+    """
+    if client is not None:
+        try:
+            _safe, user_content = _submission_user_content(structured)
+            model = model or os.getenv("OPENAI_APPEAL_MODEL", "gpt-4o")
+            body = _submission_request_body(model, user_content, max_tokens)
+            # Streamed responses carry no usage block; only the estimate is recorded
+            record_prompt_usage(estimate_prompt_tokens(body["messages"]), None, label="appeal-stream")
+            wrote = False
+            stream = governed_stream(client, breaker=get_breaker("appeal"), timeout=call_timeout("appeal"), **body)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    wrote = True
+                    yield "delta", delta
+            if wrote:
+                yield "done", "llm"
+                return
+            logger.warning("Streamed submission appeal was empty, using deterministic")
+        except Exception as e:
+            logger.warning("Streamed submission appeal LLM failed, using deterministic: %s", e)
+    yield "replace", render_deterministic_submission_appeal(structured)
+    yield "done", "deterministic"
@@ -1,33 +1,53 @@
 """
 Batch CSV → appeal text + PDFs → ZIP (background job).
+
+start_* enqueue a durable batch_appeal_jobs row; batch workers (batch_worker.py) claim it via
+batch_job_queue and call run_claimed_job, which resumes after the last checkpointed row.
 """
 import csv
+import hashlib
 import io
+import json
+import logging
 import os
 import re
 import shutil
 import threading
 import time
 import uuid
-import zipfile
 from datetime import datetime, date
 from decimal import Decimal, InvalidOperation
 from types import SimpleNamespace
 
 from flask import current_app
+from sqlalchemy import text
 
 from appeal_automation import AppealAutomationHooks
+from appeal_routing import TIER_STANDARD, route_appeal
 from credit_manager import CreditManager
-from stripe_billing import StripeBilling
+from credit_reservation import CreditReservation, SLOT_FREE_TRIAL
+from usage_outbox import enqueue_overage_usage
 from models import db, User, Appeal, ClaimStatusEvent, BatchAppealJob
-from advanced_ai_generator import advanced_ai_generator
-from appeal_pdf_builder import build_professional_pdf_bytes, build_appeal_pdf_filename
-from pdf_parser import parse_denial_pdf
+from batch_row_pipeline import OrderedRowWindow, prefetch_ordered, render_row_pdf
+from batch_job_queue import JobLease, JobParked, LeaseLost, notify_new_job
+from batch_progress import BatchProgress
+from pdf_parser import DenialLetterParser
+from claim_segmentation import parse_claim_blocks, segment_claims
+from appeal_submission_engine import (
+    build_structured_intake_from_appeal,
+    render_deterministic_submission_appeal,
+    submission_appeal_request_body,
+)
+from openai_batch import MAX_WAIT_SECONDS, POLL_SECONDS, TERMINAL_STATUSES, BatchAPIError, OpenAIBatchClient
+from llm_governor import PRIORITY_BATCH, llm_priority
+
+logger = logging.getLogger(__name__)
 
 MAX_BATCH_ROWS = 100
 MAX_PDF_BATCH_FILES = 100
+MAX_PDF_BATCH_CLAIMS = 500
 _jobs_lock = threading.Lock()
-_jobs = {}  # job_id -> dict (write-through cache; durable fields also in BatchAppealJob)
+_jobs = {}  # job_id -> dict for jobs running in this process (durable state lives in BatchAppealJob)
 
 
 def _job_row_to_dict(row):
@@ -44,7 +64,8 @@ def _job_row_to_dict(row):
         'zip_path': row.zip_path,
         'zip_name': row.zip_name,
         'summary_rows': list(row.summary_rows) if row.summary_rows is not None else [],
-        'out_dir': None,
+        'db_round_trips': row.db_round_trips or 0,
+        'out_dir': (row.payload or {}).get('out_dir'),
         'defaults': {},
         'csv_path': None,
         'rows': None,
@@ -53,6 +74,37 @@ def _job_row_to_dict(row):
     }
 
 
+def _job_from_claimed_row(row):
+    """Worker-side job dict: durable progress plus the input payload needed to run / resume."""
+    job = _job_row_to_dict(row)
+    payload = row.payload or {}
+    job['out_dir'] = payload.get('out_dir')
+    job['defaults'] = payload.get('defaults') or {}
+    job['rows'] = payload.get('rows')
+    job['csv_text'] = payload.get('csv_text')
+    job['pdf_items'] = payload.get('pdf_items')
+    job['pdf_temp_dir'] = payload.get('input_dir')
+    job['economy'] = bool(payload.get('economy'))
+    job['economy_batch'] = payload.get('economy_batch')
+    job['credit_reservation'] = row.credit_reservation
+    if row.credit_reservation and not row.credit_reservation.get('settled'):
+        job['reservation'] = CreditReservation(row.user_id, row.credit_reservation)
+    return job
+
+
+def _job_payload(job):
+    return {
+        'out_dir': job.get('out_dir'),
+        'defaults': job.get('defaults') or {},
+        'rows': job.get('rows'),
+        'csv_text': job.get('csv_text'),
+        'pdf_items': job.get('pdf_items'),
+        'input_dir': job.get('pdf_temp_dir'),
+        'economy': bool(job.get('economy')),
+        'economy_batch': job.get('economy_batch'),
+    }
+
+
 def _insert_job_record(job_id, job):
     now = datetime.utcnow()
     row = BatchAppealJob(
@@ -67,6 +119,8 @@ def _insert_job_record(job_id, job):
         zip_path=job.get('zip_path'),
         zip_name=job.get('zip_name'),
         summary_rows=list(job.get('summary_rows') or []),
+        payload=_job_payload(job),
+        attempts=0,
         created_at=now,
         updated_at=now,
     )
@@ -74,26 +128,40 @@ def _insert_job_record(job_id, job):
     db.session.commit()
 
 
-def _flush_job_to_db(job_id, job):
-    """Persist durable fields from in-memory job to BatchAppealJob."""
+def _checkpoint_payload(job_id, job):
+    BatchAppealJob.query.filter_by(job_id=job_id).update(
+        {'payload': _job_payload(job)}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def _job_progress(job_id, job):
+    progress = job.get('progress')
+    if progress is None:
+        lease = job.get('lease')
+        progress = BatchProgress(job_id, job, owner=lease.owner if lease is not None else None)
+        job['progress'] = progress
+    return progress
+
+
+def _flush_job_to_db(job_id, job, force=True):
+    """
+    Persist durable fields from the in-memory job: immediately (force, terminal states) or on the
+    BatchProgress row/time cadence. Raises LeaseLost once another worker owns the job.
+    """
     if not job_id:
         return
+    lease = job.get('lease')
+    if lease is not None:
+        lease.check()
+    progress = _job_progress(job_id, job)
     try:
-        row = BatchAppealJob.query.filter_by(job_id=job_id).first()
-        if row is None:
-            return
-        row.status = job.get('status') or row.status
-        row.job_kind = job.get('job_kind') or row.job_kind
-        row.total = job.get('total')
-        row.current = job.get('current')
-        row.ok_count = job.get('ok_count')
-        row.error = job.get('error')
-        row.zip_path = job.get('zip_path')
-        row.zip_name = job.get('zip_name')
-        sr = job.get('summary_rows')
-        row.summary_rows = list(sr) if sr is not None else []
-        row.updated_at = datetime.utcnow()
-        db.session.commit()
+        if force:
+            progress.flush()
+        else:
+            progress.maybe_flush()
+    except LeaseLost:
+        raise
     except Exception:
         db.session.rollback()
         try:
@@ -179,10 +247,18 @@ def _build_denial_reason(row, claim_number):
     return '\n'.join(lines)
 
 
-def _row_to_ephemeral_appeal(row, defaults, row_index):
+def _row_token(job_id, row_index):
+    """Six hex chars for generated ids: stable per (job, row) so a resumed job rebuilds the same ids."""
+    if not job_id:
+        return uuid.uuid4().hex[:6].upper()
+    return hashlib.sha256(f'{job_id}:{row_index}'.encode()).hexdigest()[:6].upper()
+
+
+def _row_to_ephemeral_appeal(row, defaults, row_index, job_id=None):
+    token = _row_token(job_id, row_index)
     claim_number = str(_gval(row, 'claim_number', ('claim_id', 'Claim ID')) or '').strip()
     if not claim_number:
-        claim_number = f'BATCH-R{row_index + 1}-{uuid.uuid4().hex[:6].upper()}'
+        claim_number = f'BATCH-R{row_index + 1}-{token}'
     payer = str(_gval(row, 'payer', ('Payer', 'insurance')) or '').strip() or 'Unknown payer'
 
     dos = _parse_date(row)
@@ -202,7 +278,7 @@ def _row_to_ephemeral_appeal(row, defaults, row_index):
         billed = Decimal('0')
 
     denial_reason = _build_denial_reason(row, claim_number)
-    appeal_id = f"BAT-{datetime.utcnow().strftime('%Y%m%d')}-{row_index:04d}-{uuid.uuid4().hex[:6].upper()}"
+    appeal_id = f"BAT-{datetime.utcnow().strftime('%Y%m%d')}-{row_index:04d}-{token}"
 
     provider = str(defaults.get('provider_name') or 'Provider').strip()[:200]
     npi = str(defaults.get('provider_npi') or '0000000000').strip()[:20]
@@ -226,6 +302,7 @@ def _row_to_ephemeral_appeal(row, defaults, row_index):
         billed_amount=billed,
         appeal_level='level_1',
         generated_letter_text=None,
+        routing_decision_json=None,
     ), None
 
 
@@ -306,9 +383,6 @@ def _parse_pdf_to_ephemeral(parse: dict, defaults, index: int, source_name: str)
     ), None
 
 
-SUMMARY_FIELDS = ['row', 'source_file', 'claim_number', 'status', 'reason', 'seconds']
-
-
 def _persist_pdf_batch_appeal_row(user_id, ep, generated_text, appeal_pdf_abs_path, source_label, used_free_trial):
     """Persist one Appeal + events after bulk-PDF generation (mirrors queue import + completed generate state)."""
     appeal_id = f"APP-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
@@ -368,48 +442,82 @@ def _persist_pdf_batch_appeal_row(user_id, ep, generated_text, appeal_pdf_abs_pa
     AppealAutomationHooks.on_appeal_generated(appeal_row)
 
 
-def _finalize_batch_zip(job, summary_rows, ok_count, job_label: str):
-    out_dir = job['out_dir']
-    zip_name = f"appeals_batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
-    zip_path = os.path.join(out_dir, zip_name)
-    sum_csv = os.path.join(out_dir, 'batch_summary.csv')
-    with open(sum_csv, 'w', newline='', encoding='utf-8') as sf:
-        w = csv.DictWriter(sf, fieldnames=SUMMARY_FIELDS)
-        w.writeheader()
-        for s in summary_rows:
-            w.writerow({k: s.get(k, '') for k in SUMMARY_FIELDS})
-
-    report_lines = [
-        'Denial Appeal Pro — bulk processing report',
-        f'Job type: {job_label}',
-        f'Appeals generated (PDF): {ok_count}',
-        f'Line items: {len(summary_rows)}',
-        '',
-        'Errors / skipped:',
-    ]
-    problems = [s for s in summary_rows if s.get('status') not in ('ok',)]
-    if not problems:
-        report_lines.append('(none)')
-    else:
-        for s in problems:
-            report_lines.append(
-                f"  Row {s.get('row')}: [{s.get('status')}] claim={s.get('claim_number', '')} "
-                f"file={s.get('source_file', '')} — {s.get('reason', '')}"
+def _pool_app_context(app):
+    """Wrap pool callables so they run inside an app context with their own scoped session."""
+
+    def wrap(fn):
+        def run(*args):
+            with app.app_context():
+                try:
+                    return fn(*args)
+                finally:
+                    db.session.remove()
+
+        return run
+
+    return wrap
+
+
+def _reserve_for_job(job_id, job, uid, n):
+    """Reserve credits for n rows and checkpoint the reservation on the job row in one transaction."""
+    with db.engine.begin() as conn:
+        reservation = CreditManager.reserve_generations(uid, n, conn)
+        if reservation is not None:
+            conn.execute(
+                text('UPDATE batch_appeal_jobs SET credit_reservation = :r WHERE job_id = :job_id'),
+                {'r': json.dumps(reservation.state), 'job_id': job_id},
             )
-    report_path = os.path.join(out_dir, 'processing_report.txt')
-    with open(report_path, 'w', encoding='utf-8') as rf:
-        rf.write('\n'.join(report_lines))
+    job['reservation'] = reservation
+    job['credit_reservation'] = reservation.state if reservation is not None else None
+    return reservation
+
+
+def _settle_job_reservation(job_id, job, uid):
+    """
+    Refund unused / failed slots and queue the batch's overage units, in one transaction with
+    the job row (the usage outbox reports them to Stripe; see usage_outbox.py).
+    """
+    reservation = job.get('reservation')
+    if reservation is None or reservation.settled:
+        return
+    with db.engine.begin() as conn:
+        overage_qty = CreditManager.settle_reservation(reservation, conn)
+        enqueue_overage_usage(uid, overage_qty, source='batch', conn=conn)
+        conn.execute(
+            text('UPDATE batch_appeal_jobs SET credit_reservation = :r WHERE job_id = :job_id'),
+            {'r': json.dumps(reservation.state), 'job_id': job_id},
+        )
 
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.write(sum_csv, arcname='batch_summary.csv')
-        zf.write(report_path, arcname='processing_report.txt')
-        for name in os.listdir(out_dir):
-            if name.endswith('.pdf'):
-                zf.write(os.path.join(out_dir, name), arcname=name)
 
+def _admit_row(job_id, job, uid, window, complete, remaining):
+    """
+    Next slot from the job's credit reservation (slot kind, or None when no credits remain).
+    When the reservation is used up: finish in-flight rows, checkpoint, settle (failed slots are
+    returned) and reserve `remaining` more in one statement, so admit/deny matches the
+    sequential per-row try_begin_generation.
+    """
+    reservation = job.get('reservation')
+    kind = reservation.take() if reservation is not None else None
+    if kind is not None:
+        return kind
+    if reservation is not None:
+        for done in window.drain():
+            complete(*done)
+        _flush_job_to_db(job_id, job)
+        _settle_job_reservation(job_id, job, uid)
+    CreditManager.reset_usage_counters_if_needed(uid)
+    reservation = _reserve_for_job(job_id, job, uid, remaining)
+    return reservation.take() if reservation is not None else None
+
+
+def _finalize_batch_zip(job, summary_rows, ok_count, job_label: str):
+    """
+    Mark the job done. The ZIP itself is streamed at download time from out_dir + summary_rows
+    (batch_zip_stream), so nothing is archived or copied here.
+    """
     job['status'] = 'done'
-    job['zip_path'] = zip_path
-    job['zip_name'] = zip_name
+    job['zip_path'] = None
+    job['zip_name'] = f"appeals_batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
     job['ok_count'] = ok_count
     job['summary_rows'] = summary_rows
     jid = job.get('job_id')
@@ -417,21 +525,77 @@ def _finalize_batch_zip(job, summary_rows, ok_count, job_label: str):
         _flush_job_to_db(jid, job)
 
 
-def _run_job(app, job_id):
+_ROW_PDF_RE = re.compile(r'_r(\d+)\.pdf$')
+
+
+def _resume_state(job):
+    """
+    (summary_rows, ok_count, rows_done) from the last checkpoint of a re-claimed job.
+    Rows after the checkpoint are redone, so PDFs they left in out_dir are removed first.
+    """
+    summary_rows = list(job.get('summary_rows') or [])
+    rows_done = max((int(s.get('row') or 0) for s in summary_rows), default=0)
+    out_dir = job.get('out_dir')
+    if out_dir and os.path.isdir(out_dir):
+        for name in os.listdir(out_dir):
+            m = _ROW_PDF_RE.search(name)
+            if m and int(m.group(1)) > rows_done:
+                try:
+                    os.remove(os.path.join(out_dir, name))
+                except OSError:
+                    pass
+    return summary_rows, int(job.get('ok_count') or 0), rows_done
+
+
+def run_claimed_job(app, job_id, owner):
+    """Run (or resume) a job this worker claimed via batch_job_queue.claim_next_job."""
     with app.app_context():
         try:
-            job = _jobs.get(job_id)
-            if job and job.get('job_kind') == 'pdf':
-                _run_pdf_batch_inner(app, job_id)
-            else:
-                _run_job_inner(app, job_id)
-        except Exception as e:
-            job = _jobs.get(job_id)
-            if job:
-                job['status'] = 'error'
-                job['error'] = str(e)[:2000]
-                _flush_job_to_db(job_id, job)
+            row = BatchAppealJob.query.filter_by(job_id=job_id).first()
+            if row is None:
+                return
+            job = _job_from_claimed_row(row)
+            if not job.get('out_dir'):
+                job['out_dir'] = os.path.join(app.config['GENERATED_FOLDER'], f'batch_{job_id}')
+            os.makedirs(job['out_dir'], exist_ok=True)
+            with JobLease(app, job_id, owner) as lease:
+                job['lease'] = lease
+                with _jobs_lock:
+                    _jobs[job_id] = job
+                try:
+                    if job.get('job_kind') == 'pdf':
+                        _run_pdf_batch_inner(app, job_id)
+                    else:
+                        _run_job_inner(app, job_id)
+                except LeaseLost:
+                    db.session.rollback()
+                    logger.warning('Batch job %s taken over by another worker; stopping', job_id)
+                except JobParked as parked:
+                    db.session.rollback()
+                    if lease.park(parked.retry_after):
+                        logger.info('Batch job %s parked for %ss', job_id, parked.retry_after)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.exception('Batch job %s failed', job_id)
+                    job['status'] = 'error'
+                    job['error'] = str(e)[:2000]
+                    try:
+                        _flush_job_to_db(job_id, job)
+                        _settle_job_reservation(job_id, job, job['user_id'])
+                    except LeaseLost:
+                        pass
+                    except Exception:
+                        logger.exception('Batch job %s: credit reservation not settled', job_id)
+                logger.info(
+                    'Batch job %s %s: %s summary rows, %s progress DB round-trips',
+                    job_id,
+                    job.get('status'),
+                    len(job.get('summary_rows') or []),
+                    job.get('db_round_trips', 0),
+                )
         finally:
+            with _jobs_lock:
+                _jobs.pop(job_id, None)
             db.session.remove()
 
 
@@ -444,8 +608,8 @@ def _run_job_inner(app, job_id):
     out_dir = job['out_dir']
     defaults = job.get('defaults') or {}
 
-    summary_rows = []
-    ok_count = 0
+    summary_rows, ok_count, rows_done = _resume_state(job)
+    job['summary_rows'] = summary_rows
     user = User.query.get(uid)
     if not user:
         job['status'] = 'error'
@@ -456,6 +620,9 @@ def _run_job_inner(app, job_id):
     rows = []
     if job.get('rows') is not None:
         rows = [_normalize_row_keys(r) for r in (job.get('rows') or [])]
+    elif job.get('csv_text') is not None:
+        reader = csv.DictReader(io.StringIO(job['csv_text']))
+        rows = [_normalize_row_keys(r) for r in reader]
     else:
         if not csv_path:
             job['status'] = 'error'
@@ -489,29 +656,75 @@ def _run_job_inner(app, job_id):
     job['status'] = 'running'
     _flush_job_to_db(job_id, job)
 
-    for i, row in enumerate(rows):
-        job['current'] = i + 1
-        _flush_job_to_db(job_id, job)
-        rnum = i + 1
-        row = _normalize_row_keys(row)
-        ep, err = _row_to_ephemeral_appeal(row, defaults, i)
-        claim_hint = str(_gval(row, 'claim_number', ('claim_id',)) or '').strip() or '—'
+    # Built once: the economy letters and the PDFs / summary rows must carry the same claim numbers
+    eps = {
+        i + 1: _row_to_ephemeral_appeal(row, defaults, i, job_id)
+        for i, row in enumerate(rows)
+        if i + 1 > rows_done
+    }
+    letters = _economy_letters(job_id, job, uid, eps) if job.get('economy') else {}
+    window = OrderedRowWindow(wrap=_pool_app_context(app))
 
-        if err:
+    def complete(ctx, result, err):
+        nonlocal ok_count
+        if 'summary' in ctx:
+            summary_rows.append(ctx['summary'])
+            return
+        job['reservation'].record(err is None)
+        if err is not None:
             summary_rows.append(
                 {
-                    'row': rnum,
+                    'row': ctx['row'],
                     'source_file': '',
-                    'claim_number': claim_hint,
-                    'status': 'skipped',
-                    'reason': err,
+                    'claim_number': ctx['claim_number'],
+                    'status': 'error',
+                    'reason': str(err)[:500],
                     'seconds': '',
                 }
             )
+            return
+        _text, pdf_path, elapsed = result
+        ok_count += 1
+        job['ok_count'] = ok_count
+        summary_rows.append(
+            {
+                'row': ctx['row'],
+                'source_file': '',
+                'claim_number': ctx['claim_number'],
+                'status': 'ok',
+                'reason': '',
+                'seconds': round(elapsed, 2),
+                'pdf_name': os.path.basename(pdf_path),
+            }
+        )
+        _flush_job_to_db(job_id, job, force=False)
+
+    for i, row in enumerate(rows):
+        rnum = i + 1
+        if rnum <= rows_done:
+            continue
+        job['current'] = rnum
+        _flush_job_to_db(job_id, job, force=False)
+        ep, err = eps[rnum]
+        claim_hint = str(_gval(row, 'claim_number', ('claim_id',)) or '').strip() or '—'
+
+        if err:
+            skipped = {
+                'row': rnum,
+                'source_file': '',
+                'claim_number': claim_hint,
+                'status': 'skipped',
+                'reason': err,
+                'seconds': '',
+            }
+            for done in window.add_resolved({'summary': skipped}):
+                complete(*done)
             continue
 
-        allowed, _sub, used_free = CreditManager.try_begin_generation(uid)
-        if not allowed:
+        slot = _admit_row(job_id, job, uid, window, complete, len(rows) - i)
+        if slot is None:
+            for done in window.drain():
+                complete(*done)
             summary_rows.append(
                 {
                     'row': rnum,
@@ -525,66 +738,152 @@ def _run_job_inner(app, job_id):
             job['error'] = (
                 f'Insufficient credits at row {rnum} — partial ZIP contains rows processed before this point'
             )
-            _flush_job_to_db(job_id, job)
             break
 
+        ctx = {'row': rnum, 'claim_number': ep.claim_number, 'used_free': slot == SLOT_FREE_TRIAL}
+        for done in window.submit(ctx, render_row_pdf, ep, out_dir, rnum, letters.get(rnum)):
+            complete(*done)
+
+    for done in window.drain():
+        complete(*done)
+    _flush_job_to_db(job_id, job)
+    _settle_job_reservation(job_id, job, uid)
+
+    _finalize_batch_zip(job, summary_rows, ok_count, 'csv')
+
+
+def _economy_route(ep, structured, saved=None):
+    """
+    Routing decision for an economy row, stored on ep.routing_decision_json as
+    AdvancedAIAppealGenerator._route does. A decision checkpointed with the batch is reused.
+    """
+    route = saved
+    if route is None:
         try:
-            t0 = time.perf_counter()
-            if not getattr(advanced_ai_generator, 'enabled', True):
-                text = f"Batch appeal draft for claim {ep.claim_number}\n\n{ep.denial_reason}"
-            else:
-                text = advanced_ai_generator.generate_appeal_content(ep)
-            ep.generated_letter_text = text
-            pdf_bytes = build_professional_pdf_bytes(ep)
-            fname = build_appeal_pdf_filename(ep)
-            safe = re.sub(r'[^\w\-.]+', '_', fname)
-            stem, ext = os.path.splitext(safe)
-            if not ext:
-                ext = '.pdf'
-            safe_unique = f'{stem}_r{rnum}{ext}'
-            pdf_path = os.path.join(out_dir, safe_unique)
-            with open(pdf_path, 'wb') as out:
-                out.write(pdf_bytes)
-            ok_count += 1
-            job['ok_count'] = ok_count
-            _flush_job_to_db(job_id, job)
-            elapsed = time.perf_counter() - t0
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': '',
-                    'claim_number': ep.claim_number,
-                    'status': 'ok',
-                    'reason': '',
-                    'seconds': round(elapsed, 2),
-                }
-            )
-            CreditManager.increment_usage(uid, used_free_trial=used_free)
-            usage_stats = CreditManager.get_usage_stats(uid)
-            sub_id = getattr(user, 'stripe_subscription_id', None)
-            if (
-                usage_stats
-                and usage_stats.get('overage_count', 0) > 0
-                and sub_id
-                and not used_free
-            ):
-                try:
-                    StripeBilling.report_overage_usage(uid, quantity=1)
-                except Exception:
-                    pass
+            route = route_appeal(structured)
         except Exception as e:
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': '',
-                    'claim_number': ep.claim_number,
-                    'status': 'error',
-                    'reason': str(e)[:500],
-                    'seconds': '',
-                }
+            logger.warning('Appeal routing failed for %s, using standard tier: %s', ep.appeal_id, e)
+            route = {'tier': TIER_STANDARD, 'use_llm': True, 'model': None, 'max_tokens': 4000, 'reasons': ['routing error']}
+    ep.routing_decision_json = json.dumps(route, default=str)
+    return route
+
+
+def _economy_letters(job_id, job, uid, eps):
+    """
+    Economy mode: letters for the remaining valid rows from one OpenAI Batch API submission.
+    Credits are reserved first and only rows holding a slot are sent. Each row is routed like a
+    synchronous generation: deterministic-tier rows are rendered here and never sent, the others
+    go out with their tier's model and max_tokens. The batch id and the routing decisions are
+    checkpointed in the job payload. While the batch runs (hours, at worst) the job raises
+    JobParked, so the worker slot is freed and a later claim polls again, without paying twice.
+    Returns {row number: letter}. Lines that fail (or a batch that fails / expires, or is still
+    running after OPENAI_BATCH_MAX_WAIT_SECONDS) get the deterministic letter. If the
+    submission itself fails, only the deterministic rows are returned and the rest go down the
+    usual per-row path.
+    """
+    pending = [(rnum, ep) for rnum, (ep, err) in eps.items() if not err]
+    if not pending:
+        return {}
+    if job.get('reservation') is None:
+        CreditManager.reset_usage_counters_if_needed(uid)
+        _reserve_for_job(job_id, job, uid, len(pending))
+    reservation = job.get('reservation')
+    available = len(reservation) - len(reservation.state['outcomes']) if reservation is not None else 0
+    structured = {rnum: build_structured_intake_from_appeal(ep) for rnum, ep in pending[:available]}
+    if not structured:
+        return {}
+    saved = (job.get('economy_batch') or {}).get('routes') or {}
+    routes = {
+        rnum: _economy_route(ep, structured[rnum], saved.get(str(rnum)))
+        for rnum, ep in pending[:available]
+    }
+    letters = {
+        rnum: render_deterministic_submission_appeal(s)
+        for rnum, s in structured.items()
+        if not routes[rnum]['use_llm']
+    }
+    structured = {rnum: s for rnum, s in structured.items() if routes[rnum]['use_llm']}
+    if not structured:
+        return letters
+
+    client = OpenAIBatchClient()
+    batch_id = (job.get('economy_batch') or {}).get('id')
+    if not batch_id:
+        lines = [
+            (
+                f'row-{rnum}',
+                submission_appeal_request_body(s, routes[rnum]['model'], routes[rnum]['max_tokens'] or 4000),
             )
+            for rnum, s in structured.items()
+        ]
+        try:
+            batch_id = client.submit(lines, metadata={'job_id': job_id})
+        except BatchAPIError as e:
+            logger.warning('Batch job %s: economy submission failed, generating per row: %s', job_id, e)
+            return letters
+        job['economy_batch'] = {
+            'id': batch_id,
+            'submitted_at': time.time(),
+            'routes': {str(rnum): route for rnum, route in routes.items()},
+        }
+        _checkpoint_payload(job_id, job)
+        logger.info(
+            'Batch job %s: %s rows submitted as OpenAI batch %s (%s deterministic)',
+            job_id, len(structured), batch_id, len(letters),
+        )
 
-    _finalize_batch_zip(job, summary_rows, ok_count, 'csv')
+    results = {}
+    try:
+        batch = client.retrieve(batch_id)
+        status = batch.get('status')
+        if status in TERMINAL_STATUSES:
+            results = client.results(batch)
+            if status != 'completed':
+                logger.warning('Batch job %s: OpenAI batch %s ended %s', job_id, batch_id, status)
+        else:
+            submitted_at = (job.get('economy_batch') or {}).get('submitted_at') or time.time()
+            if time.time() - submitted_at < MAX_WAIT_SECONDS:
+                raise JobParked(POLL_SECONDS)
+            client.cancel(batch_id)
+            logger.warning('Batch job %s: OpenAI batch %s not finished in time (status %s)', job_id, batch_id, status)
+    except BatchAPIError as e:
+        logger.warning('Batch job %s: OpenAI batch %s failed: %s', job_id, batch_id, e)
+
+    for rnum, s in structured.items():
+        letters[rnum] = results.get(f'row-{rnum}') or render_deterministic_submission_appeal(s)
+    return letters
+
+
+def _parse_block_at_batch_priority(block):
+    with llm_priority(PRIORITY_BATCH):
+        return parse_claim_blocks([block])[0]
+
+
+def _segment_pdf_items(job_id, job, items):
+    """
+    Claim units of a PDF batch in row order: [(label, block, error)]. A multi-claim remittance
+    becomes one unit per claim block; a file whose text cannot be extracted becomes one unit
+    with error set. Text extraction is cached, so a resumed job segments again cheaply.
+    """
+    parser = DenialLetterParser()
+    units = []
+    for i, item in enumerate(items):
+        path = item.get('path')
+        label = item.get('name') or (os.path.basename(path) if path else f'file_{i + 1}')
+        try:
+            text = parser.extract_text_from_pdf(path)
+        except Exception as e:
+            err_msg = str(e) if isinstance(e, ValueError) else str(e)[:500]
+            units.append((label, None, f'extraction failed: {err_msg}'))
+            continue
+        if not text:
+            units.append((label, None, 'Could not extract text from PDF'))
+            continue
+        blocks = segment_claims(text)
+        for k, block in enumerate(blocks, start=1):
+            units.append((f'{label} (claim {k}/{len(blocks)})' if len(blocks) > 1 else label, block, None))
+        _flush_job_to_db(job_id, job, force=False)
+    return units
 
 
 def _run_pdf_batch_inner(app, job_id):
@@ -596,18 +895,22 @@ def _run_pdf_batch_inner(app, job_id):
     defaults = job.get('defaults') or {}
     items = job.get('pdf_items') or []
 
-    summary_rows = []
-    ok_count = 0
+    lease_lost = False
     try:
-        _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items, summary_rows)
+        _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items)
+    except LeaseLost:
+        # Uploaded PDFs stay on disk for the worker that now owns the job
+        lease_lost = True
+        raise
     finally:
         td = job.get('pdf_temp_dir')
-        if td and os.path.isdir(td):
+        if not lease_lost and td and os.path.isdir(td):
             shutil.rmtree(td, ignore_errors=True)
 
 
-def _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items, summary_rows):
-    ok_count = 0
+def _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items):
+    summary_rows, ok_count, rows_done = _resume_state(job)
+    job['summary_rows'] = summary_rows
     user = User.query.get(uid)
     if not user:
         job['status'] = 'error'
@@ -626,68 +929,110 @@ def _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items, summar
         _flush_job_to_db(job_id, job)
         return
 
-    job['total'] = len(items)
     job['status'] = 'running'
     _flush_job_to_db(job_id, job)
 
-    for i, item in enumerate(items):
-        job['current'] = i + 1
+    units = _segment_pdf_items(job_id, job, items)
+    if len(units) > MAX_PDF_BATCH_CLAIMS:
+        job['status'] = 'error'
+        job['error'] = f'Maximum {MAX_PDF_BATCH_CLAIMS} claims per batch (uploaded files contain {len(units)})'
         _flush_job_to_db(job_id, job)
-        rnum = i + 1
-        path = item.get('path')
-        label = item.get('name') or (os.path.basename(path) if path else f'file_{rnum}')
+        return
+    job['total'] = len(units)
+    _flush_job_to_db(job_id, job)
 
-        parse = None
-        err_msg = None
-        try:
-            parse = parse_denial_pdf(path)
-        except ValueError as e:
-            err_msg = str(e)
-        except Exception as e:
-            err_msg = str(e)[:500]
+    wrap = _pool_app_context(current_app._get_current_object())
+    window = OrderedRowWindow(wrap=wrap)
 
-        if err_msg:
+    def complete(ctx, result, err):
+        nonlocal ok_count
+        if 'summary' in ctx:
+            summary_rows.append(ctx['summary'])
+            return
+        if err is None:
+            text, pdf_path, elapsed = result
+            try:
+                t0 = time.perf_counter()
+                _persist_pdf_batch_appeal_row(uid, ctx['ep'], text, pdf_path, ctx['label'], ctx['used_free'])
+                elapsed += time.perf_counter() - t0
+            except Exception as e:
+                db.session.rollback()
+                err = e
+        job['reservation'].record(err is None)
+        if err is not None:
             summary_rows.append(
                 {
-                    'row': rnum,
-                    'source_file': label,
-                    'claim_number': '—',
-                    'status': 'skipped',
-                    'reason': f'extraction failed: {err_msg}',
+                    'row': ctx['row'],
+                    'source_file': ctx['label'],
+                    'claim_number': ctx['ep'].claim_number,
+                    'status': 'error',
+                    'reason': str(err)[:500],
                     'seconds': '',
                 }
             )
+            return
+        ok_count += 1
+        job['ok_count'] = ok_count
+        summary_rows.append(
+            {
+                'row': ctx['row'],
+                'source_file': ctx['label'],
+                'claim_number': ctx['ep'].claim_number,
+                'status': 'ok',
+                'reason': '',
+                'seconds': round(elapsed, 2),
+                'pdf_name': os.path.basename(pdf_path),
+            }
+        )
+        # The Appeal row is committed: checkpoint now, or a re-claimed job would redo this row
+        # (duplicate Appeal + events, hooks fired again, its PDF removed by _resume_state)
+        _flush_job_to_db(job_id, job)
+
+    def skip(rnum, label, reason):
+        row = {
+            'row': rnum,
+            'source_file': label,
+            'claim_number': '—',
+            'status': 'skipped',
+            'reason': reason,
+            'seconds': '',
+        }
+        for done in window.add_resolved({'summary': row}):
+            complete(*done)
+
+    parsed = prefetch_ordered(
+        lambda entry: _parse_block_at_batch_priority(entry[1][1]) if entry[1][1] is not None else None,
+        [(i, unit) for i, unit in enumerate(units) if i + 1 > rows_done],
+        size=window.size,
+        wrap=wrap,
+    )
+    for (i, (label, _block, seg_err)), parse, parse_exc in parsed:
+        rnum = i + 1
+        job['current'] = rnum
+        _flush_job_to_db(job_id, job, force=False)
+
+        if seg_err is not None:
+            skip(rnum, label, seg_err)
+            continue
+
+        if parse_exc is not None:
+            err_msg = str(parse_exc) if isinstance(parse_exc, ValueError) else str(parse_exc)[:500]
+            skip(rnum, label, f'extraction failed: {err_msg}')
             continue
 
         if not parse.get('success'):
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': label,
-                    'claim_number': '—',
-                    'status': 'skipped',
-                    'reason': str(parse.get('error') or parse.get('message') or 'extraction failed'),
-                    'seconds': '',
-                }
-            )
+            skip(rnum, label, str(parse.get('error') or parse.get('message') or 'extraction failed'))
             continue
 
         ep, perr = _parse_pdf_to_ephemeral(parse, defaults, i, label)
         if perr:
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': label,
-                    'claim_number': '—',
-                    'status': 'skipped',
-                    'reason': perr,
-                    'seconds': '',
-                }
-            )
+            skip(rnum, label, perr)
             continue
 
-        allowed, _sub, used_free = CreditManager.try_begin_generation(uid)
-        if not allowed:
+        slot = _admit_row(job_id, job, uid, window, complete, len(units) - i)
+        if slot is None:
+            for done in window.drain():
+                complete(*done)
             summary_rows.append(
                 {
                     'row': rnum,
@@ -699,67 +1044,18 @@ def _run_pdf_batch_inner_core(job_id, job, uid, out_dir, defaults, items, summar
                 }
             )
             job['error'] = (
-                f'Insufficient credits at file {rnum} — partial ZIP contains appeals generated before this point'
+                f'Insufficient credits at claim {rnum} — partial ZIP contains appeals generated before this point'
             )
-            _flush_job_to_db(job_id, job)
             break
 
-        try:
-            t0 = time.perf_counter()
-            if not getattr(advanced_ai_generator, 'enabled', True):
-                text = f"Batch appeal draft for claim {ep.claim_number}\n\n{ep.denial_reason}"
-            else:
-                text = advanced_ai_generator.generate_appeal_content(ep)
-            ep.generated_letter_text = text
-            pdf_bytes = build_professional_pdf_bytes(ep)
-            fname = build_appeal_pdf_filename(ep)
-            safe = re.sub(r'[^\w\-.]+', '_', fname)
-            stem, ext = os.path.splitext(safe)
-            if not ext:
-                ext = '.pdf'
-            safe_unique = f'{stem}_r{rnum}{ext}'
-            pdf_path = os.path.join(out_dir, safe_unique)
-            with open(pdf_path, 'wb') as out:
-                out.write(pdf_bytes)
-            _persist_pdf_batch_appeal_row(uid, ep, text, pdf_path, label, used_free)
-            ok_count += 1
-            job['ok_count'] = ok_count
-            _flush_job_to_db(job_id, job)
-            elapsed = time.perf_counter() - t0
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': label,
-                    'claim_number': ep.claim_number,
-                    'status': 'ok',
-                    'reason': '',
-                    'seconds': round(elapsed, 2),
-                }
-            )
-            CreditManager.increment_usage(uid, used_free_trial=used_free)
-            usage_stats = CreditManager.get_usage_stats(uid)
-            sub_id = getattr(user, 'stripe_subscription_id', None)
-            if (
-                usage_stats
-                and usage_stats.get('overage_count', 0) > 0
-                and sub_id
-                and not used_free
-            ):
-                try:
-                    StripeBilling.report_overage_usage(uid, quantity=1)
-                except Exception:
-                    pass
-        except Exception as e:
-            summary_rows.append(
-                {
-                    'row': rnum,
-                    'source_file': label,
-                    'claim_number': ep.claim_number,
-                    'status': 'error',
-                    'reason': str(e)[:500],
-                    'seconds': '',
-                }
-            )
+        ctx = {'row': rnum, 'label': label, 'ep': ep, 'claim_number': ep.claim_number, 'used_free': slot == SLOT_FREE_TRIAL}
+        for done in window.submit(ctx, render_row_pdf, ep, out_dir, rnum):
+            complete(*done)
+
+    for done in window.drain():
+        complete(*done)
+    _flush_job_to_db(job_id, job)
+    _settle_job_reservation(job_id, job, uid)
 
     _finalize_batch_zip(job, summary_rows, ok_count, 'pdf_multi')
 
@@ -782,88 +1078,77 @@ def _base_job_dict(user_id, out_dir, defaults):
         'rows': None,
         'pdf_items': None,
         'pdf_temp_dir': None,
+        'economy': False,
+        'economy_batch': None,
     }
 
 
-def start_batch_job(app, user_id, csv_path, defaults=None):
-    job_id = uuid.uuid4().hex
+def _enqueue_job(app, user_id, defaults, job_id=None, **fields):
+    """Insert a queued BatchAppealJob carrying everything a worker needs; returns job_id."""
+    job_id = job_id or uuid.uuid4().hex
     out_dir = os.path.join(app.config['GENERATED_FOLDER'], f'batch_{job_id}')
     os.makedirs(out_dir, exist_ok=True)
     job = _base_job_dict(user_id, out_dir, defaults)
     job['job_id'] = job_id
-    job['csv_path'] = csv_path
-    job['job_kind'] = 'csv'
-    with _jobs_lock:
-        _jobs[job_id] = job
+    job.update(fields)
     try:
         _insert_job_record(job_id, job)
     except Exception:
         db.session.rollback()
-        with _jobs_lock:
-            _jobs.pop(job_id, None)
+        shutil.rmtree(out_dir, ignore_errors=True)
         raise
-    t = threading.Thread(target=_run_job, args=(app, job_id), daemon=True)
-    t.start()
+    notify_new_job()
     return job_id
 
 
-def start_batch_job_from_rows(app, user_id, rows, defaults=None):
-    job_id = uuid.uuid4().hex
-    out_dir = os.path.join(app.config['GENERATED_FOLDER'], f'batch_{job_id}')
-    os.makedirs(out_dir, exist_ok=True)
-    job = _base_job_dict(user_id, out_dir, defaults)
-    job['job_id'] = job_id
-    job['rows'] = list(rows or [])
-    job['job_kind'] = 'csv'
-    with _jobs_lock:
-        _jobs[job_id] = job
+def start_batch_job(app, user_id, csv_path, defaults=None, economy=False):
+    """
+    economy=True generates every row's letter through one OpenAI Batch API submission
+    (discounted, off the synchronous rate limits, may take hours) instead of per-row calls.
+    """
+    with open(csv_path, 'r', encoding='utf-8', errors='replace') as f:
+        csv_text = f.read()
+    job_id = _enqueue_job(
+        app, user_id, defaults, job_kind='csv', csv_text=csv_text, economy=bool(economy)
+    )
     try:
-        _insert_job_record(job_id, job)
-    except Exception:
-        db.session.rollback()
-        with _jobs_lock:
-            _jobs.pop(job_id, None)
-        raise
-    t = threading.Thread(target=_run_job, args=(app, job_id), daemon=True)
-    t.start()
+        os.unlink(csv_path)
+    except OSError:
+        pass
     return job_id
 
 
+def start_batch_job_from_rows(app, user_id, rows, defaults=None, economy=False):
+    return _enqueue_job(
+        app, user_id, defaults, job_kind='csv', rows=list(rows or []), economy=bool(economy)
+    )
+
+
 def start_pdf_batch_job(app, user_id, pdf_items, defaults=None, pdf_temp_dir=None):
+    """
+    Uploads are moved under GENERATED_FOLDER (batch_<id>/input) so whichever worker claims the
+    job, including after a restart, can read them.
+    """
     job_id = uuid.uuid4().hex
-    out_dir = os.path.join(app.config['GENERATED_FOLDER'], f'batch_{job_id}')
-    os.makedirs(out_dir, exist_ok=True)
-    job = _base_job_dict(user_id, out_dir, defaults)
-    job['job_id'] = job_id
-    job['pdf_items'] = list(pdf_items or [])
-    job['job_kind'] = 'pdf'
-    job['pdf_temp_dir'] = pdf_temp_dir
-    with _jobs_lock:
-        _jobs[job_id] = job
-    try:
-        _insert_job_record(job_id, job)
-    except Exception:
-        db.session.rollback()
-        with _jobs_lock:
-            _jobs.pop(job_id, None)
-        raise
-    t = threading.Thread(target=_run_job, args=(app, job_id), daemon=True)
-    t.start()
-    return job_id
+    input_dir = os.path.join(app.config['GENERATED_FOLDER'], f'batch_{job_id}', 'input')
+    os.makedirs(input_dir, exist_ok=True)
+    items = []
+    for item in pdf_items or []:
+        src = item.get('path')
+        dest = os.path.join(input_dir, os.path.basename(src)) if src else None
+        if src and os.path.isfile(src):
+            shutil.move(src, dest)
+        items.append(dict(item, path=dest))
+    if pdf_temp_dir and os.path.isdir(pdf_temp_dir):
+        shutil.rmtree(pdf_temp_dir, ignore_errors=True)
+    return _enqueue_job(
+        app, user_id, defaults, job_id=job_id, job_kind='pdf', pdf_items=items, pdf_temp_dir=input_dir
+    )
 
 
 def get_job(job_id):
-    with _jobs_lock:
-        cached = _jobs.get(job_id)
-        if cached is not None:
-            return cached
+    """Status view from the durable row (the job may be running in another worker process)."""
     row = BatchAppealJob.query.filter_by(job_id=job_id).first()
     if row is None:
         return None
-    d = _job_row_to_dict(row)
-    with _jobs_lock:
-        existing = _jobs.get(job_id)
-        if existing is not None:
-            return existing
-        _jobs[job_id] = d
-        return d
+    return _job_row_to_dict(row)
@@ -0,0 +1,241 @@
+"""
+Durable batch job queue on batch_appeal_jobs.
+
+Web requests insert a 'queued' row (with its worker payload) and return; worker processes claim
+rows with SELECT … FOR UPDATE SKIP LOCKED, hold a time-limited lease renewed by a heartbeat thread,
+and checkpoint summary_rows as they go. A worker that dies (deploy, OOM, recycle) stops renewing;
+once its lease expires the job is claimable again and the next worker resumes after the last
+completed row. Jobs that are interrupted BATCH_MAX_ATTEMPTS times are failed by
+sweep_interrupted_batch_jobs. A job waiting on something external (an OpenAI Batch API run)
+raises JobParked; the worker hands it back with a not-before time instead of holding a slot,
+and that re-claim does not count as an attempt.
+
+Env:
+  BATCH_LEASE_SECONDS      lease length granted per claim / heartbeat
+  BATCH_HEARTBEAT_SECONDS  heartbeat interval (keep well under the lease)
+  BATCH_MAX_ATTEMPTS       claims per job before it is failed
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default, minimum=1):
+    try:
+        return max(minimum, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+LEASE_SECONDS = _env_int('BATCH_LEASE_SECONDS', 90)
+HEARTBEAT_SECONDS = _env_int('BATCH_HEARTBEAT_SECONDS', 15)
+MAX_ATTEMPTS = _env_int('BATCH_MAX_ATTEMPTS', 3)
+
+_CLAIMABLE = (
+    "(status = 'queued' OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < :now))) "
+    "AND attempts < :max_attempts"
+)
+
+_wake = threading.Event()
+
+
+class LeaseLost(Exception):
+    """Another worker now owns the job (our lease expired); stop without writing further state."""
+
+
+class JobParked(Exception):
+    """The job is waiting on external work; hand it back until retry_after seconds from now."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'parked for {retry_after}s')
+        self.retry_after = retry_after
+
+
+def new_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def notify_new_job():
+    """Wake workers in this process so a freshly queued job does not wait for the next poll."""
+    _wake.set()
+
+
+def wait_for_job(timeout):
+    woke = _wake.wait(timeout)
+    _wake.clear()
+    return woke
+
+
+def claim_next_job(owner, now=None):
+    """
+    Claim the oldest queued job (or running job whose lease expired) for `owner`.
+    Returns job_id, or None when nothing is claimable. Must run inside an app context.
+    """
+    now = now or datetime.utcnow()
+    params = {
+        'now': now,
+        'owner': owner,
+        'expires': now + timedelta(seconds=LEASE_SECONDS),
+        'max_attempts': MAX_ATTEMPTS,
+    }
+    with db.engine.begin() as conn:
+        if db.engine.dialect.name == 'postgresql':
+            row = conn.execute(
+                text(
+                    f"""WITH next AS (
+                        SELECT job_id FROM batch_appeal_jobs
+                        WHERE {_CLAIMABLE}
+                        ORDER BY created_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE batch_appeal_jobs j
+                    SET status = 'running', lease_owner = :owner, lease_expires_at = :expires,
+                        heartbeat_at = :now, attempts = j.attempts + 1, updated_at = :now
+                    FROM next WHERE j.job_id = next.job_id
+                    RETURNING j.job_id"""
+                ),
+                params,
+            ).first()
+            return row[0] if row else None
+
+        # SQLite (dev/tests): no row locks, so claim with a compare-and-set UPDATE instead
+        candidates = conn.execute(
+            text(f'SELECT job_id FROM batch_appeal_jobs WHERE {_CLAIMABLE} ORDER BY created_at LIMIT 5'),
+            params,
+        ).fetchall()
+        for (job_id,) in candidates:
+            res = conn.execute(
+                text(
+                    f"""UPDATE batch_appeal_jobs
+                    SET status = 'running', lease_owner = :owner, lease_expires_at = :expires,
+                        heartbeat_at = :now, attempts = attempts + 1, updated_at = :now
+                    WHERE job_id = :job_id AND {_CLAIMABLE}"""
+                ),
+                dict(params, job_id=job_id),
+            )
+            if res.rowcount == 1:
+                return job_id
+    return None
+
+
+def renew_lease(job_id, owner, now=None):
+    """Heartbeat: extend the lease if `owner` still holds it. Returns False when the lease was lost."""
+    now = now or datetime.utcnow()
+    with db.engine.begin() as conn:
+        res = conn.execute(
+            text(
+                """UPDATE batch_appeal_jobs
+                SET heartbeat_at = :now, lease_expires_at = :expires
+                WHERE job_id = :job_id AND lease_owner = :owner"""
+            ),
+            {
+                'now': now,
+                'expires': now + timedelta(seconds=LEASE_SECONDS),
+                'job_id': job_id,
+                'owner': owner,
+            },
+        )
+        return res.rowcount == 1
+
+
+def release_lease(job_id, owner):
+    """Drop the lease after the job reached a terminal state (done / error)."""
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                """UPDATE batch_appeal_jobs SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE job_id = :job_id AND lease_owner = :owner"""
+            ),
+            {'job_id': job_id, 'owner': owner},
+        )
+
+
+def park_job(job_id, owner, not_before, now=None):
+    """
+    Drop `owner`'s lease but keep the job unclaimable until not_before (lease_expires_at holds
+    it), and take back the attempt its claim counted. Returns False when the lease was lost.
+    """
+    now = now or datetime.utcnow()
+    with db.engine.begin() as conn:
+        res = conn.execute(
+            text(
+                """UPDATE batch_appeal_jobs
+                SET lease_owner = NULL, lease_expires_at = :not_before, updated_at = :now,
+                    attempts = CASE WHEN attempts > 0 THEN attempts - 1 ELSE 0 END
+                WHERE job_id = :job_id AND lease_owner = :owner"""
+            ),
+            {'now': now, 'not_before': not_before, 'job_id': job_id, 'owner': owner},
+        )
+        return res.rowcount == 1
+
+
+class JobLease:
+    """
+    Heartbeat thread for one claimed job. check() raises LeaseLost once a renewal fails,
+    so the job thread stops before overwriting state owned by the worker that took over.
+    """
+
+    def __init__(self, app, job_id, owner, interval=None):
+        self.app = app
+        self.job_id = job_id
+        self.owner = owner
+        self.interval = interval or HEARTBEAT_SECONDS
+        self.lost = threading.Event()
+        self.parked = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    ok = renew_lease(self.job_id, self.owner)
+            except Exception:
+                logger.exception('Batch job heartbeat failed job_id=%s', self.job_id)
+                continue
+            if not ok:
+                logger.warning('Batch job lease lost job_id=%s owner=%s', self.job_id, self.owner)
+                self.lost.set()
+                return
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLost(self.job_id)
+
+    def park(self, retry_after):
+        """Stop heartbeating and park the job (park_job) instead of releasing it at exit."""
+        self._stop.set()
+        self._thread.join(timeout=5)
+        if self.lost.is_set():
+            return False
+        with self.app.app_context():
+            self.parked = park_job(self.job_id, self.owner, datetime.utcnow() + timedelta(seconds=retry_after))
+        return self.parked
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._beat, name=f'batch-heartbeat-{self.job_id[:8]}', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        if not self.lost.is_set() and not self.parked:
+            try:
+                with self.app.app_context():
+                    release_lease(self.job_id, self.owner)
+            except Exception:
+                logger.exception('Batch job lease release failed job_id=%s', self.job_id)
+        return False
@@ -0,0 +1,137 @@
+"""
+Coalesced progress writes for batch appeal jobs.
+
+The job thread updates the in-memory job dict freely and calls maybe_flush() after each row;
+BatchProgress writes to batch_appeal_jobs only every BATCH_PROGRESS_FLUSH_ROWS summary rows or
+BATCH_PROGRESS_FLUSH_SECONDS, whichever comes first. flush() is forced for terminal states and
+after rows with committed side effects (a PDF batch row's Appeal insert), so a resumed job never
+redoes them.
+Each write is one UPDATE that appends just the summary rows added since the previous write
+(jsonb concatenation on PostgreSQL) instead of re-sending the whole array, together with the
+job's credit reservation state so row outcomes and billing checkpoint atomically. Writes are counted
+in db_round_trips so the per-job cost is visible on the job row.
+
+Env:
+  BATCH_PROGRESS_FLUSH_ROWS     summary rows buffered before a write
+  BATCH_PROGRESS_FLUSH_SECONDS  max seconds between writes while rows are completing
+"""
+import json
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from batch_job_queue import LeaseLost
+from models import db
+
+
+def _env_num(name, default, cast=int):
+    try:
+        return max(cast(0), cast(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+FLUSH_ROWS = _env_num('BATCH_PROGRESS_FLUSH_ROWS', 10)
+FLUSH_SECONDS = _env_num('BATCH_PROGRESS_FLUSH_SECONDS', 2.0, float)
+
+_SCALAR_FIELDS = ('status', 'job_kind', 'total', 'current', 'ok_count', 'error', 'zip_path', 'zip_name')
+
+
+def _json_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    return str(o)
+
+
+class BatchProgress:
+    """
+    Write-behind view of one job's durable fields. `on_flush` runs after every successful write
+    (the worker uses it to record usage only for rows whose checkpoint is durable).
+    """
+
+    def __init__(self, job_id, job, owner=None, every_rows=None, every_seconds=None, on_flush=None):
+        self.job_id = job_id
+        self.job = job
+        self.owner = owner
+        self.every_rows = FLUSH_ROWS if every_rows is None else every_rows
+        self.every_seconds = FLUSH_SECONDS if every_seconds is None else every_seconds
+        self.on_flush = on_flush
+        # Rows already in the DB (a resumed job starts from its checkpoint)
+        self.persisted_rows = len(job.get('summary_rows') or [])
+        self.round_trips = int(job.get('db_round_trips') or 0)
+        self._last_flush = time.monotonic()
+        self._persisted_scalars = self._scalars()
+
+    def _scalars(self):
+        return tuple(self.job.get(f) for f in _SCALAR_FIELDS) + (self._reservation_json(),)
+
+    def _reservation_json(self):
+        state = self.job.get('credit_reservation')
+        return json.dumps(state) if state is not None else None
+
+    def pending_rows(self):
+        return len(self.job.get('summary_rows') or []) - self.persisted_rows
+
+    def maybe_flush(self):
+        """Flush if the row or time cadence is due and something changed; returns True if it wrote."""
+        pending = self.pending_rows()
+        if pending >= max(1, self.every_rows):
+            self.flush()
+            return True
+        if time.monotonic() - self._last_flush < self.every_seconds:
+            return False
+        if pending <= 0 and self._scalars() == self._persisted_scalars:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        """Write scalars + new summary rows now. Raises LeaseLost if another worker owns the job."""
+        rows = list(self.job.get('summary_rows') or [])
+        new_rows = rows[self.persisted_rows:]
+        self.round_trips += 1
+        params = {f: self.job.get(f) for f in _SCALAR_FIELDS}
+        params.update(
+            credit_reservation=self._reservation_json(),
+            job_id=self.job_id,
+            owner=self.owner,
+            trips=self.round_trips,
+            now=datetime.utcnow(),
+        )
+        if db.engine.dialect.name == 'postgresql':
+            params['new_rows'] = json.dumps(new_rows, default=_json_default)
+            summary_sql = (
+                "summary_rows = CAST(COALESCE(CAST(summary_rows AS jsonb), '[]'::jsonb) "
+                "|| CAST(:new_rows AS jsonb) AS json)"
+            )
+        else:
+            # SQLite (dev/tests) has no cheap append; rewrite the array
+            params['all_rows'] = json.dumps(rows, default=_json_default)
+            summary_sql = 'summary_rows = :all_rows'
+        lease_sql = ' AND lease_owner = :owner' if self.owner else ''
+        with db.engine.begin() as conn:
+            res = conn.execute(
+                text(
+                    f"""UPDATE batch_appeal_jobs SET
+                        status = COALESCE(:status, status), job_kind = COALESCE(:job_kind, job_kind),
+                        total = :total, current = :current, ok_count = :ok_count, error = :error,
+                        zip_path = :zip_path, zip_name = :zip_name, {summary_sql},
+                        credit_reservation = :credit_reservation,
+                        db_round_trips = :trips, updated_at = :now
+                    WHERE job_id = :job_id{lease_sql}"""
+                ),
+                params,
+            )
+        if self.owner and res.rowcount == 0:
+            raise LeaseLost(self.job_id)
+        self.persisted_rows = len(rows)
+        self._persisted_scalars = tuple(params[f] for f in _SCALAR_FIELDS) + (params['credit_reservation'],)
+        self.job['db_round_trips'] = self.round_trips
+        self._last_flush = time.monotonic()
+        if self.on_flush is not None:
+            self.on_flush()
@@ -0,0 +1,168 @@
+"""
+Bounded concurrent row execution for batch appeal jobs.
+
+Rows are admitted by the job thread in CSV / upload order (credit checks stay there), the slow
+part (LLM letter + PDF render + disk write) runs on a process-wide thread pool, and results are
+handed back in admission order so summary_rows, usage accounting and partial-ZIP cut-offs match
+the sequential worker exactly.
+
+Env:
+  BATCH_ROW_CONCURRENCY    rows in flight per job (1 = legacy sequential, runs inline)
+  BATCH_MAX_INFLIGHT_ROWS  rows in flight across all jobs in this process
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from advanced_ai_generator import advanced_ai_generator
+from appeal_pdf_builder import build_professional_pdf_bytes, build_appeal_pdf_filename
+from llm_governor import PRIORITY_BATCH, llm_priority
+
+
+def _env_int(name, default, minimum=1):
+    try:
+        return max(minimum, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+BATCH_ROW_CONCURRENCY = _env_int('BATCH_ROW_CONCURRENCY', 4)
+BATCH_MAX_INFLIGHT_ROWS = _env_int('BATCH_MAX_INFLIGHT_ROWS', 8)
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def get_row_pool():
+    """Process-wide executor shared by every batch job (caps total in-flight rows)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=BATCH_MAX_INFLIGHT_ROWS,
+                thread_name_prefix='batch-row',
+            )
+        return _pool
+
+
+class _Resolved:
+    """Future-like holder for rows that finished inline (or never needed the pool)."""
+
+    def __init__(self, result=None, error=None):
+        self._result = result
+        self._error = error
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def _run_captured(fn, args):
+    try:
+        return _Resolved(result=fn(*args))
+    except Exception as e:
+        return _Resolved(error=e)
+
+
+class OrderedRowWindow:
+    """
+    Sliding window of in-flight rows. submit() blocks on the oldest row once the window is full;
+    every call returns the rows that completed, always in submission order, as
+    (context, result, error) tuples. `wrap` decorates callables that go to the pool
+    (e.g. to push an app context); size 1 runs inline on the caller's thread.
+    """
+
+    def __init__(self, size=None, executor=None, wrap=None):
+        self.size = max(1, int(size or BATCH_ROW_CONCURRENCY))
+        self._executor = executor
+        self._wrap = wrap
+        self._pending = deque()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def count(self, predicate):
+        return sum(1 for ctx, _f in self._pending if predicate(ctx))
+
+    def _pop(self):
+        ctx, fut = self._pending.popleft()
+        try:
+            return ctx, fut.result(), None
+        except Exception as e:
+            return ctx, None, e
+
+    def _start(self, fn, args):
+        if self.size == 1:
+            return _run_captured(fn, args)
+        if self._wrap is not None:
+            fn = self._wrap(fn)
+        executor = self._executor or get_row_pool()
+        return executor.submit(fn, *args)
+
+    def submit(self, context, fn, *args):
+        done = []
+        while len(self._pending) >= self.size:
+            done.append(self._pop())
+        self._pending.append((context, self._start(fn, args)))
+        return done
+
+    def add_resolved(self, context, result=None):
+        """Queue an already-finished row (e.g. skipped) so it keeps its place in the ordering."""
+        done = []
+        while len(self._pending) >= self.size:
+            done.append(self._pop())
+        self._pending.append((context, _Resolved(result=result)))
+        return done
+
+    def drain(self):
+        done = []
+        while self._pending:
+            done.append(self._pop())
+        return done
+
+
+def prefetch_ordered(fn, items, size=None, executor=None, wrap=None):
+    """Yield (item, result, error) for fn(item) in input order, keeping up to `size` calls running."""
+    window = OrderedRowWindow(size=size, executor=executor, wrap=wrap)
+    for item in items:
+        for ctx, result, err in window.submit(item, fn, item):
+            yield ctx, result, err
+    for ctx, result, err in window.drain():
+        yield ctx, result, err
+
+
+def render_row_pdf(ep, out_dir, rnum, letter_text=None):
+    """
+    Letter text + professional PDF for one ephemeral appeal, written to out_dir.
+    No DB or Flask access, so it is safe to run on pool threads. LLM calls run at batch priority
+    so interactive generations are served first when the OpenAI rate governor is saturated.
+    letter_text (economy jobs: already generated through the Batch API) skips generation.
+    Returns (letter_text, pdf_path, seconds).
+    """
+    t0 = time.perf_counter()
+    if letter_text:
+        text = letter_text
+    elif not getattr(advanced_ai_generator, 'enabled', True):
+        text = f"Batch appeal draft for claim {ep.claim_number}\n\n{ep.denial_reason}"
+    else:
+        with llm_priority(PRIORITY_BATCH):
+            text = advanced_ai_generator.generate_appeal_content(ep)
+    ep.generated_letter_text = text
+    pdf_bytes = build_professional_pdf_bytes(ep)
+    fname = build_appeal_pdf_filename(ep)
+    safe = re.sub(r'[^\w\-.]+', '_', fname)
+    stem, ext = os.path.splitext(safe)
+    if not ext:
+        ext = '.pdf'
+    safe_unique = f'{stem}_r{rnum}{ext}'
+    pdf_path = os.path.join(out_dir, safe_unique)
+    # Write-then-rename so a streaming ZIP download never picks up a half-written PDF
+    tmp_path = pdf_path + '.part'
+    with open(tmp_path, 'wb') as out:
+        out.write(pdf_bytes)
+    os.replace(tmp_path, pdf_path)
+    return text, pdf_path, time.perf_counter() - t0
@@ -0,0 +1,105 @@
+"""
+Batch appeal job worker: claims queued batch_appeal_jobs and runs them (see batch_job_queue.py).
+
+Standalone (Procfile `worker`):  python batch_worker.py
+Web processes also run an embedded worker unless BATCH_EMBEDDED_WORKER=0, so single-process
+deploys keep working; set it to 0 on web once dedicated workers are running so web latency and
+batch throughput scale independently. Workers must share GENERATED_FOLDER with web (PDF uploads
+and ZIPs live there).
+
+Env:
+  BATCH_WORKER_JOBS          jobs run concurrently per worker process
+  BATCH_WORKER_POLL_SECONDS  idle poll interval (new jobs in the same process wake it immediately)
+  BATCH_EMBEDDED_WORKER      1 = also run a worker inside each web process
+"""
+import logging
+import os
+import signal
+import threading
+
+from batch_appeals_worker import run_claimed_job
+from batch_job_queue import claim_next_job, new_worker_id, wait_for_job, _env_int
+from migrate_batch_appeal_jobs import sweep_interrupted_batch_jobs
+from models import db
+from usage_outbox import start_usage_reporter
+
+logger = logging.getLogger(__name__)
+
+WORKER_JOBS = _env_int('BATCH_WORKER_JOBS', 1)
+POLL_SECONDS = _env_int('BATCH_WORKER_POLL_SECONDS', 5)
+
+_embedded_lock = threading.Lock()
+_embedded_started = False
+
+
+def run_worker_loop(app, stop_event=None, poll_seconds=None):
+    """Claim → run → repeat until stop_event is set. Each loop runs one job at a time."""
+    stop_event = stop_event or threading.Event()
+    poll_seconds = poll_seconds or POLL_SECONDS
+    owner = new_worker_id()
+    logger.info('Batch worker %s started', owner)
+    while not stop_event.is_set():
+        job_id = None
+        try:
+            with app.app_context():
+                sweep_interrupted_batch_jobs(db)
+                job_id = claim_next_job(owner)
+                db.session.remove()
+        except Exception:
+            logger.exception('Batch worker %s: claim failed', owner)
+        if job_id:
+            logger.info('Batch worker %s claimed job %s', owner, job_id)
+            run_claimed_job(app, job_id, owner)
+            continue
+        wait_for_job(poll_seconds)
+    logger.info('Batch worker %s stopped', owner)
+
+
+def start_worker_threads(app, count=None, stop_event=None):
+    threads = []
+    for n in range(count or WORKER_JOBS):
+        t = threading.Thread(
+            target=run_worker_loop,
+            args=(app, stop_event),
+            name=f'batch-worker-{n}',
+            daemon=True,
+        )
+        t.start()
+        threads.append(t)
+    return threads
+
+
+def start_embedded_batch_worker(app):
+    """Start worker threads inside this (web) process once, unless BATCH_EMBEDDED_WORKER=0."""
+    global _embedded_started
+    if os.getenv('BATCH_EMBEDDED_WORKER', '1').strip().lower() in ('0', 'false', 'no'):
+        return
+    with _embedded_lock:
+        if _embedded_started:
+            return
+        _embedded_started = True
+    start_worker_threads(app)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    from app import app
+
+    stop = threading.Event()
+
+    def _shutdown(signum, _frame):
+        # Stop claiming; a job cut off mid-run keeps its checkpoint and is resumed by the next worker
+        logger.info('Batch worker received signal %s; stopping after current jobs', signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    start_usage_reporter(app)
+    threads = start_worker_threads(app, stop_event=stop)
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
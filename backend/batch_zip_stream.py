@@ -0,0 +1,106 @@
+"""
+Streaming ZIP download for batch appeal jobs.
+
+The archive is assembled on the fly from the PDFs already in the job's out_dir plus a summary CSV
+and processing report rendered from summary_rows, so no ZIP file is ever written (peak disk ≈ the
+PDFs themselves) and a running job can be downloaded partially: only rows already checkpointed
+in summary_rows are included.
+"""
+import csv
+import io
+import os
+import zipfile
+
+SUMMARY_FIELDS = ['row', 'source_file', 'claim_number', 'status', 'reason', 'seconds']
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target: zipfile falls back to data descriptors and we drain bytes as we go."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def summary_csv_bytes(summary_rows):
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=SUMMARY_FIELDS)
+    w.writeheader()
+    for s in summary_rows:
+        w.writerow({k: s.get(k, '') for k in SUMMARY_FIELDS})
+    return buf.getvalue().encode('utf-8')
+
+
+def processing_report_bytes(summary_rows, ok_count, job_label, partial=False):
+    report_lines = [
+        'Denial Appeal Pro — bulk processing report',
+        f'Job type: {job_label}',
+        f'Appeals generated (PDF): {ok_count}',
+        f'Line items: {len(summary_rows)}',
+    ]
+    if partial:
+        report_lines.append('PARTIAL DOWNLOAD — batch still running; later rows are not included')
+    report_lines.extend(['', 'Errors / skipped:'])
+    problems = [s for s in summary_rows if s.get('status') not in ('ok',)]
+    if not problems:
+        report_lines.append('(none)')
+    else:
+        for s in problems:
+            report_lines.append(
+                f"  Row {s.get('row')}: [{s.get('status')}] claim={s.get('claim_number', '')} "
+                f"file={s.get('source_file', '')} — {s.get('reason', '')}"
+            )
+    return '\n'.join(report_lines).encode('utf-8')
+
+
+def batch_pdf_names(out_dir, summary_rows, partial=False):
+    """
+    PDFs to include, in row order. Rows record their pdf_name; jobs finished before that field
+    existed fall back to every PDF in out_dir (never for partial downloads, where an in-flight
+    row's file may still be incomplete).
+    """
+    names = [s['pdf_name'] for s in summary_rows if s.get('status') == 'ok' and s.get('pdf_name')]
+    if names or partial:
+        return [n for n in names if os.path.isfile(os.path.join(out_dir, n))]
+    return sorted(n for n in os.listdir(out_dir) if n.endswith('.pdf'))
+
+
+def iter_batch_zip(out_dir, summary_rows, ok_count, job_label, partial=False):
+    """Yield the ZIP archive in chunks (summary CSV, report, then each PDF streamed from disk)."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('batch_summary.csv', summary_csv_bytes(summary_rows))
+        zf.writestr(
+            'processing_report.txt',
+            processing_report_bytes(summary_rows, ok_count, job_label, partial=partial),
+        )
+        yield sink.drain()
+        for name in batch_pdf_names(out_dir, summary_rows, partial=partial):
+            info = zipfile.ZipInfo.from_file(os.path.join(out_dir, name), arcname=name)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(os.path.join(out_dir, name), 'rb') as src, zf.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
@@ -0,0 +1,104 @@
+"""
+Batch generation throughput benchmark (offline).
+
+Runs the batch row pipeline against a stubbed OpenAI client that sleeps for a fixed latency,
+so the sequential vs. concurrent speedup can be measured without network or API spend.
+
+Usage:
+    python bench_batch_throughput.py [--rows 24] [--latency 1.5] [--concurrency 1 4 8]
+"""
+import argparse
+import tempfile
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from advanced_ai_generator import advanced_ai_generator
+from batch_row_pipeline import OrderedRowWindow, render_row_pdf
+
+
+class StubChatCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        letter = (
+            "RE: Request for Reconsideration\n\n"
+            "We respectfully request reconsideration of the denial referenced above.\n\n"
+            + "The service was billed and documented correctly. " * 40
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=letter))])
+
+
+class StubOpenAIClient:
+    def __init__(self, latency):
+        self.chat = SimpleNamespace(completions=StubChatCompletions(latency))
+
+
+def _ephemeral_row(i):
+    return SimpleNamespace(
+        appeal_id=f'BENCH-{i:04d}',
+        payer='Aetna',
+        claim_number=f'CLM{100000 + i}',
+        patient_id='PT',
+        provider_name='Bench Clinic',
+        provider_npi='1234567893',
+        provider_address='1 Main St',
+        date_of_service=date(2026, 1, 15),
+        denial_reason='CO-50 not medically necessary. Billed amount: 1250.00',
+        denial_code='CO-50',
+        diagnosis_code='M54.5',
+        cpt_codes='99214',
+        billed_amount=Decimal('1250.00'),
+        appeal_level='level_1',
+        generated_letter_text=None,
+    )
+
+
+def run_once(rows, concurrency):
+    out_dir = tempfile.mkdtemp(prefix='dap_bench_')
+    window = OrderedRowWindow(size=concurrency)
+    order = []
+    t0 = time.perf_counter()
+    for i in range(rows):
+        for ctx, _result, err in window.submit(i + 1, render_row_pdf, _ephemeral_row(i), out_dir, i + 1):
+            order.append((ctx, err))
+    for ctx, _result, err in window.drain():
+        order.append((ctx, err))
+    elapsed = time.perf_counter() - t0
+    errors = [e for _c, e in order if e is not None]
+    assert [c for c, _e in order] == list(range(1, rows + 1)), 'results out of order'
+    return elapsed, errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('--rows', type=int, default=24)
+    ap.add_argument('--latency', type=float, default=1.5, help='stub OpenAI latency (seconds)')
+    ap.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    args = ap.parse_args()
+
+    stub = StubOpenAIClient(args.latency)
+    advanced_ai_generator.client = stub
+    advanced_ai_generator.enabled = True
+
+    print(f'rows={args.rows} stub_latency={args.latency}s')
+    baseline = None
+    for c in args.concurrency:
+        elapsed, errors = run_once(args.rows, c)
+        baseline = baseline or elapsed
+        print(
+            f'  concurrency={c:<3} {elapsed:7.2f}s  {args.rows / elapsed:6.2f} rows/s  '
+            f'speedup x{baseline / elapsed:4.1f}  errors={len(errors)}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Regex extraction layer benchmark (offline, no LLM).
+
+Documents per second on a synthetic ~48 KB multi-line EOB and on the short letters of the
+golden corpus (testdata/denial_corpus.txt) for:
+  - per-pattern: the ten extract_* passes _regex_extract_dict used to make
+  - scanner:     _regex_extract_dict on one scan_denial_text pass
+  - parse:       parse_denial_from_text end to end (scan, labels, merge, confidence, normalize)
+
+Usage:
+    python bench_denial_scan.py [--lines 400] [--seconds 2]
+"""
+import argparse
+import os
+import time
+
+from pdf_parser import DenialLetterParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_eob(lines):
+    out = [
+        "REMITTANCE ADVICE  Payer: Blue Cross Blue Shield  Check # 000123  Date 01/20/2026",
+        "Patient Name: DOE, JANE  Member ID W123456789  Rendering NPI 2345678901",
+        "Claim Number: BCX20260115001  ICN 2026A0003",
+    ]
+    for i in range(lines):
+        out.append(
+            f"{i + 1:04d} 99214 25 01/{i % 28 + 1:02d}/2026 BILLED $250.00 ALLOWED $180.00 PAID $144.00 "
+            f"CO-45 $70.00 PR-2 $36.00 N130 M54.5 J45.909"
+        )
+    out.append("Amount paid: $57,600.00  CARC 45 Charges exceed the contracted fee schedule.")
+    return "\n".join(out)
+
+
+def per_pattern(parser, text):
+    return (
+        parser.extract_denial_codes(text),
+        parser.extract_dates(text),
+        parser.extract_claim_number(text),
+        parser.extract_payer_name(text),
+        parser.extract_patient_name(text),
+        parser.extract_amounts(text),
+        parser.extract_npi(text),
+        parser.extract_rarc_codes(text),
+        parser.extract_cpt_codes(text),
+        parser.extract_icd_codes(text),
+    )
+
+
+def rate(fn, docs, seconds):
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        for d in docs:
+            fn(d)
+        n += len(docs)
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=400)
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+    os.environ["OPENAI_API_KEY"] = ""  # regex layer only
+
+    parser = DenialLetterParser()
+    eob = build_eob(args.lines)
+    with open(os.path.join(HERE, "testdata", "denial_corpus.txt"), encoding="utf-8") as fh:
+        letters = fh.read().split("\n=====\n")
+    for name, docs in ((f"EOB {len(eob) / 1024:.0f} KiB", [eob]), (f"{len(letters)} short letters", letters)):
+        legacy = rate(lambda d: per_pattern(parser, d), docs, args.seconds)
+        scanner = rate(parser._regex_extract_dict, docs, args.seconds)
+        parse = rate(parser.parse_denial_from_text, docs, args.seconds)
+        print(name)
+        print(f"  per-pattern  {legacy:9.1f} docs/s")
+        print(f"  scanner      {scanner:9.1f} docs/s  {scanner / legacy:5.2f}x")
+        print(f"  parse        {parse:9.1f} docs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+PDF text extraction benchmark (offline).
+
+Builds a synthetic remittance PDF (dense line items on every page), then times:
+  - legacy:   the old serial loop with text += page_text + "\\n"
+  - serial:   pdf_page_extract with one process
+  - parallel: pdf_page_extract on the process pool (pool start-up excluded; it is paid once)
+  - early:    serial / parallel with a claim-number + CARC stop_when
+  - cached:   a repeat extraction of the same bytes (pdf_text_cache memory tier)
+
+Usage:
+    python bench_pdf_extraction.py [--pages 200] [--workers 4] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+import PyPDF2
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import pdf_page_extract
+import pdf_parser
+from pdf_parser import DenialLetterParser
+from pdf_text_cache import PdfTextCache
+
+
+def build_pdf(path, pages):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter)
+    for p in range(pages):
+        y = 750
+        c.drawString(40, y, f"REMITTANCE ADVICE  page {p + 1} of {pages}  Payer: Blue Cross")
+        if p == 2:
+            c.drawString(40, y - 14, "Claim number BCX20260115001 Patient ACCT 448812")
+        for line in range(48):
+            y -= 14 if line else 28
+            c.drawString(
+                40,
+                y,
+                f"{p + 1:03d}-{line:02d} 99214 01/15/2026 BILLED 250.00 ALLOWED 180.00 "
+                f"PAID 144.00 CO-45 70.00 PR-2 36.00 N130",
+            )
+        c.showPage()
+    c.save()
+    with open(path, "wb") as fh:
+        fh.write(buf.getvalue())
+
+
+def legacy_extract(path):
+    with open(path, "rb") as fh:
+        reader = PyPDF2.PdfReader(fh)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text() + "\n"
+    return text
+
+
+def timed(fn, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs), result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "remittance.pdf")
+        build_pdf(path, args.pages)
+        print(f"{args.pages}-page PDF, {os.path.getsize(path) / 1024:.0f} KiB, {os.cpu_count()} CPU(s)")
+
+        pdf_page_extract.EXTRACT_WORKERS = args.workers
+        pdf_page_extract._get_pool().submit(int).result()  # start the pool outside the timings
+
+        t_legacy, legacy_text = timed(lambda: legacy_extract(path), args.repeat)
+        t_serial, serial = timed(lambda: pdf_page_extract.extract_pages(path, workers=1), args.repeat)
+        t_par, par = timed(lambda: pdf_page_extract.extract_pages(path, workers=args.workers), args.repeat)
+        stop = DenialLetterParser().claim_fields_stop
+        t_serial_early, serial_early = timed(
+            lambda: pdf_page_extract.extract_pages(path, stop_when=stop(), workers=1), args.repeat
+        )
+        t_early, early = timed(
+            lambda: pdf_page_extract.extract_pages(path, stop_when=stop(), workers=args.workers), args.repeat
+        )
+        assert par["pages"] == serial["pages"]
+        assert "\n".join(serial["pages"]) + "\n" == legacy_text
+
+        cache = PdfTextCache(memory_entries=8, disk_dir=None)
+        parser = DenialLetterParser()
+        with mock.patch.object(pdf_parser, "get_pdf_text_cache", return_value=cache):
+            parser.extract_text_from_pdf(path)
+            t_cached, _ = timed(lambda: parser.extract_text_from_pdf(path), args.repeat)
+
+        rows = [
+            ("legacy (serial, +=)", t_legacy, args.pages),
+            ("serial engine", t_serial, len(serial["pages"])),
+            (f"parallel x{args.workers}", t_par, len(par["pages"])),
+            ("serial + stop early", t_serial_early, len(serial_early["pages"])),
+            ("parallel + stop early", t_early, len(early["pages"])),
+            ("cached repeat", t_cached, args.pages),
+        ]
+        for name, t, pages in rows:
+            print(f"  {name:24s} {t * 1000:9.1f} ms  {pages:4d} pages  {t_legacy / t:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
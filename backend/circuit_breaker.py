@@ -0,0 +1,206 @@
+"""
+Circuit breakers for the OpenAI dependency.
+
+One breaker per purpose ("extraction", "appeal") wraps the OpenAI call. governed_create() and
+governed_stream() apply it inside the governor permit, so only the HTTP call is timed. While OpenAI is healthy
+the breaker is closed and calls pass through. After LLM_BREAKER_FAILURE_THRESHOLD consecutive bad
+calls it opens. A bad call is a timeout, connection error, 429 or 5xx, or a success slower than the
+purpose's slow-call threshold. While open, calls fail immediately with CircuitOpenError, so callers
+drop straight to the deterministic letter / regex extraction instead of each waiting out the full
+timeout. After LLM_BREAKER_OPEN_SECONDS one half-open probe is let through. If it succeeds, the
+breaker closes; if not, it reopens. Other 4xx errors (bad prompt, auth) are our problem, not
+OpenAI's, and do not count. Breakers are per process; state is on GET /health.
+
+Env:
+  LLM_BREAKER_ENABLED                  0 disables the breakers
+  LLM_BREAKER_FAILURE_THRESHOLD        consecutive bad calls that open the breaker
+  LLM_BREAKER_OPEN_SECONDS             time open before a half-open probe
+  LLM_BREAKER_SLOW_EXTRACTION_SECONDS  extraction call slower than this counts as bad
+  LLM_BREAKER_SLOW_APPEAL_SECONDS      appeal call slower than this counts as bad
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from llm_governor import GovernorTimeout
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_SLOW_CALL_SECONDS = {
+    "extraction": ("LLM_BREAKER_SLOW_EXTRACTION_SECONDS", 20.0),
+    "appeal": ("LLM_BREAKER_SLOW_APPEAL_SECONDS", 60.0),
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def breaker_enabled() -> bool:
+    return os.getenv("LLM_BREAKER_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class CircuitOpenError(RuntimeError):
+    """The breaker is open; the caller should use its non-LLM fallback."""
+
+
+def is_dependency_failure(error: BaseException) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx mean OpenAI is unhealthy; other 4xx do not."""
+    if isinstance(error, GovernorTimeout) or not isinstance(error, Exception):
+        # Local queue timeout, or GeneratorExit from a client that left a stream: not OpenAI's health
+        return False
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, open_seconds: float = 30.0, slow_call_seconds: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "short_circuited": 0,
+            "opened": 0,
+            "probes": 0,
+        }
+
+    def _admit(self) -> bool:
+        """True when the call may run; the caller that flips open -> half_open carries the probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.stats["probes"] += 1
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            probe, self._probe_in_flight = self._probe_in_flight, False
+            if ok:
+                if self.state != CLOSED:
+                    logger.info("LLM circuit %s closed", self.name)
+                self.state = CLOSED
+                self._consecutive = 0
+                return
+            self._consecutive += 1
+            if probe or self._consecutive >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.stats["opened"] += 1
+                    logger.warning(
+                        "LLM circuit %s opened after %d bad call(s)", self.name, self._consecutive
+                    )
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def reject_if_open(self) -> None:
+        """
+        Raise CircuitOpenError while open and not yet due a probe, without taking the probe.
+        Lets governed calls fail before queueing for a governor permit they would not use.
+        """
+        if not breaker_enabled():
+            return
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats["short_circuited"] += 1
+                raise CircuitOpenError(f"OpenAI circuit '{self.name}' is open; using fallback")
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run fn() through the breaker. Raises CircuitOpenError without calling fn while open."""
+        with self.guard():
+            return fn()
+
+    @contextmanager
+    def guard(self):
+        """
+        Context-manager form of call() for work that is not one function call (a streamed
+        completion): the block's duration and exception are judged like fn() would be.
+        """
+        if not breaker_enabled():
+            yield
+            return
+        if not self._admit():
+            raise CircuitOpenError(f"OpenAI circuit '{self.name}' is open; using fallback")
+        t0 = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if is_dependency_failure(e):
+                with self._lock:
+                    self.stats["failures"] += 1
+                self._record(False)
+            else:
+                # Not OpenAI's fault: release a half-open probe without judging the dependency
+                with self._lock:
+                    self._probe_in_flight = False
+            raise
+        slow = time.monotonic() - t0 > self.slow_call_seconds
+        if slow:
+            with self._lock:
+                self.stats["slow_calls"] += 1
+        self._record(not slow)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self.stats)
+            s.update(
+                state=self.state,
+                consecutive_failures=self._consecutive,
+                failure_threshold=self.failure_threshold,
+                slow_call_seconds=self.slow_call_seconds,
+            )
+            if self.state == OPEN:
+                s["retry_in_seconds"] = round(
+                    max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1
+                )
+        return s
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            env_name, default = _SLOW_CALL_SECONDS.get(name, ("LLM_BREAKER_SLOW_SECONDS", 60.0))
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(_env_float("LLM_BREAKER_FAILURE_THRESHOLD", 5)),
+                open_seconds=_env_float("LLM_BREAKER_OPEN_SECONDS", 30),
+                slow_call_seconds=_env_float(env_name, default),
+            )
+        return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: get_breaker(name).snapshot() for name in sorted(set(_SLOW_CALL_SECONDS) | set(_breakers))}
@@ -0,0 +1,123 @@
+"""
+Per-claim segmentation of multi-claim remittance / EOB text.
+
+An 835-style remittance PDF lists many claims one after another. Parsed as one blob, it yields
+a single claim number, a single payer and the union of every claim's codes. segment_claims()
+splits the text at claim header lines, i.e. lines that start with Claim / Claim # / CLM / ICN /
+Payer Claim Control Number followed by an id. A new block starts at each header whose id differs
+from the current block's. Text before the first header (payer, check number, dates) is shared
+context and is prepended to every block. Blocks with the same id (e.g. a claim listed again in a
+closing summary) are merged in first-seen order. Text with fewer than two distinct claim headers
+comes back as one block, so single-claim letters parse exactly as before.
+
+parse_claim_blocks() runs the regex + LLM extraction (parse_denial_text) on every block
+concurrently and returns the results in block order.
+
+Env:
+  CLAIM_SEGMENT_MAX_CLAIMS    blocks kept per document (the rest are dropped and reported)
+  CLAIM_PARSE_WORKERS         concurrent per-block extractions
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_CLAIMS = _env_int("CLAIM_SEGMENT_MAX_CLAIMS", 200)
+PARSE_WORKERS = _env_int("CLAIM_PARSE_WORKERS", 4)
+PREAMBLE_MAX_CHARS = 1500
+
+_CLAIM_HEADER = re.compile(
+    r"^[^\S\n]*(?:payer\s+claim\s+control\s+(?:number|no\.?|#)|claim\s*(?:number|no\.?|#|id)?|clm\s*#?|icn)"
+    r"[^\S\n]*[:#]?[^\S\n]*([A-Z0-9][A-Z0-9-]{4,29})\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def find_claim_headers(text: str) -> List[Dict[str, Any]]:
+    """[{'start': offset of the header line, 'claim_number'}] for every claim header line."""
+    out = []
+    for m in _CLAIM_HEADER.finditer(text or ""):
+        claim = m.group(1).upper()
+        if not any(ch.isdigit() for ch in claim):
+            continue  # "Claim Status", "Claim Detail" and similar labels
+        out.append({"start": m.start(), "claim_number": claim})
+    return out
+
+
+def segment_claims(text: str, max_claims: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    [{'claim_number', 'text'}] in document order; one block with claim_number None when the text
+    has fewer than two distinct claim headers.
+    """
+    text = text or ""
+    headers = find_claim_headers(text)
+    if len({h["claim_number"] for h in headers}) < 2:
+        return [{"claim_number": None, "text": text}]
+
+    starts = []
+    current = None
+    for h in headers:
+        if h["claim_number"] != current:
+            starts.append(h)
+            current = h["claim_number"]
+
+    preamble = text[: starts[0]["start"]].strip()[:PREAMBLE_MAX_CHARS]
+    merged: Dict[str, List[str]] = {}
+    for i, h in enumerate(starts):
+        end = starts[i + 1]["start"] if i + 1 < len(starts) else len(text)
+        merged.setdefault(h["claim_number"], []).append(text[h["start"]:end].strip())
+
+    blocks = [
+        {"claim_number": claim, "text": (preamble + "\n\n" if preamble else "") + "\n".join(parts)}
+        for claim, parts in merged.items()
+    ]
+    limit = max_claims or MAX_CLAIMS
+    if len(blocks) > limit:
+        logger.warning("Remittance has %s claims; keeping the first %s", len(blocks), limit)
+        blocks = blocks[:limit]
+    return blocks
+
+
+def parse_claim_blocks(
+    blocks: List[Dict[str, Any]],
+    parse: Optional[Callable[[str], Dict[str, Any]]] = None,
+    max_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    parse(block text) for every block, concurrently, in block order. A block whose extraction
+    raises comes back as {'success': False, 'error'} instead of failing the document.
+    parse defaults to pdf_parser.parse_denial_text (regex + LLM).
+    """
+    if parse is None:
+        from pdf_parser import parse_denial_text as parse
+
+    def one(block: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = parse(block["text"])
+        except Exception as e:
+            logger.warning("Claim block %s extraction failed: %s", block.get("claim_number"), e)
+            return {"success": False, "error": str(e)[:500], "claim_number": block.get("claim_number")}
+        if isinstance(result, dict):
+            if block.get("claim_number"):
+                # The header id defines the block; extraction could pick up another id in the shared preamble
+                result["claim_number"] = block["claim_number"]
+            result.setdefault("raw_text", block["text"][:500])
+        return result
+
+    if len(blocks) <= 1:
+        return [one(b) for b in blocks]
+    with ThreadPoolExecutor(max_workers=min(len(blocks), max_workers or PARSE_WORKERS)) as pool:
+        return list(pool.map(one, blocks))
@@ -6,6 +6,7 @@ PLUS usage-based tracking for SaaS model
 
 from datetime import datetime, date, timedelta
 from models import db, User, SubscriptionPlan, CreditPack, Appeal
+from credit_reservation import CreditReservation, reserve_generations, settle_reservation
 from typing import Optional, Dict, Union
 
 
@@ -105,6 +106,7 @@ class CreditManager:
         Returns (allowed: bool, used_subscription_credit: bool, used_free_trial: bool).
         used_subscription_credit True when a pooled credit was deducted; False when using tier usage only.
         used_free_trial True when no credits/subscription path applied and a free trial slot is consumed.
+        Batch jobs use reserve_generations instead (one statement for the whole batch).
         """
         user = User.query.get(user_id)
         if not user:
@@ -126,7 +128,27 @@ class CreditManager:
         if not has_active_sub and ft_used < CreditManager.FREE_TRIAL_LIMIT:
             return True, False, True
         return False, False, False
-    
+
+    @staticmethod
+    def reserve_generations(user_id, n: int, conn=None) -> Optional[CreditReservation]:
+        """
+        Atomically reserve up to n generations for a batch (one locked UPDATE on users), granted in
+        the order try_begin_generation would admit n sequential rows. See credit_reservation.py.
+        Pass `conn` to reserve inside a caller's transaction (e.g. together with the job row).
+        """
+        if conn is None:
+            with db.engine.begin() as own:
+                return reserve_generations(own, user_id, n, CreditManager.FREE_TRIAL_LIMIT)
+        return reserve_generations(conn, user_id, n, CreditManager.FREE_TRIAL_LIMIT)
+
+    @staticmethod
+    def settle_reservation(reservation: CreditReservation, conn=None) -> int:
+        """Refund unused / failed slots of a batch reservation; returns overage units to report."""
+        if conn is None:
+            with db.engine.begin() as own:
+                return settle_reservation(own, reservation)
+        return settle_reservation(conn, reservation)
+
     @staticmethod
     def get_credit_balance(user_id: int) -> int:
         """Get user's total credit balance"""
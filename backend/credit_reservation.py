@@ -0,0 +1,260 @@
+"""
+Bulk credit reservation for batch appeal jobs.
+
+A batch reserves all the generations it may need in ONE statement on the users row (locked,
+sized and applied together), consumes the slots locally in row order, and settles once at the
+end: unused slots are refunded and usage counters are rolled back for rows that failed. Grants
+follow exactly the order CreditManager.try_begin_generation admits sequential rows (subscription
+credits, bulk credits, subscription usage up to plan_limit + soft grace, then free trial), so a
+batch spends the same balance a row-by-row loop would, with two round trips instead of two per row.
+
+The reservation state is plain JSON; the batch worker checkpoints it with the job row so a
+resumed job neither re-reserves nor double-refunds.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+SOFT_GRACE_APPEALS = 2  # plan_limit + grace before the hard block (matches try_begin_generation)
+
+SLOT_SUB_CREDIT = 'sub_credit'
+SLOT_BULK_CREDIT = 'bulk_credit'
+SLOT_USAGE = 'usage'
+SLOT_FREE_TRIAL = 'free_trial'
+
+# One statement: lock the users row, size each grant in admission order, apply it, return the grant.
+_RESERVE_SQL_PG = """
+WITH u AS (
+    SELECT id,
+           COALESCE(subscription_credits, 0) AS sc,
+           COALESCE(bulk_credits, 0) AS bc,
+           COALESCE(appeals_generated_monthly, 0) AS m,
+           COALESCE(free_trial_generations_used, 0) AS ft,
+           COALESCE(plan_limit, 0) AS pl,
+           COALESCE(overage_count, 0) AS ov,
+           stripe_subscription_id AS sub_id,
+           (COALESCE(subscription_tier, '') <> '' AND COALESCE(billing_status, 'active') = 'active') AS active_sub
+    FROM users WHERE id = :uid
+    FOR UPDATE
+), c AS (
+    SELECT u.*, LEAST(:n, sc) AS take_sc, LEAST(:n - LEAST(:n, sc), bc) AS take_bc FROM u
+), g AS (
+    SELECT c.*,
+           CASE WHEN NOT active_sub THEN 0
+                WHEN pl > 0 THEN LEAST(:n - take_sc - take_bc, GREATEST(0, pl + :soft_grace - (m + take_sc + take_bc)))
+                ELSE :n - take_sc - take_bc
+           END AS take_usage,
+           CASE WHEN active_sub THEN 0
+                ELSE LEAST(:n - take_sc - take_bc, GREATEST(0, :ft_limit - ft))
+           END AS take_ft
+    FROM c
+), t AS (
+    SELECT g.*, take_sc + take_bc + take_usage + take_ft AS total FROM g
+)
+UPDATE users SET
+    subscription_credits = t.sc - t.take_sc,
+    bulk_credits = t.bc - t.take_bc,
+    appeals_generated_today = COALESCE(users.appeals_generated_today, 0) + t.total,
+    appeals_generated_weekly = COALESCE(users.appeals_generated_weekly, 0) + t.total,
+    appeals_generated_monthly = t.m + t.total,
+    free_trial_generations_used = t.ft + t.take_ft,
+    overage_count = CASE WHEN t.pl > 0 AND t.m + t.total > t.pl THEN t.m + t.total - t.pl ELSE t.ov END
+FROM t
+WHERE users.id = t.id
+RETURNING t.take_sc, t.take_bc, t.take_usage, t.take_ft, t.m, t.ov, t.pl, t.sub_id
+"""
+
+
+def _plan_reservation(
+    n: int, sc: int, bc: int, m: int, ft: int, pl: int, active_sub: bool, ft_limit: int
+) -> Dict:
+    """Python twin of the grant sizing in _RESERVE_SQL_PG (SQLite / dev path)."""
+    take_sc = min(n, max(0, sc))
+    take_bc = min(n - take_sc, max(0, bc))
+    rest = n - take_sc - take_bc
+    take_usage = take_ft = 0
+    if active_sub:
+        if pl > 0:
+            take_usage = min(rest, max(0, pl + SOFT_GRACE_APPEALS - (m + take_sc + take_bc)))
+        else:
+            take_usage = rest
+    else:
+        take_ft = min(rest, max(0, ft_limit - ft))
+    return {'take_sc': take_sc, 'take_bc': take_bc, 'take_usage': take_usage, 'take_ft': take_ft}
+
+
+def _reserve_generic(conn, user_id, n: int, ft_limit: int) -> Optional[Dict]:
+    u = conn.execute(
+        text(
+            """SELECT COALESCE(subscription_credits, 0) AS sc, COALESCE(bulk_credits, 0) AS bc,
+                      COALESCE(appeals_generated_monthly, 0) AS m,
+                      COALESCE(free_trial_generations_used, 0) AS ft,
+                      COALESCE(plan_limit, 0) AS pl, COALESCE(overage_count, 0) AS ov,
+                      stripe_subscription_id AS sub_id, subscription_tier, billing_status
+               FROM users WHERE id = :uid"""
+        ),
+        {'uid': user_id},
+    ).mappings().first()
+    if u is None:
+        return None
+    active_sub = bool(u['subscription_tier'] and (u['billing_status'] or 'active') == 'active')
+    grant = _plan_reservation(n, u['sc'], u['bc'], u['m'], u['ft'], u['pl'], active_sub, ft_limit)
+    total = sum(grant.values())
+    monthly = u['m'] + total
+    conn.execute(
+        text(
+            """UPDATE users SET
+                subscription_credits = :sc, bulk_credits = :bc,
+                appeals_generated_today = COALESCE(appeals_generated_today, 0) + :total,
+                appeals_generated_weekly = COALESCE(appeals_generated_weekly, 0) + :total,
+                appeals_generated_monthly = :monthly,
+                free_trial_generations_used = :ft,
+                overage_count = :overage
+            WHERE id = :uid"""
+        ),
+        {
+            'uid': user_id,
+            'sc': u['sc'] - grant['take_sc'],
+            'bc': u['bc'] - grant['take_bc'],
+            'total': total,
+            'monthly': monthly,
+            'ft': u['ft'] + grant['take_ft'],
+            'overage': monthly - u['pl'] if u['pl'] > 0 and monthly > u['pl'] else u['ov'],
+        },
+    )
+    return dict(grant, m=u['m'], ov=u['ov'], pl=u['pl'], sub_id=u['sub_id'])
+
+
+class CreditReservation:
+    """
+    Generations reserved for one batch job, consumed locally in row order.
+    take() hands out the next slot kind (None when exhausted); record() stores each admitted
+    row's outcome in the same order. `state` is plain JSON so it can be checkpointed with the job.
+    """
+
+    def __init__(self, user_id, state: Dict):
+        self.user_id = user_id
+        self.state = state
+        self._next = len(state['outcomes'])
+
+    @classmethod
+    def from_grant(cls, user_id, row) -> "CreditReservation":
+        slots = (
+            [SLOT_SUB_CREDIT] * int(row['take_sc'])
+            + [SLOT_BULK_CREDIT] * int(row['take_bc'])
+            + [SLOT_USAGE] * int(row['take_usage'])
+            + [SLOT_FREE_TRIAL] * int(row['take_ft'])
+        )
+        return cls(
+            user_id,
+            {
+                'slots': slots,
+                'outcomes': [],
+                'base_monthly': int(row['m']),
+                'pre_overage': int(row['ov']),
+                'plan_limit': int(row['pl']),
+                'stripe_subscription': bool(row['sub_id']),
+                'settled': False,
+            },
+        )
+
+    @property
+    def settled(self) -> bool:
+        return bool(self.state.get('settled'))
+
+    def __len__(self):
+        return len(self.state['slots'])
+
+    def take(self) -> Optional[str]:
+        if self.settled or self._next >= len(self.state['slots']):
+            return None
+        kind = self.state['slots'][self._next]
+        self._next += 1
+        return kind
+
+    def record(self, ok: bool) -> None:
+        self.state['outcomes'].append(bool(ok))
+
+    def refunds(self) -> Dict:
+        slots: List[str] = self.state['slots']
+        outcomes: List[bool] = self.state['outcomes']
+        unused = slots[len(outcomes):]
+        failed = [kind for kind, ok in zip(slots, outcomes) if not ok]
+        return {
+            'refund_sc': unused.count(SLOT_SUB_CREDIT),
+            'refund_bc': unused.count(SLOT_BULK_CREDIT),
+            'dec': len(unused) + len(failed),
+            'dec_ft': unused.count(SLOT_FREE_TRIAL) + failed.count(SLOT_FREE_TRIAL),
+        }
+
+    def overage_quantity(self) -> int:
+        """
+        Stripe overage units for the successful rows: the same per-row rule the sequential worker
+        applied after increment_usage (overage_count > 0, has a subscription, not a free trial).
+        """
+        if not self.state.get('stripe_subscription'):
+            return 0
+        pl = self.state['plan_limit']
+        qty = 0
+        rank = 0
+        for kind, ok in zip(self.state['slots'], self.state['outcomes']):
+            if not ok:
+                continue
+            rank += 1
+            monthly = self.state['base_monthly'] + rank
+            overage = monthly - pl if pl > 0 and monthly > pl else self.state['pre_overage']
+            if overage > 0 and kind != SLOT_FREE_TRIAL:
+                qty += 1
+        return qty
+
+
+def reserve_generations(conn, user_id, n: int, ft_limit: int) -> Optional[CreditReservation]:
+    """
+    Reserve up to n generations on `conn` (caller owns the transaction). Usage counters are
+    incremented up front as if every slot succeeds. Returns None if the user does not exist;
+    an empty reservation means nothing is available.
+    """
+    n = max(0, int(n))
+    if conn.dialect.name == 'postgresql':
+        row = conn.execute(
+            text(_RESERVE_SQL_PG),
+            {'uid': user_id, 'n': n, 'soft_grace': SOFT_GRACE_APPEALS, 'ft_limit': ft_limit},
+        ).mappings().first()
+    else:
+        row = _reserve_generic(conn, user_id, n, ft_limit)
+    if row is None:
+        return None
+    return CreditReservation.from_grant(user_id, row)
+
+
+def settle_reservation(conn, reservation: CreditReservation) -> int:
+    """
+    Return unused slots and undo usage for failed ones, in one UPDATE on users:
+    unused credits go back to their pool; counters drop by unused + failed slots (failed rows
+    never counted as generated); a failed credit slot stays deducted, as with deduct_credit.
+    Marks the reservation settled and returns the overage quantity to report to Stripe.
+    """
+    if reservation.settled:
+        return 0
+    r = reservation.refunds()
+    greatest, least = ('GREATEST', 'LEAST') if conn.dialect.name == 'postgresql' else ('MAX', 'MIN')
+    conn.execute(
+        text(
+            f"""UPDATE users SET
+                subscription_credits = subscription_credits + :refund_sc,
+                bulk_credits = bulk_credits + :refund_bc,
+                appeals_generated_today = {greatest}(0, appeals_generated_today - :dec),
+                appeals_generated_weekly = {greatest}(0, appeals_generated_weekly - :dec),
+                appeals_generated_monthly = {greatest}(0, appeals_generated_monthly - :dec),
+                free_trial_generations_used = {greatest}(0, COALESCE(free_trial_generations_used, 0) - :dec_ft),
+                overage_count = CASE
+                    WHEN plan_limit > 0 AND appeals_generated_monthly - :dec > plan_limit
+                    THEN appeals_generated_monthly - :dec - plan_limit
+                    ELSE {least}(COALESCE(overage_count, 0), :pre_overage)
+                END
+            WHERE id = :uid"""
+        ),
+        {**r, 'uid': reservation.user_id, 'pre_overage': reservation.state['pre_overage']},
+    )
+    reservation.state['settled'] = True
+    return reservation.overage_quantity()
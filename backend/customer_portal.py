@@ -17,7 +17,7 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal, InvalidOperation
 from functools import wraps
 
-from flask import Blueprint, request, jsonify, g, current_app, send_file, session
+from flask import Blueprint, Response, request, jsonify, g, current_app, send_file, session
 from werkzeug.utils import secure_filename
 
 from sqlalchemy import and_, case, func, or_
@@ -47,6 +47,10 @@ from batch_appeals_worker import (
     MAX_BATCH_ROWS,
     MAX_PDF_BATCH_FILES,
 )
+from batch_worker import start_embedded_batch_worker
+from usage_outbox import start_usage_reporter
+from idempotency import idempotent
+from batch_zip_stream import iter_batch_zip
 from denial_analytics import compute_recovery_dashboard
 from follow_up_appeal import generate_follow_up_letter_text, should_generate_follow_up
 from appeal_automation import AppealAutomationHooks
@@ -315,11 +319,15 @@ def _batch_appeal_job_status_dict(job_id, user_id):
         'current': j.get('current', 0),
         'ok_count': j.get('ok_count'),
         'error': j.get('error'),
+        'db_round_trips': j.get('db_round_trips', 0),
+        'partial_zip_available': j.get('status') in ('queued', 'running') and bool(j.get('ok_count')),
     }
 
 
 def init_customer_portal(app, limiter, generator):
     app.extensions['appeal_generator'] = generator
+    start_embedded_batch_worker(app)
+    start_usage_reporter(app)
 
     limit = limiter.limit
 
@@ -1204,7 +1212,8 @@ def init_customer_portal(app, limiter, generator):
     @require_customer_auth()
     def queue_batch_appeals_start():
         """CSV batch: generate appeal text + PDF per row; poll job then download ZIP.
-        Accepts JSON { rows, defaults? } or multipart file field \"file\" (.csv)."""
+        Accepts JSON { rows, defaults?, economy? } or multipart file field \"file\" (.csv).
+        economy: letters go through the OpenAI Batch API (cheaper, may take hours)."""
         uid = g.current_user_id
         app_obj = current_app._get_current_object()
 
@@ -1217,7 +1226,9 @@ def init_customer_portal(app, limiter, generator):
             if len(rows) > MAX_BATCH_ROWS:
                 return jsonify({'error': f'Maximum {MAX_BATCH_ROWS} rows per batch'}), 400
             try:
-                job_id = start_batch_job_from_rows(app_obj, uid, rows, defaults)
+                job_id = start_batch_job_from_rows(
+                    app_obj, uid, rows, defaults, economy=bool(data.get('economy'))
+                )
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
             return jsonify({'job_id': job_id, 'max_rows': MAX_BATCH_ROWS, 'job_kind': 'csv'}), 202
@@ -1241,7 +1252,8 @@ def init_customer_portal(app, limiter, generator):
         tmp.close()
         try:
             f.save(tmp.name)
-            job_id = start_batch_job(app_obj, uid, tmp.name, defaults)
+            economy = (request.form.get('economy') or '').strip().lower() in ('1', 'true', 'yes')
+            job_id = start_batch_job(app_obj, uid, tmp.name, defaults, economy=economy)
         except Exception as e:
             try:
                 os.unlink(tmp.name)
@@ -1316,19 +1328,44 @@ def init_customer_portal(app, limiter, generator):
     @customer_bp.route('/queue/batch-appeals/<job_id>/zip', methods=['GET'])
     @require_customer_auth()
     def queue_batch_appeals_zip(job_id):
+        """Streamed ZIP of the batch. ?partial=1 while running downloads the rows finished so far."""
         j = get_job(job_id)
         if not j or j.get('user_id') != g.current_user_id:
             return jsonify({'error': 'Not found'}), 404
-        if j.get('status') != 'done' or not j.get('zip_path'):
-            return jsonify({'error': 'Batch not ready yet', 'status': j.get('status')}), 400
-        path = j['zip_path']
-        if not os.path.isfile(path):
+        status = j.get('status')
+        partial = str(request.args.get('partial', '')).lower() in ('1', 'true', 'yes')
+        if status == 'done' and j.get('zip_path'):
+            # Jobs finished before ZIPs were streamed have a prebuilt archive
+            path = j['zip_path']
+            if not os.path.isfile(path):
+                return jsonify({'error': 'ZIP no longer available — start a new batch'}), 410
+            return send_file(path, as_attachment=True, download_name=j.get('zip_name') or 'appeals_batch.zip')
+        if status != 'done' and not (partial and status in ('queued', 'running')):
+            return jsonify({'error': 'Batch not ready yet', 'status': status}), 400
+        out_dir = j.get('out_dir')
+        if not out_dir or not os.path.isdir(out_dir):
             return jsonify({'error': 'ZIP no longer available — start a new batch'}), 410
-        return send_file(path, as_attachment=True, download_name=j.get('zip_name') or 'appeals_batch.zip')
+        if status == 'done':
+            zip_name = j.get('zip_name') or 'appeals_batch.zip'
+        else:
+            zip_name = f"appeals_batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_partial.zip"
+        job_label = 'pdf_multi' if j.get('job_kind') == 'pdf' else 'csv'
+        return Response(
+            iter_batch_zip(
+                out_dir,
+                j.get('summary_rows') or [],
+                j.get('ok_count') or 0,
+                job_label,
+                partial=status != 'done',
+            ),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{zip_name}"'},
+        )
 
     @customer_bp.route('/claims/ingest', methods=['POST'])
     @limit('120 per hour')
     @require_customer_auth()
+    @idempotent('claims_ingest', user=lambda: g.current_user_id)
     def claims_ingest():
         """Billing/EHR-style single claim ingest: validate, score, persist."""
         uid = g.current_user_id
@@ -1404,6 +1441,7 @@ def init_customer_portal(app, limiter, generator):
     @customer_bp.route('/claims/ingest/batch', methods=['POST'])
     @limit('60 per hour')
     @require_customer_auth()
+    @idempotent('claims_ingest_batch', user=lambda: g.current_user_id)
     def claims_ingest_batch():
         """Batch ingest (max 100 rows) for clearinghouse / PM exports."""
         uid = g.current_user_id
@@ -11,8 +11,15 @@ import os
 import re
 from copy import deepcopy
 from decimal import Decimal, InvalidOperation
+from functools import cached_property
 from typing import Any, Dict, List, Optional, Tuple
 
+from circuit_breaker import get_breaker
+from llm_cache import content_key, get_cache, normalize_text, prompt_version
+from llm_governor import governed_create
+from openai_clients import call_timeout, get_openai_client
+from single_flight import get_flight
+
 logger = logging.getLogger(__name__)
 
 EXTRACTION_SYSTEM_PROMPT = """You are a medical billing denial extraction engine.
@@ -217,17 +224,18 @@ def _apply_llm_response_aliases(data: Dict[str, Any]) -> Dict[str, Any]:
     return d
 
 
-def _person_name_in_raw(name: str, raw_text: str) -> bool:
+def _person_name_in_raw(name: str, raw_text) -> bool:
     """Looser match for patient names vs raw text (middle initials, comma order, extra spaces)."""
-    if _verbatim_in_raw(name, raw_text):
+    raw = _raw_view(raw_text)
+    if _verbatim_in_raw(name, raw):
         return True
     n = str(name).strip()
-    if len(n) < 2 or not raw_text:
+    if len(n) < 2 or not raw.text:
         return False
     alpha_tokens = re.findall(r"[A-Za-z]{2,}", n)
     if len(alpha_tokens) < 2:
-        return _verbatim_in_raw(n, raw_text)
-    raw_l = raw_text.lower()
+        return _verbatim_in_raw(n, raw)
+    raw_l = raw.lower
     pos = 0
     for tok in (alpha_tokens[0], alpha_tokens[-1]):
         i = raw_l.find(tok.lower(), pos)
@@ -321,32 +329,71 @@ def _compact_text(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").lower())
 
 
-def _verbatim_in_raw(value: Optional[str], raw_text: str) -> bool:
-    if not value or not raw_text:
+class _RawText:
+    """
+    Raw document text plus the case-folded / squeezed copies the confidence checks match
+    against, each built once on first use instead of once per field or per code.
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ""
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def upper(self) -> str:
+        return self.text.upper()
+
+    @cached_property
+    def squeezed(self) -> str:
+        return re.sub(r"[\s\-]+", "", self.text).lower()
+
+    @cached_property
+    def compact(self) -> str:
+        return _compact_text(self.text)
+
+    @cached_property
+    def no_commas(self) -> str:
+        return self.text.replace(",", "")
+
+    @cached_property
+    def no_dots(self) -> "_RawText":
+        return _RawText(self.text.replace(".", ""))
+
+
+def _raw_view(raw_text) -> _RawText:
+    return raw_text if isinstance(raw_text, _RawText) else _RawText(raw_text)
+
+
+def _verbatim_in_raw(value: Optional[str], raw_text) -> bool:
+    raw = _raw_view(raw_text)
+    if not value or not raw.text:
         return False
     v = str(value).strip()
     if len(v) < 3:
         return False
-    if v in raw_text:
+    if v in raw.text:
         return True
-    if v.lower() in raw_text.lower():
+    if v.lower() in raw.lower:
         return True
     v2 = re.sub(r"[\s\-]+", "", v)
-    r2 = re.sub(r"[\s\-]+", "", raw_text)
-    if len(v2) >= 5 and v2.lower() in r2.lower():
+    if len(v2) >= 5 and v2.lower() in raw.squeezed:
         return True
     return False
 
 
-def _code_in_raw(code: str, raw_text: str) -> bool:
-    if not code or not raw_text:
+def _code_in_raw(code: str, raw_text) -> bool:
+    raw = _raw_view(raw_text)
+    if not code or not raw.text:
         return False
     c = str(code).strip()
     if len(c) < 2:
         return False
-    if c in raw_text:
+    if c in raw.text:
         return True
-    if c.upper() in raw_text.upper():
+    if c.upper() in raw.upper:
         return True
     return False
 
@@ -356,6 +403,7 @@ def calculate_confidence(extracted_data: Dict[str, Any], raw_text: str) -> Dict[
     Per-field high | medium | low using presence + match against raw text.
     """
     raw = raw_text or ""
+    view = _RawText(raw)
     fc: Dict[str, str] = {}
 
     def set_field(key: str, level: str):
@@ -378,44 +426,42 @@ def calculate_confidence(extracted_data: Dict[str, Any], raw_text: str) -> Dict[
         if field in ("billed_amount", "paid_amount"):
             digits = re.sub(r"[^\d.]", "", sval)
             if digits and digits.replace(".", "", 1).isdigit():
-                if _verbatim_in_raw(sval, raw) or re.search(
-                    re.escape(digits.split(".")[0]), raw.replace(",", "")
-                ):
+                if _verbatim_in_raw(sval, view) or digits.split(".")[0] in view.no_commas:
                     set_field(field, "high")
                 else:
                     set_field(field, "medium")
             else:
                 set_field(field, "low")
         elif field == "date_of_service":
-            if _verbatim_in_raw(sval, raw) or sval.replace("-", "/") in raw:
+            if _verbatim_in_raw(sval, view) or sval.replace("-", "/") in raw:
                 set_field(field, "high")
             else:
                 set_field(field, "medium")
         elif field == "denial_reason_text":
-            if len(sval) >= 20 and _compact_text(sval)[:80] in _compact_text(raw):
+            if len(sval) >= 20 and _compact_text(sval)[:80] in view.compact:
                 set_field(field, "high")
-            elif any(w for w in sval.split()[:6] if len(w) > 4 and w.lower() in raw.lower()):
+            elif any(w for w in sval.split()[:6] if len(w) > 4 and w.lower() in view.lower):
                 set_field(field, "medium")
             else:
                 set_field(field, "low")
         else:
             if field == "patient_name":
-                if _person_name_in_raw(sval, raw):
+                if _person_name_in_raw(sval, view):
                     set_field(field, "high")
                 else:
                     set_field(field, "medium")
-            elif _verbatim_in_raw(sval, raw):
+            elif _verbatim_in_raw(sval, view):
                 set_field(field, "high")
             else:
                 set_field(field, "medium")
 
     # Arrays — aggregate level
     for arr_key, item_checker in [
-        ("cpt_codes", lambda item: _code_in_raw(item, raw)),
-        ("icd10_codes", lambda item: _code_in_raw(item.replace(".", ""), raw.replace(".", ""))),
-        ("carc_codes", lambda item: _code_in_raw(item, raw) or _code_in_raw(f"CO {item}", raw)),
-        ("rarc_codes", lambda item: _code_in_raw(item, raw)),
-        ("modifiers", lambda item: _code_in_raw(item, raw) or _code_in_raw("-" + item, raw)),
+        ("cpt_codes", lambda item: _code_in_raw(item, view)),
+        ("icd10_codes", lambda item: _code_in_raw(item.replace(".", ""), view.no_dots)),
+        ("carc_codes", lambda item: _code_in_raw(item, view) or _code_in_raw(f"CO {item}", view)),
+        ("rarc_codes", lambda item: _code_in_raw(item, view)),
+        ("modifiers", lambda item: _code_in_raw(item, view) or _code_in_raw("-" + item, view)),
     ]:
         arr = extracted_data.get(arr_key) or []
         if not arr:
@@ -453,9 +499,24 @@ def llm_carc_to_denial_code_strings(carc_codes: List[str]) -> List[str]:
     return _dedupe_preserve(out)
 
 
+EXTRACTION_INPUT_CHARS = 48000
+EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def extraction_cache_key(raw_text: str, model: str) -> str:
+    """Normalized document text (as sent to the model) + model + system prompt version."""
+    return content_key(
+        normalize_text(raw_text[:EXTRACTION_INPUT_CHARS]),
+        model,
+        prompt_version(EXTRACTION_SYSTEM_PROMPT),
+    )
+
+
 def extract_with_openai(raw_text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """
     Call OpenAI; return post-processed extraction dict or None + error message.
+    Results are cached by content (see llm_cache); failures are not cached. Concurrent calls for
+    the same document share one request (single_flight).
     Never raises — caller merges with regex.
     """
     if not is_llm_extraction_enabled():
@@ -465,22 +526,41 @@ def extract_with_openai(raw_text: str) -> Tuple[Optional[Dict[str, Any]], Option
     if len(text.strip()) < 15:
         return None, "text too short"
 
+    model = os.getenv("OPENAI_EXTRACTION_MODEL", "gpt-4o-mini")
+    cache = get_cache("extraction", EXTRACTION_CACHE_TTL_SECONDS)
+    cache_key = extraction_cache_key(text, model)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, None
+
     try:
-        from openai import OpenAI
+        client = get_openai_client()
     except ImportError:
         return None, "openai package missing"
+    if client is None:
+        return None, "OpenAI not configured"
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    model = os.getenv("OPENAI_EXTRACTION_MODEL", "gpt-4o-mini")
+    (processed, err), shared = get_flight("extraction").do(
+        cache_key, lambda: _extract_uncached(client, model, text, cache, cache_key)
+    )
+    if shared and processed is not None:
+        processed = deepcopy(processed)
+    return processed, err
+
+
+def _extract_uncached(client, model: str, text: str, cache, cache_key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     user_block = (
         "Document text (preserve meaning; line breaks may be messy):\n\n"
-        + text[:48000]
+        + text[:EXTRACTION_INPUT_CHARS]
     )
 
     try:
-        resp = client.chat.completions.create(
+        resp = governed_create(
+            client,
+            breaker=get_breaker("extraction"),
             model=model,
             temperature=0.1,
+            timeout=call_timeout("extraction"),
             response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
@@ -494,6 +574,7 @@ def extract_with_openai(raw_text: str) -> Tuple[Optional[Dict[str, Any]], Option
         return None, str(e)[:300]
 
     processed = post_process_extraction(parsed if isinstance(parsed, dict) else {})
+    cache.set(cache_key, processed)
     return processed, None
 
 
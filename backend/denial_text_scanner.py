@@ -0,0 +1,176 @@
+"""
+Compiled scanner for the regex extraction layer.
+
+DenialLetterParser's extract_* methods each run their own finditer over the full text (CARC,
+CO/PR/OA, three date patterns, amounts, NPI, RARC, CPT, ICD-10) and handle every match in
+Python; extract_structured adds a pass for N-codes. On a dense EOB that is ten-plus scans and
+thousands of Python-level match objects, most of them the same few codes repeated per line.
+
+scan_denial_text() reads the document once as \\w+ tokens (a C-level findall) and dedupes them
+before any Python work. Whole-token patterns (CARC, CPT/HCPCS, NPI, RARC, N-codes, CO45-style
+codes) are classified on the distinct tokens only, in first-seen order. Patterns that span
+tokens run as precompiled scans, and only when the distinct tokens show they can match: dates
+in N/N/N form from runs of /- joined digit tokens (each distinct run parsed once), month-name
+dates only if a month word occurs, CO/PR/OA with separators only if such a bare group occurs,
+ICD-10 only if a code head occurs.
+
+The output is the candidate set the legacy passes produce, quirks included (every 1-3 digit
+token is a CARC candidate; matches of one pattern do not overlap, so 01/02/03/04/05 holds the
+date 01/02/03 only). test_denial_text_scanner checks it against a golden corpus recorded from
+the per-pattern extractors. Labeled fields (claim number, payer, patient, PAYER: / CLM# / DOS:)
+are first-match searches that usually stop early; they stay as precompiled searches.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+_WORD = re.compile(r"\w+")
+# Three or more digit tokens joined by single / or - (MM/DD/YYYY, YYYY-MM-DD, 01/02/03/04 ...)
+_DIGIT_RUN = re.compile(r"(?<!\w)\d+(?:[/-]\d+){2,}(?!\w)")
+_MONTH_WORD = re.compile(r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*", re.IGNORECASE)
+_RARC = re.compile(r"N\d{1,4}|M\d{1,3}|MA\d{2,4}", re.IGNORECASE)
+_HCPCS = re.compile(r"[A-V]\d{4}")
+_ICD_HEAD = re.compile(r"[A-TV-Z][0-9][A-Z0-9]")
+_REMARK = re.compile(r"N\d+", re.IGNORECASE)
+
+# DenialLetterParser's patterns, run only when the token scan shows they can match. CO and ICD
+# lead with the character class and check the word boundary behind it, which lets the regex
+# engine skip ahead to candidate letters; _CO also matches pairs like "CA", filtered afterwards.
+_CO = re.compile(r"([CPO][ORA])(?<=\b..)[:\s-]*(\d{1,3})\b", re.IGNORECASE)
+_MONTH_DATE = re.compile(
+    r"\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{1,2}),?\s+(\d{4})\b", re.IGNORECASE
+)
+_ICD10 = re.compile(r"([A-TV-Z])(?<=\b.)([0-9][A-Z0-9](?:\.[A-Z0-9]{1,4})?)\b")
+_AMOUNT = re.compile(r"\$\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)")
+_RUN_SPLIT = re.compile(r"[/-]")
+
+_ADJUSTMENT_GROUPS = ("CO", "PR", "OA")
+
+RARC_LIMIT = 20
+CPT_LIMIT = 25
+ICD_LIMIT = 25
+
+
+def _dec(tok: str, lo: int, hi: int) -> bool:
+    return lo <= len(tok) <= hi and tok.isdecimal()
+
+
+def _numeric_date(a: str, b: str, c: str) -> Optional[datetime]:
+    try:
+        if int(a) > 1900:  # YYYY-MM-DD format
+            return datetime(int(a), int(b), int(c))
+        year = int(c)  # MM/DD/YYYY format
+        if year < 100:
+            year += 2000
+        return datetime(year, int(a), int(b))
+    except ValueError:
+        return None
+
+
+def _run_dates(run: str) -> List[datetime]:
+    """
+    Dates the MM/DD/YYYY and YYYY-MM-DD patterns find inside one digit run, each pattern
+    scanning left to right without overlapping its own matches.
+    """
+    parts = _RUN_SPLIT.split(run)
+    out = []
+    # (digits in the first part, digits in the last part) of MM/DD/YYYY and YYYY-MM-DD
+    for (a_lo, a_hi), (c_lo, c_hi) in (((1, 2), (2, 4)), ((4, 4), (1, 2))):
+        i = 0
+        while i + 2 < len(parts):
+            a, b, c = parts[i], parts[i + 1], parts[i + 2]
+            if _dec(a, a_lo, a_hi) and _dec(b, 1, 2) and _dec(c, c_lo, c_hi):
+                d = _numeric_date(a, b, c)
+                if d is not None:
+                    out.append(d)
+                i += 3
+            else:
+                i += 1
+    return out
+
+
+def scan_denial_text(text: str) -> Dict[str, Any]:
+    """
+    Candidates of the regex layer in one token scan plus gated multi-token scans:
+      denial_codes   sorted CO-/PR-/OA- and CARC- codes (extract_denial_codes)
+      dates          every parseable date, unordered (extract_dates)
+      amounts        every $ amount, in document order (extract_amounts)
+      npi            first 10-digit token not starting with 1 (extract_npi)
+      rarc_codes / cpt_codes / icd_codes    as extract_rarc_codes / _cpt_codes / _icd_codes
+      remark_codes   N-codes as extract_structured collects them
+    """
+    text = text or ""
+    tokens = dict.fromkeys(_WORD.findall(text))  # distinct tokens in first-seen order
+
+    codes = set()
+    npi = None
+    rarc: List[str] = []
+    cpt: List[str] = []
+    remark: List[str] = []
+    has_group = has_month = has_icd = False
+
+    for tok in tokens:
+        if tok.isdecimal():
+            size = len(tok)
+            if size <= 3:
+                codes.add(f"CARC-{tok}")
+            elif size == 5:
+                if not tok.startswith(("19", "20")):
+                    cpt.append(tok)
+            elif size == 10 and npi is None and not tok.startswith("1"):
+                npi = tok
+            continue
+
+        first = tok[0]
+        if first in "cCoOpP":
+            head = tok[:2].upper()
+            if head in _ADJUSTMENT_GROUPS:
+                if len(tok) == 2:
+                    has_group = True  # "CO 45" / "PR-2": the code is the next token
+                elif _dec(tok[2:], 1, 3):
+                    codes.add(f"{head}-{tok[2:]}")
+            elif tok[:4].lower() == "carc" and _dec(tok[4:], 1, 3):
+                codes.add(f"CARC-{tok[4:]}")
+        if first in "nNmM" and _RARC.fullmatch(tok):
+            rarc.append(tok.upper())
+        if "N" in tok or "n" in tok:
+            remark.extend(_REMARK.findall(tok))
+        if _HCPCS.fullmatch(tok):
+            cpt.append(tok)
+        elif not has_icd and _ICD_HEAD.fullmatch(tok):
+            has_icd = True
+        if not has_month and _MONTH_WORD.fullmatch(tok):
+            has_month = True
+
+    if has_group:
+        for group, code in set(_CO.findall(text)):
+            group = group.upper()
+            if group in _ADJUSTMENT_GROUPS:
+                codes.add(f"{group}-{code}")
+
+    # Each distinct run / month date is parsed once and repeated as often as it occurs
+    dates: List[datetime] = []
+    for run, count in Counter(_DIGIT_RUN.findall(text)).items():
+        dates.extend(_run_dates(run) * count)
+    if has_month:
+        for (month, day, year), count in Counter(_MONTH_DATE.findall(text)).items():
+            try:
+                dates.extend([datetime.strptime(f"{month} {int(day)}, {int(year)}", "%b %d, %Y")] * count)
+            except ValueError:
+                continue
+
+    icd = list(dict.fromkeys(a + b for a, b in _ICD10.findall(text)))[:ICD_LIMIT] if has_icd else []
+
+    return {
+        "denial_codes": sorted(codes),
+        "dates": dates,
+        "amounts": [float(a.replace(",", "")) for a in _AMOUNT.findall(text)],
+        "npi": npi,
+        "rarc_codes": list(dict.fromkeys(rarc))[:RARC_LIMIT],
+        "cpt_codes": cpt[:CPT_LIMIT],
+        "icd_codes": icd,
+        "remark_codes": list(dict.fromkeys(x.upper() for x in remark)),
+    }
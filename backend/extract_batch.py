@@ -0,0 +1,282 @@
+"""
+Bulk denial text extraction (/api/extract/batch).
+
+Clearinghouse feeds send hundreds of denial texts at a time. Posting them one by one to
+/api/extract/text builds a parser per call and runs the regex layer and the LLM one after
+the other. parse_batch_body() reads a JSON array (of strings or {"id", "text"} objects), an
+object with a "documents" array, or NDJSON (one string or object per line). Each item is checked
+the same way /api/extract/text checks a body. A bad item becomes an error for that item, not
+for the whole request.
+
+iter_extractions() splits parse_denial_from_text into its stages and runs them as a pipeline:
+  - regex layer (scan, labeled fields, regex fields) on a pool of worker processes, since it is
+    CPU-bound and re holds the GIL
+  - LLM layer (extract_with_openai, so the shared client, cache, single-flight and governor all
+    apply) on a bounded thread pool, in parallel with the regex layer; calls run at
+    PRIORITY_BATCH so interactive extractions keep going first
+  - merge and response building back on the process pool once both layers are in
+Results are yielded as documents finish, each with its index and id; an exception in any stage
+becomes that document's error. The pools are shared by all requests, so the LLM bound is per
+process, not per request. If a worker process dies (OOM kill), the broken pool is dropped, so the
+next batch starts a fresh one, and the rest of this batch runs those stages in-process.
+
+The endpoint requires a JWT and refuses bodies over EXTRACT_BATCH_MAX_BODY_MB before reading them.
+
+Env:
+  EXTRACT_BATCH_MAX_DOCUMENTS     documents per request
+  EXTRACT_BATCH_MAX_BODY_MB       request body limit
+  EXTRACT_BATCH_WORKERS           regex-layer worker processes (default: CPU count, at most 4;
+                                  1 = one in-process thread)
+  EXTRACT_BATCH_LLM_CONCURRENCY   documents in the LLM layer at once
+"""
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from denial_llm_extraction import extract_with_openai
+from llm_governor import PRIORITY_BATCH, llm_priority
+from pdf_parser import DenialLetterParser
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_DOCUMENTS = _env_int("EXTRACT_BATCH_MAX_DOCUMENTS", 500)
+REGEX_WORKERS = _env_int("EXTRACT_BATCH_WORKERS", min(4, os.cpu_count() or 1))
+LLM_CONCURRENCY = _env_int("EXTRACT_BATCH_LLM_CONCURRENCY", 4)
+MAX_TEXT_CHARS = 100_000  # same limit as /api/extract/text
+MAX_BATCH_BODY_BYTES = _env_int("EXTRACT_BATCH_MAX_BODY_MB", 8) * 1024 * 1024
+
+_pools: Dict[str, Executor] = {}
+_pools_lock = threading.Lock()
+_stats = {"batches": 0, "documents": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+_worker_parser: Optional[DenialLetterParser] = None
+
+
+def _get_regex_pool() -> Executor:
+    with _pools_lock:
+        if "regex" not in _pools:
+            if REGEX_WORKERS > 1:
+                # spawn: forking a threaded web worker can copy held locks into the child
+                _pools["regex"] = ProcessPoolExecutor(
+                    max_workers=REGEX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                _pools["regex"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extract-regex")
+        return _pools["regex"]
+
+
+def _drop_regex_pool(pool: Executor) -> bool:
+    """Forget a broken process pool so the next batch gets a fresh one. Returns True."""
+    logger.warning("batch extraction worker process died; continuing in-process")
+    with _pools_lock:
+        if _pools.get("regex") is pool:
+            del _pools["regex"]
+    pool.shutdown(wait=False, cancel_futures=True)
+    return True
+
+
+def _run_inline(fn, *args) -> Future:
+    """fn(*args) in this thread, as a finished Future (fallback once the process pool broke)."""
+    fut: Future = Future()
+    try:
+        fut.set_result(fn(*args))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+
+def _get_llm_pool() -> Executor:
+    with _pools_lock:
+        if "llm" not in _pools:
+            _pools["llm"] = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="extract-llm")
+        return _pools["llm"]
+
+
+def _parser() -> DenialLetterParser:
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = DenialLetterParser()
+    return _worker_parser
+
+
+def _regex_stage(text: str) -> Dict[str, Any]:
+    return _parser().regex_layers(text)
+
+
+def _llm_stage(text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    with llm_priority(PRIORITY_BATCH):
+        return extract_with_openai(text)
+
+
+def _combine_stage(
+    text: str, layers: Dict[str, Any], llm_proc: Optional[Dict[str, Any]], llm_err: Optional[str]
+) -> Dict[str, Any]:
+    return _parser().combine_layers(text, layers, llm_proc, llm_err)
+
+
+def _item(index: int, raw: Any) -> Dict[str, Any]:
+    """{'index', 'id', 'text'} for a valid document, {'index', 'id', 'error'} otherwise."""
+    doc_id: Any = index
+    text = raw
+    if isinstance(raw, dict):
+        doc_id = raw.get("id", index)
+        text = raw.get("text")
+    if not isinstance(doc_id, (str, int)) or isinstance(doc_id, bool):
+        doc_id = index
+    if text is not None and not isinstance(text, str):
+        return {"index": index, "id": doc_id, "error": "Expected a string or an object with 'text'"}
+    text = (text or "").strip()
+    if not text:
+        return {"index": index, "id": doc_id, "error": "Empty text"}
+    if len(text) > MAX_TEXT_CHARS:
+        return {"index": index, "id": doc_id, "error": "Text exceeds maximum length"}
+    return {"index": index, "id": doc_id, "text": text}
+
+
+def _ndjson_items(body: str) -> List[Dict[str, Any]]:
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(_item(len(items), json.loads(line)))
+        except ValueError:
+            items.append({"index": len(items), "id": len(items), "error": "Invalid JSON line"})
+    return items
+
+
+def parse_batch_body(body: bytes, content_type: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    (items, None) for a readable request body, ([], message) otherwise. NDJSON is read when the
+    content type says so, or when the body is not a single JSON document.
+    """
+    try:
+        text = (body or b"").decode("utf-8")
+    except UnicodeDecodeError:
+        return [], "Body must be UTF-8"
+    ctype = (content_type or "").lower()
+    if "ndjson" in ctype or "jsonl" in ctype:
+        items = _ndjson_items(text)
+    else:
+        try:
+            doc = json.loads(text)
+        except ValueError:
+            items = _ndjson_items(text)
+            if not items or all(i.get("error") == "Invalid JSON line" for i in items):
+                return [], "Body must be a JSON array, an object with 'documents', or NDJSON"
+        else:
+            if isinstance(doc, dict):
+                doc = doc.get("documents")
+            if not isinstance(doc, list):
+                return [], "Body must be a JSON array, an object with 'documents', or NDJSON"
+            items = [_item(i, raw) for i, raw in enumerate(doc)]
+    if not items:
+        return [], "No documents"
+    if len(items) > MAX_DOCUMENTS:
+        return [], f"Too many documents (max {MAX_DOCUMENTS})"
+    return items, None
+
+
+def _error(item: Dict[str, Any], message: str) -> Dict[str, Any]:
+    return {"index": item["index"], "id": item["id"], "success": False, "error": message}
+
+
+def iter_extractions(
+    items: List[Dict[str, Any]],
+    regex_pool: Optional[Executor] = None,
+    llm_pool: Optional[Executor] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {'index', 'id', **parse_denial_from_text result} or {'index', 'id', 'success': False,
+    'error'} per item, in completion order. Closing the generator (client gone) cancels the
+    stages that have not started.
+    """
+    regex_pool = regex_pool or _get_regex_pool()
+    llm_pool = llm_pool or _get_llm_pool()
+    parser = DenialLetterParser()
+    pending: Dict[Future, Tuple[str, Dict[str, Any], Tuple]] = {}
+    partial: Dict[int, Dict[str, Any]] = {}
+    failed = 0
+    broken = False
+
+    def cpu(stage, item, fn, *args):
+        nonlocal broken
+        if not broken:
+            try:
+                pending[regex_pool.submit(fn, *args)] = (stage, item, (fn, *args))
+                return
+            except BrokenProcessPool:
+                broken = _drop_regex_pool(regex_pool)
+        pending[_run_inline(fn, *args)] = (stage, item, (fn, *args))
+
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["documents"] += len(items)
+
+    try:
+        for item in items:
+            if "error" in item:
+                failed += 1
+                yield _error(item, item["error"])
+            elif not parser.has_parseable_text(item["text"]):
+                yield {"index": item["index"], "id": item["id"], **parser.insufficient_text_response(item["text"])}
+            else:
+                partial[item["index"]] = {}
+                cpu("regex", item, _regex_stage, item["text"])
+                pending[llm_pool.submit(_llm_stage, item["text"])] = ("llm", item, ())
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, item, call = pending.pop(fut)
+                state = partial.get(item["index"])
+                if state is None:
+                    continue  # the other stage of this document already failed
+                try:
+                    value = fut.result()
+                except BrokenProcessPool:
+                    broken = broken or _drop_regex_pool(regex_pool)
+                    pending[_run_inline(*call)] = (stage, item, call)
+                    continue
+                except Exception as e:
+                    logger.warning("batch extraction %s stage failed for item %s: %s", stage, item["index"], e)
+                    del partial[item["index"]]
+                    failed += 1
+                    yield _error(item, str(e) or type(e).__name__)
+                    continue
+                if stage == "combine":
+                    del partial[item["index"]]
+                    yield {"index": item["index"], "id": item["id"], **value}
+                    continue
+                state[stage] = value
+                if "regex" in state and "llm" in state:
+                    llm_proc, llm_err = state["llm"]
+                    cpu("combine", item, _combine_stage, item["text"], state["regex"], llm_proc, llm_err)
+    finally:
+        for fut in pending:
+            fut.cancel()
+        with _stats_lock:
+            _stats["failed"] += failed
+
+
+def extract_batch_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        s = dict(_stats)
+    s.update({"max_documents": MAX_DOCUMENTS, "regex_workers": REGEX_WORKERS, "llm_concurrency": LLM_CONCURRENCY})
+    return s
@@ -0,0 +1,206 @@
+"""
+Accept-then-poll appeal generation.
+
+POST /api/generate/appeal/jobs stores the pending appeal and a GenerationJob, hands the
+OpenAI round-trip to a small in-process thread pool, and returns 202 with the job handle.
+The web worker is free again after a couple of inserts, so slow generations no longer pin
+gunicorn's sync workers (or starve /health). Clients poll GET /api/generate/appeal/jobs/<id>.
+Job state lives in the database, so any worker process can answer the poll.
+
+An Idempotency-Key header is scoped to the user. A retried POST with the same key returns
+the existing job instead of generating again. Jobs left queued/running by a process that died
+are marked as errors after GENERATION_JOB_STALE_SECONDS, so a client polling one of them can
+resubmit.
+
+The same executor runs the LLM refinement of draft-first generations (speculative_generation.py).
+
+Env:
+  GENERATION_WORKERS              background generation threads per process
+  GENERATION_JOB_STALE_SECONDS    age after which an unfinished job counts as interrupted
+  GENERATION_EMBEDDED_EXECUTOR    0 to skip the startup schema check / stale sweep
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from batch_job_queue import _env_int
+from models import GenerationJob, db
+
+logger = logging.getLogger(__name__)
+
+GENERATION_WORKERS = _env_int("GENERATION_WORKERS", 4)
+STALE_SECONDS = _env_int("GENERATION_JOB_STALE_SECONDS", 600)
+IDEMPOTENCY_KEY_MAX = 255
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats = {"submitted": 0, "running": 0, "done": 0, "failed": 0}
+_stats_lock = threading.Lock()
+_started = False
+
+
+def _bump(key: str, delta: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += delta
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="appeal-gen")
+        return _executor
+
+
+def create_generation_job(user_id, appeal_id: str, idempotency_key: Optional[str] = None) -> Tuple[GenerationJob, bool]:
+    """
+    Add a queued job and commit it together with whatever the caller already added to the session
+    (the pending Appeal). Returns (job, created). created is False when the user already has a job
+    for this Idempotency-Key; the session is rolled back in that case, so the new appeal is dropped.
+    """
+    key = (idempotency_key or "").strip()[:IDEMPOTENCY_KEY_MAX] or None
+    if key:
+        existing = GenerationJob.query.filter_by(user_id=user_id, idempotency_key=key).first()
+        if existing is not None:
+            db.session.rollback()
+            return existing, False
+    job = GenerationJob(
+        job_id=uuid.uuid4().hex,
+        user_id=user_id,
+        appeal_id=appeal_id,
+        idempotency_key=key,
+        status="queued",
+        created_at=datetime.utcnow(),
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request with the same key won the insert
+        db.session.rollback()
+        existing = GenerationJob.query.filter_by(user_id=user_id, idempotency_key=key).first()
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+
+def _set_status(job_id: str, status: str, error: Optional[str] = None) -> None:
+    values: Dict[str, Any] = {"status": status}
+    if status == "running":
+        values["started_at"] = datetime.utcnow()
+    else:
+        values["finished_at"] = datetime.utcnow()
+        values["error"] = error
+    GenerationJob.query.filter_by(job_id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def submit_generation_job(app, job_id: str, run: Callable[[], None]) -> None:
+    """
+    Run run() on the generation pool inside an app context, moving the job through
+    running -> done (or error with the exception text). run() does the generation and commits
+    the appeal.
+    """
+
+    def task():
+        with app.app_context():
+            _bump("running")
+            try:
+                _set_status(job_id, "running")
+                run()
+                _set_status(job_id, "done")
+                _bump("done")
+            except Exception as e:
+                logger.exception("Generation job %s failed", job_id)
+                db.session.rollback()
+                _bump("failed")
+                try:
+                    _set_status(job_id, "error", f"Generation failed: {e}"[:2000])
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Generation job %s: could not record failure", job_id)
+            finally:
+                _bump("running", -1)
+                db.session.remove()
+
+    _bump("submitted")
+    _get_executor().submit(task)
+
+
+def job_view(job: GenerationJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.job_id,
+        "appeal_id": job.appeal_id,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": f"/api/generate/appeal/jobs/{job.job_id}",
+    }
+
+
+def sweep_stale_generation_jobs(now: Optional[datetime] = None) -> int:
+    """Mark queued/running jobs older than STALE_SECONDS as interrupted; returns how many."""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=STALE_SECONDS)
+    n = (
+        GenerationJob.query.filter(
+            GenerationJob.status.in_(("queued", "running")), GenerationJob.created_at < cutoff
+        ).update(
+            {
+                "status": "error",
+                "error": "Generation interrupted (server restarted); please retry",
+                "finished_at": datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    return n
+
+
+def start_generation_executor(app) -> None:
+    """
+    Ensure the generation tables/columns exist and sweep interrupted jobs once per process
+    (pool threads start lazily).
+    """
+    global _started
+    if os.getenv("GENERATION_EMBEDDED_EXECUTOR", "1").strip().lower() in ("0", "false", "no"):
+        return
+    with _executor_lock:
+        if _started:
+            return
+        _started = True
+    with app.app_context():
+        from migrate_appeal_routing import ensure_appeal_routing_column
+        from migrate_generation_jobs import ensure_generation_jobs_schema
+        from migrate_letter_versions import ensure_letter_versions_schema
+
+        ensure_generation_jobs_schema(db)
+        # appeals columns the generation paths write (routing decision, letter version)
+        ensure_appeal_routing_column(db)
+        ensure_letter_versions_schema(db)
+        try:
+            swept = sweep_stale_generation_jobs()
+            if swept:
+                logger.warning("Marked %s interrupted generation job(s) as failed", swept)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Generation job sweep failed")
+        finally:
+            db.session.remove()
+
+
+def generation_job_stats() -> Dict[str, int]:
+    with _stats_lock:
+        s = dict(_stats)
+    s["workers"] = GENERATION_WORKERS
+    return s
@@ -0,0 +1,255 @@
+"""
+Idempotency-Key support for POST endpoints that create appeals or spend OpenAI tokens.
+
+A request that carries an Idempotency-Key header claims (endpoint, user, key) in the
+idempotency_keys table before the view runs. The row holds a fingerprint of the request
+(method, path, body) and, once the view returns 2xx, the response status and body. Outcomes:
+  - new key: the view runs once and its 2xx response is stored for IDEMPOTENCY_TTL_SECONDS.
+  - replay with the same fingerprint: the stored response is returned with Idempotent-Replay: true,
+    and nothing is generated or inserted again.
+  - same key with a different body: 422.
+  - concurrent duplicate while the first request is still running: waits for it to finish
+    (up to IDEMPOTENCY_WAIT_SECONDS, then 409 with Retry-After).
+Non-2xx responses and exceptions release the key so the client can retry. A claim whose owner
+died is taken over once its lock expires. Rows are written on their own connection, so they
+do not interfere with the view's session transaction.
+
+Env:
+  IDEMPOTENCY_TTL_SECONDS    how long a stored response is replayed
+  IDEMPOTENCY_LOCK_SECONDS   how long an in-progress claim blocks duplicates before it is taken over
+  IDEMPOTENCY_WAIT_SECONDS   how long a concurrent duplicate waits for the first request
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+KEY_MAX = 255
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+TTL_SECONDS = _env_int("IDEMPOTENCY_TTL_SECONDS", 86400)
+LOCK_SECONDS = _env_int("IDEMPOTENCY_LOCK_SECONDS", 150)
+WAIT_SECONDS = _env_int("IDEMPOTENCY_WAIT_SECONDS", 120)
+POLL_SECONDS = 0.2
+_PURGE_EVERY = 200
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+_writes = 0
+_stats = {"claimed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "mismatches": 0, "released": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _ensure_schema() -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            from migrate_idempotency_keys import ensure_idempotency_keys_schema
+
+            ensure_idempotency_keys_schema(db)
+            _schema_ready = True
+
+
+def request_fingerprint() -> str:
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(b"\0")
+    h.update(request.path.encode())
+    h.update(b"\0")
+    h.update(request.get_data(cache=True) or b"")
+    return h.hexdigest()
+
+
+def _row(conn, scope: str, user_key: str, key: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        text(
+            "SELECT fingerprint, status, response_status, response_body, content_type, locked_until, expires_at "
+            "FROM idempotency_keys WHERE scope = :scope AND user_key = :user_key AND idem_key = :key"
+        ),
+        {"scope": scope, "user_key": user_key, "key": key},
+    ).mappings().first()
+    return dict(row) if row else None
+
+
+def _try_claim(scope: str, user_key: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    Claim the key for this request. Returns None when claimed, else the existing row (done,
+    mismatched or still in progress). Expired rows and abandoned claims are replaced.
+    """
+    global _writes
+    now = datetime.utcnow()
+    params = {
+        "scope": scope,
+        "user_key": user_key,
+        "key": key,
+        "fp": fingerprint,
+        "now": now,
+        "locked_until": now + timedelta(seconds=LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=TTL_SECONDS),
+    }
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM idempotency_keys WHERE scope = :scope AND user_key = :user_key AND idem_key = :key "
+                "AND (expires_at < :now OR (status = 'in_progress' AND locked_until < :now))"
+            ),
+            params,
+        )
+        inserted = conn.execute(
+            text(
+                "INSERT INTO idempotency_keys "
+                "(scope, user_key, idem_key, fingerprint, status, locked_until, created_at, expires_at) "
+                "VALUES (:scope, :user_key, :key, :fp, 'in_progress', :locked_until, :now, :expires_at) "
+                "ON CONFLICT (scope, user_key, idem_key) DO NOTHING"
+            ),
+            params,
+        ).rowcount
+        if inserted:
+            with _stats_lock:
+                _writes += 1
+                purge = _writes % _PURGE_EVERY == 0
+            if purge:
+                conn.execute(text("DELETE FROM idempotency_keys WHERE expires_at < :now"), params)
+            return None
+        return _row(conn, scope, user_key, key)
+
+
+def _store(scope: str, user_key: str, key: str, resp: Response) -> None:
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE idempotency_keys SET status = 'done', response_status = :status, "
+                "response_body = :body, content_type = :ctype WHERE scope = :scope AND user_key = :user_key "
+                "AND idem_key = :key"
+            ),
+            {
+                "status": resp.status_code,
+                "body": resp.get_data(as_text=True),
+                "ctype": resp.content_type,
+                "scope": scope,
+                "user_key": user_key,
+                "key": key,
+            },
+        )
+
+
+def _release(scope: str, user_key: str, key: str) -> None:
+    _count("released")
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM idempotency_keys WHERE scope = :scope AND user_key = :user_key "
+                "AND idem_key = :key AND status = 'in_progress'"
+            ),
+            {"scope": scope, "user_key": user_key, "key": key},
+        )
+
+
+def _replay(row: Dict[str, Any]) -> Response:
+    _count("replayed")
+    resp = Response(
+        row["response_body"] or "",
+        status=int(row["response_status"] or 200),
+        content_type=row["content_type"] or "application/json",
+    )
+    resp.headers["Idempotent-Replay"] = "true"
+    return resp
+
+
+def idempotent(scope: str, user: Callable[[], Any]):
+    """
+    Decorate a POST view so requests carrying Idempotency-Key run at most once per
+    (scope, user, key). `user()` returns the caller's id; when it is falsy (unauthenticated),
+    the view runs without idempotency so it can return its own auth error.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.headers.get(HEADER) or "").strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > KEY_MAX:
+                return jsonify({"error": f"{HEADER} must be at most {KEY_MAX} characters"}), 400
+            user_key = user()
+            if not user_key:
+                return view(*args, **kwargs)
+            user_key = str(user_key)
+            _ensure_schema()
+            fingerprint = request_fingerprint()
+
+            deadline = time.monotonic() + WAIT_SECONDS
+            waited = False
+            while True:
+                existing = _try_claim(scope, user_key, key, fingerprint)
+                if existing is None:
+                    break
+                if existing["fingerprint"] != fingerprint:
+                    _count("mismatches")
+                    return jsonify({"error": f"{HEADER} was already used with a different request"}), 422
+                if existing["status"] == "done":
+                    return _replay(existing)
+                if not waited:
+                    waited = True
+                    _count("waited")
+                if time.monotonic() >= deadline:
+                    _count("conflicts")
+                    return (
+                        jsonify({"error": "A request with this Idempotency-Key is still in progress"}),
+                        409,
+                        {"Retry-After": "5"},
+                    )
+                time.sleep(POLL_SECONDS)
+
+            _count("claimed")
+            try:
+                resp = make_response(view(*args, **kwargs))
+            except BaseException:
+                _release(scope, user_key, key)
+                raise
+            if 200 <= resp.status_code < 300 and not resp.is_streamed:
+                try:
+                    _store(scope, user_key, key, resp)
+                except Exception:
+                    logger.exception("Could not store idempotent response for %s", scope)
+                    _release(scope, user_key, key)
+            else:
+                _release(scope, user_key, key)
+            return resp
+
+        return wrapper
+
+    return decorator
+
+
+def idempotency_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,261 @@
+"""
+Content-addressed cache for LLM results.
+
+Two tiers: a per-process LRU (microseconds, lost on restart) in front of the shared llm_cache
+table (survives restarts, shared by web and worker processes, entries expire after the
+namespace TTL). Keys are SHA-256 digests of everything that determines the model output
+(normalized input, model, prompt version), so a prompt edit changes every key and stale entries
+simply age out. Only successful results are stored; values are JSON.
+
+Env:
+  LLM_CACHE_ENABLED              0 = bypass every cache (always call the model)
+  LLM_CACHE_LRU_SIZE             in-process entries per namespace
+  LLM_CACHE_DB_MAX_ROWS          table rows kept per namespace; least recently hit are evicted
+  EXTRACTION_CACHE_TTL_SECONDS   lifetime of a cached denial extraction
+  APPEAL_CACHE_ENABLED           1 = also cache appeal letters (per user; see appeal_submission_engine)
+  APPEAL_CACHE_TTL_SECONDS       lifetime of a cached appeal letter
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import has_app_context
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+LRU_SIZE = _env_int("LLM_CACHE_LRU_SIZE", 512)
+DB_MAX_ROWS = _env_int("LLM_CACHE_DB_MAX_ROWS", 50000)
+EVICT_EVERY_WRITES = 200
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_caches: Dict[str, "TieredCache"] = {}
+
+
+def cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+
+
+def prompt_version(prompt: str) -> str:
+    """Short digest of a system prompt; part of every key so prompt edits invalidate the cache."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+_SPACE_RE = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_text(raw: str) -> str:
+    """Whitespace-insensitive form of document text (paste vs PDF extraction differ mostly here)."""
+    lines = (_SPACE_RE.sub(" ", ln).strip() for ln in raw.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def content_key(*parts: Any) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _ensure_schema() -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            from migrate_llm_cache import ensure_llm_cache_schema
+
+            ensure_llm_cache_schema(db)
+            _schema_ready = True
+
+
+class TieredCache:
+    """LRU + llm_cache table for one namespace. Values must be JSON-serializable."""
+
+    def __init__(self, namespace: str, ttl_seconds: int, lru_size: Optional[int] = None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.lru_size = LRU_SIZE if lru_size is None else lru_size
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, key: str, scope: str = "") -> Optional[Any]:
+        """Cached value (a private copy) or None."""
+        if not cache_enabled():
+            return None
+        full = f"{scope}:{key}"
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(full)
+            if entry is not None:
+                if entry[1] > now:
+                    self._lru.move_to_end(full)
+                    self.stats["memory_hits"] += 1
+                    return deepcopy(entry[0])
+                del self._lru[full]
+        found = self._db_get(key, scope)
+        if found is None:
+            self._count("misses")
+            return None
+        value, ttl_left = found
+        self._count("db_hits")
+        self._remember(full, value, now + ttl_left)
+        return deepcopy(value)
+
+    def set(self, key: str, value: Any, scope: str = "") -> None:
+        if not cache_enabled():
+            return
+        self._remember(f"{scope}:{key}", deepcopy(value), time.time() + self.ttl_seconds)
+        self._db_set(key, scope, value)
+        self._count("writes")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def _remember(self, full: str, value: Any, expires: float) -> None:
+        if self.lru_size <= 0:
+            return
+        with self._lock:
+            self._lru[full] = (value, expires)
+            self._lru.move_to_end(full)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _db_get(self, key: str, scope: str) -> Optional[tuple]:
+        """(value, seconds until expiry) from the table, or None."""
+        if not has_app_context():
+            return None
+        try:
+            _ensure_schema()
+            now = datetime.utcnow()
+            with db.engine.begin() as conn:
+                row = conn.execute(
+                    text(
+                        """SELECT value, expires_at FROM llm_cache
+                           WHERE namespace = :ns AND scope = :scope AND cache_key = :key AND expires_at > :now"""
+                    ),
+                    {"ns": self.namespace, "scope": scope, "key": key, "now": now},
+                ).first()
+                if row is None:
+                    return None
+                conn.execute(
+                    text(
+                        """UPDATE llm_cache SET hit_count = hit_count + 1, last_hit_at = :now
+                           WHERE namespace = :ns AND scope = :scope AND cache_key = :key"""
+                    ),
+                    {"ns": self.namespace, "scope": scope, "key": key, "now": now},
+                )
+            expires_at = row[1]
+            if isinstance(expires_at, str):  # SQLite text timestamps
+                expires_at = datetime.fromisoformat(expires_at)
+            return json.loads(row[0]), max(0.0, (expires_at - now).total_seconds())
+        except Exception as e:
+            self._count("errors")
+            logger.debug("llm_cache read failed (%s): %s", self.namespace, e)
+            return None
+
+    def _db_set(self, key: str, scope: str, value: Any) -> None:
+        if not has_app_context():
+            return
+        try:
+            _ensure_schema()
+            now = datetime.utcnow()
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text(
+                        """INSERT INTO llm_cache
+                               (namespace, scope, cache_key, value, created_at, expires_at, last_hit_at, hit_count)
+                           VALUES (:ns, :scope, :key, :value, :now, :expires, :now, 0)
+                           ON CONFLICT (namespace, scope, cache_key) DO UPDATE SET
+                               value = excluded.value, created_at = excluded.created_at,
+                               expires_at = excluded.expires_at, last_hit_at = excluded.last_hit_at"""
+                    ),
+                    {
+                        "ns": self.namespace,
+                        "scope": scope,
+                        "key": key,
+                        "value": json.dumps(value, default=str),
+                        "now": now,
+                        "expires": now + timedelta(seconds=self.ttl_seconds),
+                    },
+                )
+            with self._lock:
+                self._writes += 1
+                due = self._writes % EVICT_EVERY_WRITES == 1
+            if due:
+                self.evict()
+        except Exception as e:
+            self._count("errors")
+            logger.debug("llm_cache write failed (%s): %s", self.namespace, e)
+
+    def evict(self, max_rows: Optional[int] = None) -> int:
+        """Delete expired rows, then the least recently hit beyond max_rows. Returns rows deleted."""
+        max_rows = DB_MAX_ROWS if max_rows is None else max_rows
+        with db.engine.begin() as conn:
+            deleted = conn.execute(
+                text("DELETE FROM llm_cache WHERE namespace = :ns AND expires_at <= :now"),
+                {"ns": self.namespace, "now": datetime.utcnow()},
+            ).rowcount
+            deleted += conn.execute(
+                text(
+                    """DELETE FROM llm_cache WHERE namespace = :ns AND id IN (
+                           SELECT id FROM llm_cache WHERE namespace = :ns
+                           ORDER BY last_hit_at DESC LIMIT -1 OFFSET :keep
+                       )"""
+                    if conn.dialect.name == "sqlite"
+                    else """DELETE FROM llm_cache WHERE namespace = :ns AND id IN (
+                           SELECT id FROM llm_cache WHERE namespace = :ns
+                           ORDER BY last_hit_at DESC OFFSET :keep
+                       )"""
+                ),
+                {"ns": self.namespace, "keep": max_rows},
+            ).rowcount
+        self._count("evictions", max(0, deleted or 0))
+        return deleted or 0
+
+
+def get_cache(namespace: str, ttl_seconds: int) -> TieredCache:
+    cache = _caches.get(namespace)
+    if cache is None:
+        cache = _caches.setdefault(namespace, TieredCache(namespace, ttl_seconds))
+    return cache
+
+
+def llm_cache_stats() -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for ns, cache in _caches.items():
+        s = dict(cache.stats)
+        lookups = s["memory_hits"] + s["db_hits"] + s["misses"]
+        s["hit_ratio"] = round((s["memory_hits"] + s["db_hits"]) / lookups, 4) if lookups else 0.0
+        out[ns] = s
+    return out
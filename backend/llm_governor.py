@@ -0,0 +1,277 @@
+"""
+Client-side OpenAI rate governor.
+
+Every LLM call takes a permit before it is sent. A permit needs one request from the RPM bucket,
+its estimated tokens (prompt characters / 4 + max_tokens) from the TPM bucket, and a concurrency
+slot. Both buckets refill continuously. Callers that cannot be served wait in a priority queue,
+so interactive requests (the default) go ahead of batch rows (code run inside
+llm_priority(PRIORITY_BATCH)), FIFO within a priority. After a call, the estimate is corrected
+with the reported usage. A 429 from OpenAI pauses the governor for the retry-after period instead
+of letting every queued caller hit the same limit. Limits are per process: set them to this
+process's share of the org quota.
+
+Env:
+  OPENAI_RPM_LIMIT                requests per minute
+  OPENAI_TPM_LIMIT                tokens per minute
+  OPENAI_MAX_CONCURRENCY          calls in flight
+  LLM_GOVERNOR_MAX_WAIT_SECONDS   queue wait before a caller gives up (GovernorTimeout)
+"""
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class GovernorTimeout(RuntimeError):
+    """No permit within the allowed wait; callers treat it like a rate-limit error."""
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Run LLM calls in this block (this thread / context) at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = 0) -> int:
+    """Rough prompt size (~4 characters per token, plus per-message overhead) and the completion budget."""
+    chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return chars // 4 + 8 * len(messages) + int(max_tokens or 0)
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class Permit:
+    def __init__(self, governor: "LLMGovernor", tokens: int):
+        self._governor = governor
+        self.tokens = tokens
+
+    def record_usage(self, total_tokens: Optional[int]) -> None:
+        """Correct the TPM bucket with the tokens OpenAI actually counted."""
+        if total_tokens is not None:
+            self._governor._adjust_tokens(int(total_tokens) - self.tokens)
+            self.tokens = int(total_tokens)
+
+    def rate_limited(self, retry_after: Optional[float] = None) -> None:
+        self._governor.backoff(retry_after)
+
+
+class LLMGovernor:
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int, max_wait_seconds: float):
+        self._cond = threading.Condition()
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_wait_seconds = max_wait_seconds
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._queue: list = []
+        self._seq = itertools.count()
+        self.stats = {
+            "granted": 0,
+            "queued": 0,
+            "timeouts": 0,
+            "rate_limited": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _ready(self, cost: float, now: float) -> float:
+        """0 when a permit can be granted now, else seconds to wait (or a short poll for a slot)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= self.max_concurrency:
+            return 1.0
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(self._requests.seconds_until(1), self._tokens.seconds_until(cost))
+
+    @contextmanager
+    def permit(self, est_tokens: int, priority: Optional[int] = None, max_wait: Optional[float] = None):
+        """Block until a permit is granted (priority order), yield it, release the slot on exit."""
+        priority = current_priority() if priority is None else priority
+        max_wait = self.max_wait_seconds if max_wait is None else max_wait
+        cost = float(max(1, est_tokens))
+        start = time.monotonic()
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            queued = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._ready(cost, now) if self._queue[0] == entry else 1.0
+                    if wait <= 0:
+                        break
+                    if not queued:
+                        queued = True
+                        self.stats["queued"] += 1
+                    remaining = max_wait - (now - start)
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise GovernorTimeout(f"OpenAI governor: no capacity within {max_wait:.0f}s")
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+            self._requests.level -= 1
+            self._tokens.level -= min(cost, self._tokens.capacity)
+            self._in_flight += 1
+            waited = time.monotonic() - start
+            self.stats["granted"] += 1
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+        try:
+            yield Permit(self, int(cost))
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _adjust_tokens(self, delta: int) -> None:
+        with self._cond:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level - delta)
+            self._cond.notify_all()
+
+    def backoff(self, seconds: Optional[float] = None) -> None:
+        """OpenAI returned 429: hold every queued caller for `seconds` (default 10)."""
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + (seconds or 10.0))
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            depth: Dict[str, int] = {}
+            for priority, _seq in self._queue:
+                label = "interactive" if priority <= PRIORITY_INTERACTIVE else "batch"
+                depth[label] = depth.get(label, 0) + 1
+            s = dict(self.stats)
+            s.update(
+                queue_depth=len(self._queue),
+                queue_depth_by_priority=depth,
+                in_flight=self._in_flight,
+                wait_seconds_avg=round(s["wait_seconds_total"] / s["granted"], 4) if s["granted"] else 0.0,
+                paused_seconds=round(max(0.0, self._paused_until - time.monotonic()), 2),
+                rpm_limit=self._requests.capacity,
+                tpm_limit=self._tokens.capacity,
+                max_concurrency=self.max_concurrency,
+            )
+            s["wait_seconds_total"] = round(s["wait_seconds_total"], 4)
+            s["wait_seconds_max"] = round(s["wait_seconds_max"], 4)
+        return s
+
+
+_governor: Optional[LLMGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> LLMGovernor:
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = LLMGovernor(
+                    rpm=_env_num("OPENAI_RPM_LIMIT", 500),
+                    tpm=_env_num("OPENAI_TPM_LIMIT", 200000),
+                    max_concurrency=int(_env_num("OPENAI_MAX_CONCURRENCY", 16)),
+                    max_wait_seconds=_env_num("LLM_GOVERNOR_MAX_WAIT_SECONDS", 120),
+                )
+    return _governor
+
+
+def retry_after_seconds(error: Any) -> Optional[float]:
+    """Retry-After from an openai.RateLimitError's response headers, if present."""
+    try:
+        value = error.response.headers.get("retry-after")
+        return float(value) if value else None
+    except Exception:
+        return None
+
+
+def _guarded(breaker: Any):
+    """breaker.guard() for the HTTP call only, so time queued for a permit is not judged as OpenAI's."""
+    return breaker.guard() if breaker is not None else nullcontext()
+
+
+def governed_create(client: Any, breaker: Any = None, **kwargs: Any) -> Any:
+    """
+    client.chat.completions.create(**kwargs) under a governor permit at the caller's priority.
+    The debit is corrected from resp.usage and a 429 pauses the governor before re-raising.
+    With a circuit breaker, an open breaker fails before queueing and only the call is timed.
+    """
+    if breaker is not None:
+        breaker.reject_if_open()
+    est = estimate_tokens(kwargs.get("messages") or [], kwargs.get("max_tokens") or 1000)
+    with get_governor().permit(est) as permit:
+        try:
+            with _guarded(breaker):
+                resp = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                permit.rate_limited(retry_after_seconds(e))
+            raise
+        permit.record_usage(getattr(getattr(resp, "usage", None), "total_tokens", None))
+        return resp
+
+
+def governed_stream(client: Any, breaker: Any = None, **kwargs: Any) -> Iterator[Any]:
+    """
+    Streamed client.chat.completions.create(stream=True, **kwargs), yielding chunks. The permit
+    (and its concurrency slot) is held until the stream is exhausted or closed. A breaker times
+    the request and the stream, not the wait for the permit.
+    """
+    if breaker is not None:
+        breaker.reject_if_open()
+    est = estimate_tokens(kwargs.get("messages") or [], kwargs.get("max_tokens") or 1000)
+    with get_governor().permit(est) as permit, _guarded(breaker):
+        try:
+            stream = client.chat.completions.create(stream=True, **kwargs)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                permit.rate_limited(retry_after_seconds(e))
+            raise
+        yield from stream
+
+
+def llm_governor_stats() -> Dict[str, Any]:
+    return get_governor().snapshot()
@@ -0,0 +1,27 @@
+"""Add appeals.routing_decision_json (appeal_routing.py decision) if missing."""
+
+
+def ensure_appeal_routing_column(db) -> None:
+    from sqlalchemy import text
+
+    if db.engine.dialect.name == "postgresql":
+        sql = "ALTER TABLE appeals ADD COLUMN IF NOT EXISTS routing_decision_json JSONB"
+    else:
+        sql = "ALTER TABLE appeals ADD COLUMN routing_decision_json TEXT"
+    with db.engine.begin() as conn:
+        try:
+            conn.execute(text(sql))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_appeal_routing_column(db)
+        print("appeals.routing_decision_json migration complete.")
+
+
+if __name__ == "__main__":
+    run()
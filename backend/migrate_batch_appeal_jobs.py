@@ -1,5 +1,6 @@
 """
-batch_appeal_jobs table for durable batch ZIP job metadata.
+batch_appeal_jobs table for durable batch ZIP job metadata and the batch worker queue
+(payload + lease columns; see batch_job_queue.py).
 Run once: python migrate_batch_appeal_jobs.py
 Also invoked at app startup via ensure_batch_appeal_jobs_schema(db).
 """
@@ -16,7 +17,7 @@ def ensure_batch_appeal_jobs_schema(db) -> None:
         stmts = [
             """CREATE TABLE IF NOT EXISTS batch_appeal_jobs (
                 job_id VARCHAR(64) NOT NULL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id),
+                user_id CHAR(32) NOT NULL,
                 status VARCHAR(32) NOT NULL DEFAULT 'queued',
                 job_kind VARCHAR(16) NOT NULL DEFAULT 'csv',
                 total INTEGER,
@@ -26,16 +27,31 @@ def ensure_batch_appeal_jobs_schema(db) -> None:
                 zip_path VARCHAR(1024),
                 zip_name VARCHAR(512),
                 summary_rows TEXT,
+                payload TEXT,
+                lease_owner VARCHAR(128),
+                lease_expires_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                db_round_trips INTEGER NOT NULL DEFAULT 0,
+                credit_reservation TEXT,
                 created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
             )""",
             'CREATE INDEX IF NOT EXISTS ix_batch_appeal_jobs_user_id ON batch_appeal_jobs (user_id)',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN payload TEXT',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN lease_owner VARCHAR(128)',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN lease_expires_at TIMESTAMP',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN heartbeat_at TIMESTAMP',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN db_round_trips INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN credit_reservation TEXT',
+            'CREATE INDEX IF NOT EXISTS ix_batch_appeal_jobs_claim ON batch_appeal_jobs (status, created_at)',
         ]
     else:
         stmts = [
             """CREATE TABLE IF NOT EXISTS batch_appeal_jobs (
                 job_id VARCHAR(64) NOT NULL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id),
+                user_id UUID NOT NULL REFERENCES public.users(id),
                 status VARCHAR(32) NOT NULL DEFAULT 'queued',
                 job_kind VARCHAR(16) NOT NULL DEFAULT 'csv',
                 total INTEGER,
@@ -45,33 +61,92 @@ def ensure_batch_appeal_jobs_schema(db) -> None:
                 zip_path VARCHAR(1024),
                 zip_name VARCHAR(512),
                 summary_rows JSON,
+                payload JSON,
+                lease_owner VARCHAR(128),
+                lease_expires_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                db_round_trips INTEGER NOT NULL DEFAULT 0,
+                credit_reservation JSON,
                 created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
                 updated_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
             )""",
             'CREATE INDEX IF NOT EXISTS ix_batch_appeal_jobs_user_id ON batch_appeal_jobs (user_id)',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS payload JSON',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(128)',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS db_round_trips INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE batch_appeal_jobs ADD COLUMN IF NOT EXISTS credit_reservation JSON',
+            'CREATE INDEX IF NOT EXISTS ix_batch_appeal_jobs_claim ON batch_appeal_jobs (status, created_at)',
         ]
-    with db.engine.begin() as conn:
-        for s in stmts:
-            try:
+    for s in stmts:
+        # One transaction per statement: a failed ALTER (column exists) must not abort the rest on PostgreSQL
+        try:
+            with db.engine.begin() as conn:
                 conn.execute(text(s))
-            except Exception:
-                pass
+        except Exception:
+            pass
+
+
+def _dead_job_filter(db, now):
+    from models import BatchAppealJob
+    from batch_job_queue import MAX_ATTEMPTS
+
+    return (
+        BatchAppealJob.status.in_(['queued', 'running']),
+        BatchAppealJob.attempts >= MAX_ATTEMPTS,
+        db.or_(BatchAppealJob.lease_expires_at.is_(None), BatchAppealJob.lease_expires_at < now),
+    )
+
+
+def _dead_batch_job_ids(db, now):
+    """job_ids the sweep should fail; on PostgreSQL rows another sweeper holds are skipped."""
+    from models import BatchAppealJob
+
+    query = db.session.query(BatchAppealJob.job_id).filter(*_dead_job_filter(db, now))
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    return [job_id for (job_id,) in query.all()]
 
 
 def sweep_interrupted_batch_jobs(db) -> None:
-    """Mark queued/running jobs as error after server restart (Option A)."""
+    """
+    Fail jobs that keep dying mid-run (lease expired after BATCH_MAX_ATTEMPTS claims), settling
+    any credit reservation they still hold in the same transaction.
+    Every worker loop sweeps, so each job is claimed with a compare-and-set UPDATE first and only
+    the sweeper that moved it to 'error' refunds credits and queues overage.
+    Other queued/running jobs are left alone: a worker re-claims them and resumes from the
+    last completed row once their lease has expired.
+    """
     from models import BatchAppealJob
+    from batch_job_queue import MAX_ATTEMPTS
+    from credit_reservation import CreditReservation, settle_reservation
+    from usage_outbox import enqueue_overage_usage
 
-    msg = 'Interrupted by server restart'
+    msg = f'Interrupted {MAX_ATTEMPTS} times (worker restart or crash); giving up'
     now = datetime.utcnow()
-    BatchAppealJob.query.filter(BatchAppealJob.status.in_(['queued', 'running'])).update(
-        {
-            BatchAppealJob.status: 'error',
-            BatchAppealJob.error: msg,
-            BatchAppealJob.updated_at: now,
-        },
-        synchronize_session=False,
-    )
+    job_ids = _dead_batch_job_ids(db, now)
+    if not job_ids:
+        return
+    for job_id in job_ids:
+        claimed = BatchAppealJob.query.filter(
+            BatchAppealJob.job_id == job_id, *_dead_job_filter(db, now)
+        ).update(
+            {'status': 'error', 'error': msg, 'lease_owner': None, 'lease_expires_at': None, 'updated_at': now},
+            synchronize_session=False,
+        )
+        if claimed != 1:
+            continue  # another sweeper (or a worker) got there first
+        row = db.session.get(BatchAppealJob, job_id, populate_existing=True)
+        state = row.credit_reservation
+        if state and not state.get('settled'):
+            reservation = CreditReservation(row.user_id, dict(state))
+            conn = db.session.connection()
+            qty = settle_reservation(conn, reservation)
+            enqueue_overage_usage(row.user_id, qty, source='batch', conn=conn)
+            row.credit_reservation = reservation.state
     db.session.commit()
 
 
@@ -0,0 +1,46 @@
+"""
+generation_jobs table: accept-then-poll appeal generations (POST /api/generate/appeal/jobs).
+Run once: python migrate_generation_jobs.py
+Also invoked at app startup via ensure_generation_jobs_schema(db).
+"""
+
+from sqlalchemy import text
+
+
+def ensure_generation_jobs_schema(db) -> None:
+    """Idempotent CREATE for generation_jobs (PostgreSQL or SQLite)."""
+    user_col = "user_id CHAR(32) NOT NULL" if db.engine.dialect.name == "sqlite" else "user_id UUID NOT NULL"
+    stmts = [
+        f"""CREATE TABLE IF NOT EXISTS generation_jobs (
+            job_id VARCHAR(64) PRIMARY KEY,
+            {user_col},
+            appeal_id VARCHAR(50) NOT NULL,
+            idempotency_key VARCHAR(255),
+            status VARCHAR(16) NOT NULL DEFAULT 'queued',
+            error TEXT,
+            created_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            CONSTRAINT uq_generation_jobs_idem UNIQUE (user_id, idempotency_key)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_generation_jobs_user_id ON generation_jobs (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_generation_jobs_status ON generation_jobs (status, created_at)",
+    ]
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_generation_jobs_schema(db)
+        print("generation_jobs migration complete.")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,52 @@
+"""
+idempotency_keys table: claimed Idempotency-Key headers with request fingerprint, status and
+stored response (idempotency.py).
+Run once: python migrate_idempotency_keys.py
+Also created on first use by idempotency.
+"""
+
+from sqlalchemy import text
+
+
+def ensure_idempotency_keys_schema(db) -> None:
+    """Idempotent CREATE for idempotency_keys (PostgreSQL or SQLite)."""
+    if db.engine.dialect.name == "sqlite":
+        id_col = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    else:
+        id_col = "id BIGSERIAL PRIMARY KEY"
+    stmts = [
+        f"""CREATE TABLE IF NOT EXISTS idempotency_keys (
+            {id_col},
+            scope VARCHAR(64) NOT NULL,
+            user_key VARCHAR(64) NOT NULL,
+            idem_key VARCHAR(255) NOT NULL,
+            fingerprint VARCHAR(64) NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'in_progress',
+            response_status INTEGER,
+            response_body TEXT,
+            content_type VARCHAR(128),
+            locked_until TIMESTAMP NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            CONSTRAINT uq_idempotency_keys UNIQUE (scope, user_key, idem_key)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires ON idempotency_keys (expires_at)",
+    ]
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_idempotency_keys_schema(db)
+        print("idempotency_keys migration complete.")
+
+
+if __name__ == "__main__":
+    run()
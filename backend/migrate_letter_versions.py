@@ -0,0 +1,56 @@
+"""
+appeals.letter_version and claim_status_events for draft-first generation (speculative_generation.py).
+Run once: python migrate_letter_versions.py
+Also invoked at app startup via ensure_letter_versions_schema(db).
+"""
+
+from sqlalchemy import text
+
+
+def ensure_letter_versions_schema(db) -> None:
+    """Idempotent ALTER/CREATE (PostgreSQL or SQLite)."""
+    if db.engine.dialect.name == "sqlite":
+        stmts = [
+            "ALTER TABLE appeals ADD COLUMN letter_version INTEGER DEFAULT 0",
+            """CREATE TABLE IF NOT EXISTS claim_status_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                appeal_db_id INTEGER NOT NULL,
+                user_id CHAR(32),
+                event_type VARCHAR(80) NOT NULL,
+                message TEXT,
+                created_at TIMESTAMP NOT NULL
+            )""",
+        ]
+    else:
+        stmts = [
+            "ALTER TABLE appeals ADD COLUMN IF NOT EXISTS letter_version INTEGER DEFAULT 0",
+            """CREATE TABLE IF NOT EXISTS claim_status_events (
+                id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                appeal_db_id INTEGER NOT NULL REFERENCES appeals (id) ON DELETE CASCADE,
+                user_id UUID REFERENCES users (id) ON DELETE SET NULL,
+                event_type VARCHAR(80) NOT NULL,
+                message TEXT,
+                created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+            )""",
+        ]
+    stmts.append(
+        "CREATE INDEX IF NOT EXISTS ix_claim_status_events_appeal_db_id ON claim_status_events (appeal_db_id)"
+    )
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_letter_versions_schema(db)
+        print("letter_version / claim_status_events migration complete.")
+
+
+if __name__ == "__main__":
+    run()
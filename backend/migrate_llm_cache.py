@@ -0,0 +1,49 @@
+"""
+llm_cache table: shared tier of llm_cache.TieredCache (content-addressed LLM results with TTL).
+Run once: python migrate_llm_cache.py
+Also created on first use by llm_cache.
+"""
+
+from sqlalchemy import text
+
+
+def ensure_llm_cache_schema(db) -> None:
+    """Idempotent CREATE for llm_cache (PostgreSQL or SQLite)."""
+    if db.engine.dialect.name == "sqlite":
+        id_col = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    else:
+        id_col = "id BIGSERIAL PRIMARY KEY"
+    stmts = [
+        f"""CREATE TABLE IF NOT EXISTS llm_cache (
+            {id_col},
+            namespace VARCHAR(32) NOT NULL,
+            scope VARCHAR(64) NOT NULL DEFAULT '',
+            cache_key VARCHAR(64) NOT NULL,
+            value TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            last_hit_at TIMESTAMP NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            CONSTRAINT uq_llm_cache_key UNIQUE (namespace, scope, cache_key)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_llm_cache_expires ON llm_cache (namespace, expires_at)",
+        "CREATE INDEX IF NOT EXISTS ix_llm_cache_last_hit ON llm_cache (namespace, last_hit_at)",
+    ]
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_llm_cache_schema(db)
+        print("llm_cache migration complete.")
+
+
+if __name__ == "__main__":
+    run()
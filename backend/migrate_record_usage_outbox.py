@@ -0,0 +1,63 @@
+"""
+record_usage_outbox table: Next.js record-usage callbacks waiting for delivery
+(written with the appeal in /api/generate/appeal, sent by record_usage_outbox.RecordUsageSender).
+Run once: python migrate_record_usage_outbox.py
+Also invoked at app startup via ensure_record_usage_outbox_schema(db).
+"""
+
+from sqlalchemy import text
+
+
+def ensure_record_usage_outbox_schema(db) -> None:
+    """Idempotent CREATE for record_usage_outbox (PostgreSQL or SQLite)."""
+    if db.engine.dialect.name == "sqlite":
+        stmts = [
+            """CREATE TABLE IF NOT EXISTS record_usage_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id CHAR(32) NOT NULL,
+                appeal_id VARCHAR(50) NOT NULL,
+                generated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_error TEXT,
+                delivered_at TIMESTAMP
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_record_usage_outbox_due ON record_usage_outbox (status, next_attempt_at)",
+        ]
+    else:
+        stmts = [
+            """CREATE TABLE IF NOT EXISTS record_usage_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                user_id UUID NOT NULL,
+                appeal_id VARCHAR(50) NOT NULL,
+                generated_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+                last_error TEXT,
+                delivered_at TIMESTAMP
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_record_usage_outbox_due ON record_usage_outbox (next_attempt_at) "
+            "WHERE status = 'pending'",
+            # Early versions stored callers' bearer JWTs for per-event delivery
+            "ALTER TABLE record_usage_outbox DROP COLUMN IF EXISTS auth_token",
+        ]
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_record_usage_outbox_schema(db)
+        print("record_usage_outbox migration complete.")
+
+
+if __name__ == "__main__":
+    run()
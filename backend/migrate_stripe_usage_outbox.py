@@ -0,0 +1,68 @@
+"""
+stripe_usage_outbox table: metered overage events waiting to be reported to Stripe
+(written on the generation path, flushed in aggregate by usage_outbox.UsageReporter).
+Run once: python migrate_stripe_usage_outbox.py
+Also invoked at startup via ensure_stripe_usage_outbox_schema(db).
+"""
+
+from sqlalchemy import text
+
+
+def ensure_stripe_usage_outbox_schema(db) -> None:
+    """Idempotent CREATE for stripe_usage_outbox (PostgreSQL or SQLite)."""
+    if db.engine.dialect.name == 'sqlite':
+        stmts = [
+            """CREATE TABLE IF NOT EXISTS stripe_usage_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id CHAR(32) NOT NULL,
+                stripe_subscription_id VARCHAR(255) NOT NULL,
+                quantity INTEGER NOT NULL,
+                source VARCHAR(32),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                reported_at TIMESTAMP,
+                report_key VARCHAR(64),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )""",
+            'CREATE INDEX IF NOT EXISTS ix_stripe_usage_outbox_pending ON stripe_usage_outbox (reported_at, id)',
+            'CREATE INDEX IF NOT EXISTS ix_stripe_usage_outbox_report_key ON stripe_usage_outbox (report_key)',
+        ]
+    else:
+        stmts = [
+            """CREATE TABLE IF NOT EXISTS stripe_usage_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                user_id UUID NOT NULL REFERENCES public.users(id),
+                stripe_subscription_id VARCHAR(255) NOT NULL,
+                quantity INTEGER NOT NULL,
+                source VARCHAR(32),
+                created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+                reported_at TIMESTAMP,
+                report_key VARCHAR(64),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )""",
+            # Only unreported rows are scanned by the reporter
+            'CREATE INDEX IF NOT EXISTS ix_stripe_usage_outbox_pending ON stripe_usage_outbox (id) '
+            'WHERE reported_at IS NULL',
+            # Keyed groups are marked reported / failed by report_key
+            'CREATE INDEX IF NOT EXISTS ix_stripe_usage_outbox_report_key ON stripe_usage_outbox (report_key) '
+            'WHERE reported_at IS NULL',
+        ]
+    for s in stmts:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(s))
+        except Exception:
+            pass
+
+
+def run():
+    from app import app, db
+
+    with app.app_context():
+        ensure_stripe_usage_outbox_schema(db)
+        print('stripe_usage_outbox migration complete.')
+
+
+if __name__ == '__main__':
+    run()
@@ -103,6 +103,120 @@ class Appeal(db.Model):
     resubmission_ready = db.Column(db.Boolean, nullable=False, default=False)
     corrected_claim_json = db.Column(JSONB, nullable=True)
     resubmission_package_json = db.Column(JSONB, nullable=True)
+    routing_decision_json = db.Column(JSONB, nullable=True)
+    # Bumped each time generated_letter_text is replaced (draft -> refined letter)
+    letter_version = db.Column(db.Integer, nullable=True, default=0)
 
     def __repr__(self):
         return f"<Appeal {self.appeal_id}>"
+
+
+class BatchAppealJob(db.Model):
+    """batch_appeal_jobs — Flask-owned batch ZIP jobs; also the durable queue batch workers claim from."""
+
+    __tablename__ = "batch_appeal_jobs"
+
+    job_id = db.Column(String(64), primary_key=True)
+    user_id: Any = db.Column(UUID(as_uuid=True), nullable=False, index=True)
+    status = db.Column(String(32), nullable=False, default="queued")
+    job_kind = db.Column(String(16), nullable=False, default="csv")
+    total = db.Column(db.Integer, nullable=True)
+    current = db.Column(db.Integer, nullable=True)
+    ok_count = db.Column(db.Integer, nullable=True)
+    error = db.Column(SAText, nullable=True)
+    zip_path = db.Column(String(1024), nullable=True)
+    zip_name = db.Column(String(512), nullable=True)
+    summary_rows = db.Column(db.JSON, nullable=True)
+    # Worker input (defaults, rows / csv_text, pdf_items, out_dir) so any worker can run or resume the job
+    payload = db.Column(db.JSON, nullable=True)
+    lease_owner = db.Column(String(128), nullable=True)
+    lease_expires_at = db.Column(DateTime, nullable=True)
+    heartbeat_at = db.Column(DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # credit_reservation.CreditReservation state: slots reserved up front, per-row outcomes, settled flag
+    credit_reservation = db.Column(db.JSON, nullable=True)
+    # Progress writes issued for this job (batch_progress.BatchProgress)
+    db_round_trips = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BatchAppealJob {self.job_id} {self.status}>"
+
+
+class StripeUsageEvent(db.Model):
+    """stripe_usage_outbox — overage units queued for Stripe; usage_outbox.UsageReporter reports them in aggregate."""
+
+    __tablename__ = "stripe_usage_outbox"
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id: Any = db.Column(UUID(as_uuid=True), nullable=False)
+    stripe_subscription_id = db.Column(String(255), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    source = db.Column(String(32), nullable=True)
+    created_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+    reported_at = db.Column(DateTime, nullable=True)
+    # Idempotency key of the aggregated usage record that covered this row
+    report_key = db.Column(String(64), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(SAText, nullable=True)
+
+    def __repr__(self):
+        return f"<StripeUsageEvent {self.id} sub={self.stripe_subscription_id} qty={self.quantity}>"
+
+
+class RecordUsageEvent(db.Model):
+    """record_usage_outbox — Next.js record-usage callbacks, delivered by record_usage_outbox.RecordUsageSender."""
+
+    __tablename__ = "record_usage_outbox"
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id: Any = db.Column(UUID(as_uuid=True), nullable=False)
+    appeal_id = db.Column(String(50), nullable=False)
+    generated_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+    status = db.Column(String(16), nullable=False, default="pending")  # pending | delivered | dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(SAText, nullable=True)
+    delivered_at = db.Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<RecordUsageEvent {self.id} {self.appeal_id} {self.status}>"
+
+
+class GenerationJob(db.Model):
+    """generation_jobs — accept-then-poll appeal generations run by generation_jobs' background executor."""
+
+    __tablename__ = "generation_jobs"
+    __table_args__ = (db.UniqueConstraint("user_id", "idempotency_key", name="uq_generation_jobs_idem"),)
+
+    job_id = db.Column(String(64), primary_key=True)
+    user_id: Any = db.Column(UUID(as_uuid=True), nullable=False, index=True)
+    appeal_id = db.Column(String(50), nullable=False)
+    # Client Idempotency-Key: a retried POST returns this job instead of starting another
+    idempotency_key = db.Column(String(255), nullable=True)
+    status = db.Column(String(16), nullable=False, default="queued")  # queued | running | done | error
+    error = db.Column(SAText, nullable=True)
+    created_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(DateTime, nullable=True)
+    finished_at = db.Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<GenerationJob {self.job_id} {self.appeal_id} {self.status}>"
+
+
+class ClaimStatusEvent(db.Model):
+    """claim_status_events — per-appeal timeline shown in the queue UI (also written by Next.js)."""
+
+    __tablename__ = "claim_status_events"
+
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    # appeals.id; the database holds the foreign key (ON DELETE CASCADE)
+    appeal_db_id = db.Column(Integer, nullable=False, index=True)
+    user_id: Any = db.Column(UUID(as_uuid=True), nullable=True, index=True)
+    event_type = db.Column(String(80), nullable=False)
+    message = db.Column(SAText, nullable=True)
+    created_at = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ClaimStatusEvent {self.appeal_db_id} {self.event_type}>"
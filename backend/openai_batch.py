@@ -0,0 +1,168 @@
+"""
+OpenAI Batch API client for "economy" batch jobs.
+
+Economy CSV jobs do not call chat completions once per row. They send every row's request in one
+Batch API submission, which is billed at the discounted batch rate and does not count against
+the synchronous RPM/TPM limits. The flow is:
+  1. Upload a JSONL file with one line per row: {"custom_id", "method", "url", "body"}.
+  2. Create a batch for /v1/chat/completions.
+  3. Poll until the batch is terminal.
+  4. Download the output and error files and map them back by custom_id.
+Everything goes over plain HTTP, and base_url can point at a local fake endpoint in tests.
+
+Env:
+  OPENAI_BATCH_BASE_URL          API root (default OPENAI_BASE_URL or https://api.openai.com/v1)
+  OPENAI_BATCH_POLL_SECONDS      status poll interval
+  OPENAI_BATCH_MAX_WAIT_SECONDS  give up waiting (the batch is cancelled) after this long
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+POLL_SECONDS = _env_float("OPENAI_BATCH_POLL_SECONDS", 30)
+MAX_WAIT_SECONDS = _env_float("OPENAI_BATCH_MAX_WAIT_SECONDS", 86400)
+
+
+class BatchAPIError(RuntimeError):
+    """Submission, polling or result download failed."""
+
+
+def build_batch_jsonl(requests: Iterable[Tuple[str, Dict[str, Any]]]) -> bytes:
+    """One Batch API line per (custom_id, chat-completions body)."""
+    lines = [
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_URL, "body": body})
+        for custom_id, body in requests
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(content: str) -> Dict[str, Optional[str]]:
+    """
+    custom_id -> message text from an output or error file. Lines that errored, returned a
+    non-200 status or have no text map to None.
+    """
+    results: Dict[str, Optional[str]] = {}
+    for line in (content or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        custom_id = item.get("custom_id")
+        if not custom_id:
+            continue
+        response = item.get("response") or {}
+        text = None
+        if not item.get("error") and response.get("status_code") == 200:
+            try:
+                text = (response["body"]["choices"][0]["message"]["content"] or "").strip() or None
+            except (KeyError, IndexError, TypeError):
+                text = None
+        results[custom_id] = text
+    return results
+
+
+class OpenAIBatchClient:
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, client: Optional[httpx.Client] = None):
+        self.base_url = (
+            base_url
+            or os.getenv("OPENAI_BATCH_BASE_URL")
+            or os.getenv("OPENAI_BASE_URL")
+            or "https://api.openai.com/v1"
+        ).rstrip("/")
+        key = api_key or os.getenv("OPENAI_API_KEY") or ""
+        self._client = client or httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0))
+        self._headers = {"Authorization": f"Bearer {key}"}
+
+    def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        try:
+            resp = self._client.request(method, self.base_url + path, headers=self._headers, **kwargs)
+        except httpx.HTTPError as e:
+            raise BatchAPIError(f"{method} {path}: {e}") from e
+        if resp.status_code >= 400:
+            raise BatchAPIError(f"{method} {path}: HTTP {resp.status_code} {resp.text[:300]}")
+        return resp
+
+    def submit(self, requests: Iterable[Tuple[str, Dict[str, Any]]], metadata: Optional[Dict[str, str]] = None) -> str:
+        """Upload the JSONL input and create the batch; returns the batch id."""
+        upload = self._request(
+            "POST",
+            "/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch_input.jsonl", build_batch_jsonl(requests), "application/jsonl")},
+        ).json()
+        batch = self._request(
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": upload["id"],
+                "endpoint": CHAT_COMPLETIONS_URL,
+                "completion_window": "24h",
+                "metadata": metadata or {},
+            },
+        ).json()
+        return batch["id"]
+
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def cancel(self, batch_id: str) -> None:
+        try:
+            self._request("POST", f"/batches/{batch_id}/cancel")
+        except BatchAPIError as e:
+            logger.warning("Could not cancel OpenAI batch %s: %s", batch_id, e)
+
+    def wait(
+        self,
+        batch_id: str,
+        poll_seconds: Optional[float] = None,
+        max_wait_seconds: Optional[float] = None,
+        on_poll: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Poll until the batch is terminal. on_poll(batch) runs after every poll. Raising from it
+        (e.g. the job lease was lost) stops the wait. Past max_wait_seconds the batch is
+        cancelled and BatchAPIError is raised.
+        """
+        poll = POLL_SECONDS if poll_seconds is None else poll_seconds
+        deadline = time.monotonic() + (MAX_WAIT_SECONDS if max_wait_seconds is None else max_wait_seconds)
+        while True:
+            batch = self.retrieve(batch_id)
+            if on_poll is not None:
+                on_poll(batch)
+            if batch.get("status") in TERMINAL_STATUSES:
+                return batch
+            if time.monotonic() >= deadline:
+                self.cancel(batch_id)
+                raise BatchAPIError(f"OpenAI batch {batch_id} not finished in time (status {batch.get('status')})")
+            time.sleep(poll)
+
+    def results(self, batch: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """custom_id -> text for every line in the output and error files (None = failed line)."""
+        results: Dict[str, Optional[str]] = {}
+        for key in ("error_file_id", "output_file_id"):
+            file_id = batch.get(key)
+            if file_id:
+                results.update(parse_batch_output(self._request("GET", f"/files/{file_id}/content").text))
+        return results
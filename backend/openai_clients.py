@@ -0,0 +1,143 @@
+"""
+Process-wide OpenAI client registry.
+
+Every caller (denial extraction, AdvancedAIAppealGenerator, the submission engine) shares one
+OpenAI client per API key, backed by one keep-alive httpx connection pool, instead of building a
+client (new pool, new TLS handshake) per call. Calls pass an explicit per-purpose timeout from
+call_timeout(). Connection reuse is measured with httpcore trace events: a request that did not
+open a TCP connection rode a pooled keep-alive one, and openai_pool_stats() reports handshakes
+per request so the effect can be checked in production.
+
+Env:
+  OPENAI_MAX_CONNECTIONS             pool size per client
+  OPENAI_MAX_KEEPALIVE_CONNECTIONS   idle connections kept open
+  OPENAI_KEEPALIVE_EXPIRY_SECONDS    idle connection lifetime
+  OPENAI_CONNECT_TIMEOUT_SECONDS     TCP + TLS connect timeout
+  OPENAI_TIMEOUT_SECONDS             default request timeout
+  OPENAI_EXTRACTION_TIMEOUT_SECONDS  timeout for denial extraction calls
+  OPENAI_APPEAL_TIMEOUT_SECONDS      timeout for appeal generation calls
+  OPENAI_MAX_RETRIES                 SDK retries per call
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_CONNECTIONS = int(_env_float("OPENAI_MAX_CONNECTIONS", 20)) or 20
+MAX_KEEPALIVE_CONNECTIONS = int(_env_float("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10))
+KEEPALIVE_EXPIRY_SECONDS = _env_float("OPENAI_KEEPALIVE_EXPIRY_SECONDS", 60.0)
+CONNECT_TIMEOUT_SECONDS = _env_float("OPENAI_CONNECT_TIMEOUT_SECONDS", 5.0)
+DEFAULT_TIMEOUT_SECONDS = _env_float("OPENAI_TIMEOUT_SECONDS", 60.0)
+MAX_RETRIES = int(_env_float("OPENAI_MAX_RETRIES", 2))
+
+_CALL_TIMEOUTS = {
+    "extraction": ("OPENAI_EXTRACTION_TIMEOUT_SECONDS", 30.0),
+    "appeal": ("OPENAI_APPEAL_TIMEOUT_SECONDS", 90.0),
+}
+
+
+class PoolStats:
+    """Thread-safe counters fed by httpcore trace events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def trace(self, event_name: str, _info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            requests, new, tls = self.requests, self.new_connections, self.tls_handshakes
+        return {
+            "requests": requests,
+            "new_connections": new,
+            "tls_handshakes": tls,
+            "reused_connections": max(0, requests - new),
+            "handshakes_per_request": round(tls / requests, 4) if requests else 0.0,
+        }
+
+
+_lock = threading.Lock()
+_clients: Dict[str, Any] = {}
+_stats = PoolStats()
+
+
+def build_http_client(stats: Optional[PoolStats] = None, **kwargs) -> httpx.Client:
+    """Keep-alive httpx client with the configured limits and reuse instrumentation."""
+    stats = stats or _stats
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        follow_redirects=True,
+        event_hooks={"request": [stats.on_request]},
+        **kwargs,
+    )
+
+
+def get_openai_client(api_key: Optional[str] = None):
+    """
+    Shared OpenAI client for api_key (default OPENAI_API_KEY); None when no key is configured.
+    Raises ImportError if the openai package is missing.
+    """
+    key = (api_key if api_key is not None else os.getenv("OPENAI_API_KEY") or "").strip()
+    if not key:
+        return None
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    from openai import OpenAI
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=key, http_client=build_http_client(), max_retries=MAX_RETRIES)
+            _clients[key] = client
+            logger.info(
+                "OpenAI client pool created (max_connections=%s, keepalive=%s)",
+                MAX_CONNECTIONS,
+                MAX_KEEPALIVE_CONNECTIONS,
+            )
+    return client
+
+
+def call_timeout(purpose: str) -> httpx.Timeout:
+    """Per-call timeout for `purpose` ('extraction' / 'appeal'), keeping the shared connect timeout."""
+    env_name, default = _CALL_TIMEOUTS.get(purpose, ("OPENAI_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+    return httpx.Timeout(_env_float(env_name, default), connect=CONNECT_TIMEOUT_SECONDS)
+
+
+def openai_pool_stats() -> Dict[str, Any]:
+    stats = _stats.snapshot()
+    stats["clients"] = len(_clients)
+    return stats
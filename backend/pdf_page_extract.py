@@ -0,0 +1,171 @@
+"""
+Page-parallel PDF text extraction for long remittances / EOBs.
+
+PyPDF2's extract_text is pure Python and CPU-bound. A 200-page EOB parsed page by page on one
+core blocks the request for seconds. Documents of at least PDF_PARALLEL_MIN_PAGES pages are
+split into page ranges and extracted on a process pool. Each worker maps the PDF file read-only
+(mmap), opens its own PdfReader on the mapping and extracts only its range, so the document is
+never pickled to workers and the OS shares the pages between processes. Ranges come back in
+order and are joined once, without repeated string concatenation.
+
+Callers can cap the number of pages (max_pages) or pass stop_when. stop_when is called with the
+text of each new page (serial) or page range (pool), in order, and extraction stops once it
+returns True, e.g. when the claim number and CARC of a single-claim letter have been seen. The
+predicate keeps its own state across calls. Such a result has truncated=True.
+
+If a worker process dies (OOM kill, a page that crashes the parser), the broken pool is dropped
+so the next document gets a fresh one, and the current document finishes serially.
+
+Env:
+  PDF_EXTRACT_WORKERS         worker processes (default: CPU count, at most 4; 1 = always serial)
+  PDF_PARALLEL_MIN_PAGES      page count from which the process pool is used
+  PDF_PAGES_PER_TASK          pages per worker task
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+EXTRACT_WORKERS = _env_int("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = _env_int("PDF_PARALLEL_MIN_PAGES", 24)
+PAGES_PER_TASK = _env_int("PDF_PAGES_PER_TASK", 16)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded web worker can copy held locks into the child
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _drop_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_text(page) -> Tuple[str, bool]:
+    """(text, failed) for one page; a page PyPDF2 cannot read counts as failed, not fatal."""
+    try:
+        return page.extract_text() or "", False
+    except Exception as e:
+        logger.warning("Could not extract text from page: %s", e)
+        return "", True
+
+
+def _open_reader(stream) -> PyPDF2.PdfReader:
+    reader = PyPDF2.PdfReader(stream)
+    if reader.is_encrypted:
+        try:
+            reader.decrypt("")  # Try empty password
+        except Exception:
+            raise ValueError("PDF is password protected. Please provide an unencrypted version.")
+    return reader
+
+
+def _extract_range(path: str, start: int, end: int) -> List[Tuple[str, bool]]:
+    """Worker: text of pages [start, end) from a read-only mapping of the file."""
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = _open_reader(mm)
+        return [_page_text(reader.pages[i]) for i in range(start, min(end, len(reader.pages)))]
+
+
+def _extract_serial(
+    reader: PyPDF2.PdfReader, limit: int, stop_when: Optional[Callable[[str], bool]], results: List[Tuple[str, bool]]
+) -> None:
+    """Append pages len(results) .. limit - 1 to results, one by one, until stop_when says stop."""
+    for i in range(len(results), limit):
+        results.append(_page_text(reader.pages[i]))
+        if stop_when is not None and stop_when(results[-1][0]):
+            return
+
+
+def _entry(results: List[Tuple[str, bool]], page_count: int, truncated: bool) -> Dict:
+    pages = [t for t, _failed in results]
+    return {
+        "pages": pages,
+        "page_count": page_count,
+        "empty_pages": [i for i, (t, failed) in enumerate(results, start=1) if failed or len(t.strip()) < 10],
+        "failed_pages": [i for i, (_t, failed) in enumerate(results, start=1) if failed],
+        "truncated": truncated,
+    }
+
+
+def extract_pages(
+    path: str,
+    max_pages: Optional[int] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+    workers: Optional[int] = None,
+) -> Dict:
+    """
+    {'pages', 'page_count', 'empty_pages', 'failed_pages', 'truncated'} for the PDF at path.
+    page_count is the document's page count; pages holds the extracted prefix (all pages unless
+    max_pages / stop_when cut it short). Raises ValueError for unreadable, encrypted or empty PDFs.
+    """
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = _open_reader(mm)
+        page_count = len(reader.pages)
+        if page_count == 0:
+            raise ValueError("PDF has no pages")
+        limit = min(page_count, max_pages) if max_pages else page_count
+        workers = EXTRACT_WORKERS if workers is None else workers
+
+        if workers <= 1 or limit < PARALLEL_MIN_PAGES:
+            results: List[Tuple[str, bool]] = []
+            _extract_serial(reader, limit, stop_when, results)
+            return _entry(results, page_count, truncated=len(results) < page_count)
+
+    ranges = deque((s, min(s + PAGES_PER_TASK, limit)) for s in range(0, limit, PAGES_PER_TASK))
+    pool = _get_pool()
+    # A bounded window of ranges in flight keeps every worker busy, and an early stop wastes
+    # at most the window rather than the rest of the document
+    window = 2 * workers
+    in_flight: deque = deque()
+    results = []
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < window:
+                s, e = ranges.popleft()
+                in_flight.append(pool.submit(_extract_range, path, s, e))
+            chunk = in_flight.popleft().result()
+            results.extend(chunk)
+            if stop_when is not None and stop_when("\n".join(t for t, _failed in chunk)):
+                break
+    except BrokenProcessPool:
+        logger.warning("PDF extraction worker process died; finishing %s serially from page %s", path, len(results) + 1)
+        _drop_pool(pool)
+        in_flight.clear()
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _extract_serial(_open_reader(mm), limit, stop_when, results)
+    finally:
+        for fut in in_flight:
+            fut.cancel()
+    return _entry(results, page_count, truncated=len(results) < page_count)
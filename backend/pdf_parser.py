@@ -3,14 +3,22 @@ PDF Parser for Denial Letters
 Extracts key information from denial letters and EOBs
 """
 
+import os
 import re
+import tempfile
 from datetime import datetime
 from typing import Dict, Optional, List
-import PyPDF2
+
+from claim_segmentation import parse_claim_blocks, segment_claims
+from denial_text_scanner import scan_denial_text
+from pdf_page_extract import extract_pages
+from pdf_text_cache import cache_enabled, get_pdf_text_cache, pdf_digest
 
 class DenialLetterParser:
     """Parse denial letters and EOBs to extract key information"""
     
+    MIN_PARSE_CHARS = 20  # stripped text shorter than this gets the empty response
+
     # Common CARC code patterns
     CARC_PATTERN = re.compile(r'\b(?:CARC[:\s-]*)?(\d{1,3})\b', re.IGNORECASE)
     CO_PATTERN = re.compile(r'\b(CO|PR|OA)[:\s-]*(\d{1,3})\b', re.IGNORECASE)
@@ -48,58 +56,118 @@ class DenialLetterParser:
     
     # NPI pattern
     NPI_PATTERN = re.compile(r'\b(\d{10})\b')
+
+    # Patient / member name labels
+    PATIENT_PATTERNS = [
+        re.compile(r"(?:Patient|Member|Subscriber|Insured|Beneficiary)(?:\s+Name)?\s*[:#]\s*([^\n\r,]{2,120})", re.IGNORECASE),
+        re.compile(r"Pt\.?\s*Name\s*[:#]\s*([^\n\r,]{2,120})", re.IGNORECASE),
+        re.compile(r"(?:Name\s+of\s+(?:Patient|Member|Subscriber))\s*[:#]\s*([^\n\r,]{2,120})", re.IGNORECASE),
+    ]
     
     def __init__(self):
         pass
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def extract_text_from_pdf(self, pdf_path: str, max_pages: Optional[int] = None, stop_when=None) -> str:
         """
         Extract text from PDF (PyPDF2). Preserves line breaks from the content stream.
         Scanned/image-only PDFs are not OCR'd here — integrate Tesseract/pdf2image if needed.
+        Page text is cached by the SHA-256 of the file bytes (pdf_text_cache), so the same
+        PDF is only parsed once; long PDFs are extracted page-parallel (pdf_page_extract).
+        max_pages / stop_when (see pdf_page_extract.extract_pages) end extraction early.
         """
         try:
             with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                
-                # CHECK IF PDF IS ENCRYPTED
-                if reader.is_encrypted:
-                    try:
-                        reader.decrypt('')  # Try empty password
-                    except:
-                        raise ValueError("PDF is password protected. Please provide an unencrypted version.")
-                
-                # CHECK IF PDF HAS PAGES
-                if len(reader.pages) == 0:
-                    raise ValueError("PDF has no pages")
-                
-                text = ""
-                empty_pages = 0
-                
-                for i, page in enumerate(reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if not page_text or len(page_text.strip()) < 10:
-                            empty_pages += 1
-                        text += page_text + "\n"
-                    except Exception as e:
-                        print(f"⚠️  Warning: Could not extract text from page {i+1}: {e}")
-                        empty_pages += 1
-                
-                # VALIDATE MINIMUM TEXT LENGTH
-                if len(text.strip()) < 50:
-                    raise ValueError(
-                        "PDF contains insufficient text. This may be an image-based PDF. "
-                        "Please use a text-based PDF or enter information manually."
-                    )
-                
-                return text
-                
+                data = file.read()
+        except Exception as e:
+            raise ValueError(f"Failed to read PDF: {str(e)}")
+        entry = self.extract_pages_from_pdf_bytes(data, pdf_path, max_pages=max_pages, stop_when=stop_when)
+        return self._validated_text(entry)
+
+    def extract_text_from_pdf_bytes(self, data: bytes, max_pages: Optional[int] = None, stop_when=None) -> str:
+        """extract_text_from_pdf for PDF bytes already in memory."""
+        entry = self.extract_pages_from_pdf_bytes(data, max_pages=max_pages, stop_when=stop_when)
+        return self._validated_text(entry)
+
+    def _validated_text(self, entry: Dict) -> str:
+        text = "".join(
+            page_text + "\n"
+            for i, page_text in enumerate(entry['pages'], start=1)
+            if i not in entry['failed_pages']
+        )
+
+        # VALIDATE MINIMUM TEXT LENGTH
+        if len(text.strip()) < 50:
+            raise ValueError(
+                "PDF contains insufficient text. This may be an image-based PDF. "
+                "Please use a text-based PDF or enter information manually."
+            )
+
+        return text
+
+    def extract_pages_from_pdf_bytes(
+        self,
+        data: bytes,
+        pdf_path: Optional[str] = None,
+        max_pages: Optional[int] = None,
+        stop_when=None,
+    ) -> Dict:
+        """
+        {'pages': [text per page], 'page_count', 'empty_pages', 'failed_pages', 'truncated'}
+        (1-based page numbers), served from pdf_text_cache when these exact bytes were parsed
+        before. Only complete extractions are cached; a cached one also answers capped calls.
+        pdf_path, when given, must hold the same bytes (saves spilling them to a temp file).
+        """
+        use_cache = cache_enabled()
+        digest = pdf_digest(data) if use_cache else None
+        if use_cache:
+            cached = get_pdf_text_cache().get(digest)
+            if cached is not None:
+                if max_pages and max_pages < len(cached['pages']):
+                    cached['pages'] = cached['pages'][:max_pages]
+                    cached['truncated'] = True
+                return cached
+
+        entry = self._parse_pdf_pages(data, pdf_path, max_pages=max_pages, stop_when=stop_when)
+        if use_cache and not entry.get('truncated'):
+            get_pdf_text_cache().set(digest, entry)
+        return entry
+
+    def _parse_pdf_pages(self, data: bytes, pdf_path: Optional[str] = None, max_pages=None, stop_when=None) -> Dict:
+        spilled = None
+        try:
+            if pdf_path is None:
+                # Pool workers map the PDF from a file
+                fd, spilled = tempfile.mkstemp(suffix='.pdf')
+                with os.fdopen(fd, 'wb') as fh:
+                    fh.write(data)
+                pdf_path = spilled
+            return extract_pages(pdf_path, max_pages=max_pages, stop_when=stop_when)
+
         except ValueError as e:
             # Re-raise ValueError with user-friendly message
             raise
         except Exception as e:
             # Catch all other errors
             raise ValueError(f"Failed to read PDF: {str(e)}")
+        finally:
+            if spilled and os.path.exists(spilled):
+                os.remove(spilled)
+
+    def claim_fields_stop(self):
+        """
+        stop_when predicate for extract_text_from_pdf: True once a claim number and a CARC
+        (CO/PR/OA-nn) have both appeared in the pages read so far.
+        """
+        seen = {'claim': False, 'carc': False}
+
+        def stop(new_text: str) -> bool:
+            if not seen['claim']:
+                seen['claim'] = any(p.search(new_text) for p in self.CLAIM_PATTERNS)
+            if not seen['carc']:
+                seen['carc'] = bool(self.CO_PATTERN.search(new_text))
+            return seen['claim'] and seen['carc']
+
+        return stop
     
     def extract_denial_codes(self, text: str) -> List[str]:
         """Extract CARC/RARC denial codes from text"""
@@ -121,12 +189,6 @@ class DenialLetterParser:
     
     def extract_dates(self, text: str) -> Dict[str, Optional[str]]:
         """Extract relevant dates from text"""
-        dates = {
-            "denial_date": None,
-            "service_date": None,
-            "received_date": None
-        }
-        
         all_dates = []
         
         # Extract all dates from text
@@ -153,10 +215,19 @@ class DenialLetterParser:
                         all_dates.append(date_obj)
                 except (ValueError, IndexError):
                     continue
-        
+
+        return self._date_fields(all_dates)
+
+    def _date_fields(self, all_dates: List[datetime]) -> Dict[str, Optional[str]]:
+        """denial / service date guesses from every date found in the text"""
+        dates = {
+            "denial_date": None,
+            "service_date": None,
+            "received_date": None
+        }
         # Sort dates and make educated guesses
         if all_dates:
-            all_dates.sort()
+            all_dates = sorted(all_dates)
             
             # Most recent date is likely the denial date
             if len(all_dates) > 0:
@@ -198,13 +269,8 @@ class DenialLetterParser:
         """Extract patient / member / subscriber name from common EOB and denial labels."""
         if not text:
             return None
-        patterns = [
-            r"(?:Patient|Member|Subscriber|Insured|Beneficiary)(?:\s+Name)?\s*[:#]\s*([^\n\r,]{2,120})",
-            r"Pt\.?\s*Name\s*[:#]\s*([^\n\r,]{2,120})",
-            r"(?:Name\s+of\s+(?:Patient|Member|Subscriber))\s*[:#]\s*([^\n\r,]{2,120})",
-        ]
-        for pat in patterns:
-            m = re.search(pat, text, re.I)
+        for pat in self.PATIENT_PATTERNS:
+            m = pat.search(text)
             if m:
                 s = m.group(1).strip().strip('"').strip("'").rstrip(",").strip()
                 if len(s) >= 2 and len(s.split()) <= 10:
@@ -213,6 +279,19 @@ class DenialLetterParser:
     
     def extract_amounts(self, text: str) -> Dict[str, Optional[float]]:
         """Extract monetary amounts from text"""
+        all_amounts = []
+        for match in self.AMOUNT_PATTERN.finditer(text):
+            amount_str = match.group(1).replace(',', '')
+            try:
+                amount = float(amount_str)
+                all_amounts.append(amount)
+            except ValueError:
+                continue
+
+        return self._amount_fields(text, all_amounts)
+
+    def _amount_fields(self, text: str, all_amounts: List[float]) -> Dict[str, Optional[float]]:
+        """billed / denied / paid guesses from every $ amount in the text and the paid line"""
         amounts = {
             "billed_amount": None,
             "allowed_amount": None,
@@ -227,15 +306,6 @@ class DenialLetterParser:
             except ValueError:
                 pass
 
-        all_amounts = []
-        for match in self.AMOUNT_PATTERN.finditer(text):
-            amount_str = match.group(1).replace(',', '')
-            try:
-                amount = float(amount_str)
-                all_amounts.append(amount)
-            except ValueError:
-                continue
-
         if all_amounts:
             amounts["billed_amount"] = max(all_amounts)
             if len(all_amounts) > 1:
@@ -282,18 +352,23 @@ class DenialLetterParser:
                 return match
         return None
     
-    def _regex_extract_dict(self, text: str) -> Dict:
-        """Structured fields from regex/heuristics (layer merged with LLM when available)."""
-        denial_codes = self.extract_denial_codes(text)
-        dates = self.extract_dates(text)
+    def _regex_extract_dict(self, text: str, scan: Optional[Dict] = None) -> Dict:
+        """
+        Structured fields from regex/heuristics (layer merged with LLM when available).
+        Codes, dates, amounts and NPI come from one scan_denial_text pass (same results as the
+        extract_* methods); pass scan to reuse one already made for this text.
+        """
+        scan = scan if scan is not None else scan_denial_text(text)
+        denial_codes = scan["denial_codes"]
+        dates = self._date_fields(scan["dates"])
         claim_number = self.extract_claim_number(text)
         payer_name = self.extract_payer_name(text)
         patient_name = self.extract_patient_name(text)
-        amounts = self.extract_amounts(text)
-        npi = self.extract_npi(text)
-        rarc_codes = self.extract_rarc_codes(text)
-        cpt_codes = self.extract_cpt_codes(text)
-        icd_codes = self.extract_icd_codes(text)
+        amounts = self._amount_fields(text, scan["amounts"])
+        npi = scan["npi"]
+        rarc_codes = scan["rarc_codes"]
+        cpt_codes = scan["cpt_codes"]
+        icd_codes = scan["icd_codes"]
 
         def fnum(x):
             if x is None:
@@ -326,63 +401,94 @@ class DenialLetterParser:
         Extract structured fields from raw denial / EOB text (PDF or paste).
         Uses OpenAI JSON extraction when configured, merged with regex; never returns total failure.
         """
+        from denial_llm_extraction import extract_with_openai
+
+        raw = text or ""
+        if not self.has_parseable_text(raw):
+            return self.insufficient_text_response(raw)
+        layers = self.regex_layers(raw)
+        llm_proc, llm_err = extract_with_openai(raw)
+        return self.combine_layers(raw, layers, llm_proc, llm_err)
+
+    def has_parseable_text(self, text: str) -> bool:
+        return len((text or "").strip()) >= self.MIN_PARSE_CHARS
+
+    def insufficient_text_response(self, text: str) -> Dict:
+        """The empty-fields response for text too short to parse."""
+        from denial_llm_extraction import build_normalized_api_response
+
+        empty = {
+            "payer_name": None,
+            "claim_number": None,
+            "patient_name": None,
+            "service_date": None,
+            "denial_date": None,
+            "cpt_codes": [],
+            "icd_codes": [],
+            "rarc_codes": [],
+            "denial_codes": [],
+            "billed_amount": None,
+            "paid_amount": None,
+            "denied_amount": None,
+            "provider_npi": None,
+            "provider_name": None,
+            "patient_id": None,
+            "modifiers": [],
+            "denial_reason_text": None,
+        }
+        return build_normalized_api_response(empty, text or "", llm_used=False, llm_error="insufficient_text")
+
+    def regex_layers(self, text: str) -> Dict:
+        """
+        The LLM-free layers of parse_denial_from_text: {'structured': labeled fields,
+        'regex': _regex_extract_dict}. Plain data, so it can be computed in a worker process.
+        """
+        from utils.normalize_denial_parse import extract_structured
+
+        raw = text or ""
+        scan = scan_denial_text(raw)
+        return {
+            "structured": extract_structured(raw, scan=scan),
+            "regex": self._regex_extract_dict(raw, scan=scan),
+        }
+
+    def combine_layers(
+        self, text: str, layers: Dict, llm_proc: Optional[Dict], llm_err: Optional[str]
+    ) -> Dict:
+        """Merge the regex layers with an extract_with_openai result into the API response."""
         from denial_llm_extraction import (
             build_normalized_api_response,
-            extract_with_openai,
             llm_result_to_merged_fields,
             merge_extraction_layers,
         )
-        from utils.normalize_denial_parse import extract_structured, overlay_structured_over_merge
+        from utils.normalize_denial_parse import overlay_structured_over_merge
 
-        raw = text or ""
-        stripped = raw.strip()
-        if len(stripped) < 20:
-            empty = {
-                "payer_name": None,
-                "claim_number": None,
-                "patient_name": None,
-                "service_date": None,
-                "denial_date": None,
-                "cpt_codes": [],
-                "icd_codes": [],
-                "rarc_codes": [],
-                "denial_codes": [],
-                "billed_amount": None,
-                "paid_amount": None,
-                "denied_amount": None,
-                "provider_npi": None,
-                "provider_name": None,
-                "patient_id": None,
-                "modifiers": [],
-                "denial_reason_text": None,
-            }
-            return build_normalized_api_response(
-                empty, raw, llm_used=False, llm_error="insufficient_text"
-            )
-
-        structured = extract_structured(raw)
-        rx = self._regex_extract_dict(raw)
-        llm_proc, llm_err = extract_with_openai(raw)
         llm_fields = None
         llm_used = False
         if llm_proc:
             llm_used = True
             llm_fields = llm_result_to_merged_fields(llm_proc)
-        merged = merge_extraction_layers(llm_fields, rx)
-        merged = overlay_structured_over_merge(merged, structured)
-        return build_normalized_api_response(merged, raw, llm_used=llm_used, llm_error=llm_err)
+        merged = merge_extraction_layers(llm_fields, layers["regex"])
+        merged = overlay_structured_over_merge(merged, layers["structured"])
+        return build_normalized_api_response(merged, text or "", llm_used=llm_used, llm_error=llm_err)
 
-    def parse_denial_letter(self, pdf_path: str) -> Dict:
+    def parse_denial_letter(self, pdf_path: str, max_pages: Optional[int] = None, stop_early: bool = False) -> Dict:
         """
         Parse a denial letter PDF and extract all relevant information
 
         Args:
             pdf_path: Path to the PDF file
+            max_pages: Only read the first max_pages pages
+            stop_early: Stop reading pages once a claim number and CARC have been found
 
         Returns:
             dict: Extracted information
         """
-        text = self.extract_text_from_pdf(pdf_path)
+        text = self.extract_text_from_pdf(
+            pdf_path,
+            max_pages=max_pages,
+            stop_when=self.claim_fields_stop() if stop_early else None,
+        )
 
         if not text:
             return {
@@ -395,7 +501,25 @@ class DenialLetterParser:
             return result
         result["raw_text"] = text[:500]
         return result
-    
+
+    def parse_remittance(self, pdf_path: str) -> Dict:
+        """
+        Parse a remittance / EOB PDF that may list several claims: one result per claim block
+        (see claim_segmentation), extracted concurrently. A single-claim PDF gives one result.
+
+        Returns:
+            dict: {'success', 'claim_count', 'claims'} or {'success': False, 'error'}
+        """
+        text = self.extract_text_from_pdf(pdf_path)
+        if not text:
+            return {
+                "success": False,
+                "error": "Could not extract text from PDF"
+            }
+
+        claims = parse_claim_blocks(segment_claims(text), parse=self.parse_denial_from_text)
+        return {"success": True, "claim_count": len(claims), "claims": claims}
+
     def _calculate_confidence(
         self,
         denial_codes,
@@ -431,10 +555,16 @@ class DenialLetterParser:
             return "low"
 
 # Convenience functions
-def parse_denial_pdf(pdf_path: str) -> Dict:
+def parse_denial_pdf(pdf_path: str, max_pages: Optional[int] = None, stop_early: bool = False) -> Dict:
     """Parse a denial letter PDF"""
     parser = DenialLetterParser()
-    return parser.parse_denial_letter(pdf_path)
+    return parser.parse_denial_letter(pdf_path, max_pages=max_pages, stop_early=stop_early)
+
+
+def parse_remittance_pdf(pdf_path: str) -> Dict:
+    """Parse a (possibly multi-claim) remittance PDF into per-claim results"""
+    parser = DenialLetterParser()
+    return parser.parse_remittance(pdf_path)
 
 
 def parse_denial_text(raw_text: str) -> Dict:
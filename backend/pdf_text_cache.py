@@ -0,0 +1,248 @@
+"""
+Content-addressed cache for PDF text extraction.
+
+The key is the SHA-256 of the uploaded PDF bytes. The value is what PyPDF2 produced for that
+file: per-page text, page count, and the pages that yielded no text (diagnostics for scanned
+PDFs). The same denial letter is often extracted at /api/extract/file, again inside a
+multi-PDF batch, and again on re-upload; every extraction after the first skips PDF parsing.
+
+There are two tiers:
+  - a per-process LRU.
+  - a directory of JSON files shared by every process on the host. It is bounded by total size,
+    and the least recently used files are evicted first. Files older than
+    PDF_TEXT_CACHE_TTL_SECONDS are ignored and removed.
+Extracted text is PHI, so the directory and files are created owner-only (0700 / 0600). The
+directory should be kept off shared volumes.
+
+Env:
+  PDF_TEXT_CACHE_ENABLED          0 = always parse the PDF
+  PDF_TEXT_CACHE_MEMORY_ENTRIES   in-process entries
+  PDF_TEXT_CACHE_DIR              on-disk tier location (empty string disables the disk tier)
+  PDF_TEXT_CACHE_MAX_DISK_MB      size bound of the on-disk tier
+  PDF_TEXT_CACHE_TTL_SECONDS      lifetime of an on-disk entry
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored shape or the extraction itself changes; older entries are then misses
+ENTRY_VERSION = 1
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def cache_enabled() -> bool:
+    return os.getenv("PDF_TEXT_CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+
+
+def pdf_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class PdfTextCache:
+    """LRU + size-bounded directory of JSON entries keyed by PDF SHA-256."""
+
+    def __init__(
+        self,
+        memory_entries: int = 128,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: int = 7 * 86400,
+    ):
+        self.memory_entries = memory_entries
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Cached extraction (a private copy) or None."""
+        with self._lock:
+            entry = self._lru.get(digest)
+            if entry is not None:
+                self._lru.move_to_end(digest)
+                self.stats["memory_hits"] += 1
+                return deepcopy(entry)
+        entry = self._disk_get(digest)
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._remember(digest, entry)
+        return deepcopy(entry)
+
+    def set(self, digest: str, entry: Dict[str, Any]) -> None:
+        entry = dict(deepcopy(entry), version=ENTRY_VERSION)
+        self._remember(digest, entry)
+        self._disk_set(digest, entry)
+        self._count("writes")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def _remember(self, digest: str, entry: Dict[str, Any]) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._lru[digest] = entry
+            self._lru.move_to_end(digest)
+            while len(self._lru) > self.memory_entries:
+                self._lru.popitem(last=False)
+
+    def _disk_get(self, digest: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._path(digest)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        try:
+            if time.time() - st.st_mtime > self.ttl_seconds:
+                self._remove(path, st.st_size)
+                return None
+            with open(path, "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+            if entry.get("version") != ENTRY_VERSION:
+                return None
+            os.utime(path)  # recency for eviction
+            return entry
+        except Exception as e:
+            self._count("errors")
+            logger.debug("pdf text cache read failed for %s: %s", digest[:12], e)
+            return None
+
+    def _disk_set(self, digest: str, entry: Dict[str, Any]) -> None:
+        if not self.disk_dir:
+            return
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            payload = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(payload)
+                os.chmod(tmp, 0o600)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += len(payload) - old_size
+            self._evict_if_needed()
+        except Exception as e:
+            self._count("errors")
+            logger.warning("pdf text cache write failed for %s: %s", digest[:12], e)
+
+    def _scan(self):
+        """(path, size, mtime) of every entry on disk."""
+        out = []
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                out.append((p, st.st_size, st.st_mtime))
+        return out
+
+    def _evict_if_needed(self) -> None:
+        with self._lock:
+            known = self._disk_bytes
+        if known is not None and known <= self.max_disk_bytes:
+            return
+        files = self._scan()
+        total = sum(size for _p, size, _m in files)
+        if total > self.max_disk_bytes:
+            # Least recently used first, down to 90% so eviction does not run on every write
+            target = self.max_disk_bytes * 9 // 10
+            for p, size, _m in sorted(files, key=lambda f: f[2]):
+                if total <= target:
+                    break
+                try:
+                    os.remove(p)
+                    total -= size
+                    self._count("evictions")
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def _remove(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            s: Dict[str, Any] = dict(self.stats)
+            s["memory_entries"] = len(self._lru)
+            s["disk_bytes"] = self._disk_bytes
+        s["disk_enabled"] = bool(self.disk_dir)
+        return s
+
+
+_cache: Optional[PdfTextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_text_cache() -> PdfTextCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            default_dir = os.path.join(tempfile.gettempdir(), "dap_pdf_text_cache")
+            _cache = PdfTextCache(
+                memory_entries=_env_int("PDF_TEXT_CACHE_MEMORY_ENTRIES", 128),
+                disk_dir=os.getenv("PDF_TEXT_CACHE_DIR", default_dir).strip() or None,
+                max_disk_bytes=_env_int("PDF_TEXT_CACHE_MAX_DISK_MB", 256) * 1024 * 1024,
+                ttl_seconds=_env_int("PDF_TEXT_CACHE_TTL_SECONDS", 7 * 86400),
+            )
+        return _cache
+
+
+def pdf_text_cache_stats() -> Dict[str, Any]:
+    s = get_pdf_text_cache().snapshot()
+    s["enabled"] = cache_enabled()
+    return s
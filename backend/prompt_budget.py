@@ -0,0 +1,161 @@
+"""
+Prompt budgeting for the appeal letter request.
+
+The intake comes from build_structured_intake_from_appeal. Before it goes into the prompt it is
+compacted: None, empty strings and empty lists (no date of service, no modifiers, ...) are
+dropped and the JSON is dumped without indentation. If it is still over
+APPEAL_PROMPT_TOKEN_BUDGET, denial_reason_text (the only free text; up to 1500 characters, about
+375 tokens, of a ~500-token intake) is clipped: sentences naming CARC/RARC codes are kept in
+full, then the head and tail of the rest with a marker in between. The default budget leaves
+short denial texts alone and clips the long payer boilerplate. Letter structure comes from the
+system prompt, so only the facts shrink.
+
+Token counts use tiktoken when it is installed, otherwise ~4 characters per token. Each call
+logs the estimate against the prompt_tokens OpenAI reports, and budget_stats() (on /health)
+keeps the running totals, so the estimator can be checked in production.
+
+Env:
+  APPEAL_PROMPT_TOKEN_BUDGET   token budget for the intake JSON in the user message
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional dependency
+    _ENCODING = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+INTAKE_TOKEN_BUDGET = _env_int("APPEAL_PROMPT_TOKEN_BUDGET", 350)
+MESSAGE_OVERHEAD_TOKENS = 4
+CLIP_MARKER = " …[clipped]… "
+
+# Intake fields that may be clipped to fit the budget (the rest are codes, names and amounts)
+FREE_TEXT_FIELDS = ("denial_reason_text",)
+
+_CODE_SENTENCE = re.compile(r"\b(?:CARC|RARC|CO|PR|OA|PI|N\d{1,3}|M\d{1,3})[-\s]?\d*\b")
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "estimated_prompt_tokens": 0, "actual_prompt_tokens": 0, "clipped_requests": 0, "tokens_saved": 0}
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(count_tokens(str(m.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def dump_compact(d: Dict[str, Any]) -> str:
+    return json.dumps(d, separators=(",", ":"), ensure_ascii=False)
+
+
+def _empty(v: Any) -> bool:
+    return v is None or (isinstance(v, (str, list, dict, tuple)) and len(v) == 0) or (isinstance(v, str) and not v.strip())
+
+
+def compact_intake(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop empty values (recursively)."""
+    out: Dict[str, Any] = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            v = compact_intake(v)
+        elif isinstance(v, list):
+            v = [x for x in (compact_intake(i) if isinstance(i, dict) else i for i in v) if not _empty(x)]
+        if _empty(v):
+            continue
+        out[k] = v
+    return out
+
+
+def clip_text(text: str, max_tokens: int) -> str:
+    """
+    Shorten text to about max_tokens: keep sentences that cite CARC/RARC codes, then the
+    head (2/3) and tail (1/3) of the rest, joined by a marker.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(40, max_tokens * 4)
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    coded = " ".join(s for s in sentences if _CODE_SENTENCE.search(s))
+    if coded and len(coded) <= max_chars // 2:
+        rest = " ".join(s for s in sentences if not _CODE_SENTENCE.search(s))
+        room = max_chars - len(coded) - len(CLIP_MARKER)
+        if len(rest) <= room:
+            return coded + " " + rest
+        return coded + CLIP_MARKER + rest[: max(0, room)].rstrip()
+    room = max_chars - len(CLIP_MARKER)
+    head = room * 2 // 3
+    return text[:head].rstrip() + CLIP_MARKER + text[-(room - head):].lstrip()
+
+
+def fit_intake(d: Dict[str, Any], budget_tokens: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Compact d and clip free text until its JSON fits budget_tokens. Returns (intake, report), where
+    report has tokens_before / tokens_after / clipped fields.
+    """
+    budget = budget_tokens or INTAKE_TOKEN_BUDGET
+    before = count_tokens(json.dumps(d, indent=2, ensure_ascii=False))
+    out = compact_intake(d)
+    clipped: List[str] = []
+    over = count_tokens(dump_compact(out)) - budget
+    if over > 0:
+        for k in (f for f in FREE_TEXT_FIELDS if isinstance(out.get(f), str)):
+            if over <= 0:
+                break
+            current = count_tokens(out[k])
+            target = max(50, current - over)
+            if target >= current:
+                continue
+            out[k] = clip_text(out[k], target)
+            clipped.append(k)
+            over = count_tokens(dump_compact(out)) - budget
+    report = {"tokens_before": before, "tokens_after": count_tokens(dump_compact(out)), "clipped": clipped}
+    with _stats_lock:
+        if clipped:
+            _stats["clipped_requests"] += 1
+        _stats["tokens_saved"] += max(0, report["tokens_before"] - report["tokens_after"])
+    return out, report
+
+
+def record_prompt_usage(estimated: int, actual: Optional[int], label: str = "appeal") -> None:
+    """Log the per-request estimate against OpenAI's prompt_tokens and keep running totals."""
+    with _stats_lock:
+        _stats["requests"] += 1
+        if actual is not None:
+            # Totals only cover requests with reported usage so the ratio compares like with like
+            _stats["estimated_prompt_tokens"] += estimated
+            _stats["actual_prompt_tokens"] += int(actual)
+    logger.info("%s prompt tokens: estimated=%s actual=%s", label, estimated, actual)
+
+
+def budget_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        s = dict(_stats)
+    s["intake_token_budget"] = INTAKE_TOKEN_BUDGET
+    s["estimator"] = "tiktoken" if _ENCODING is not None else "chars/4"
+    if s["actual_prompt_tokens"]:
+        s["estimate_ratio"] = round(s["estimated_prompt_tokens"] / s["actual_prompt_tokens"], 3)
+    return s
@@ -0,0 +1,282 @@
+"""
+Outbox for the Next.js record-usage callback.
+
+/api/generate/appeal adds a record_usage_outbox row in the same commit as the appeal and returns;
+RecordUsageSender delivers pending rows from a background thread over one pooled keep-alive
+httpx client, in batches ({"events": [...]}) authorized by X-Internal-Secret; the route answers
+with per-event results. Failed deliveries are retried with exponential backoff (plus jitter)
+until RECORD_USAGE_MAX_ATTEMPTS, then marked dead; 4xx responses other than 408/425/429 are dead
+at once. A retried event may already have been counted (the response was lost), so the route
+counts each appeal_id once. Callers' JWTs are never stored, so INTERNAL_API_SECRET is required
+whenever NEXT_INTERNAL_API_URL is set: start_record_usage_sender() refuses to start without it,
+and rows queued meanwhile stay pending until it is configured.
+
+A flush claims its rows in a short transaction (next_attempt_at pushed out by CLAIM_SECONDS),
+POSTs with no transaction open and writes the results in a second short transaction, so no
+row lock is held across the HTTP call. A sender that dies mid-POST leaves rows that come due
+again once the claim runs out.
+
+Env:
+  NEXT_INTERNAL_API_URL             Next.js base URL (unset = callbacks are skipped, as before)
+  INTERNAL_API_SECRET               shared secret for the route (required with NEXT_INTERNAL_API_URL)
+  RECORD_USAGE_BATCH                events per batched POST / rows per flush
+  RECORD_USAGE_MAX_ATTEMPTS         deliveries tried before an event is marked dead
+  RECORD_USAGE_BACKOFF_SECONDS      first retry delay (doubles per attempt)
+  RECORD_USAGE_MAX_BACKOFF_SECONDS  retry delay cap
+  RECORD_USAGE_POLL_SECONDS         idle poll interval (new events wake the sender immediately)
+  RECORD_USAGE_EMBEDDED_SENDER      1 = run the sender inside each web process
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from batch_job_queue import _env_int
+from models import db, RecordUsageEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = _env_int("RECORD_USAGE_BATCH", 50)
+MAX_ATTEMPTS = _env_int("RECORD_USAGE_MAX_ATTEMPTS", 8)
+BACKOFF_SECONDS = _env_int("RECORD_USAGE_BACKOFF_SECONDS", 5)
+MAX_BACKOFF_SECONDS = _env_int("RECORD_USAGE_MAX_BACKOFF_SECONDS", 900)
+POLL_SECONDS = _env_int("RECORD_USAGE_POLL_SECONDS", 5)
+REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+CLAIM_SECONDS = 60  # well past REQUEST_TIMEOUT: a claimed row is not picked up again mid-POST
+RETRYABLE_STATUS = {408, 425, 429}
+
+_wake = threading.Event()
+_embedded_lock = threading.Lock()
+_embedded_started = False
+
+
+def _base_url() -> str:
+    return (os.getenv("NEXT_INTERNAL_API_URL") or "").strip().rstrip("/")
+
+
+def _secret() -> str:
+    return (os.getenv("INTERNAL_API_SECRET") or "").strip()
+
+
+def check_record_usage_config() -> None:
+    """Raise RuntimeError when callbacks are configured without the secret they are sent with."""
+    if _base_url() and not _secret():
+        raise RuntimeError(
+            "NEXT_INTERNAL_API_URL is set but INTERNAL_API_SECRET is not: record-usage callbacks "
+            "need the same INTERNAL_API_SECRET on the engine and the Next.js site"
+        )
+
+
+def enqueue_record_usage(user_id, appeal_id: str) -> Optional[RecordUsageEvent]:
+    """
+    Add a pending callback to the session (committed by the caller with the appeal). The row is
+    written even while INTERNAL_API_SECRET is missing and delivered once it is set.
+    """
+    if not _base_url():
+        logger.warning("NEXT_INTERNAL_API_URL not set; skipping record-usage")
+        return None
+    event = RecordUsageEvent(
+        user_id=user_id,
+        appeal_id=appeal_id,
+        generated_at=datetime.utcnow(),
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(event)
+    return event
+
+
+def notify_record_usage() -> None:
+    """Wake this process's sender (call after committing new events)."""
+    _wake.set()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retry number `attempts` (1-based): BACKOFF_SECONDS * 2^(n-1), capped, 50–100% jitter."""
+    delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _payload(event: RecordUsageEvent) -> Dict[str, str]:
+    return {
+        "user_id": str(event.user_id),
+        "appeal_id": event.appeal_id,
+        "generated_at": event.generated_at.isoformat() + "Z",
+    }
+
+
+class RecordUsageSender:
+    """Delivers due outbox rows. Keep one instance per process so the HTTP pool is reused."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        secret: Optional[str] = None,
+        client: Optional[httpx.Client] = None,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        self.base_url = (base_url if base_url is not None else _base_url()).rstrip("/")
+        self.secret = secret if secret is not None else _secret()
+        self._client = client
+        self.batch_size = batch_size or BATCH_SIZE
+        self.max_attempts = max_attempts or MAX_ATTEMPTS
+        self.stats = {"requests": 0, "delivered": 0, "retried": 0, "dead": 0}
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/api/internal/record-usage"
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=60.0),
+            )
+        return self._client
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+    def flush(self) -> int:
+        """Deliver one page of due events; returns how many rows were processed."""
+        if not self.secret:
+            return 0
+        claimed = self._claim()
+        if not claimed:
+            return 0
+        outcomes = self._post([payload for _, payload in claimed])
+        try:
+            events = {
+                e.id: e
+                for e in RecordUsageEvent.query.filter(RecordUsageEvent.id.in_([i for i, _ in claimed])).all()
+            }
+            for (event_id, _), (error, permanent) in zip(claimed, outcomes):
+                event = events.get(event_id)
+                if event is None or event.status != "pending":
+                    continue
+                if error is None:
+                    self._delivered(event)
+                else:
+                    self._failed(event, error, permanent)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(claimed)
+
+    def _claim(self) -> List[Tuple[Any, Dict[str, str]]]:
+        """Claim a page of due rows in one short transaction; returns [(id, payload)]."""
+        now = datetime.utcnow()
+        try:
+            events: List[RecordUsageEvent] = (
+                RecordUsageEvent.query.filter(
+                    RecordUsageEvent.status == "pending",
+                    RecordUsageEvent.next_attempt_at <= now,
+                )
+                .order_by(RecordUsageEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            claimed = [(e.id, _payload(e)) for e in events]
+            for event in events:
+                event.next_attempt_at = now + timedelta(seconds=CLAIM_SECONDS)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return claimed
+
+    def _post(self, payloads: List[Dict[str, str]]) -> List[Tuple[Optional[str], bool]]:
+        """One batched POST; returns (None, False) per delivered event, else (error, permanent)."""
+        try:
+            self.stats["requests"] += 1
+            r = self.client.post(
+                self.url,
+                json={"events": payloads},
+                headers={"X-Internal-Secret": self.secret},
+            )
+        except httpx.HTTPError as e:
+            return [(f"request error: {e}", False)] * len(payloads)
+        if r.status_code >= 400:
+            permanent = r.status_code < 500 and r.status_code not in RETRYABLE_STATUS
+            return [(f"{r.status_code} {r.text[:500]}", permanent)] * len(payloads)
+        try:
+            results = (r.json() or {}).get("results") or []
+        except ValueError:
+            return [(f"{r.status_code} unreadable response", False)] * len(payloads)
+        outcomes: List[Tuple[Optional[str], bool]] = []
+        for i in range(len(payloads)):
+            res = results[i] if i < len(results) and isinstance(results[i], dict) else {}
+            if res.get("ok"):
+                outcomes.append((None, False))
+                continue
+            status = int(res.get("status") or 500)
+            outcomes.append((
+                f"{status} {res.get('error') or 'no result'}",
+                400 <= status < 500 and status not in RETRYABLE_STATUS,
+            ))
+        return outcomes
+
+    def _delivered(self, event: RecordUsageEvent) -> None:
+        event.status = "delivered"
+        event.delivered_at = datetime.utcnow()
+        event.last_error = None
+        self.stats["delivered"] += 1
+
+    def _failed(self, event: RecordUsageEvent, error: str, permanent: bool) -> None:
+        event.attempts = (event.attempts or 0) + 1
+        event.last_error = error[:1000]
+        if permanent or event.attempts >= self.max_attempts:
+            event.status = "dead"
+            self.stats["dead"] += 1
+            logger.error("record-usage for %s dead after %s attempt(s): %s", event.appeal_id, event.attempts, error)
+            return
+        event.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(event.attempts))
+        self.stats["retried"] += 1
+        logger.warning("record-usage for %s failed (attempt %s): %s", event.appeal_id, event.attempts, error)
+
+    def run(self, app, stop_event: Optional[threading.Event] = None) -> None:
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            processed = 0
+            try:
+                with app.app_context():
+                    processed = self.flush()
+                    db.session.remove()
+            except Exception:
+                logger.exception("record-usage flush failed")
+            if processed >= self.batch_size:
+                continue
+            _wake.wait(POLL_SECONDS)
+            _wake.clear()
+
+
+def start_record_usage_sender(app) -> None:
+    """
+    Start the sender thread in this process once, unless RECORD_USAGE_EMBEDDED_SENDER=0.
+    Raises RuntimeError (at app startup) when NEXT_INTERNAL_API_URL is set without INTERNAL_API_SECRET.
+    """
+    global _embedded_started
+    check_record_usage_config()
+    if os.getenv("RECORD_USAGE_EMBEDDED_SENDER", "1").strip().lower() in ("0", "false", "no"):
+        return
+    with _embedded_lock:
+        if _embedded_started:
+            return
+        _embedded_started = True
+    with app.app_context():
+        from migrate_record_usage_outbox import ensure_record_usage_outbox_schema
+
+        ensure_record_usage_outbox_schema(db)
+    threading.Thread(target=RecordUsageSender().run, args=(app,), name="record-usage-sender", daemon=True).start()
@@ -0,0 +1,77 @@
+"""
+Single-flight coalescing for duplicate in-flight LLM calls.
+
+When several threads ask for the same key at once (double-clicked generate, intake preview racing
+/api/generate/appeal, a batch re-running a document that is mid-extraction), the first caller runs
+the call and the rest wait for it and share its result, or its exception. Nothing is kept once the
+call finishes; llm_cache covers repeats after that. Coalescing is per process.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {"leaders": 0, "shared": 0, "in_flight": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn() once per concurrent key. Returns (result, shared): shared is True for callers that
+        waited on another thread's call (copy mutable results before changing them).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["leaders"] += 1
+                self.stats["in_flight"] = len(self._calls)
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                self.stats["in_flight"] = len(self._calls)
+            call.done.set()
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name)
+        return flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: dict(f.stats) for name, f in _flights.items()}
@@ -0,0 +1,95 @@
+"""
+Draft-first appeal generation.
+
+With "draft": true, POST /api/generate/appeal does not wait for OpenAI. It stores the
+deterministic submission letter (render_deterministic_submission_appeal, a few milliseconds)
+as letter_version 1 and returns it at once. The LLM letter is then generated on the
+generation executor (generation_jobs.py), and the client can poll its job. When the refined
+letter arrives it replaces generated_letter_text and bumps letter_version. Each step is
+written to claim_status_events for the queue UI timeline.
+
+A refinement is applied only if letter_version is still the draft's version. If the letter was
+edited or regenerated in the meantime, the newer text is kept. When the LLM is unavailable, the
+draft stays the final letter and a refine_failed event says so.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Optional
+
+from models import Appeal, ClaimStatusEvent, db
+
+logger = logging.getLogger(__name__)
+
+EVENT_DRAFT = "draft_generated"
+EVENT_REFINED = "letter_refined"
+EVENT_REFINE_FAILED = "refine_failed"
+
+# Columns generate_appeal_content sets besides the letter; copied over with the refined text
+_REFINED_FIELDS = ("ai_model_used", "ai_generation_method", "ai_word_count", "routing_decision_json")
+
+
+def add_claim_event(appeal_db_id: int, user_id: Any, event_type: str, message: Optional[str] = None) -> ClaimStatusEvent:
+    """Add a claim_status_events row to the session; the caller commits."""
+    ev = ClaimStatusEvent(
+        appeal_db_id=appeal_db_id,
+        user_id=user_id,
+        event_type=event_type,
+        message=message,
+        created_at=datetime.utcnow(),
+    )
+    db.session.add(ev)
+    return ev
+
+
+def apply_refined_letter(appeal: Appeal, draft_version: int, letter: str, user_id: Any) -> bool:
+    """
+    Replace the draft with the refined letter if appeal.letter_version is still draft_version.
+    Returns False (and changes nothing) when the letter moved on in the meantime.
+    """
+    values = {f: getattr(appeal, f) for f in _REFINED_FIELDS if hasattr(appeal, f)}
+    # Drop the in-memory changes generate_appeal_content made; the conditional UPDATE below decides
+    db.session.expire(appeal)
+    values.update(
+        {
+            "generated_letter_text": letter,
+            "letter_version": draft_version + 1,
+            "last_generated_at": datetime.utcnow(),
+            "tracking_updated_at": datetime.utcnow(),
+        }
+    )
+    updated = (
+        Appeal.query.filter(Appeal.id == appeal.id, db.func.coalesce(Appeal.letter_version, 0) == draft_version)
+        .update(values, synchronize_session=False)
+    )
+    if not updated:
+        db.session.rollback()
+        logger.info("Refined letter for %s dropped: letter changed since draft v%s", appeal.appeal_id, draft_version)
+        return False
+    add_claim_event(
+        appeal.id,
+        user_id,
+        EVENT_REFINED,
+        f"Appeal letter refined by AI ({values.get('ai_model_used') or 'LLM'}, version {draft_version + 1})",
+    )
+    db.session.commit()
+    return True
+
+
+def refine_appeal(generator, appeal_id: str, draft_version: int, user_id: Any, regenerate: bool = False) -> bool:
+    """
+    Background step of a draft generation: run the LLM letter and apply it over the draft.
+    Raises when the LLM could not produce a letter, so the generation job ends in error
+    while the draft stays in place.
+    """
+    appeal = Appeal.query.filter_by(appeal_id=appeal_id).first()
+    if appeal is None:
+        raise LookupError(f"Appeal {appeal_id} not found")
+    letter = generator.generate_appeal_content(appeal, regenerate=regenerate)
+    if not str(getattr(appeal, "ai_generation_method", "") or "").startswith("submission_engine_llm"):
+        db.session.expire(appeal)
+        add_claim_event(appeal.id, user_id, EVENT_REFINE_FAILED, "AI refinement unavailable; the draft letter was kept")
+        db.session.commit()
+        raise RuntimeError("AI refinement unavailable; the draft letter was kept")
+    return apply_refined_letter(appeal, draft_version, letter, user_id)
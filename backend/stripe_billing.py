@@ -4,10 +4,10 @@ Handles subscriptions, metered billing, and customer portal
 """
 
 import stripe
-from datetime import datetime
 from typing import Optional, Dict
 from models import db, User
 from config import Config
+from usage_outbox import enqueue_overage_usage
 
 # Initialize Stripe
 stripe.api_key = Config.STRIPE_SECRET_KEY
@@ -141,48 +141,23 @@ class StripeBilling:
     @staticmethod
     def report_overage_usage(user_id: int, quantity: int = 1) -> bool:
         """
-        Report metered usage to Stripe for overage billing
+        Queue metered overage usage for Stripe (no Stripe call on this path).
+        usage_outbox.UsageReporter sends queued units in aggregate in the background.
         
         Args:
             user_id: User ID
             quantity: Number of appeals to report (default 1)
             
         Returns:
-            True if successful
+            True if queued (user has a subscription)
         """
         try:
-            user = User.query.get(user_id)
-            if not user or not user.stripe_subscription_id:
+            queued = enqueue_overage_usage(user_id, quantity, source='generation')
+            if not queued:
                 print(f"⚠️  User {user_id} has no active subscription")
-                return False
-            
-            # Get subscription to find metered item
-            subscription = stripe.Subscription.retrieve(user.stripe_subscription_id)
-            
-            # Find the metered overage item
-            overage_item = None
-            for item in subscription['items']['data']:
-                if item['price']['id'] == StripeBilling.OVERAGE_PRICE_ID:
-                    overage_item = item
-                    break
-            
-            if not overage_item:
-                print(f"⚠️  No metered overage item found for user {user_id}")
-                return False
-            
-            # Report usage
-            stripe.SubscriptionItem.create_usage_record(
-                overage_item['id'],
-                quantity=quantity,
-                timestamp=int(datetime.utcnow().timestamp()),
-                action='increment'
-            )
-            
-            print(f"✓ Reported {quantity} overage usage for user {user_id}")
-            return True
-            
+            return queued
         except Exception as e:
-            print(f"❌ Error reporting overage usage: {e}")
+            print(f"❌ Error queueing overage usage: {e}")
             return False
     
     @staticmethod
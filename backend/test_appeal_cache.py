@@ -0,0 +1,92 @@
+"""
+Tests for the opt-in appeal letter cache: identical intake per user reuses the letter,
+users are isolated, "regenerate" bypasses the lookup, and the cache is off by default.
+"""
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+
+import llm_cache
+from appeal_submission_engine import generate_submission_appeal
+from migrate_llm_cache import ensure_llm_cache_schema
+from models import db
+
+INTAKE = {
+    "payer_name": "Aetna",
+    "claim_number": "CLM100",
+    "patient_name": "Jane Doe",
+    "date_of_service": "2026-01-15",
+    "cpt_codes": ["99214"],
+    "carc_codes": ["50"],
+    "denial_reason_text": "CO-50 not medically necessary",
+}
+
+
+class StubClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        text = f"Appeal letter #{self.calls}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class TestAppealCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_llm_cache_schema(db)
+        llm_cache._schema_ready = True
+        llm_cache._caches.clear()
+        self.env = mock.patch.dict(os.environ, {"APPEAL_CACHE_ENABLED": "1"})
+        self.env.start()
+        self.client = StubClient()
+
+    def tearDown(self):
+        self.env.stop()
+        llm_cache._caches.clear()
+        db.session.remove()
+        self.ctx.pop()
+
+    def _gen(self, intake=INTAKE, **kw):
+        return generate_submission_appeal(dict(intake), self.client, **kw)
+
+    def test_identical_intake_reuses_letter_per_user(self):
+        first = self._gen(cache_scope="user-a")
+        self.assertEqual(first, ("Appeal letter #1", "llm"))
+        reordered = dict(reversed(list(INTAKE.items())))
+        self.assertEqual(self._gen(reordered, cache_scope="user-a"), first)
+        self.assertEqual(self._gen(cache_scope="user-b")[0], "Appeal letter #2")
+        self.assertEqual(self.client.calls, 2)
+
+    def test_changed_intake_misses(self):
+        self._gen(cache_scope="user-a")
+        self._gen(dict(INTAKE, claim_number="CLM101"), cache_scope="user-a")
+        self.assertEqual(self.client.calls, 2)
+
+    def test_regenerate_bypasses_and_refreshes(self):
+        self._gen(cache_scope="user-a")
+        self.assertEqual(self._gen(cache_scope="user-a", bypass_cache=True)[0], "Appeal letter #2")
+        self.assertEqual(self._gen(cache_scope="user-a")[0], "Appeal letter #2")
+        self.assertEqual(self.client.calls, 2)
+
+    def test_off_by_default_and_without_scope(self):
+        self._gen()
+        self._gen()
+        with mock.patch.dict(os.environ, {"APPEAL_CACHE_ENABLED": "0"}):
+            self._gen(cache_scope="user-a")
+            self._gen(cache_scope="user-a")
+        self.assertEqual(self.client.calls, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
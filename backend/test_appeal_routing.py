@@ -0,0 +1,105 @@
+"""
+Tests for complexity-based appeal routing: low-value administrative denials skip the LLM,
+routine claims use the light model, high-value or clinical claims use the standard model,
+and the generator passes the tier through and records the decision on the appeal.
+"""
+import json
+import os
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+import llm_governor
+from advanced_ai_generator import AdvancedAIAppealGenerator
+from appeal_routing import TIER_DETERMINISTIC, TIER_LIGHT, TIER_STANDARD, route_appeal
+from llm_governor import LLMGovernor
+
+BASE = {
+    "payer_name": "Aetna",
+    "claim_number": "CLM7",
+    "cpt_codes": ["99213"],
+    "icd10_codes": ["E11.9"],
+    "modifiers": [],
+}
+
+
+class StubClient:
+    def __init__(self):
+        self.kwargs = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.kwargs.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="LLM appeal letter"))])
+
+
+class TestAppealRouting(unittest.TestCase):
+
+    def test_low_value_timely_filing_skips_llm(self):
+        route = route_appeal({**BASE, "carc_codes": ["29"], "billed_amount": "40.00"})
+        self.assertEqual(route["tier"], TIER_DETERMINISTIC)
+        self.assertFalse(route["use_llm"])
+        self.assertEqual(route["inputs"]["strategy"], "timely_filing")
+        regen = route_appeal({**BASE, "carc_codes": ["29"], "billed_amount": "40.00"}, regenerate=True)
+        self.assertTrue(regen["use_llm"])
+
+    def test_routine_claim_uses_light_model(self):
+        with mock.patch.dict(os.environ, {"OPENAI_APPEAL_MODEL_LIGHT": "mini-model"}):
+            route = route_appeal({**BASE, "carc_codes": ["18"], "billed_amount": "450.00"})
+        self.assertEqual(route["tier"], TIER_LIGHT)
+        self.assertEqual(route["model"], "mini-model")
+        self.assertLess(route["max_tokens"], 4000)
+
+    def test_high_value_multi_carc_medical_necessity_uses_standard(self):
+        route = route_appeal({**BASE, "carc_codes": ["50", "16", "197"], "billed_amount": "50000.00"})
+        self.assertEqual(route["tier"], TIER_STANDARD)
+        self.assertEqual(route["max_tokens"], 4000)
+        self.assertEqual(route["inputs"]["carc_count"], 3)
+        self.assertEqual(route["inputs"]["strategy"], "medical_necessity")
+        self.assertGreater(route["inputs"]["risk_score"], 0)
+        with mock.patch.dict(os.environ, {"APPEAL_ROUTING_ENABLED": "0"}):
+            cheap = route_appeal({**BASE, "carc_codes": ["29"], "billed_amount": "40.00"})
+        self.assertEqual(cheap["tier"], TIER_STANDARD)
+
+    def test_generator_applies_and_records_route(self):
+        gen = AdvancedAIAppealGenerator.__new__(AdvancedAIAppealGenerator)
+        gen.enabled = True
+        gen.client = StubClient()
+        appeal = SimpleNamespace(
+            appeal_id="APP-R1",
+            user_id=None,
+            payer="Aetna",
+            claim_number="CLM7",
+            patient_id="P1",
+            provider_name="Clinic",
+            date_of_service=date(2026, 1, 5),
+            denial_reason="CO-29 time limit for filing has expired",
+            denial_code="CO-29",
+            diagnosis_code="E11.9",
+            cpt_codes="99213",
+            billed_amount=40,
+            ai_model_used=None,
+            ai_generation_method=None,
+            routing_decision_json=None,
+        )
+        letter = gen.generate_appeal_content(appeal)
+        self.assertEqual(gen.client.kwargs, [])
+        self.assertIn("CLM7", letter)
+        self.assertEqual(appeal.ai_model_used, "deterministic_submission")
+        self.assertEqual(json.loads(appeal.routing_decision_json)["tier"], TIER_DETERMINISTIC)
+
+        appeal.billed_amount = 450
+        gov = LLMGovernor(rpm=6000, tpm=10_000_000, max_concurrency=4, max_wait_seconds=5)
+        with mock.patch.object(llm_governor, "get_governor", return_value=gov), mock.patch.dict(
+            os.environ, {"OPENAI_APPEAL_MODEL_LIGHT": "mini-model"}
+        ):
+            letter = gen.generate_appeal_content(appeal)
+        self.assertEqual(letter, "LLM appeal letter")
+        self.assertEqual(gen.client.kwargs[0]["model"], "mini-model")
+        self.assertEqual(appeal.ai_model_used, "mini-model")
+        self.assertEqual(json.loads(appeal.routing_decision_json)["tier"], TIER_LIGHT)
+
+
+if __name__ == "__main__":
+    unittest.main()
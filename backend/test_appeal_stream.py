@@ -0,0 +1,99 @@
+"""
+Tests for streamed appeal generation: deltas are forwarded as the model writes them,
+failures before or mid-stream end in one deterministic "replace", and a client that
+disconnects releases its governor slot without counting against the circuit breaker.
+"""
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import circuit_breaker
+import llm_governor
+from appeal_submission_engine import stream_submission_appeal
+from circuit_breaker import CLOSED, CircuitBreaker
+from llm_governor import LLMGovernor
+
+INTAKE = {"payer_name": "Aetna", "claim_number": "CLM42", "carc_codes": ["50"]}
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class StreamingStub:
+    def __init__(self, pieces, fail_after=None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.kwargs = None
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+
+        def gen():
+            for i, piece in enumerate(self.pieces):
+                if self.fail_after is not None and i == self.fail_after:
+                    raise ConnectionError("stream reset")
+                yield _chunk(piece)
+            yield SimpleNamespace(choices=[])
+
+        return gen()
+
+
+class TestAppealStream(unittest.TestCase):
+
+    def setUp(self):
+        self.gov = LLMGovernor(rpm=6000, tpm=10_000_000, max_concurrency=4, max_wait_seconds=5)
+        self.breaker = CircuitBreaker("appeal", failure_threshold=1, open_seconds=60)
+        self.patches = [
+            mock.patch.object(llm_governor, "get_governor", return_value=self.gov),
+            mock.patch.dict(circuit_breaker._breakers, {"appeal": self.breaker}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_deltas_then_done(self):
+        stub = StreamingStub(["Dear ", "Aetna", ",\n"])
+        events = list(stream_submission_appeal(dict(INTAKE), stub))
+        self.assertEqual(
+            events,
+            [("delta", "Dear "), ("delta", "Aetna"), ("delta", ",\n"), ("done", "llm")],
+        )
+        self.assertTrue(stub.kwargs["stream"])
+        self.assertEqual(stub.kwargs["messages"][0]["role"], "system")
+        self.assertEqual(self.gov.snapshot()["in_flight"], 0)
+
+    def test_mid_stream_failure_replaces_with_deterministic(self):
+        stub = StreamingStub(["Dear ", "Aetna"], fail_after=1)
+        events = list(stream_submission_appeal(dict(INTAKE), stub))
+        self.assertEqual(events[0], ("delta", "Dear "))
+        self.assertEqual(events[1][0], "replace")
+        self.assertIn("CLM42", events[1][1])
+        self.assertEqual(events[-1], ("done", "deterministic"))
+        self.assertEqual(self.breaker.state, "open")
+
+    def test_no_client_or_open_breaker_goes_straight_to_fallback(self):
+        kinds = [k for k, _ in stream_submission_appeal(dict(INTAKE), None)]
+        self.assertEqual(kinds, ["replace", "done"])
+        self.breaker.state = "open"
+        self.breaker._opened_at = 10 ** 12
+        stub = StreamingStub(["x"])
+        kinds = [k for k, _ in stream_submission_appeal(dict(INTAKE), stub)]
+        self.assertEqual(kinds, ["replace", "done"])
+        self.assertIsNone(stub.kwargs)
+
+    def test_disconnect_releases_slot_without_tripping_breaker(self):
+        stream = stream_submission_appeal(dict(INTAKE), StreamingStub(["a", "b", "c"]))
+        self.assertEqual(next(stream), ("delta", "a"))
+        self.assertEqual(self.gov.snapshot()["in_flight"], 1)
+        stream.close()
+        self.assertEqual(self.gov.snapshot()["in_flight"], 0)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
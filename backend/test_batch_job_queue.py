@@ -0,0 +1,171 @@
+"""
+Tests for the durable batch job queue: claiming, leases, heartbeats and the attempts cap.
+Runs against SQLite (the PostgreSQL path uses FOR UPDATE SKIP LOCKED with the same predicate).
+"""
+import sqlite3
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import text
+
+import batch_job_queue as q
+import migrate_batch_appeal_jobs
+from credit_reservation import CreditReservation
+from migrate_batch_appeal_jobs import ensure_batch_appeal_jobs_schema, sweep_interrupted_batch_jobs
+from migrate_stripe_usage_outbox import ensure_stripe_usage_outbox_schema
+from models import db, BatchAppealJob
+
+
+class TestBatchJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_batch_appeal_jobs_schema(db)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def _job(self, created_offset=0, **kw):
+        now = datetime.utcnow() + timedelta(seconds=created_offset)
+        row = BatchAppealJob(
+            job_id=uuid.uuid4().hex,
+            user_id=kw.pop('user_id_override', None) or uuid.uuid4(),
+            status=kw.pop('status', 'queued'),
+            summary_rows=[],
+            payload={'rows': [{'claim_number': 'C1'}]},
+            attempts=kw.pop('attempts', 0),
+            created_at=now,
+            updated_at=now,
+            **kw,
+        )
+        db.session.add(row)
+        db.session.commit()
+        return row.job_id
+
+    def _row(self, job_id):
+        db.session.expire_all()
+        return db.session.get(BatchAppealJob, job_id)
+
+    def test_claims_oldest_queued_job_once(self):
+        older = self._job(created_offset=-10)
+        newer = self._job()
+        self.assertEqual(q.claim_next_job('w1'), older)
+        self.assertEqual(q.claim_next_job('w2'), newer)
+        self.assertIsNone(q.claim_next_job('w3'))
+        row = self._row(older)
+        self.assertEqual(row.status, 'running')
+        self.assertEqual(row.lease_owner, 'w1')
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.lease_expires_at, datetime.utcnow())
+
+    def test_live_lease_is_not_reclaimed(self):
+        job_id = self._job()
+        q.claim_next_job('w1')
+        self.assertIsNone(q.claim_next_job('w2'))
+        self.assertTrue(q.renew_lease(job_id, 'w1'))
+
+    def test_expired_lease_is_reclaimed_and_old_owner_loses_it(self):
+        job_id = self._job()
+        q.claim_next_job('w1')
+        later = datetime.utcnow() + timedelta(seconds=q.LEASE_SECONDS + 1)
+        self.assertEqual(q.claim_next_job('w2', now=later), job_id)
+        self.assertFalse(q.renew_lease(job_id, 'w1'))
+        row = self._row(job_id)
+        self.assertEqual(row.lease_owner, 'w2')
+        self.assertEqual(row.attempts, 2)
+
+    def test_release_only_by_owner(self):
+        job_id = self._job()
+        q.claim_next_job('w1')
+        q.release_lease(job_id, 'someone-else')
+        self.assertEqual(self._row(job_id).lease_owner, 'w1')
+        q.release_lease(job_id, 'w1')
+        row = self._row(job_id)
+        self.assertIsNone(row.lease_owner)
+        self.assertIsNone(row.lease_expires_at)
+
+    def test_parked_job_waits_and_keeps_its_attempts(self):
+        job_id = self._job()
+        q.claim_next_job('w1')
+        not_before = datetime.utcnow() + timedelta(seconds=q.LEASE_SECONDS * 10)
+        self.assertFalse(q.park_job(job_id, 'w2', not_before))
+        self.assertTrue(q.park_job(job_id, 'w1', not_before))
+        row = self._row(job_id)
+        self.assertIsNone(row.lease_owner)
+        self.assertEqual(row.attempts, 0)
+        self.assertIsNone(q.claim_next_job('w2', now=not_before - timedelta(seconds=1)))
+        self.assertEqual(q.claim_next_job('w2', now=not_before + timedelta(seconds=1)), job_id)
+        self.assertEqual(self._row(job_id).attempts, 1)
+
+    def test_terminal_jobs_are_never_claimed(self):
+        self._job(status='done')
+        self._job(status='error')
+        self.assertIsNone(q.claim_next_job('w1'))
+
+    def test_attempts_cap_and_sweep(self):
+        job_id = self._job(status='running', attempts=q.MAX_ATTEMPTS)
+        self.assertIsNone(q.claim_next_job('w1'))
+        sweep_interrupted_batch_jobs(db)
+        row = self._row(job_id)
+        self.assertEqual(row.status, 'error')
+        self.assertIn('Interrupted', row.error)
+
+    def test_concurrent_sweeps_settle_a_dead_job_once(self):
+        ensure_stripe_usage_outbox_schema(db)
+        uid = uuid.uuid4()
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                """CREATE TABLE users (
+                    id CHAR(32) PRIMARY KEY, subscription_credits INTEGER DEFAULT 0,
+                    bulk_credits INTEGER DEFAULT 0, appeals_generated_today INTEGER DEFAULT 0,
+                    appeals_generated_weekly INTEGER DEFAULT 0, appeals_generated_monthly INTEGER DEFAULT 0,
+                    free_trial_generations_used INTEGER DEFAULT 0, plan_limit INTEGER DEFAULT 0,
+                    overage_count INTEGER DEFAULT 0, stripe_subscription_id VARCHAR(255)
+                )"""
+            ))
+            conn.execute(
+                text("INSERT INTO users (id, bulk_credits, appeals_generated_monthly, plan_limit, stripe_subscription_id) "
+                     "VALUES (:id, 0, 13, 10, 'sub_1')"),
+                {'id': uid.hex},
+            )
+        # Three usage slots reserved past the plan limit; one row generated before the job died
+        res = CreditReservation.from_grant(uid, {
+            'take_sc': 0, 'take_bc': 0, 'take_usage': 3, 'take_ft': 0,
+            'm': 10, 'ov': 0, 'pl': 10, 'sub_id': 'sub_1',
+        })
+        res.take()
+        res.record(True)
+        job_id = self._job(status='running', attempts=q.MAX_ATTEMPTS, user_id_override=uid, credit_reservation=res.state)
+
+        # The second sweeper read the row (reservation still unsettled) before the first committed
+        with mock.patch.dict(sqlite3.adapters, {(uuid.UUID, sqlite3.PrepareProtocol): lambda u: u.hex}):
+            sweep_interrupted_batch_jobs(db)
+            self._row(job_id).credit_reservation = dict(res.state)
+            db.session.commit()
+            with mock.patch.object(migrate_batch_appeal_jobs, '_dead_batch_job_ids', return_value=[job_id]):
+                sweep_interrupted_batch_jobs(db)
+
+        with db.engine.connect() as conn:
+            monthly = conn.execute(text('SELECT appeals_generated_monthly FROM users')).scalar()
+            queued = conn.execute(text('SELECT COALESCE(SUM(quantity), 0) FROM stripe_usage_outbox')).scalar()
+        self.assertEqual(monthly, 11)
+        self.assertEqual(queued, 1)
+        self.assertEqual(self._row(job_id).status, 'error')
+
+    def test_sweep_leaves_resumable_jobs(self):
+        job_id = self._job(status='running', attempts=1)
+        sweep_interrupted_batch_jobs(db)
+        self.assertEqual(self._row(job_id).status, 'running')
+        self.assertEqual(q.claim_next_job('w1'), job_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests for coalesced batch progress writes (cadence, incremental summary rows, round-trip counter).
+"""
+import unittest
+import uuid
+from datetime import datetime
+
+from flask import Flask
+
+from batch_job_queue import LeaseLost
+from batch_progress import BatchProgress
+from migrate_batch_appeal_jobs import ensure_batch_appeal_jobs_schema
+from models import db, BatchAppealJob
+
+
+class TestBatchProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_batch_appeal_jobs_schema(db)
+        now = datetime.utcnow()
+        self.job_id = uuid.uuid4().hex
+        db.session.add(
+            BatchAppealJob(
+                job_id=self.job_id,
+                user_id=uuid.uuid4(),
+                status='running',
+                summary_rows=[],
+                lease_owner='w1',
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        db.session.commit()
+        self.job = {'status': 'running', 'total': 30, 'current': 0, 'ok_count': 0, 'summary_rows': []}
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def _row(self):
+        db.session.expire_all()
+        return db.session.get(BatchAppealJob, self.job_id)
+
+    def _add_row(self, n):
+        self.job['current'] = n
+        self.job['summary_rows'].append({'row': n, 'status': 'ok'})
+
+    def test_row_cadence_coalesces_writes(self):
+        progress = BatchProgress(self.job_id, self.job, owner='w1', every_rows=10, every_seconds=3600)
+        for n in range(1, 31):
+            self._add_row(n)
+            progress.maybe_flush()
+        self.assertEqual(progress.round_trips, 3)
+        row = self._row()
+        self.assertEqual([r['row'] for r in row.summary_rows], list(range(1, 31)))
+        self.assertEqual(row.current, 30)
+        self.assertEqual(row.db_round_trips, 3)
+
+    def test_time_cadence_and_idle(self):
+        progress = BatchProgress(self.job_id, self.job, every_rows=100, every_seconds=0)
+        self.assertFalse(progress.maybe_flush())  # nothing changed yet
+        self._add_row(1)
+        self.assertTrue(progress.maybe_flush())
+        self.assertFalse(progress.maybe_flush())
+        self.job['current'] = 2
+        self.assertTrue(progress.maybe_flush())
+        self.assertEqual(self._row().current, 2)
+
+    def test_terminal_flush_writes_pending_rows(self):
+        calls = []
+        progress = BatchProgress(
+            self.job_id, self.job, every_rows=10, every_seconds=3600, on_flush=lambda: calls.append(1)
+        )
+        self._add_row(1)
+        self._add_row(2)
+        self.assertFalse(progress.maybe_flush())
+        self.assertEqual(calls, [])
+        self.job['status'] = 'done'
+        progress.flush()
+        row = self._row()
+        self.assertEqual(row.status, 'done')
+        self.assertEqual(len(row.summary_rows), 2)
+        self.assertEqual(calls, [1])
+
+    def test_resumed_job_appends_after_checkpoint(self):
+        self.job['summary_rows'] = [{'row': 1, 'status': 'ok'}]
+        BatchProgress(self.job_id, self.job).flush()
+        resumed = dict(self.job, summary_rows=list(self._row().summary_rows))
+        progress = BatchProgress(self.job_id, resumed)
+        self.assertEqual(progress.pending_rows(), 0)
+        resumed['summary_rows'].append({'row': 2, 'status': 'ok'})
+        progress.flush()
+        self.assertEqual([r['row'] for r in self._row().summary_rows], [1, 2])
+
+    def test_lost_lease_raises(self):
+        progress = BatchProgress(self.job_id, self.job, owner='someone-else')
+        self._add_row(1)
+        with self.assertRaises(LeaseLost):
+            progress.flush()
+        self.assertEqual(self._row().summary_rows, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests for the batch row pipeline: ordering, bounded in-flight rows, error capture.
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_row_pipeline import OrderedRowWindow, prefetch_ordered
+
+
+class TestOrderedRowWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def _collect(self, window, jobs):
+        out = []
+        for ctx, fn, args in jobs:
+            out.extend(window.submit(ctx, fn, *args))
+        out.extend(window.drain())
+        return out
+
+    def test_results_in_submission_order(self):
+        """Rows that finish early are still handed back in admission order"""
+        window = OrderedRowWindow(size=4, executor=self.executor)
+        delays = [0.08, 0.01, 0.05, 0.0, 0.03, 0.02]
+        jobs = [(i, lambda d, i=i: (time.sleep(d), i)[1], (d,)) for i, d in enumerate(delays)]
+        out = self._collect(window, jobs)
+        self.assertEqual([ctx for ctx, _r, _e in out], list(range(len(delays))))
+        self.assertEqual([r for _c, r, _e in out], list(range(len(delays))))
+
+    def test_in_flight_bounded_by_window(self):
+        """Never more than `size` rows running for one window"""
+        window = OrderedRowWindow(size=3, executor=self.executor)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def work():
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+
+        self._collect(window, [(i, work, ()) for i in range(12)])
+        self.assertLessEqual(state['peak'], 3)
+        self.assertGreaterEqual(state['peak'], 2)
+
+    def test_errors_are_captured_per_row(self):
+        window = OrderedRowWindow(size=2, executor=self.executor)
+
+        def boom():
+            raise RuntimeError('row failed')
+
+        out = self._collect(window, [(1, lambda: 'ok', ()), (2, boom, ()), (3, lambda: 'ok', ())])
+        self.assertEqual([c for c, _r, _e in out], [1, 2, 3])
+        self.assertIsNone(out[0][2])
+        self.assertIsInstance(out[1][2], RuntimeError)
+        self.assertEqual(out[2][1], 'ok')
+
+    def test_size_one_runs_inline(self):
+        """Legacy sequential mode runs on the caller's thread, without the pool"""
+        window = OrderedRowWindow(size=1, executor=None)
+        caller = threading.get_ident()
+        out = self._collect(window, [(i, threading.get_ident, ()) for i in range(3)])
+        self.assertTrue(all(r == caller for _c, r, _e in out))
+
+    def test_resolved_rows_keep_their_place(self):
+        window = OrderedRowWindow(size=3, executor=self.executor)
+        out = []
+        out.extend(window.submit('a', lambda: (time.sleep(0.03), 'a')[1]))
+        out.extend(window.add_resolved('skipped', 'skip'))
+        out.extend(window.submit('c', lambda: 'c'))
+        out.extend(window.drain())
+        self.assertEqual([c for c, _r, _e in out], ['a', 'skipped', 'c'])
+        self.assertEqual(window.count(lambda ctx: True), 0)
+
+    def test_prefetch_ordered(self):
+        items = [0.03, 0.0, 0.02, 0.01]
+        out = list(prefetch_ordered(lambda d: (time.sleep(d), d)[1], items, size=3, executor=self.executor))
+        self.assertEqual([item for item, _r, _e in out], items)
+        self.assertEqual([r for _i, r, _e in out], items)
+
+
+if __name__ == '__main__':
+    unittest.main()
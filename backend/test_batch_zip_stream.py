@@ -0,0 +1,63 @@
+"""
+Tests for the streamed batch ZIP: valid archive, row order, partial downloads.
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from batch_zip_stream import iter_batch_zip
+
+
+class TestBatchZipStream(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp(prefix='dap_zip_test_')
+        self.pdfs = {}
+        for n in (1, 2, 3):
+            name = f'appeal_r{n}.pdf'
+            data = b'%PDF-1.4\n' + os.urandom(200 * 1024) + b'\n%%EOF'
+            with open(os.path.join(self.out_dir, name), 'wb') as f:
+                f.write(data)
+            self.pdfs[name] = data
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def _ok(self, n):
+        return {'row': n, 'claim_number': f'C{n}', 'status': 'ok', 'pdf_name': f'appeal_r{n}.pdf'}
+
+    def _zip(self, *args, **kwargs):
+        chunks = list(iter_batch_zip(self.out_dir, *args, **kwargs))
+        self.assertGreater(len(chunks), 3)  # streamed, not one buffer
+        return zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+    def test_complete_archive(self):
+        rows = [self._ok(1), {'row': 2, 'status': 'error', 'reason': 'boom'}, self._ok(3)]
+        zf = self._zip(rows, 2, 'csv')
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(
+            zf.namelist(),
+            ['batch_summary.csv', 'processing_report.txt', 'appeal_r1.pdf', 'appeal_r3.pdf'],
+        )
+        self.assertEqual(zf.read('appeal_r3.pdf'), self.pdfs['appeal_r3.pdf'])
+        self.assertIn('Row 2: [error]', zf.read('processing_report.txt').decode('utf-8'))
+        self.assertNotIn('pdf_name', zf.read('batch_summary.csv').decode('utf-8'))
+
+    def test_partial_only_includes_checkpointed_rows(self):
+        with open(os.path.join(self.out_dir, 'appeal_r4.pdf.part'), 'wb') as f:
+            f.write(b'%PDF-incomplete')
+        zf = self._zip([self._ok(1)], 1, 'pdf_multi', partial=True)
+        self.assertEqual(zf.namelist()[2:], ['appeal_r1.pdf'])
+        self.assertIn('PARTIAL DOWNLOAD', zf.read('processing_report.txt').decode('utf-8'))
+
+    def test_rows_without_pdf_names_fall_back_to_directory(self):
+        rows = [{'row': n, 'status': 'ok'} for n in (1, 2, 3)]
+        zf = self._zip(rows, 3, 'csv')
+        self.assertEqual(sorted(zf.namelist()[2:]), sorted(self.pdfs))
+
+
+if __name__ == '__main__':
+    unittest.main()
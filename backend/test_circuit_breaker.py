@@ -0,0 +1,139 @@
+"""
+Tests for the OpenAI circuit breaker: consecutive failures and slow calls open it, open
+short-circuits without calling OpenAI, a half-open probe closes or reopens it, client-side
+4xx errors do not count, only the OpenAI call (not the governor queue) is timed, and generation
+falls back to the deterministic letter while open.
+"""
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import circuit_breaker
+from appeal_submission_engine import generate_submission_appeal
+import llm_governor
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from llm_governor import LLMGovernor, governed_create
+
+
+class Upstream(Exception):
+    def __init__(self, status_code=None):
+        super().__init__(f"upstream {status_code}")
+        self.status_code = status_code
+
+
+def _fail(status_code=None):
+    def fn():
+        raise Upstream(status_code)
+    return fn
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_consecutive_failures_and_short_circuits(self):
+        cb = CircuitBreaker("t", failure_threshold=3, open_seconds=60)
+        for _ in range(2):
+            self.assertRaises(Upstream, cb.call, _fail(503))
+        self.assertEqual(cb.call(lambda: "ok"), "ok")
+        for _ in range(3):
+            self.assertRaises(Upstream, cb.call, _fail())
+        self.assertEqual(cb.state, OPEN)
+        called = []
+        with self.assertRaises(CircuitOpenError):
+            cb.call(lambda: called.append(1))
+        self.assertEqual(called, [])
+        snap = cb.snapshot()
+        self.assertEqual((snap["opened"], snap["short_circuited"], snap["failures"]), (1, 1, 5))
+        self.assertGreater(snap["retry_in_seconds"], 0)
+
+    def test_slow_successes_open_the_breaker(self):
+        cb = CircuitBreaker("t", failure_threshold=2, slow_call_seconds=0.01)
+
+        def slow():
+            time.sleep(0.02)
+            return "late"
+
+        self.assertEqual(cb.call(slow), "late")
+        self.assertEqual(cb.call(slow), "late")
+        self.assertEqual(cb.state, OPEN)
+        self.assertEqual(cb.snapshot()["slow_calls"], 2)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        cb = CircuitBreaker("t", failure_threshold=1, open_seconds=0.05)
+        self.assertRaises(Upstream, cb.call, _fail(500))
+        time.sleep(0.06)
+        self.assertRaises(Upstream, cb.call, _fail(500))
+        self.assertEqual(cb.state, OPEN)
+        time.sleep(0.06)
+        self.assertEqual(cb.call(lambda: "back"), "back")
+        self.assertEqual(cb.state, CLOSED)
+        self.assertEqual(cb.snapshot()["probes"], 2)
+
+    def test_single_probe_while_half_open(self):
+        cb = CircuitBreaker("t", failure_threshold=1, open_seconds=0)
+        self.assertRaises(Upstream, cb.call, _fail(500))
+
+        def probe():
+            self.assertEqual(cb.state, HALF_OPEN)
+            with self.assertRaises(CircuitOpenError):
+                cb.call(lambda: "second")
+            return "probe"
+
+        self.assertEqual(cb.call(probe), "probe")
+        self.assertEqual(cb.state, CLOSED)
+
+    def test_client_errors_do_not_count(self):
+        cb = CircuitBreaker("t", failure_threshold=1)
+        self.assertRaises(Upstream, cb.call, _fail(400))
+        self.assertRaises(Upstream, cb.call, _fail(401))
+        self.assertEqual(cb.state, CLOSED)
+        self.assertRaises(Upstream, cb.call, _fail(429))
+        self.assertEqual(cb.state, OPEN)
+
+    def test_governor_wait_is_not_timed_and_open_breaker_skips_the_queue(self):
+        gov = LLMGovernor(rpm=6000, tpm=10_000_000, max_concurrency=1, max_wait_seconds=5)
+        cb = CircuitBreaker("t", failure_threshold=1, open_seconds=60, slow_call_seconds=0.1)
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: "ok")))
+        held = threading.Event()
+
+        def hold_permit():
+            with gov.permit(10):
+                held.set()
+                time.sleep(0.3)
+
+        holder = threading.Thread(target=hold_permit)
+        holder.start()
+        held.wait()
+        with mock.patch.object(llm_governor, "get_governor", return_value=gov):
+            self.assertEqual(governed_create(stub, breaker=cb, messages=[]), "ok")
+            holder.join()
+            self.assertEqual((cb.state, cb.stats["slow_calls"]), (CLOSED, 0))
+            down = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: _fail(503)())))
+            self.assertRaises(Upstream, governed_create, down, breaker=cb, messages=[])
+            self.assertEqual(cb.state, OPEN)
+            granted = gov.snapshot()["granted"]
+            self.assertRaises(CircuitOpenError, governed_create, stub, breaker=cb, messages=[])
+        self.assertEqual(gov.snapshot()["granted"], granted)
+
+    def test_generation_falls_back_while_open(self):
+        calls = []
+
+        def create(**kwargs):
+            calls.append(1)
+            raise Upstream(503)
+
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        intake = {"payer_name": "Aetna", "claim_number": "CLM7", "carc_codes": ["50"]}
+        breaker = CircuitBreaker("appeal", failure_threshold=2, open_seconds=60)
+        with mock.patch.dict(circuit_breaker._breakers, {"appeal": breaker}), \
+                mock.patch.dict(os.environ, {"APPEAL_CACHE_ENABLED": "0"}):
+            sources = [generate_submission_appeal(dict(intake), stub)[1] for _ in range(4)]
+        self.assertEqual(sources, ["deterministic"] * 4)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(breaker.snapshot()["short_circuited"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests for per-claim segmentation: a remittance splits at claim headers with the shared preamble
+on every block, repeated ids merge, single-claim text stays one block, and block extraction keeps
+order, captures per-block failures and pins the header claim number.
+"""
+import threading
+import unittest
+
+from claim_segmentation import find_claim_headers, parse_claim_blocks, segment_claims
+
+REMITTANCE = """REMITTANCE ADVICE
+Payer: Blue Cross Blue Shield
+Check # 000123 Date 01/20/2026
+
+Claim Number: BCX1001
+Patient: DOE, JANE  DOS 01/02/2026
+99214 BILLED 250.00 PAID 0.00 CO-50
+
+Claim #: BCX1002
+Patient: ROE, RICHARD  DOS 01/05/2026
+99213 BILLED 180.00 PAID 0.00 CO-197
+
+ICN 2026A0003
+Patient: POE, ED  DOS 01/07/2026
+97110 BILLED 90.00 PAID 0.00 CO-16
+
+Claim Number: BCX1001 (summary)
+TOTAL ADJUSTMENTS 250.00
+"""
+
+
+class TestSegmentClaims(unittest.TestCase):
+
+    def test_headers_require_digit_in_id(self):
+        claims = [h["claim_number"] for h in find_claim_headers("Claim Status: DENIED\nClaim Details\nCLM# X12345\n")]
+        self.assertEqual(claims, ["X12345"])
+
+    def test_split_merge_and_preamble(self):
+        blocks = segment_claims(REMITTANCE)
+        self.assertEqual([b["claim_number"] for b in blocks], ["BCX1001", "BCX1002", "2026A0003"])
+        for b in blocks:
+            self.assertTrue(b["text"].startswith("REMITTANCE ADVICE"))
+            self.assertIn("Check # 000123", b["text"])
+        self.assertIn("CO-50", blocks[0]["text"])
+        self.assertIn("TOTAL ADJUSTMENTS", blocks[0]["text"])
+        self.assertNotIn("CO-197", blocks[0]["text"])
+        self.assertIn("CO-197", blocks[1]["text"])
+        self.assertIn("CO-16", blocks[2]["text"])
+
+    def test_single_claim_is_one_unlabelled_block(self):
+        text = "Dear provider,\nClaim Number: BCX1001\nDenied CO-50.\nRe: Claim BCX1001\n"
+        self.assertEqual(segment_claims(text), [{"claim_number": None, "text": text}])
+        self.assertEqual(segment_claims(""), [{"claim_number": None, "text": ""}])
+
+    def test_max_claims(self):
+        self.assertEqual(len(segment_claims(REMITTANCE, max_claims=2)), 2)
+
+
+class TestParseClaimBlocks(unittest.TestCase):
+
+    def test_order_errors_and_claim_number(self):
+        blocks = segment_claims(REMITTANCE)
+        threads = set()
+
+        def parse(text):
+            threads.add(threading.get_ident())
+            if "CO-197" in text:
+                raise ValueError("boom")
+            return {"success": True, "claim_number": "BCX1001", "denial_code": "CO-16" if "CO-16" in text else "CO-50"}
+
+        results = parse_claim_blocks(blocks, parse=parse, max_workers=3)
+        self.assertEqual([r["claim_number"] for r in results], ["BCX1001", "BCX1002", "2026A0003"])
+        self.assertTrue(results[0]["success"])
+        self.assertEqual(results[1], {"success": False, "error": "boom", "claim_number": "BCX1002"})
+        self.assertEqual(results[2]["denial_code"], "CO-16")
+        self.assertEqual(results[2]["raw_text"], blocks[2]["text"][:500])
+
+    def test_single_block_keeps_extracted_claim_number(self):
+        results = parse_claim_blocks(segment_claims("Claim BCX9 CO-50"), parse=lambda t: {"success": True, "claim_number": "BCX9"})
+        self.assertEqual(results[0]["claim_number"], "BCX9")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+Tests for bulk credit reservation: grant order matches sequential try_begin_generation,
+settle refunds unused / failed slots, and overage is counted per successful row.
+Runs against SQLite (the PostgreSQL path sizes the grant with the same rules in one UPDATE).
+"""
+import unittest
+import uuid
+
+from flask import Flask
+from sqlalchemy import text
+
+from credit_reservation import (
+    CreditReservation,
+    SLOT_BULK_CREDIT,
+    SLOT_FREE_TRIAL,
+    SLOT_SUB_CREDIT,
+    SLOT_USAGE,
+    _plan_reservation,
+    reserve_generations,
+    settle_reservation,
+)
+from models import db
+
+FT_LIMIT = 3
+
+
+def _sequential(n, sc, bc, m, ft, pl, active_sub):
+    """Row-by-row admission as try_begin_generation + increment_usage would apply it."""
+    kinds = []
+    for _ in range(n):
+        if sc > 0:
+            sc -= 1
+            kind = SLOT_SUB_CREDIT
+        elif bc > 0:
+            bc -= 1
+            kind = SLOT_BULK_CREDIT
+        elif active_sub:
+            if pl > 0 and m >= pl + 2:
+                break
+            kind = SLOT_USAGE
+        elif ft < FT_LIMIT:
+            ft += 1
+            kind = SLOT_FREE_TRIAL
+        else:
+            break
+        m += 1
+        kinds.append(kind)
+    return kinds
+
+
+class TestCreditReservation(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        with db.engine.begin() as conn:
+            conn.execute(
+                text(
+                    """CREATE TABLE users (
+                        id CHAR(32) PRIMARY KEY,
+                        subscription_credits INTEGER DEFAULT 0,
+                        bulk_credits INTEGER DEFAULT 0,
+                        appeals_generated_today INTEGER DEFAULT 0,
+                        appeals_generated_weekly INTEGER DEFAULT 0,
+                        appeals_generated_monthly INTEGER DEFAULT 0,
+                        free_trial_generations_used INTEGER DEFAULT 0,
+                        plan_limit INTEGER DEFAULT 0,
+                        overage_count INTEGER DEFAULT 0,
+                        stripe_subscription_id VARCHAR(255),
+                        subscription_tier VARCHAR(50),
+                        billing_status VARCHAR(50)
+                    )"""
+                )
+            )
+
+    def tearDown(self):
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP TABLE users'))
+        self.ctx.pop()
+
+    def _user(self, **cols):
+        uid = uuid.uuid4().hex
+        cols['id'] = uid
+        names = ', '.join(cols)
+        binds = ', '.join(f':{k}' for k in cols)
+        with db.engine.begin() as conn:
+            conn.execute(text(f'INSERT INTO users ({names}) VALUES ({binds})'), cols)
+        return uid
+
+    def _get(self, uid):
+        with db.engine.connect() as conn:
+            return conn.execute(text('SELECT * FROM users WHERE id = :id'), {'id': uid}).mappings().first()
+
+    def test_plan_matches_sequential_admission(self):
+        cases = [
+            (5, 2, 1, 0, 0, 0, False),
+            (10, 0, 0, 0, 1, 0, False),
+            (10, 1, 0, 8, 0, 10, True),
+            (4, 0, 0, 12, 0, 10, True),
+            (7, 0, 3, 0, 0, 0, True),
+            (6, 0, 0, 0, 3, 0, False),
+        ]
+        for case in cases:
+            n, sc, bc, m, ft, pl, active = case
+            grant = _plan_reservation(n, sc, bc, m, ft, pl, active, FT_LIMIT)
+            res = CreditReservation.from_grant('u', dict(grant, m=m, ov=0, pl=pl, sub_id=None))
+            self.assertEqual(res.state['slots'], _sequential(*case), case)
+
+    def test_reserve_and_settle_refunds_unused_and_failed(self):
+        uid = self._user(
+            subscription_credits=1, bulk_credits=2, subscription_tier='pro',
+            billing_status='active', plan_limit=10, appeals_generated_monthly=5,
+        )
+        with db.engine.begin() as conn:
+            res = reserve_generations(conn, uid, 6, FT_LIMIT)
+        self.assertEqual(res.state['slots'], [SLOT_SUB_CREDIT, SLOT_BULK_CREDIT, SLOT_BULK_CREDIT] + [SLOT_USAGE] * 3)
+        u = self._get(uid)
+        self.assertEqual((u['subscription_credits'], u['bulk_credits'], u['appeals_generated_monthly']), (0, 0, 11))
+        self.assertEqual(u['overage_count'], 1)
+
+        # Rows 1-4 admitted: credit row 2 failed, usage row 4 failed; slots 5-6 unused
+        for ok in (True, False, True, False):
+            res.take()
+            res.record(ok)
+        with db.engine.begin() as conn:
+            qty = settle_reservation(conn, res)
+        u = self._get(uid)
+        # Failed credit stays deducted; unused bulk credit 0 (both bulk slots used), counters drop 2 unused + 2 failed
+        self.assertEqual((u['subscription_credits'], u['bulk_credits']), (0, 0))
+        self.assertEqual(u['appeals_generated_monthly'], 7)
+        self.assertEqual(u['overage_count'], 0)
+        self.assertEqual(qty, 0)
+        self.assertTrue(res.settled)
+        with db.engine.begin() as conn:
+            self.assertEqual(settle_reservation(conn, res), 0)
+        self.assertEqual(self._get(uid)['appeals_generated_monthly'], 7)
+
+    def test_unused_credits_and_free_trial_returned(self):
+        uid = self._user(bulk_credits=2, free_trial_generations_used=1)
+        with db.engine.begin() as conn:
+            res = reserve_generations(conn, uid, 10, FT_LIMIT)
+        self.assertEqual(len(res), 4)
+        res.take()
+        res.record(True)
+        with db.engine.begin() as conn:
+            settle_reservation(conn, res)
+        u = self._get(uid)
+        self.assertEqual(u['bulk_credits'], 1)
+        self.assertEqual(u['free_trial_generations_used'], 1)
+        self.assertEqual(u['appeals_generated_monthly'], 1)
+
+    def test_overage_quantity_counts_successful_rows_past_plan_limit(self):
+        uid = self._user(
+            subscription_tier='pro', billing_status='active', plan_limit=10,
+            appeals_generated_monthly=9, stripe_subscription_id='sub_1',
+        )
+        with db.engine.begin() as conn:
+            res = reserve_generations(conn, uid, 5, FT_LIMIT)
+        self.assertEqual(len(res), 3)
+        for ok in (True, False, True):
+            res.take()
+            res.record(ok)
+        self.assertIsNone(res.take())
+        # Successful rows land at monthly 10 and 11: only the second is over the limit
+        self.assertEqual(res.overage_quantity(), 1)
+
+    def test_missing_user(self):
+        with db.engine.begin() as conn:
+            self.assertIsNone(reserve_generations(conn, uuid.uuid4().hex, 3, FT_LIMIT))
+
+    def test_state_round_trips_as_json(self):
+        res = CreditReservation.from_grant('u', {
+            'take_sc': 1, 'take_bc': 0, 'take_usage': 2, 'take_ft': 0,
+            'm': 0, 'ov': 0, 'pl': 0, 'sub_id': None,
+        })
+        res.take()
+        res.record(True)
+        resumed = CreditReservation('u', dict(res.state))
+        self.assertEqual(resumed.take(), SLOT_USAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
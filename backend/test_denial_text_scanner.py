@@ -0,0 +1,92 @@
+"""
+Tests for the compiled denial text scanner: the regex layer, label extraction, confidence and
+the full no-LLM parse match the golden corpus recorded from the per-pattern extractors, and
+scan_denial_text agrees with the extract_* methods on randomized documents built from the
+fragments those patterns are sensitive to.
+"""
+import json
+import os
+import random
+import unittest
+from unittest import mock
+
+from denial_llm_extraction import calculate_confidence
+from denial_text_scanner import scan_denial_text
+from pdf_parser import DenialLetterParser
+from utils.normalize_denial_parse import extract_structured
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Extraction as an LLM might return it: partial matches, reordered names, codes not in the text
+PERTURBED = {
+    "payer_name": "blue cross", "claim_number": "BCX-2026 0115001", "patient_name": "Jane Doe",
+    "date_of_service": "2026-01-15", "billed_amount": "1250.00", "paid_amount": "144",
+    "cpt_codes": ["99214", "99999"], "icd10_codes": ["M54.5", "M545"], "carc_codes": ["45", "197"],
+    "rarc_codes": ["N130", "n54"], "modifiers": ["RT", "59"],
+    "denial_reason_text": "Charges exceed the contracted fee schedule.",
+}
+
+FRAGMENTS = [
+    "CO", "co", "PR", "oa", "CA", "OR", "Cr", "CARC", "carc", "45", "4", "123", "1234", "12345",
+    "19999", "1234567890", "2234567890", "01", "1", "2026", "26", "13", "2026x", "x01", "/", "-",
+    "--", "//", " - ", ":", " ", "\n", ",", ".", "$", "$ ", "1,234", "1,23", "00", "Jan", "january",
+    "Sept", "Mayday", "01/02/2026", "Jan 5, 2026", "2026-01-02", "M54", "M", "MA", "N", "N130",
+    "MA12", "A12", "B34", "J1234", "v1234", "U07", "_", "٤", "Ｎ",
+]
+
+
+def _json(value):
+    return json.loads(json.dumps(value))
+
+
+class TestDenialTextScannerGolden(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(HERE, "testdata", "denial_corpus.txt"), encoding="utf-8") as fh:
+            cls.docs = fh.read().split("\n=====\n")
+        with open(os.path.join(HERE, "testdata", "denial_scan_golden.json"), encoding="utf-8") as fh:
+            cls.golden = json.load(fh)
+
+    def test_corpus_matches_golden(self):
+        self.assertEqual(len(self.docs), len(self.golden))
+        parser = DenialLetterParser()
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+            for doc, expected in zip(self.docs, self.golden):
+                with self.subTest(doc=doc[:40]):
+                    self.assertEqual(_json(parser._regex_extract_dict(doc)), expected["regex"])
+                    self.assertEqual(_json(extract_structured(doc)), expected["structured"])
+                    self.assertEqual(
+                        _json(extract_structured(doc, scan=scan_denial_text(doc))), expected["structured"]
+                    )
+                    self.assertEqual(_json(calculate_confidence(PERTURBED, doc)), expected["confidence"])
+                    self.assertEqual(_json(parser.parse_denial_from_text(doc)), expected["response"])
+
+
+class TestDenialTextScannerDifferential(unittest.TestCase):
+
+    def test_random_documents_match_per_pattern_extractors(self):
+        parser = DenialLetterParser()
+        captured = []
+        date_fields = parser._date_fields
+        parser._date_fields = lambda dates: captured.append(sorted(dates)) or date_fields(dates)
+        rnd = random.Random(7)
+        for _ in range(3000):
+            doc = "".join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(1, 40)))
+            scan = scan_denial_text(doc)
+            captured.clear()
+            parser.extract_dates(doc)
+            with self.subTest(doc=doc):
+                self.assertEqual(scan["denial_codes"], parser.extract_denial_codes(doc))
+                self.assertEqual(sorted(scan["dates"]), captured[0])
+                self.assertEqual(scan["npi"], parser.extract_npi(doc))
+                self.assertEqual(scan["rarc_codes"], parser.extract_rarc_codes(doc))
+                self.assertEqual(scan["cpt_codes"], parser.extract_cpt_codes(doc))
+                self.assertEqual(scan["icd_codes"], parser.extract_icd_codes(doc))
+                self.assertEqual(
+                    parser._amount_fields(doc, scan["amounts"]), parser.extract_amounts(doc)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Tests for bulk text extraction: request bodies (JSON array, documents object, NDJSON) become
+items with per-item errors, the staged pipeline returns what parse_denial_from_text returns for
+each document, stage failures stay on their document, and the LLM layer runs at batch priority
+within its pool's bound.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import mock
+
+import extract_batch
+from extract_batch import iter_extractions, parse_batch_body
+from llm_governor import PRIORITY_BATCH, current_priority
+from pdf_parser import DenialLetterParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _corpus():
+    with open(os.path.join(HERE, "testdata", "denial_corpus.txt"), encoding="utf-8") as fh:
+        return fh.read().split("\n=====\n")
+
+
+def _json(value):
+    return json.loads(json.dumps(value))
+
+
+class TestParseBatchBody(unittest.TestCase):
+
+    def test_json_array_and_item_errors(self):
+        body = json.dumps(["  CO-50 letter  ", {"id": "a1", "text": "x"}, {"id": "a2"}, {"text": 5}, "y" * 100_001])
+        items, err = parse_batch_body(body.encode(), "application/json")
+        self.assertIsNone(err)
+        self.assertEqual(items[0], {"index": 0, "id": 0, "text": "CO-50 letter"})
+        self.assertEqual(items[1], {"index": 1, "id": "a1", "text": "x"})
+        self.assertEqual(items[2]["error"], "Empty text")
+        self.assertEqual(items[3]["error"], "Expected a string or an object with 'text'")
+        self.assertEqual(items[4]["error"], "Text exceeds maximum length")
+
+    def test_documents_object_and_ndjson(self):
+        items, err = parse_batch_body(json.dumps({"documents": [{"id": 7, "text": "a"}]}).encode())
+        self.assertEqual((items, err), ([{"index": 0, "id": 7, "text": "a"}], None))
+        body = b'{"id": "x", "text": "one"}\n\n"two"\n{not json\n'
+        for ctype in ("application/x-ndjson", None):
+            items, err = parse_batch_body(body, ctype)
+            self.assertIsNone(err)
+            self.assertEqual([i.get("text") for i in items], ["one", "two", None])
+            self.assertEqual(items[2], {"index": 2, "id": 2, "error": "Invalid JSON line"})
+
+    def test_request_errors(self):
+        self.assertEqual(parse_batch_body(b"[]")[1], "No documents")
+        self.assertEqual(parse_batch_body(b'{"text": "a"}')[1], "Body must be a JSON array, an object with 'documents', or NDJSON")
+        self.assertEqual(parse_batch_body(b"not json")[1], "Body must be a JSON array, an object with 'documents', or NDJSON")
+        with mock.patch.object(extract_batch, "MAX_DOCUMENTS", 2):
+            self.assertEqual(parse_batch_body(b'["a", "b", "c"]')[1], "Too many documents (max 2)")
+
+
+class TestIterExtractions(unittest.TestCase):
+
+    def setUp(self):
+        self.regex_pool = ThreadPoolExecutor(max_workers=2)
+        self.llm_pool = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.regex_pool.shutdown()
+        self.llm_pool.shutdown()
+
+    def _run(self, items):
+        return list(iter_extractions(items, regex_pool=self.regex_pool, llm_pool=self.llm_pool))
+
+    def test_matches_single_document_parse(self):
+        docs = _corpus() + ["short"]
+        items, _ = parse_batch_body(json.dumps(docs).encode())
+        parser = DenialLetterParser()
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+            rows = self._run(items)
+            expected = [parser.parse_denial_from_text(item["text"]) for item in items]
+        self.assertEqual(sorted(r["index"] for r in rows), list(range(len(docs))))
+        for row in rows:
+            with self.subTest(index=row["index"]):
+                self.assertEqual(row.pop("id"), row["index"])
+                self.assertEqual(_json(row), _json({"index": row["index"], **expected[row["index"]]}))
+
+    def test_item_and_stage_errors(self):
+        doc = _corpus()[0]
+        items = [
+            {"index": 0, "id": "bad", "error": "Empty text"},
+            {"index": 1, "id": "boom", "text": doc + " BOOM"},
+            {"index": 2, "id": "ok", "text": doc},
+        ]
+
+        def llm(text):
+            if "BOOM" in text:
+                raise RuntimeError("llm down")
+            return None, "OpenAI not configured"
+
+        with mock.patch.object(extract_batch, "extract_with_openai", side_effect=llm):
+            rows = {r["id"]: r for r in self._run(items)}
+        self.assertEqual(rows["bad"], {"index": 0, "id": "bad", "success": False, "error": "Empty text"})
+        self.assertEqual(rows["boom"], {"index": 1, "id": "boom", "success": False, "error": "llm down"})
+        self.assertTrue(rows["ok"]["success"])
+        self.assertEqual(rows["ok"]["llm_error"], "OpenAI not configured")
+
+    def test_llm_layer_bounded_at_batch_priority(self):
+        lock = threading.Lock()
+        active = [0, 0]
+        priorities = set()
+
+        def llm(text):
+            priorities.add(current_priority())
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return None, "OpenAI not configured"
+
+        doc = _corpus()[0]
+        items = [{"index": i, "id": i, "text": doc} for i in range(8)]
+        with mock.patch.object(extract_batch, "extract_with_openai", side_effect=llm):
+            rows = self._run(items)
+        self.assertEqual(len(rows), 8)
+        self.assertTrue(all(r["success"] for r in rows))
+        self.assertEqual(active[1], 2)
+        self.assertEqual(priorities, {PRIORITY_BATCH})
+
+    def test_process_pool(self):
+        doc = _corpus()[0]
+        pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+                rows = list(iter_extractions([{"index": 0, "id": 0, "text": doc}], regex_pool=pool, llm_pool=self.llm_pool))
+                expected = DenialLetterParser().parse_denial_from_text(doc)
+        finally:
+            pool.shutdown()
+        self.assertEqual(_json(rows), _json([{"index": 0, "id": 0, **expected}]))
+
+    def test_broken_process_pool_is_dropped_and_batch_runs_in_process(self):
+        doc = _corpus()[0]
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        pool.submit(os._exit, 1).exception()  # worker killed, as by the OOM killer
+        items = [{"index": i, "id": i, "text": doc} for i in range(3)]
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}), mock.patch.dict(extract_batch._pools, {"regex": pool}):
+            rows = list(iter_extractions(items, regex_pool=pool, llm_pool=self.llm_pool))
+            self.assertNotIn("regex", extract_batch._pools)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(r["success"] for r in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests for accept-then-poll generation jobs: Idempotency-Key replays return the first job,
+the executor moves jobs through running -> done / error, and stale unfinished jobs are swept.
+Runs against SQLite.
+"""
+import threading
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+import generation_jobs as gj
+from migrate_generation_jobs import ensure_generation_jobs_schema
+from models import db, GenerationJob
+
+
+class TestGenerationJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_generation_jobs_schema(db)
+        self.uid = uuid.uuid4()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def _status(self, job_id):
+        db.session.expire_all()
+        return db.session.get(GenerationJob, job_id)
+
+    def _wait(self, job_id, statuses=("done", "error")):
+        for _ in range(200):
+            job = self._status(job_id)
+            if job.status in statuses:
+                return job
+            threading.Event().wait(0.01)
+        self.fail(f"job {job_id} did not finish")
+
+    def test_idempotency_key_returns_existing_job(self):
+        first, created = gj.create_generation_job(self.uid, "APP-1", "key-1")
+        self.assertTrue(created)
+        again, created_again = gj.create_generation_job(self.uid, "APP-2", "key-1")
+        self.assertFalse(created_again)
+        self.assertEqual(again.job_id, first.job_id)
+        self.assertEqual(again.appeal_id, "APP-1")
+        other_user, created_other = gj.create_generation_job(uuid.uuid4(), "APP-3", "key-1")
+        self.assertTrue(created_other)
+        no_key_a, _ = gj.create_generation_job(self.uid, "APP-4", None)
+        no_key_b, _ = gj.create_generation_job(self.uid, "APP-5", "  ")
+        self.assertNotEqual(no_key_a.job_id, no_key_b.job_id)
+
+    def test_executor_runs_job_to_done(self):
+        job, _ = gj.create_generation_job(self.uid, "APP-1")
+        ran = threading.Event()
+        gj.submit_generation_job(self.app, job.job_id, ran.set)
+        done = self._wait(job.job_id)
+        self.assertTrue(ran.is_set())
+        self.assertEqual(done.status, "done")
+        self.assertIsNotNone(done.started_at)
+        self.assertIsNotNone(done.finished_at)
+        view = gj.job_view(done)
+        self.assertEqual(view["status_url"], f"/api/generate/appeal/jobs/{job.job_id}")
+
+    def test_executor_records_failure(self):
+        job, _ = gj.create_generation_job(self.uid, "APP-1")
+
+        def boom():
+            raise RuntimeError("OpenAI down")
+
+        gj.submit_generation_job(self.app, job.job_id, boom)
+        failed = self._wait(job.job_id)
+        self.assertEqual(failed.status, "error")
+        self.assertIn("OpenAI down", failed.error)
+
+    def test_sweep_marks_stale_jobs(self):
+        old, _ = gj.create_generation_job(self.uid, "APP-OLD")
+        fresh, _ = gj.create_generation_job(self.uid, "APP-NEW")
+        GenerationJob.query.filter_by(job_id=old.job_id).update(
+            {"created_at": datetime.utcnow() - timedelta(seconds=gj.STALE_SECONDS + 60)}
+        )
+        db.session.commit()
+        self.assertEqual(gj.sweep_stale_generation_jobs(), 1)
+        self.assertEqual(self._status(old.job_id).status, "error")
+        self.assertEqual(self._status(fresh.job_id).status, "queued")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Tests for Idempotency-Key handling: replays return the stored response without re-running
+the view, a reused key with a different body is rejected, concurrent duplicates wait for the
+first request, and failed requests release the key. Runs against a SQLite file database.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify, request
+
+import idempotency
+from models import db
+
+
+class TestIdempotency(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.db_path}"
+        db.init_app(self.app)
+        idempotency._schema_ready = False
+        self.calls = []
+        self.fail_next = False
+
+        @self.app.route("/gen", methods=["POST"])
+        @idempotency.idempotent("gen", user=lambda: request.headers.get("X-User"))
+        def gen():
+            body = request.get_json()
+            self.calls.append(body)
+            time.sleep(body.get("sleep", 0))
+            if self.fail_next:
+                self.fail_next = False
+                return jsonify({"error": "upstream"}), 502
+            return jsonify({"appeal_id": f"APP-{len(self.calls)}"}), 200
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        os.unlink(self.db_path)
+
+    def _post(self, body, key="k1", user="u1"):
+        headers = {"X-User": user}
+        if key:
+            headers["Idempotency-Key"] = key
+        return self.app.test_client().post("/gen", data=json.dumps(body), content_type="application/json", headers=headers)
+
+    def test_replay_returns_stored_response(self):
+        first = self._post({"claim": "C1"})
+        second = self._post({"claim": "C1"})
+        self.assertEqual(first.get_json(), {"appeal_id": "APP-1"})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.get_json(), {"appeal_id": "APP-1"})
+        self.assertEqual(second.headers.get("Idempotent-Replay"), "true")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_key_scoped_per_user_and_optional(self):
+        self._post({"claim": "C1"}, user="u1")
+        self._post({"claim": "C1"}, user="u2")
+        self._post({"claim": "C1"}, key=None)
+        self._post({"claim": "C1"}, key=None)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        self._post({"claim": "C1"})
+        resp = self._post({"claim": "C2"})
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_failure_releases_key(self):
+        self.fail_next = True
+        self.assertEqual(self._post({"claim": "C1"}).status_code, 502)
+        retry = self._post({"claim": "C1"})
+        self.assertEqual(retry.status_code, 200)
+        self.assertIsNone(retry.headers.get("Idempotent-Replay"))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_concurrent_duplicate_waits_for_first(self):
+        results = []
+
+        def send():
+            results.append(self._post({"claim": "C1", "sleep": 0.5}))
+
+        with mock.patch.object(idempotency, "POLL_SECONDS", 0.05):
+            threads = [threading.Thread(target=send) for _ in range(3)]
+            for t in threads:
+                t.start()
+                time.sleep(0.05)
+            for t in threads:
+                t.join(10)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([r.get_json() for r in results], [{"appeal_id": "APP-1"}] * 3)
+        self.assertEqual(sum(r.headers.get("Idempotent-Replay") == "true" for r in results), 2)
+
+    def test_abandoned_claim_is_taken_over(self):
+        with self.app.test_request_context("/gen", method="POST", data=b"{}"):
+            idempotency._ensure_schema()
+            with mock.patch.object(idempotency, "LOCK_SECONDS", -1):
+                self.assertIsNone(idempotency._try_claim("gen", "u1", "k1", idempotency.request_fingerprint()))
+        resp = self._post({})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Tests for the content-addressed LLM cache: key normalization and prompt versioning, LRU and
+table tiers, TTL and eviction, and extract_with_openai serving repeats from the cache.
+"""
+import os
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+
+import denial_llm_extraction as dle
+import llm_cache
+from llm_cache import TieredCache, content_key, normalize_text
+from migrate_llm_cache import ensure_llm_cache_schema
+from models import db
+
+DOC = "ACME HEALTH PLAN\nClaim #: 123456789\nPatient:  Jane Doe\n\nCARC 50 - not medically necessary"
+
+
+class StubCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        content = '{"payer_name": "Acme Health Plan", "claim_number": "123456789", "carc_codes": ["50"]}'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class TestLLMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_llm_cache_schema(db)
+        llm_cache._schema_ready = True
+        llm_cache._caches.clear()
+
+    def tearDown(self):
+        llm_cache._caches.clear()
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_normalized_text_ignores_whitespace_noise(self):
+        a = "Claim  #: 1\r\n\r\n\r\n\tPatient: Jane  \n"
+        b = "Claim #: 1\n\nPatient: Jane"
+        self.assertEqual(normalize_text(a), normalize_text(b))
+        self.assertNotEqual(content_key(normalize_text(a), "m"), content_key(normalize_text(a), "m2"))
+
+    def test_prompt_change_changes_key(self):
+        k1 = dle.extraction_cache_key(DOC, "gpt-4o-mini")
+        with mock.patch.object(dle, "EXTRACTION_SYSTEM_PROMPT", dle.EXTRACTION_SYSTEM_PROMPT + "\nNew rule."):
+            k2 = dle.extraction_cache_key(DOC, "gpt-4o-mini")
+        self.assertNotEqual(k1, k2)
+
+    def test_memory_then_table_tier(self):
+        cache = TieredCache("t", ttl_seconds=60)
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", {"a": [1]})
+        got = cache.get("k")
+        got["a"].append(2)
+        self.assertEqual(cache.get("k"), {"a": [1]})
+        # Another process: empty LRU, same table
+        other = TieredCache("t", ttl_seconds=60)
+        self.assertEqual(other.get("k"), {"a": [1]})
+        self.assertEqual(other.get("k"), {"a": [1]})
+        self.assertEqual((other.stats["db_hits"], other.stats["memory_hits"]), (1, 1))
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_scope_isolation_and_ttl(self):
+        cache = TieredCache("t", ttl_seconds=1, lru_size=0)
+        cache.set("k", "user-a", scope="a")
+        self.assertIsNone(cache.get("k", scope="b"))
+        self.assertEqual(cache.get("k", scope="a"), "user-a")
+        time.sleep(1.1)
+        self.assertIsNone(cache.get("k", scope="a"))
+
+    def test_lru_bound_and_table_eviction(self):
+        cache = TieredCache("t", ttl_seconds=60, lru_size=2)
+        for i in range(4):
+            cache.set(f"k{i}", i)
+        self.assertEqual(len(cache._lru), 2)
+        self.assertEqual(cache.evict(max_rows=3), 1)
+        self.assertIsNone(TieredCache("t", 60).get("k0"))
+
+    def test_extraction_served_from_cache(self):
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                mock.patch.object(dle, "get_openai_client", return_value=stub):
+            first, err = dle.extract_with_openai(DOC)
+            again, _ = dle.extract_with_openai(DOC.replace("  ", " ") + "\n\n")
+            llm_cache._caches["extraction"].clear_memory()
+            from_table, _ = dle.extract_with_openai(DOC)
+        self.assertIsNone(err)
+        self.assertEqual(first["claim_number"], "123456789")
+        self.assertEqual(again, first)
+        self.assertEqual(from_table, first)
+        self.assertEqual(stub.chat.completions.calls, 1)
+        stats = llm_cache.llm_cache_stats()["extraction"]
+        self.assertEqual((stats["memory_hits"], stats["db_hits"], stats["misses"]), (1, 1, 1))
+
+    def test_disabled_cache_always_calls_model(self):
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test", "LLM_CACHE_ENABLED": "0"}), \
+                mock.patch.object(dle, "get_openai_client", return_value=stub):
+            dle.extract_with_openai(DOC)
+            dle.extract_with_openai(DOC)
+        self.assertEqual(stub.chat.completions.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
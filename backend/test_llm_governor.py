@@ -0,0 +1,142 @@
+"""
+Tests for the OpenAI rate governor: interactive callers jump queued batch callers, the RPM
+bucket and concurrency limit hold, waiters time out, usage corrects the token debit, and
+a 429 pauses the governor.
+"""
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import llm_governor
+from llm_governor import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    GovernorTimeout,
+    LLMGovernor,
+    estimate_tokens,
+    governed_create,
+    llm_priority,
+)
+
+
+def _gov(rpm=6000, tpm=10_000_000, concurrency=16, max_wait=5):
+    return LLMGovernor(rpm=rpm, tpm=tpm, max_concurrency=concurrency, max_wait_seconds=max_wait)
+
+
+class TestLLMGovernor(unittest.TestCase):
+
+    def test_interactive_served_before_queued_batch(self):
+        gov = _gov(concurrency=1)
+        order = []
+        hold = gov.permit(10)
+        hold.__enter__()
+
+        def take(label, priority):
+            with gov.permit(10, priority=priority):
+                order.append(label)
+
+        threads = []
+        for i in range(3):
+            threads.append(threading.Thread(target=take, args=(f"batch{i}", PRIORITY_BATCH)))
+            threads[-1].start()
+            time.sleep(0.02)
+        threads.append(threading.Thread(target=take, args=("interactive", PRIORITY_INTERACTIVE)))
+        threads[-1].start()
+        time.sleep(0.05)
+        snap = gov.snapshot()
+        self.assertEqual(snap["queue_depth"], 4)
+        self.assertEqual(snap["queue_depth_by_priority"], {"batch": 3, "interactive": 1})
+        hold.__exit__(None, None, None)
+        for t in threads:
+            t.join(5)
+        self.assertEqual(order, ["interactive", "batch0", "batch1", "batch2"])
+        self.assertEqual(gov.snapshot()["queue_depth"], 0)
+
+    def test_rpm_bucket_paces_requests(self):
+        gov = _gov(rpm=60)  # capacity 60, refills 1/s
+        gov._requests.level = 1
+        t0 = time.monotonic()
+        for _ in range(2):
+            with gov.permit(1):
+                pass
+        elapsed = time.monotonic() - t0
+        self.assertGreater(elapsed, 0.8)
+        snap = gov.snapshot()
+        self.assertEqual(snap["granted"], 2)
+        self.assertEqual(snap["queued"], 1)
+        self.assertGreater(snap["wait_seconds_max"], 0.8)
+
+    def test_concurrency_limit(self):
+        gov = _gov(concurrency=2)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with gov.permit(1):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(gov.snapshot()["in_flight"], 0)
+
+    def test_timeout_when_no_capacity(self):
+        gov = _gov(concurrency=1, max_wait=0.1)
+        with gov.permit(1):
+            with self.assertRaises(GovernorTimeout):
+                with gov.permit(1):
+                    pass
+        self.assertEqual(gov.snapshot()["timeouts"], 1)
+        self.assertEqual(gov.snapshot()["queue_depth"], 0)
+
+    def test_usage_corrects_token_debit(self):
+        gov = _gov(tpm=6000)
+        with gov.permit(1000) as p:
+            p.record_usage(200)
+        self.assertAlmostEqual(gov._tokens.level, 5800, delta=5)
+
+    def test_governed_create_priority_usage_and_429(self):
+        gov = _gov()
+        seen = []
+
+        def create(**kwargs):
+            seen.append(llm_governor.current_priority())
+            return SimpleNamespace(usage=SimpleNamespace(total_tokens=50))
+
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        messages = [{"role": "user", "content": "x" * 400}]
+        self.assertEqual(estimate_tokens(messages, 100), 208)
+        with mock.patch.object(llm_governor, "get_governor", return_value=gov):
+            governed_create(stub, messages=messages, max_tokens=100)
+            with llm_priority(PRIORITY_BATCH):
+                governed_create(stub, messages=messages, max_tokens=100)
+
+            class RateLimited(Exception):
+                status_code = 429
+                response = SimpleNamespace(headers={"retry-after": "3"})
+
+            def limited(**kwargs):
+                raise RateLimited()
+
+            stub.chat.completions.create = limited
+            with self.assertRaises(RateLimited):
+                governed_create(stub, messages=messages)
+        self.assertEqual(seen, [PRIORITY_INTERACTIVE, PRIORITY_BATCH])
+        snap = gov.snapshot()
+        self.assertEqual(snap["granted"], 3)
+        self.assertEqual(snap["rate_limited"], 1)
+        self.assertGreater(snap["paused_seconds"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Tests for the OpenAI Batch API client against a local fake Batch endpoint: JSONL submission,
+polling to completion, mapping output and error lines back by custom_id, and cancelling a
+batch that does not finish in time.
+"""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from appeal_routing import route_appeal
+from appeal_submission_engine import submission_appeal_request_body
+from openai_batch import BatchAPIError, OpenAIBatchClient, parse_batch_output
+
+
+class FakeBatchAPI:
+    """In-memory /files + /batches; lines whose body mentions FAIL come back as errors."""
+
+    def __init__(self, polls_until_done=2):
+        self.polls_until_done = polls_until_done
+        self.files = {}
+        self.batches = {}
+        self.cancelled = []
+        self.lock = threading.Lock()
+
+    def _finish(self, batch):
+        out, err = [], []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            req = json.loads(line)
+            if "FAIL" in json.dumps(req["body"]):
+                err.append({"custom_id": req["custom_id"], "response": None, "error": {"code": "server_error"}})
+            else:
+                content = f"Letter for {req['custom_id']}"
+                out.append({
+                    "custom_id": req["custom_id"],
+                    "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}},
+                    "error": None,
+                })
+        self.files[batch["id"] + "-out"] = "\n".join(json.dumps(x) for x in out).encode()
+        self.files[batch["id"] + "-err"] = "\n".join(json.dumps(x) for x in err).encode()
+        batch.update(status="completed", output_file_id=batch["id"] + "-out", error_file_id=batch["id"] + "-err")
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, raw=False):
+                data = body if raw else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with api.lock:
+                    if self.path == "/v1/files":
+                        payload = body.split(b"\r\n\r\n", 2)[-1].rsplit(b"\r\n--", 1)[0]
+                        file_id = f"file-{len(api.files)}"
+                        api.files[file_id] = payload
+                        return self._send(200, {"id": file_id})
+                    if self.path == "/v1/batches":
+                        req = json.loads(body)
+                        batch_id = f"batch-{len(api.batches)}"
+                        api.batches[batch_id] = {
+                            "id": batch_id,
+                            "status": "validating",
+                            "input_file_id": req["input_file_id"],
+                            "endpoint": req["endpoint"],
+                            "polls": 0,
+                        }
+                        return self._send(200, api.batches[batch_id])
+                    if self.path.endswith("/cancel"):
+                        batch_id = self.path.split("/")[3]
+                        api.cancelled.append(batch_id)
+                        api.batches[batch_id]["status"] = "cancelling"
+                        return self._send(200, api.batches[batch_id])
+                self._send(404, {"error": "not found"})
+
+            def do_GET(self):
+                with api.lock:
+                    parts = self.path.split("/")
+                    if self.path.startswith("/v1/batches/") and parts[3] in api.batches:
+                        batch = api.batches[parts[3]]
+                        batch["polls"] += 1
+                        if batch["status"] in ("validating", "in_progress"):
+                            if batch["polls"] >= api.polls_until_done:
+                                api._finish(batch)
+                            else:
+                                batch["status"] = "in_progress"
+                        return self._send(200, batch)
+                    if self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+                        return self._send(200, api.files[parts[3]], raw=True)
+                self._send(404, {"error": "not found"})
+
+        return Handler
+
+
+class TestOpenAIBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.api = FakeBatchAPI()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.api.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = OpenAIBatchClient(api_key="sk-test", base_url=f"http://127.0.0.1:{self.server.server_port}/v1")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_submit_poll_and_map_results(self):
+        ok = submission_appeal_request_body({"payer_name": "Aetna", "claim_number": "CLM1"})
+        bad = submission_appeal_request_body({"payer_name": "Aetna", "claim_number": "FAIL"})
+        batch_id = self.client.submit([("row-1", ok), ("row-2", bad), ("row-3", ok)], metadata={"job_id": "j1"})
+
+        lines = [json.loads(x) for x in self.api.files["file-0"].decode().splitlines()]
+        self.assertEqual([x["custom_id"] for x in lines], ["row-1", "row-2", "row-3"])
+        self.assertEqual(lines[0]["url"], "/v1/chat/completions")
+        self.assertEqual(lines[0]["body"]["messages"][0]["role"], "system")
+
+        seen = []
+        batch = self.client.wait(batch_id, poll_seconds=0.01, on_poll=lambda b: seen.append(b["status"]))
+        self.assertEqual(batch["status"], "completed")
+        self.assertEqual(seen[-1], "completed")
+        self.assertGreater(len(seen), 1)
+        self.assertEqual(
+            self.client.results(batch),
+            {"row-1": "Letter for row-1", "row-2": None, "row-3": "Letter for row-3"},
+        )
+
+    def test_request_body_uses_the_routed_tier(self):
+        intake = {"payer_name": "Aetna", "claim_number": "CLM1", "carc_codes": ["29"], "billed_amount": "250.00"}
+        route = route_appeal(intake)
+        self.assertEqual(route["tier"], "light")
+        body = submission_appeal_request_body(intake, route["model"], route["max_tokens"])
+        self.assertEqual((body["model"], body["max_tokens"]), (route["model"], route["max_tokens"]))
+
+    def test_wait_past_deadline_cancels(self):
+        self.api.polls_until_done = 10 ** 6
+        batch_id = self.client.submit([("row-1", {"model": "m", "messages": []})])
+        with self.assertRaises(BatchAPIError):
+            self.client.wait(batch_id, poll_seconds=0.01, max_wait_seconds=0.05)
+        self.assertEqual(self.api.cancelled, [batch_id])
+
+    def test_http_errors_raise_batch_api_error(self):
+        with self.assertRaises(BatchAPIError):
+            self.client.retrieve("missing-batch")
+        dead = OpenAIBatchClient(api_key="sk-test", base_url="http://127.0.0.1:9/v1")
+        with self.assertRaises(BatchAPIError):
+            dead.submit([("row-1", {})])
+
+    def test_parse_output_skips_non_200_and_garbage(self):
+        content = "\n".join([
+            json.dumps({"custom_id": "a", "response": {"status_code": 500, "body": {}}}),
+            "not json",
+            json.dumps({"custom_id": "b", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": " hi "}}]}}}),
+        ])
+        self.assertEqual(parse_batch_output(content), {"a": None, "b": "hi"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Tests for the shared OpenAI client registry: one client per key, per-purpose timeouts, and
+connection-reuse stats measured against a local keep-alive HTTP server.
+"""
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import openai_clients as oc
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOpenAIClients(unittest.TestCase):
+
+    def setUp(self):
+        oc._clients.clear()
+
+    def tearDown(self):
+        oc._clients.clear()
+
+    def test_registry_shares_one_client_per_key(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test-a"}):
+            a1 = oc.get_openai_client()
+            a2 = oc.get_openai_client("sk-test-a")
+        b = oc.get_openai_client("sk-test-b")
+        self.assertIs(a1, a2)
+        self.assertIsNot(a1, b)
+        self.assertEqual(oc.openai_pool_stats()["clients"], 2)
+
+    def test_no_key_means_no_client(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+            self.assertIsNone(oc.get_openai_client())
+
+    def test_call_timeouts_per_purpose(self):
+        with mock.patch.dict(os.environ, {"OPENAI_EXTRACTION_TIMEOUT_SECONDS": "12"}):
+            t = oc.call_timeout("extraction")
+        self.assertEqual(t.read, 12.0)
+        self.assertEqual(t.connect, oc.CONNECT_TIMEOUT_SECONDS)
+        self.assertEqual(oc.call_timeout("appeal").read, 90.0)
+
+    def test_keepalive_connections_are_reused_and_counted(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stats = oc.PoolStats()
+        client = oc.build_http_client(stats=stats)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/v1/ping"
+            for _ in range(5):
+                self.assertEqual(client.get(url).status_code, 200)
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+        snap = stats.snapshot()
+        self.assertEqual(snap["requests"], 5)
+        self.assertEqual(snap["new_connections"], 1)
+        self.assertEqual(snap["reused_connections"], 4)
+        self.assertEqual(snap["tls_handshakes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
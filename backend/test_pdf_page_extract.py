@@ -0,0 +1,100 @@
+"""
+Tests for page-parallel PDF extraction: the process pool returns the same pages in the same
+order as serial extraction, a broken pool is replaced and the document finishes serially,
+max_pages caps the read, stop_when ends it early, and a truncated extraction is not cached as the
+full document.
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from reportlab.pdfgen import canvas
+
+import pdf_page_extract
+import pdf_parser
+from pdf_parser import DenialLetterParser
+from pdf_text_cache import PdfTextCache
+
+PAGES = 30
+
+
+def _write_pdf(path, pages):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    for text in pages:
+        c.drawString(40, 800, text)
+        c.showPage()
+    c.save()
+    with open(path, "wb") as fh:
+        fh.write(buf.getvalue())
+
+
+class TestPdfPageExtract(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.dir.name, "eob.pdf")
+        pages = [f"Remittance page {i + 1} line item 99214 paid 85.00" for i in range(PAGES)]
+        pages[4] = "Claim number ABC12345678 adjusted CO-45 contractual obligation"
+        _write_pdf(cls.path, pages)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def test_pool_matches_serial(self):
+        serial = pdf_page_extract.extract_pages(self.path, workers=1)
+        with mock.patch.object(pdf_page_extract, "PARALLEL_MIN_PAGES", 8), mock.patch.object(
+            pdf_page_extract, "PAGES_PER_TASK", 7
+        ):
+            pooled = pdf_page_extract.extract_pages(self.path, workers=2)
+        self.assertEqual(pooled["pages"], serial["pages"])
+        self.assertEqual(pooled["page_count"], PAGES)
+        self.assertFalse(pooled["truncated"])
+        self.assertIn("Remittance page 30", pooled["pages"][-1])
+
+    def test_broken_pool_falls_back_to_serial(self):
+        serial = pdf_page_extract.extract_pages(self.path, workers=1)
+        broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        broken.submit(os._exit, 1).exception()  # worker killed, as by the OOM killer
+        with mock.patch.object(pdf_page_extract, "_pool", broken), mock.patch.object(
+            pdf_page_extract, "PARALLEL_MIN_PAGES", 8
+        ):
+            pooled = pdf_page_extract.extract_pages(self.path, workers=2)
+            self.assertIsNone(pdf_page_extract._pool)
+        self.assertEqual(pooled["pages"], serial["pages"])
+
+    def test_max_pages_and_stop_when(self):
+        capped = pdf_page_extract.extract_pages(self.path, max_pages=3, workers=1)
+        self.assertEqual(len(capped["pages"]), 3)
+        self.assertEqual(capped["page_count"], PAGES)
+        self.assertTrue(capped["truncated"])
+
+        stop = DenialLetterParser().claim_fields_stop()
+        early = pdf_page_extract.extract_pages(self.path, stop_when=stop, workers=1)
+        self.assertEqual(len(early["pages"]), 5)
+        self.assertTrue(early["truncated"])
+
+    def test_truncated_extraction_is_not_cached(self):
+        cache = PdfTextCache(memory_entries=4, disk_dir=None)
+        parser = DenialLetterParser()
+        with mock.patch.object(pdf_parser, "get_pdf_text_cache", return_value=cache):
+            early = parser.extract_text_from_pdf(self.path, stop_when=parser.claim_fields_stop())
+            self.assertEqual(cache.snapshot()["writes"], 0)
+            full = parser.extract_text_from_pdf(self.path)
+            capped = parser.extract_text_from_pdf(self.path, max_pages=2)
+        self.assertIn("CO-45", early)
+        self.assertNotIn("Remittance page 6 ", early)
+        self.assertIn("Remittance page 30", full)
+        self.assertEqual(cache.snapshot()["writes"], 1)
+        self.assertEqual(cache.snapshot()["memory_hits"], 1)
+        self.assertNotIn("Remittance page 3 ", capped)
+
+
+if __name__ == "__main__":
+    unittest.main()
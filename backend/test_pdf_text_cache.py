@@ -0,0 +1,95 @@
+"""
+Tests for the PDF text cache: a repeat extraction of the same bytes skips PyPDF2, the disk
+tier serves other processes (a cold memory tier), size-based eviction drops the least
+recently used files, and empty-page diagnostics are kept.
+"""
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from reportlab.pdfgen import canvas
+
+import pdf_parser
+import pdf_text_cache
+from pdf_parser import DenialLetterParser
+from pdf_text_cache import PdfTextCache
+
+LETTER = (
+    "Aetna Explanation of Benefits. Claim number ABC12345678 was denied. "
+    "CO-50 These are non-covered services because this is not deemed a medical necessity."
+)
+
+
+def _pdf(pages):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    for text in pages:
+        if text:
+            c.drawString(40, 800, text)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+class TestPdfTextCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = PdfTextCache(memory_entries=4, disk_dir=self.dir.name, max_disk_bytes=1024 * 1024)
+        self.patch = mock.patch.object(pdf_parser, "get_pdf_text_cache", return_value=self.cache)
+        self.patch.start()
+        self.parser = DenialLetterParser()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def test_repeat_extraction_skips_parsing(self):
+        data = _pdf([LETTER, ""])
+        with mock.patch.object(DenialLetterParser, "_parse_pdf_pages", wraps=self.parser._parse_pdf_pages) as parse:
+            first = self.parser.extract_text_from_pdf_bytes(data)
+            second = self.parser.extract_text_from_pdf_bytes(data)
+            self.cache.clear_memory()
+            third = self.parser.extract_text_from_pdf_bytes(data)
+        self.assertEqual(parse.call_count, 1)
+        self.assertIn("CO-50", first)
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        s = self.cache.snapshot()
+        self.assertEqual((s["memory_hits"], s["disk_hits"], s["misses"]), (1, 1, 1))
+
+    def test_diagnostics_are_cached(self):
+        data = _pdf([LETTER, "", LETTER])
+        self.parser.extract_text_from_pdf_bytes(data)
+        entry = self.cache.get(pdf_text_cache.pdf_digest(data))
+        self.assertEqual(entry["page_count"], 3)
+        self.assertEqual(entry["empty_pages"], [2])
+        self.assertEqual(len(entry["pages"]), 3)
+
+    def test_image_only_pdf_still_rejected_from_cache(self):
+        data = _pdf(["", ""])
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.parser.extract_text_from_pdf_bytes(data)
+        self.assertEqual(self.cache.snapshot()["writes"], 1)
+
+    def test_disk_tier_evicts_least_recently_used(self):
+        cache = PdfTextCache(memory_entries=0, disk_dir=self.dir.name, max_disk_bytes=3500)
+        entry = {"pages": ["x" * 900], "page_count": 1, "empty_pages": [], "failed_pages": []}
+        base = time.time() - 100
+        for i, digest in enumerate(("a" * 64, "b" * 64, "c" * 64)):
+            cache.set(digest, entry)
+            os.utime(cache._path(digest), (base + i, base + i))
+        self.assertIsNotNone(cache.get("a" * 64))  # touch: "b" is now the oldest
+        cache.set("d" * 64, entry)
+        self.assertIsNone(cache.get("b" * 64))
+        for digest in ("a" * 64, "c" * 64, "d" * 64):
+            self.assertIsNotNone(cache.get(digest))
+        self.assertLessEqual(cache.snapshot()["disk_bytes"], 3500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests for the appeal prompt budgeter on intakes from build_structured_intake_from_appeal:
+compaction drops empties, a long denial_reason_text is clipped to the default budget while
+CARC/RARC sentences survive, a short one is left alone, and the estimate/actual totals feed
+budget_stats().
+"""
+import datetime
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import prompt_budget as pb
+from appeal_submission_engine import build_structured_intake_from_appeal
+
+BOILERPLATE = "The submitted documentation did not support the level of service billed for this date. "
+
+
+def _appeal(**kw):
+    fields = {
+        "payer": "Blue Cross Blue Shield of Massachusetts",
+        "claim_number": "CLM-2026-000123456",
+        "patient_name": "Jonathan Q. Public",
+        "date_of_service": datetime.date(2026, 3, 1),
+        "cpt_codes": "99215-25, 93000, 36415",
+        "diagnosis_code": "E11.9, I10",
+        "billed_amount": 1234.56,
+        "paid_amount": 120.0,
+        "denial_reason": "Denied under CARC CO-50 and RARC N115: medical necessity not established. " + BOILERPLATE * 30,
+        "provider_name": "Springfield Family Medicine Associates",
+        "carc_codes": "CO-50",
+        "rarc_codes": "N115",
+    }
+    fields.update(kw)
+    return SimpleNamespace(**fields)
+
+
+class TestPromptBudget(unittest.TestCase):
+
+    def test_compact_drops_empty_values(self):
+        intake = build_structured_intake_from_appeal(_appeal(
+            patient_name="", date_of_service=None, cpt_codes="99213", diagnosis_code="",
+            billed_amount=None, paid_amount=None, denial_reason="CO-29 timely filing", rarc_codes="",
+        ))
+        out = pb.compact_intake(intake)
+        self.assertEqual(set(intake) - set(out), {"patient_name", "date_of_service", "icd10_codes", "modifiers", "rarc_codes", "billed_amount", "paid_amount"})
+        self.assertEqual(out["cpt_codes"], ["99213"])
+        dumped = pb.dump_compact(out)
+        self.assertNotIn("\n", dumped)
+        self.assertNotIn(": ", dumped)
+
+    def test_clip_text_keeps_code_sentences(self):
+        filler = "The payer reviewed the documentation submitted with the claim. " * 60
+        text = filler + "Denied under CARC CO-50 as not medically necessary. " + filler
+        clipped = pb.clip_text(text, 100)
+        self.assertLessEqual(pb.count_tokens(clipped), 110)
+        self.assertIn("CARC CO-50", clipped)
+        self.assertIn(pb.CLIP_MARKER.strip(), clipped)
+        self.assertEqual(pb.clip_text("short", 100), "short")
+
+    def test_default_budget_clips_a_long_denial_reason(self):
+        intake = build_structured_intake_from_appeal(_appeal())
+        out, report = pb.fit_intake(intake)
+        self.assertEqual(report["clipped"], ["denial_reason_text"])
+        self.assertLessEqual(report["tokens_after"], pb.INTAKE_TOKEN_BUDGET)
+        self.assertIn("CARC CO-50 and RARC N115", out["denial_reason_text"])
+        compacted = pb.compact_intake(intake)
+        self.assertEqual({k: v for k, v in out.items() if k != "denial_reason_text"},
+                         {k: v for k, v in compacted.items() if k != "denial_reason_text"})
+
+    def test_default_budget_leaves_a_short_denial_reason(self):
+        intake = build_structured_intake_from_appeal(_appeal(denial_reason="CO-50: " + BOILERPLATE * 3))
+        out, report = pb.fit_intake(intake)
+        self.assertEqual(report["clipped"], [])
+        self.assertEqual(out, pb.compact_intake(intake))
+
+    def test_record_prompt_usage_feeds_stats(self):
+        fresh = {"requests": 0, "estimated_prompt_tokens": 0, "actual_prompt_tokens": 0, "clipped_requests": 0, "tokens_saved": 0}
+        with mock.patch.dict(pb._stats, fresh):
+            pb.record_prompt_usage(110, 100)
+            pb.record_prompt_usage(50, None)
+            stats = pb.budget_stats()
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["estimated_prompt_tokens"], 110)
+        self.assertEqual(stats["estimate_ratio"], 1.1)
+        self.assertEqual(stats["intake_token_budget"], pb.INTAKE_TOKEN_BUDGET)
+        self.assertEqual(
+            pb.estimate_prompt_tokens([{"role": "user", "content": json.dumps({"a": 1})}]),
+            pb.count_tokens('{"a": 1}') + pb.MESSAGE_OVERHEAD_TOKENS,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
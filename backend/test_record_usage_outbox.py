@@ -0,0 +1,147 @@
+"""
+Tests for the record-usage callback outbox: enqueue with the appeal (held until the internal
+secret is configured, which startup requires), batched delivery over one pooled client with no
+transaction open during the POST, retry with backoff, and dead-lettering. HTTP goes to an
+httpx.MockTransport standing in for the Next.js route.
+"""
+import json
+import os
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+from flask import Flask
+from sqlalchemy import text
+
+import record_usage_outbox as ro
+from migrate_record_usage_outbox import ensure_record_usage_outbox_schema
+from models import db, RecordUsageEvent
+
+
+class FakeNext:
+    def __init__(self, status=200, batch_results=None, raise_error=False, on_request=None):
+        self.status = status
+        self.batch_results = batch_results
+        self.raise_error = raise_error
+        self.on_request = on_request
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if self.on_request:
+            self.on_request()
+        if self.raise_error:
+            raise httpx.ConnectError("connection refused", request=request)
+        body = json.loads(request.content)
+        if "events" in body:
+            results = self.batch_results or [{"ok": True, "status": 200} for _ in body["events"]]
+            return httpx.Response(200, json={"results": results})
+        return httpx.Response(self.status, json={"success": self.status < 400})
+
+
+class TestRecordUsageOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_record_usage_outbox_schema(db)
+        self.env = mock.patch.dict(os.environ, {"NEXT_INTERNAL_API_URL": "https://next.test/", "INTERNAL_API_SECRET": "s3cret"})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        db.session.remove()
+        RecordUsageEvent.__table__.drop(db.engine)
+        self.ctx.pop()
+
+    def _enqueue(self, n=1):
+        for i in range(n):
+            ro.enqueue_record_usage(uuid.uuid4(), f"APP-{i}")
+        db.session.commit()
+
+    def _sender(self, fake, **kw):
+        return ro.RecordUsageSender(client=httpx.Client(transport=httpx.MockTransport(fake)), **kw)
+
+    def _events(self):
+        db.session.expire_all()
+        return RecordUsageEvent.query.order_by(RecordUsageEvent.id).all()
+
+    def test_skipped_without_next_url(self):
+        with mock.patch.dict(os.environ, {"NEXT_INTERNAL_API_URL": ""}):
+            self.assertIsNone(ro.enqueue_record_usage(uuid.uuid4(), "APP-1"))
+            ro.check_record_usage_config()
+
+    def test_missing_secret_fails_startup_and_holds_events(self):
+        fake = FakeNext()
+        with mock.patch.dict(os.environ, {"INTERNAL_API_SECRET": "", "RECORD_USAGE_EMBEDDED_SENDER": "0"}):
+            with self.assertRaises(RuntimeError):
+                ro.start_record_usage_sender(self.app)
+            self._enqueue(1)
+            self.assertEqual(self._sender(fake).flush(), 0)
+        self.assertEqual([e.status for e in self._events()], ["pending"])
+        self._sender(fake).flush()
+        self.assertEqual([e.status for e in self._events()], ["delivered"])
+        self.assertEqual(len(fake.requests), 1)
+
+    def test_rows_are_claimed_and_no_transaction_is_open_during_the_post(self):
+        self._enqueue(2)
+        seen = []
+
+        def during_post():
+            seen.append(db.session().in_transaction())
+            with db.engine.connect() as conn:
+                seen.append(conn.execute(text(
+                    "SELECT COUNT(*) FROM record_usage_outbox WHERE next_attempt_at > :now"
+                ), {"now": datetime.utcnow() + timedelta(seconds=ro.CLAIM_SECONDS / 2)}).scalar())
+
+        self.assertEqual(self._sender(FakeNext(on_request=during_post)).flush(), 2)
+        self.assertEqual(seen, [False, 2])
+        self.assertEqual([e.status for e in self._events()], ["delivered", "delivered"])
+
+    def test_batched_delivery_with_per_event_results(self):
+        self._enqueue(3)
+        fake = FakeNext(batch_results=[
+            {"ok": True, "status": 200},
+            {"ok": False, "status": 403, "error": "Active purchase required"},
+            {"ok": False, "status": 500, "error": "Failed to update usage"},
+        ])
+        sender = self._sender(fake)
+        sender.flush()
+        self.assertEqual(len(fake.requests), 1)
+        self.assertEqual(fake.requests[0].headers["X-Internal-Secret"], "s3cret")
+        self.assertEqual(len(json.loads(fake.requests[0].content)["events"]), 3)
+        ok, forbidden, flaky = self._events()
+        self.assertEqual((ok.status, forbidden.status, flaky.status), ("delivered", "dead", "pending"))
+        self.assertGreater(flaky.next_attempt_at, datetime.utcnow())
+
+    def test_transport_error_backs_off_then_dead_letters(self):
+        self._enqueue(1)
+        fake = FakeNext(raise_error=True)
+        sender = self._sender(fake, max_attempts=2)
+        sender.flush()
+        (e,) = self._events()
+        self.assertEqual((e.status, e.attempts), ("pending", 1))
+        self.assertIn("connection refused", e.last_error)
+        # Not due yet: nothing is sent
+        self.assertEqual(sender.flush(), 0)
+        e.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        sender.flush()
+        (e,) = self._events()
+        self.assertEqual((e.status, e.attempts), ("dead", 2))
+        self.assertEqual(len(fake.requests), 2)
+
+    def test_backoff_doubles_and_caps(self):
+        with mock.patch.object(ro.random, "random", return_value=1.0):
+            delays = [ro.backoff_seconds(n) for n in (1, 2, 3)]
+            self.assertEqual(delays, [ro.BACKOFF_SECONDS, 2 * ro.BACKOFF_SECONDS, 4 * ro.BACKOFF_SECONDS])
+            self.assertEqual(ro.backoff_seconds(50), ro.MAX_BACKOFF_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
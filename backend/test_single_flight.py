@@ -0,0 +1,97 @@
+"""
+Tests for single-flight coalescing: concurrent identical calls share one execution (and its
+error), distinct keys run independently, and extract_with_openai coalesces duplicate requests.
+"""
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import denial_llm_extraction as dle
+import llm_cache
+from single_flight import SingleFlight
+
+
+def _run_concurrently(n, target):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight("t")
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"letter": "x"}
+
+        results = _run_concurrently(5, lambda: flight.do("k", slow))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r[0] == {"letter": "x"} for r in results))
+        self.assertEqual(sorted(r[1] for r in results), [False, True, True, True, True])
+        self.assertEqual(flight.stats["leaders"], 1)
+        self.assertEqual(flight.stats["shared"], 4)
+        self.assertEqual(flight.stats["in_flight"], 0)
+
+    def test_error_is_shared_and_key_released(self):
+        flight = SingleFlight("t")
+
+        def boom():
+            time.sleep(0.1)
+            raise RuntimeError("rate limited")
+
+        results = _run_concurrently(3, lambda: flight.do("k", boom))
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(flight.do("k", lambda: 7), (7, False))
+
+    def test_distinct_keys_do_not_wait_on_each_other(self):
+        flight = SingleFlight("t")
+        release = threading.Event()
+        t = threading.Thread(target=flight.do, args=("slow", release.wait))
+        t.start()
+        self.assertEqual(flight.do("fast", lambda: "ok"), ("ok", False))
+        release.set()
+        t.join(2)
+
+    def test_duplicate_extractions_share_one_openai_call(self):
+        calls = []
+
+        def create(**kwargs):
+            calls.append(1)
+            time.sleep(0.2)
+            content = '{"claim_number": "CLM-9", "carc_codes": ["50"]}'
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+        stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        doc = "Claim CLM-9 denied, CARC 50 not medically necessary."
+        llm_cache._caches.clear()
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test", "LLM_CACHE_ENABLED": "0"}), \
+                mock.patch.object(dle, "get_openai_client", return_value=stub):
+            results = _run_concurrently(4, lambda: dle.extract_with_openai(doc))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r[0]["claim_number"] == "CLM-9" for r in results))
+        results[0][0]["claim_number"] = "changed"
+        self.assertEqual(results[1][0]["claim_number"], "CLM-9")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tests for draft-first generation: the deterministic draft is returned without calling the
+LLM, the refined letter replaces it and bumps letter_version, a refinement is dropped when
+the letter changed in the meantime, and an LLM fallback keeps the draft. The appeals table
+lives in an attached SQLite "public" schema.
+"""
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+import speculative_generation as sg
+from advanced_ai_generator import AdvancedAIAppealGenerator
+from migrate_letter_versions import ensure_letter_versions_schema
+from models import Appeal, ClaimStatusEvent, db
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+class StubGenerator:
+    def __init__(self, letter, method):
+        self.letter = letter
+        self.method = method
+
+    def generate_appeal_content(self, appeal, regenerate=False):
+        appeal.ai_model_used = "gpt-4o" if self.method.endswith("llm") else "deterministic_submission"
+        appeal.ai_generation_method = self.method
+        return self.letter
+
+
+class TestSpeculativeGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        public_db = os.path.join(self.dir.name, "public.db")
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(self.dir.name, 'main.db')}"
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        event.listen(db.engine, "connect", lambda conn, _rec: conn.execute(f"ATTACH DATABASE '{public_db}' AS public"))
+        db.engine.dispose()
+        Appeal.__table__.create(db.engine)
+        ensure_letter_versions_schema(db)
+        self.uid = uuid.uuid4()
+        self.appeal = Appeal(
+            appeal_id="APP-D1",
+            payer="Aetna",
+            claim_number="CLM9",
+            patient_id="P1",
+            provider_name="Clinic",
+            provider_npi="1234567890",
+            date_of_service=date(2026, 2, 1),
+            denial_reason="CO-50 not medically necessary",
+            denial_code="CO-50",
+            billed_amount=900,
+            generated_letter_text="draft letter",
+            letter_version=1,
+        )
+        db.session.add(self.appeal)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        self.dir.cleanup()
+
+    def _reload(self):
+        db.session.expire_all()
+        return Appeal.query.filter_by(appeal_id="APP-D1").one()
+
+    def _events(self):
+        return [e.event_type for e in ClaimStatusEvent.query.order_by(ClaimStatusEvent.id)]
+
+    def test_draft_is_deterministic_and_flags_refinement(self):
+        gen = AdvancedAIAppealGenerator.__new__(AdvancedAIAppealGenerator)
+        gen.enabled = False
+        gen.client = None
+        appeal = SimpleNamespace(**{c.name: getattr(self.appeal, c.name) for c in Appeal.__table__.columns})
+        letter, refine = gen.draft_appeal_content(appeal)
+        self.assertIn("CLM9", letter)
+        self.assertFalse(refine)
+        self.assertEqual(appeal.ai_generation_method, "submission_engine_draft")
+        gen.enabled = True
+        self.assertTrue(gen.draft_appeal_content(appeal)[1])
+
+    def test_refined_letter_replaces_draft(self):
+        applied = sg.refine_appeal(StubGenerator("refined letter", "submission_engine_llm"), "APP-D1", 1, self.uid)
+        self.assertTrue(applied)
+        a = self._reload()
+        self.assertEqual(a.generated_letter_text, "refined letter")
+        self.assertEqual(a.letter_version, 2)
+        self.assertEqual(a.ai_model_used, "gpt-4o")
+        self.assertEqual(self._events(), [sg.EVENT_REFINED])
+
+    def test_refinement_dropped_when_letter_changed(self):
+        Appeal.query.filter_by(appeal_id="APP-D1").update({"generated_letter_text": "edited", "letter_version": 2})
+        db.session.commit()
+        applied = sg.refine_appeal(StubGenerator("refined letter", "submission_engine_llm"), "APP-D1", 1, self.uid)
+        self.assertFalse(applied)
+        a = self._reload()
+        self.assertEqual(a.generated_letter_text, "edited")
+        self.assertEqual(a.letter_version, 2)
+        self.assertEqual(self._events(), [])
+
+    def test_llm_fallback_keeps_draft(self):
+        stub = StubGenerator("deterministic again", "submission_engine_deterministic")
+        with self.assertRaises(RuntimeError):
+            sg.refine_appeal(stub, "APP-D1", 1, self.uid)
+        a = self._reload()
+        self.assertEqual(a.generated_letter_text, "draft letter")
+        self.assertEqual(a.letter_version, 1)
+        self.assertEqual(self._events(), [sg.EVENT_REFINE_FAILED])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Tests for the Stripe overage usage outbox: enqueue on the generation path, aggregated flush per
+subscription, metered item caching, retry on Stripe errors, and a retry after a timed-out report
+resends the identical request. Stripe is replaced by a stub client.
+"""
+import unittest
+import uuid
+
+from flask import Flask
+from sqlalchemy import text
+
+from migrate_stripe_usage_outbox import ensure_stripe_usage_outbox_schema
+from models import db
+from usage_outbox import UsageReporter, enqueue_overage_usage
+
+
+class StubStripe:
+    def __init__(self, items=None, fail=False, timeout=False):
+        self.items = items or {}
+        self.fail = fail
+        self.timeout = timeout
+        self.retrieves = []
+        self.records = []
+
+    def overage_item_id(self, subscription_id):
+        self.retrieves.append(subscription_id)
+        return self.items.get(subscription_id)
+
+    def create_usage_record(self, item_id, quantity, timestamp, idempotency_key):
+        if self.fail:
+            raise RuntimeError('stripe unavailable')
+        self.records.append((item_id, quantity, idempotency_key, timestamp))
+        if self.timeout:
+            raise TimeoutError('read timed out')  # Stripe recorded it; we never saw the response
+
+
+class TestUsageOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ensure_stripe_usage_outbox_schema(db)
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE users (id CHAR(32) PRIMARY KEY, stripe_subscription_id VARCHAR(255))'))
+
+    def tearDown(self):
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP TABLE users'))
+            conn.execute(text('DROP TABLE stripe_usage_outbox'))
+        self.ctx.pop()
+
+    def _user(self, sub_id):
+        uid = uuid.uuid4().hex
+        with db.engine.begin() as conn:
+            conn.execute(text('INSERT INTO users (id, stripe_subscription_id) VALUES (:id, :sub)'), {'id': uid, 'sub': sub_id})
+        return uid
+
+    def _pending(self):
+        with db.engine.connect() as conn:
+            return conn.execute(text('SELECT COUNT(*) FROM stripe_usage_outbox WHERE reported_at IS NULL')).scalar()
+
+    def test_enqueue_requires_subscription(self):
+        self.assertFalse(enqueue_overage_usage(self._user(None), 1))
+        self.assertFalse(enqueue_overage_usage(self._user('sub_a'), 0))
+        self.assertTrue(enqueue_overage_usage(self._user('sub_a'), 2))
+        self.assertEqual(self._pending(), 1)
+
+    def test_flush_aggregates_per_subscription_and_caches_item(self):
+        a, b = self._user('sub_a'), self._user('sub_b')
+        for uid, qty in ((a, 1), (b, 1), (a, 1), (a, 3)):
+            enqueue_overage_usage(uid, qty)
+        stub = StubStripe(items={'sub_a': 'si_a', 'sub_b': 'si_b'})
+        reporter = UsageReporter(client=stub)
+        self.assertEqual(reporter.flush(), 4)
+        self.assertEqual(sorted((r[0], r[1]) for r in stub.records), [('si_a', 5), ('si_b', 1)])
+        self.assertEqual(self._pending(), 0)
+
+        enqueue_overage_usage(a, 1)
+        reporter.flush()
+        self.assertEqual(stub.retrieves.count('sub_a'), 1)
+        self.assertEqual(stub.records[-1][:2], ('si_a', 1))
+        self.assertEqual(reporter.flush(), 0)
+
+    def test_failed_flush_keeps_rows_with_same_idempotency_key(self):
+        uid = self._user('sub_a')
+        enqueue_overage_usage(uid, 1)
+        enqueue_overage_usage(uid, 1)
+        stub = StubStripe(items={'sub_a': 'si_a'}, fail=True)
+        reporter = UsageReporter(client=stub)
+        self.assertEqual(reporter.flush(), 0)
+        self.assertEqual(self._pending(), 2)
+        with db.engine.connect() as conn:
+            attempts = conn.execute(text('SELECT attempts, last_error FROM stripe_usage_outbox')).all()
+        self.assertTrue(all(n == 1 and 'unavailable' in err for n, err in attempts))
+
+        stub.fail = False
+        self.assertEqual(reporter.flush(), 2)
+        self.assertEqual(len(stub.records), 1)
+        with db.engine.connect() as conn:
+            keys = {k for (k,) in conn.execute(text('SELECT report_key FROM stripe_usage_outbox'))}
+        self.assertEqual(keys, {stub.records[0][2]})
+
+    def test_timed_out_report_is_resent_unchanged_when_new_rows_arrive(self):
+        uid = self._user('sub_a')
+        enqueue_overage_usage(uid, 1)
+        enqueue_overage_usage(uid, 1)
+        stub = StubStripe(items={'sub_a': 'si_a'}, timeout=True)
+        reporter = UsageReporter(client=stub)
+        self.assertEqual(reporter.flush(), 0)
+
+        enqueue_overage_usage(uid, 4)
+        stub.timeout = False
+        self.assertEqual(reporter.flush(), 3)
+        first, retried, new = stub.records
+        self.assertEqual(retried, first)
+        self.assertEqual(new[1], 4)
+        self.assertNotEqual(new[2], first[2])
+        self.assertEqual(self._pending(), 0)
+
+    def test_missing_metered_item_is_retried_then_capped(self):
+        enqueue_overage_usage(self._user('sub_x'), 1)
+        reporter = UsageReporter(client=StubStripe(), max_attempts=2)
+        reporter.flush()
+        reporter.flush()
+        reporter.flush()
+        with db.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT attempts FROM stripe_usage_outbox')).scalar(), 2)
+        self.assertEqual(reporter.stats['errors'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
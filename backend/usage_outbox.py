@@ -0,0 +1,232 @@
+"""
+Stripe overage usage outbox.
+
+Generation paths never call Stripe: they insert a row into stripe_usage_outbox (one INSERT, in
+the caller's transaction when given a connection, so billing commits with the work it bills for).
+UsageReporter flushes the outbox in the background every USAGE_REPORT_INTERVAL_SECONDS in two
+steps. First, new rows are grouped per subscription and each group's idempotency key (derived
+from its row ids) is written to report_key and committed, under a short row lock. Then every
+keyed, unreported group is summed into one usage record per metered item and sent to Stripe
+outside any transaction, with the stored key and a timestamp taken from the rows, so a retry
+after a timeout or a failed commit resends the identical request and Stripe does not bill it
+twice. Rows are marked reported afterwards. The metered item id is cached per subscription, so
+steady state is one Stripe call per subscription per interval instead of two per appeal.
+
+Env:
+  USAGE_REPORT_INTERVAL_SECONDS  seconds between outbox flushes
+  USAGE_REPORT_BATCH             max outbox rows read per flush
+  USAGE_REPORT_MAX_ATTEMPTS      rows failing this many flushes are left for manual review
+  USAGE_ITEM_CACHE_SECONDS       how long a subscription's metered item id is reused
+  USAGE_EMBEDDED_REPORTER        1 = run the reporter inside each web / worker process
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from batch_job_queue import _env_int
+from models import db
+
+logger = logging.getLogger(__name__)
+
+REPORT_INTERVAL_SECONDS = _env_int('USAGE_REPORT_INTERVAL_SECONDS', 60)
+REPORT_BATCH = _env_int('USAGE_REPORT_BATCH', 500)
+MAX_ATTEMPTS = _env_int('USAGE_REPORT_MAX_ATTEMPTS', 20)
+ITEM_CACHE_SECONDS = _env_int('USAGE_ITEM_CACHE_SECONDS', 3600)
+
+_embedded_lock = threading.Lock()
+_embedded_started = False
+
+
+def enqueue_overage_usage(user_id, quantity: int = 1, source: str = None, conn=None) -> bool:
+    """
+    Queue `quantity` overage units for the user's current Stripe subscription.
+    Returns False (nothing queued) when quantity <= 0 or the user has no subscription.
+    """
+    if quantity <= 0:
+        return False
+    if conn is None:
+        with db.engine.begin() as own:
+            return enqueue_overage_usage(user_id, quantity, source, own)
+    res = conn.execute(
+        text(
+            """INSERT INTO stripe_usage_outbox (user_id, stripe_subscription_id, quantity, source, created_at)
+               SELECT id, stripe_subscription_id, :qty, :source, :now FROM users
+               WHERE id = :uid AND COALESCE(stripe_subscription_id, '') <> ''"""
+        ),
+        {'uid': user_id, 'qty': int(quantity), 'source': source, 'now': datetime.utcnow()},
+    )
+    return res.rowcount > 0
+
+
+def _as_datetime(value) -> datetime:
+    # SQLite hands DATETIME columns back as ISO strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class StripeUsageClient:
+    """The two Stripe calls the reporter needs (swap for a stub in tests)."""
+
+    def __init__(self, price_id=None):
+        import stripe
+        from config import Config
+
+        stripe.api_key = Config.STRIPE_SECRET_KEY
+        self._stripe = stripe
+        self.price_id = price_id or Config.STRIPE_OVERAGE_PRICE_ID
+
+    def overage_item_id(self, subscription_id):
+        subscription = self._stripe.Subscription.retrieve(subscription_id)
+        for item in subscription['items']['data']:
+            if item['price']['id'] == self.price_id:
+                return item['id']
+        return None
+
+    def create_usage_record(self, item_id, quantity, timestamp, idempotency_key):
+        self._stripe.SubscriptionItem.create_usage_record(
+            item_id,
+            quantity=quantity,
+            timestamp=timestamp,
+            action='increment',
+            idempotency_key=idempotency_key,
+        )
+
+
+class UsageReporter:
+    """Aggregating outbox flusher. One instance per process keeps the metered item cache warm."""
+
+    def __init__(self, client=None, batch=None, max_attempts=None, item_cache_seconds=None):
+        self._client = client
+        self.batch = batch or REPORT_BATCH
+        self.max_attempts = max_attempts or MAX_ATTEMPTS
+        self.item_cache_seconds = ITEM_CACHE_SECONDS if item_cache_seconds is None else item_cache_seconds
+        self._items = OrderedDict()  # subscription_id -> (item_id, expires_at)
+        self.stats = {'flushes': 0, 'rows_reported': 0, 'units_reported': 0, 'stripe_calls': 0, 'errors': 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = StripeUsageClient()
+        return self._client
+
+    def _item_for(self, subscription_id):
+        cached = self._items.get(subscription_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        self.stats['stripe_calls'] += 1
+        item_id = self.client.overage_item_id(subscription_id)
+        if item_id:
+            self._items[subscription_id] = (item_id, time.monotonic() + self.item_cache_seconds)
+            while len(self._items) > 10000:
+                self._items.popitem(last=False)
+        return item_id
+
+    def flush(self) -> int:
+        """Report pending rows; returns the number of outbox rows marked reported."""
+        self.stats['flushes'] += 1
+        self._assign_report_keys()
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    """SELECT id, report_key, stripe_subscription_id, quantity, created_at FROM stripe_usage_outbox
+                        WHERE reported_at IS NULL AND report_key IS NOT NULL AND attempts < :max_attempts
+                        ORDER BY id LIMIT :limit"""
+                ),
+                {'max_attempts': self.max_attempts, 'limit': self.batch},
+            ).all()
+        groups = OrderedDict()  # report_key -> [subscription, rows, units, latest created_at]
+        for _row_id, key, sub_id, qty, created_at in rows:
+            group = groups.setdefault(key, [sub_id, 0, 0, None])
+            created_at = _as_datetime(created_at)
+            group[1] += 1
+            group[2] += qty
+            group[3] = created_at if group[3] is None else max(group[3], created_at)
+        return sum(self._report_group(key, *group) for key, group in groups.items())
+
+    def _assign_report_keys(self):
+        """Group rows without a key per subscription and commit each group's idempotency key."""
+        lock = ' FOR UPDATE SKIP LOCKED' if db.engine.dialect.name == 'postgresql' else ''
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"""SELECT id, stripe_subscription_id FROM stripe_usage_outbox
+                        WHERE reported_at IS NULL AND report_key IS NULL AND attempts < :max_attempts
+                        ORDER BY id LIMIT :limit{lock}"""
+                ),
+                {'max_attempts': self.max_attempts, 'limit': self.batch},
+            ).all()
+            groups = OrderedDict()
+            for row_id, sub_id in rows:
+                groups.setdefault(sub_id, []).append(row_id)
+            for ids in groups.values():
+                id_params = {f'id{n}': v for n, v in enumerate(ids)}
+                in_ids = ', '.join(f':{k}' for k in id_params)
+                key = 'overage-' + hashlib.sha256(','.join(map(str, ids)).encode()).hexdigest()[:48]
+                conn.execute(
+                    text(
+                        f"""UPDATE stripe_usage_outbox SET report_key = :key
+                            WHERE id IN ({in_ids}) AND report_key IS NULL"""
+                    ),
+                    {**id_params, 'key': key},
+                )
+
+    def _report_group(self, key, sub_id, n, qty, latest) -> int:
+        try:
+            item_id = self._item_for(sub_id)
+            if not item_id:
+                raise LookupError(f'no metered overage item on subscription {sub_id}')
+            self.stats['stripe_calls'] += 1
+            timestamp = int(latest.replace(tzinfo=timezone.utc).timestamp())
+            self.client.create_usage_record(item_id, qty, timestamp, key)
+        except Exception as e:
+            self.stats['errors'] += 1
+            self._items.pop(sub_id, None)
+            logger.warning('Overage report failed for %s (qty=%s): %s', sub_id, qty, e)
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text(
+                        """UPDATE stripe_usage_outbox SET attempts = attempts + 1, last_error = :err
+                            WHERE report_key = :key AND reported_at IS NULL"""
+                    ),
+                    {'key': key, 'err': str(e)[:1000]},
+                )
+            return 0
+        with db.engine.begin() as conn:
+            conn.execute(
+                text('UPDATE stripe_usage_outbox SET reported_at = :now WHERE report_key = :key AND reported_at IS NULL'),
+                {'now': datetime.utcnow(), 'key': key},
+            )
+        self.stats['rows_reported'] += n
+        self.stats['units_reported'] += qty
+        return n
+
+    def run(self, app, stop_event=None, interval=None):
+        stop_event = stop_event or threading.Event()
+        interval = interval or REPORT_INTERVAL_SECONDS
+        while not stop_event.wait(interval):
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Usage outbox flush failed')
+
+
+def start_usage_reporter(app):
+    """Start the background reporter in this process once, unless USAGE_EMBEDDED_REPORTER=0."""
+    global _embedded_started
+    if os.getenv('USAGE_EMBEDDED_REPORTER', '1').strip().lower() in ('0', 'false', 'no'):
+        return
+    with _embedded_lock:
+        if _embedded_started:
+            return
+        _embedded_started = True
+    with app.app_context():
+        from migrate_stripe_usage_outbox import ensure_stripe_usage_outbox_schema
+
+        ensure_stripe_usage_outbox_schema(db)
+    threading.Thread(target=UsageReporter().run, args=(app,), name='usage-reporter', daemon=True).start()
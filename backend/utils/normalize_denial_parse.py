@@ -9,7 +9,7 @@ import logging
 import re
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -164,44 +164,60 @@ def normalize_denial_parse(raw: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
-def extract_structured(text: str) -> Dict[str, Any]:
+_LABEL_PATTERNS = {
+    "payer_name": re.compile(r"PAYER:\s*(.+)", re.I),
+    "claim_number": re.compile(r"CLM#:\s*([A-Z0-9\-]+)", re.I),
+    "service_date": re.compile(r"DOS:\s*([0-9/\-]+)", re.I),
+    "note": re.compile(r"NOTE:\s*(.+)", re.I),
+    "remark": re.compile(r"Remark:\s*(.+)", re.I),
+}
+_CPT_LINE = re.compile(r"CPT:\s*([0-9/\s]+)", re.I)
+_ICD_LINE = re.compile(r"ICD:\s*([A-Z0-9\.]+)", re.I)
+_CARC_LABEL = re.compile(r"CARC\s*(\d+)", re.I)
+_REMARK_CODE = re.compile(r"N\d+", re.I)
+_PATIENT_LINES = [
+    re.compile(r"(?:Patient|Member|Subscriber|Insured|Beneficiary)(?:\s+Name)?\s*[:#]\s*([^\n\r]{2,120})", re.I),
+    re.compile(r"Pt\.?\s*Name\s*[:#]\s*([^\n\r]{2,120})", re.I),
+    re.compile(r"(?:Name\s+of\s+(?:Patient|Member|Subscriber))\s*[:#]\s*([^\n\r]{2,120})", re.I),
+]
+
+
+def extract_structured(text: str, scan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Deterministic label-based extraction (PAYER:, CLM#:, DOS:, etc.).
     Structured values override AI/regex when non-empty (see overlay_structured_over_merge).
+    scan: scan_denial_text() result for the same text; its N-codes replace a separate pass.
     """
     if not text:
         text = ""
 
-    def get(pattern: str) -> str:
-        m = re.search(pattern, text, re.I)
+    def get(label: str) -> str:
+        m = _LABEL_PATTERNS[label].search(text)
         return m.group(1).strip() if m else ""
 
-    cpt_m = re.search(r"CPT:\s*([0-9/\s]+)", text, re.I)
+    cpt_m = _CPT_LINE.search(text)
     cpt_part = cpt_m.group(1) if cpt_m else ""
     cpt_codes = [x for x in re.split(r"[/,\s]+", cpt_part.strip()) if x]
 
-    icd_m = re.search(r"ICD:\s*([A-Z0-9\.]+)", text, re.I)
+    icd_m = _ICD_LINE.search(text)
     icd_part = icd_m.group(1) if icd_m else ""
     icd_codes = [x for x in re.split(r"[,\s]+", icd_part.strip()) if x]
 
-    carc_m = re.search(r"CARC\s*(\d+)", text, re.I)
+    carc_m = _CARC_LABEL.search(text)
     primary_denial_code = carc_m.group(1).strip() if carc_m else ""
 
-    rarc_codes = re.findall(r"N\d+", text, re.I)
-    rarc_codes = list(dict.fromkeys(x.upper() for x in rarc_codes))
+    if scan is not None:
+        rarc_codes = list(scan["remark_codes"])
+    else:
+        rarc_codes = list(dict.fromkeys(x.upper() for x in _REMARK_CODE.findall(text)))
 
-    note = get(r"NOTE:\s*(.+)")
-    remark = get(r"Remark:\s*(.+)")
+    note = get("note")
+    remark = get("remark")
     denial_reason_text = (note + " " + remark).strip()
 
     def get_patient_line() -> str:
-        patterns = [
-            r"(?:Patient|Member|Subscriber|Insured|Beneficiary)(?:\s+Name)?\s*[:#]\s*([^\n\r]{2,120})",
-            r"Pt\.?\s*Name\s*[:#]\s*([^\n\r]{2,120})",
-            r"(?:Name\s+of\s+(?:Patient|Member|Subscriber))\s*[:#]\s*([^\n\r]{2,120})",
-        ]
-        for pat in patterns:
-            m = re.search(pat, text, re.I)
+        for pat in _PATIENT_LINES:
+            m = pat.search(text)
             if m:
                 s = m.group(1).strip().strip('"').strip("'").rstrip(",").strip()
                 if len(s) >= 2:
@@ -211,9 +227,9 @@ def extract_structured(text: str) -> Dict[str, Any]:
     patient_name = get_patient_line()
 
     return {
-        "payer_name": get(r"PAYER:\s*(.+)"),
-        "claim_number": get(r"CLM#:\s*([A-Z0-9\-]+)"),
-        "service_date": get(r"DOS:\s*([0-9/\-]+)"),
+        "payer_name": get("payer_name"),
+        "claim_number": get("claim_number"),
+        "service_date": get("service_date"),
         "patient_name": patient_name,
         "cpt_codes": cpt_codes,
         "icd_codes": icd_codes,
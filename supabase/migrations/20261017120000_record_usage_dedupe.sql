@@ -0,0 +1,39 @@
+-- Count each generated appeal once in appeals_generated_monthly.
+-- The engine's record_usage_outbox retries deliveries whose response was lost, so
+-- /api/internal/record-usage can see the same appeal_id more than once. record_appeal_usage()
+-- claims the appeal_id and increments the counter in one transaction; a repeat is a no-op.
+
+CREATE TABLE IF NOT EXISTS public.processed_usage_events (
+    appeal_id character varying(255) NOT NULL PRIMARY KEY,
+    user_id uuid NOT NULL,
+    processed_at timestamp without time zone NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS ix_processed_usage_events_user_id ON public.processed_usage_events USING btree (user_id);
+
+-- Service role only (no policies)
+ALTER TABLE public.processed_usage_events ENABLE ROW LEVEL SECURITY;
+
+-- Returns true when this call counted the appeal, false when it had already been counted.
+CREATE OR REPLACE FUNCTION public.record_appeal_usage(p_appeal_id text, p_user_id uuid, p_email text)
+RETURNS boolean
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO public.processed_usage_events (appeal_id, user_id)
+    VALUES (p_appeal_id, p_user_id)
+    ON CONFLICT (appeal_id) DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+    UPDATE public.users
+    SET appeals_generated_monthly = COALESCE(appeals_generated_monthly, 0) + 1
+    WHERE lower(btrim(email)) = lower(btrim(p_email));
+    RETURN true;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.record_appeal_usage(text, uuid, text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.record_appeal_usage(text, uuid, text) TO service_role;